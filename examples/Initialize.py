@@ -48,20 +48,14 @@ if not METAPOOL_APP_ID:
         nanopool=nanopool,
         metaAssetID=USTEST_ID,
     )
-    metapool_app_id = Metapool.createMetapool(creator_account)
-    print("Metapool Created")
-    print("Metapool App ID: %i" % metapool_app_id)
-    # Fund the account and initialize the contract
-    metapool_lp_id = Metapool.setupMetapool(
+    # Create, fund and set up the contract, and opt in to the Metapool LP token asset
+    metapool_app_id, metapool_lp_id = Metapool.deploy_metapool(
         creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
     )
-    print("Metapool set up")
+    print("Metapool deployed")
+    print("Metapool App ID: %i" % metapool_app_id)
     print("Metapool LP token ID: %i" % metapool_lp_id)
 
-    # Opt in to the Metapool LP token asset
-    print("Opting in to pool token")
-    Metapool.optInToPoolToken(creator_account)
-
 # Update the contract
 else:
     update_metapool(amm_client.algod, creator_account, METAPOOL_APP_ID)
@@ -0,0 +1,350 @@
+"""Columnar store of the history of a metapool.
+
+Every app call to the metapool, including the inner calls made by another metapool, is
+decoded into one row of typed columns, together with the metapool reserves after the call.
+The transactions are fetched from the indexer by address, so that the input transfers of
+the groups and the inner transactions are included, one window of rounds at a time. An
+address search returns the newest transactions first, so each window is sorted back into
+chain order before it is replayed, and the rows appended to one raw little-endian uint64
+file per column. The state of the ingestion (next round, reserves, configuration) is saved
+after each window, so an interrupted ingestion resumes where it stopped and a later one
+only fetches the new rounds.
+
+The columns are loaded with `columns()` as read-only NumPy memory maps.
+"""
+
+import json
+import os
+import sys
+from array import array
+from base64 import b64decode
+from algosdk import abi
+from algosdk.encoding import encode_address
+from algosdk.logic import get_application_address
+from .contracts.poolStrings import metapool_strings
+from .metapoolMath import assessFee
+
+# Operation codes of the op column
+OPERATIONS = [
+    metapool_strings.op_set_metapool,
+    metapool_strings.op_metaswap,
+    metapool_strings.op_metaswap_exact_out,
+    metapool_strings.op_metaswap_from_lp,
+    metapool_strings.op_metaswap_to_meta,
+    metapool_strings.op_add_liquidity,
+    metapool_strings.op_add_liquidity_single,
+    metapool_strings.op_withdraw,
+    metapool_strings.op_withdraw_single,
+]
+OP_CODES = {
+    abi.Method.from_signature(signature).get_selector(): code
+    for code, signature in enumerate(OPERATIONS)
+}
+SWAP_OPERATIONS = {
+    OPERATIONS.index(signature)
+    for signature in [
+        metapool_strings.op_metaswap,
+        metapool_strings.op_metaswap_exact_out,
+        metapool_strings.op_metaswap_from_lp,
+        metapool_strings.op_metaswap_to_meta,
+    ]
+}
+
+# Index of the zap amount in the arguments of the methods with a zap route
+ZAP_ARGUMENT = {
+    metapool_strings.op_metaswap: 0,
+    metapool_strings.op_metaswap_exact_out: 1,
+    metapool_strings.op_add_liquidity_single: 0,
+}
+
+
+def decodeArguments(signature: str, args: list) -> list:
+    """Values of the scalar tuple argument of a metapool method call"""
+    method = abi.Method.from_signature(signature)
+    tupleType = [arg.type for arg in method.args if isinstance(arg.type, abi.TupleType)]
+    return tupleType[0].decode(b64decode(args[1]))
+
+
+# round, intra: position of the root transaction in the chain
+# op: index of the method in OPERATIONS
+# asset_in, amount_in: first asset sent to the metapool with the call (the meta asset for
+#   add_liquidity), net of the refunds
+# asset_out, amount_out: last asset sent by the metapool, other than to the nanopool
+# zap: zap amount argument of the zap route, 0 otherwise
+# pool_fee: swap fee kept by the pool, in units of the pool asset swapped in
+# txn_fee: network fees of the call and the preceding transactions of its group sent to
+#   the metapool, plus the nanopool fee reimbursement
+# fee_bps, meta_reserve, lp_reserve: configuration and reserves after the call
+COLUMNS = [
+    "round",
+    "intra",
+    "op",
+    "asset_in",
+    "amount_in",
+    "asset_out",
+    "amount_out",
+    "zap",
+    "pool_fee",
+    "txn_fee",
+    "fee_bps",
+    "meta_reserve",
+    "lp_reserve",
+]
+
+
+class AnalyticsStore:
+    def __init__(self, path: str, metapoolAppID: int):
+        """Constructor method for :class:`AnalyticsStore`
+        Args:
+            path: directory of the store, created if needed.
+            metapoolAppID: application ID of the metapool.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.state = {
+            "app_id": metapoolAppID,
+            "rows": 0,
+            "min_round": 0,
+            "meta_asset_id": 0,
+            "nanopool_lp_id": 0,
+            "nanopool_address": "",
+            "fee_bps": 0,
+            "meta_reserve": 0,
+            "lp_reserve": 0,
+            "pending": {},
+        }
+        try:
+            with open(self.statePath()) as f:
+                self.state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        if self.state["app_id"] != metapoolAppID:
+            raise ValueError("The store at %s holds another metapool" % path)
+        self.address = get_application_address(metapoolAppID)
+        # Drop any row written after the last saved state
+        for name in COLUMNS:
+            with open(self.columnPath(name), "ab") as f:
+                f.truncate(self.state["rows"] * 8)
+
+    def statePath(self) -> str:
+        return os.path.join(self.path, "state.json")
+
+    def columnPath(self, name: str) -> str:
+        return os.path.join(self.path, name + ".u64")
+
+    @property
+    def rows(self) -> int:
+        return self.state["rows"]
+
+    def ingest(self, indexer, pageSize=1000, roundsPerQuery=100_000) -> int:
+        """Fetch the transactions since the last ingestion and append their rows.
+        Args:
+            indexer: indexer client.
+            pageSize: number of transactions per indexer query.
+            roundsPerQuery: number of rounds fetched and replayed at once.
+        Returns:
+            The number of rows added.
+        """
+        rowsBefore = self.rows
+        currentRound = None
+        while True:
+            maxRound = self.state["min_round"] + roundsPerQuery - 1
+            txns, nextToken = [], None
+            while True:
+                response = indexer.search_transactions(
+                    address=self.address,
+                    min_round=self.state["min_round"],
+                    max_round=maxRound,
+                    limit=pageSize,
+                    next_page=nextToken,
+                )
+                currentRound = response.get("current-round", currentRound)
+                page = response.get("transactions", [])
+                txns += page
+                if not page or "next-token" not in response:
+                    break
+                nextToken = response["next-token"]
+            if currentRound is None:
+                break
+            # Newest first from the indexer, replayed in chain order
+            txns.sort(key=lambda t: (t["confirmed-round"], t["intra-round-offset"]))
+            rows = []
+            for txn in txns:
+                self.ingestRoot(txn, rows)
+            self.append(rows)
+            # Rounds up to the current round of the indexer are complete
+            self.state["min_round"] = min(maxRound, currentRound) + 1
+            self.state["pending"] = {}
+            self.save()
+            if maxRound >= currentRound:
+                break
+        return self.rows - rowsBefore
+
+    def ingestRoot(self, txn: dict, rows: list) -> None:
+        position = (txn["confirmed-round"], txn["intra-round-offset"])
+        group = txn.get("group")
+        pending = self.state["pending"]
+        if group is not None and group not in pending:
+            # Groups are not split across rounds, older ones are complete
+            pending.clear()
+            pending[group] = {"asset": 0, "amount": 0, "fee": 0}
+        context = pending.get(group, {"asset": 0, "amount": 0, "fee": 0})
+        self.ingestTxn(txn, context, position, rows)
+
+    def ingestTxn(self, txn: dict, context: dict, position, rows: list) -> None:
+        """Apply a transaction to the reserves, and add a row for a call to the metapool.
+
+        context holds the first transfer to the metapool and the fees of the transactions
+        that precede the call in its group or inner transaction list.
+        """
+        txnType = txn["tx-type"]
+        if txnType == "axfer":
+            transfer = txn["asset-transfer-transaction"]
+            if transfer["receiver"] == self.address:
+                self.updateReserve(transfer["asset-id"], transfer["amount"])
+                if not context["asset"]:
+                    context["asset"] = transfer["asset-id"]
+                    context["amount"] = transfer["amount"]
+                context["fee"] += txn.get("fee", 0)
+            if txn["sender"] == self.address:
+                self.updateReserve(transfer["asset-id"], -transfer["amount"])
+        elif txnType == "pay":
+            if txn["payment-transaction"]["receiver"] == self.address:
+                context["fee"] += (
+                    txn.get("fee", 0) + txn["payment-transaction"]["amount"]
+                )
+        elif txnType == "appl":
+            appId = txn["application-transaction"]["application-id"]
+            if appId == self.state["app_id"]:
+                self.ingestCall(txn, dict(context), position, rows)
+                context.update(asset=0, amount=0, fee=0)
+                return
+        inner = {"asset": 0, "amount": 0, "fee": 0}
+        for innerTxn in txn.get("inner-txns", []):
+            self.ingestTxn(innerTxn, inner, position, rows)
+
+    def ingestCall(self, txn: dict, context: dict, position, rows: list) -> None:
+        for delta in txn.get("global-state-delta", []):
+            key = b64decode(delta["key"]).decode(errors="surrogateescape")
+            if key == metapool_strings.nanopool_address:
+                self.state["nanopool_address"] = encode_address(
+                    b64decode(delta["value"].get("bytes", ""))
+                )
+            elif key in [
+                metapool_strings.meta_asset_id,
+                metapool_strings.nanopool_lp_id,
+                metapool_strings.fee_bps,
+            ]:
+                self.state[key.replace(" ", "_")] = delta["value"].get("uint", 0)
+
+        inner = {"asset": 0, "amount": 0, "fee": 0}
+        for innerTxn in txn.get("inner-txns", []):
+            self.ingestTxn(innerTxn, inner, position, rows)
+        sends, zapped = [], 0
+        for transfer in self.innerTransfers(txn):
+            if transfer["sender"] == self.address:
+                sends.append(
+                    (transfer["receiver"], transfer["asset-id"], transfer["amount"])
+                )
+            elif (
+                transfer["sender"] == self.state["nanopool_address"]
+                and transfer["receiver"] == self.address
+                and transfer["asset-id"] == self.state["nanopool_lp_id"]
+            ):
+                zapped += transfer["amount"]
+
+        args = txn["application-transaction"].get("application-args", [])
+        op = OP_CODES.get(b64decode(args[0])) if args else None
+        if op is None:
+            return
+        sender = txn["sender"]
+        assetIn = context["asset"]
+        amountIn = context["amount"] - sum(
+            amount
+            for receiver, asset, amount in sends
+            if receiver == sender and asset == assetIn
+        )
+        assetOut, amountOut = 0, 0
+        for receiver, asset, amount in sends:
+            if receiver != self.state["nanopool_address"]:
+                assetOut, amountOut = asset, amount
+        zap = 0
+        if OPERATIONS[op] in ZAP_ARGUMENT and assetIn not in [
+            self.state["meta_asset_id"],
+            self.state["nanopool_lp_id"],
+        ]:
+            zap = decodeArguments(OPERATIONS[op], args)[ZAP_ARGUMENT[OPERATIONS[op]]]
+        poolFee = 0
+        if op in SWAP_OPERATIONS:
+            if assetIn in [self.state["meta_asset_id"], self.state["nanopool_lp_id"]]:
+                swapIn = amountIn
+            else:
+                swapIn = zapped - sum(
+                    amount
+                    for receiver, asset, amount in sends
+                    if receiver == sender and asset == self.state["nanopool_lp_id"]
+                )
+            poolFee = swapIn - assessFee(swapIn, self.state["fee_bps"])
+        rows.append(
+            [
+                position[0],
+                position[1],
+                op,
+                assetIn,
+                amountIn,
+                assetOut,
+                amountOut,
+                zap,
+                poolFee,
+                context["fee"] + txn.get("fee", 0),
+                self.state["fee_bps"],
+                self.state["meta_reserve"],
+                self.state["lp_reserve"],
+            ]
+        )
+
+    def innerTransfers(self, txn: dict):
+        """Asset transfers in the inner transaction tree of a transaction, with their sender"""
+        for innerTxn in txn.get("inner-txns", []):
+            if innerTxn["tx-type"] == "axfer":
+                yield dict(
+                    innerTxn["asset-transfer-transaction"], sender=innerTxn["sender"]
+                )
+            yield from self.innerTransfers(innerTxn)
+
+    def updateReserve(self, assetId: int, amount: int) -> None:
+        if assetId == self.state["meta_asset_id"]:
+            self.state["meta_reserve"] += amount
+        elif assetId == self.state["nanopool_lp_id"]:
+            self.state["lp_reserve"] += amount
+
+    def append(self, rows: list) -> None:
+        if not rows:
+            return
+        for i, name in enumerate(COLUMNS):
+            column = array("Q", [row[i] for row in rows])
+            if sys.byteorder == "big":
+                column.byteswap()
+            with open(self.columnPath(name), "ab") as f:
+                column.tofile(f)
+        self.state["rows"] += len(rows)
+
+    def save(self) -> None:
+        """Write the state after the columns, atomically"""
+        tmp = self.statePath() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.statePath())
+
+    def columns(self) -> dict:
+        """The columns as read-only NumPy uint64 arrays, memory mapped"""
+        import numpy as np
+
+        if self.rows == 0:
+            return {name: np.zeros(0, dtype="<u8") for name in COLUMNS}
+        return {
+            name: np.memmap(
+                self.columnPath(name), dtype="<u8", mode="r", shape=(self.rows,)
+            )
+            for name in COLUMNS
+        }
@@ -0,0 +1,185 @@
+"""Arbitrage between the price of the meta asset implied by a metapool and another venue.
+
+Through the metapool and its nanopool, a nanopool asset and the meta asset trade at the
+metapool price of the nanopool LP times the nanopool value of the LP. When another venue
+(an Algofi pool of the meta asset against a nanopool asset, for example) prices the meta
+asset differently, one of two round trips starting and ending in the nanopool asset is
+profitable:
+
+    zap route:  asset -> meta on the metapool (zap, metapool swap), meta -> asset on the venue
+    burn route: asset -> meta on the venue, meta -> asset on the metapool (metapool swap, burn)
+
+The scanner keeps the state of the metapool, the nanopool and the venues current with a
+PoolStateFollower and, after every round that changed one of them, quotes both round trips
+with the exact local quotes, refresh=False, and searches the size that maximizes the profit.
+"""
+
+import time
+from typing import NamedTuple
+
+INVERSE_PHI = (5**0.5 - 1) / 2
+
+
+class Opportunity(NamedTuple):
+    """A profitable round trip, amounts in units of the nanopool asset"""
+
+    round: int
+    route: str
+    assetId: int
+    amountIn: int
+    amountOut: int
+    profit: int
+
+
+class AlgofiPoolVenue:
+    def __init__(self, pool):
+        """Constructor method for :class:`AlgofiPoolVenue`
+        Args:
+            pool: Algofi Pool of the meta asset against a nanopool asset.
+        """
+        self.pool = pool
+        self.application_id = pool.application_id
+
+    def refresh_state(self) -> None:
+        self.pool.refresh_state()
+
+    def quote(self, inTokenId: int, amount: int, outTokenId: int) -> int:
+        quote = self.pool.get_swap_exact_for_quote(inTokenId, amount)
+        if outTokenId == self.pool.asset1.asset_id:
+            return quote.asset1_delta
+        return quote.asset2_delta
+
+
+class ArbitrageScanner:
+    def __init__(self, follower, metapool, venues: dict, minProfit=None, maxShare=0.5):
+        """Constructor method for :class:`ArbitrageScanner`
+        Args:
+            follower: PoolStateFollower, the metapool and the venues are added to it.
+            metapool: MetapoolAMMClient.
+            venues: venue of the meta asset against each nanopool asset, keyed by asset ID.
+                A venue has quote(inTokenId, amount, outTokenId), and application_id and
+                refresh_state() to be followed, see AlgofiPoolVenue.
+            minProfit: smallest profit reported, per nanopool asset ID, to cover the fees.
+            maxShare: largest size searched, as a share of the nanopool reserve of the asset.
+        """
+        self.metapool = metapool
+        self.venues = venues
+        self.minProfit = minProfit or {}
+        self.maxShare = maxShare
+        self.callbacks = []
+        self.latency = 0.0
+        self.follower = follower
+        if metapool not in follower.metapools:
+            follower.follow(metapool, refreshNanopool=True)
+        for venue in venues.values():
+            if getattr(venue, "application_id", None) is not None:
+                follower.add_app(venue.application_id)
+        follower.subscribe(self.on_step)
+
+    def subscribe(self, callback) -> None:
+        """Call callback(opportunities) after each scan that found some"""
+        self.callbacks.append(callback)
+
+    def on_step(self, round: int, changed: set) -> None:
+        watched = {
+            self.metapool.metapool_application_id,
+            self.metapool.nanopool.application_id,
+        }
+        for venue in self.venues.values():
+            appId = getattr(venue, "application_id", None)
+            if appId in changed:
+                venue.refresh_state()
+                watched.add(appId)
+        if watched & changed:
+            opportunities = self.scan(round)
+            if opportunities:
+                for callback in self.callbacks:
+                    callback(opportunities)
+
+    def scan(self, round=None) -> list:
+        """Best size of each profitable round trip in the current state"""
+        start = time.perf_counter()
+        opportunities = []
+        meta = self.metapool.meta_asset_id
+        for assetId, venue in self.venues.items():
+            routes = {
+                "zap": lambda amount: venue.quote(
+                    meta, self.metaswap(assetId, amount, meta), assetId
+                ),
+                "burn": lambda amount: self.metaswap(
+                    meta, venue.quote(assetId, amount, meta), assetId
+                ),
+            }
+            for route, roundTrip in routes.items():
+                found = self.best_size(roundTrip, assetId)
+                if found is not None:
+                    amountIn, amountOut = found
+                    opportunities.append(
+                        Opportunity(
+                            round,
+                            route,
+                            assetId,
+                            amountIn,
+                            amountOut,
+                            amountOut - amountIn,
+                        )
+                    )
+        self.latency = time.perf_counter() - start
+        return opportunities
+
+    def metaswap(self, inTokenId: int, amount: int, outTokenId: int) -> int:
+        if amount <= 0:
+            return 0
+        return int(
+            self.metapool.get_metaswap_quote(
+                inTokenId, amount, outTokenId, refresh=False
+            )
+        )
+
+    def reserve(self, assetId: int) -> int:
+        nanopool = self.metapool.nanopool
+        if assetId == nanopool.asset1.asset_id:
+            return nanopool.asset1_balance
+        return nanopool.asset2_balance
+
+    def best_size(self, roundTrip, assetId: int):
+        """Size of the largest profit of a round trip, the profit is concave in the size.
+        Returns:
+            The amount in and out, None if no size makes more than the minimum profit.
+        """
+        outputs = {}
+
+        def profit(amount):
+            if amount not in outputs:
+                try:
+                    outputs[amount] = roundTrip(amount)
+                except (ValueError, ArithmeticError, RuntimeError):
+                    outputs[amount] = 0
+            return outputs[amount] - amount
+
+        low = max(getattr(self.metapool, "min_increment", 1), 1)
+        high = max(int(self.reserve(assetId) * self.maxShare), low)
+        if profit(low) <= 0:
+            return None
+        # Double the size while the profit grows, the maximum is then within [size / 2, 2 * size]
+        size = low
+        while size * 2 <= high and profit(size * 2) > profit(size):
+            size *= 2
+        a, b = max(low, size // 2), min(high, size * 2)
+        # Golden section search on the integers of [a, b], one new quote per iteration
+        c = b - int((b - a) * INVERSE_PHI)
+        d = a + int((b - a) * INVERSE_PHI)
+        while b - a > 3:
+            if profit(c) >= profit(d):
+                b, d = d, c
+                c = b - int((b - a) * INVERSE_PHI)
+            else:
+                a, c = c, d
+                d = a + int((b - a) * INVERSE_PHI)
+            if not a < c < d < b:
+                # The rounding moved the points together, place them again
+                c, d = a + (b - a) // 3, b - (b - a) // 3
+        best = max(range(a, b + 1), key=profit)
+        if profit(best) <= self.minProfit.get(assetId, 0):
+            return None
+        return best, outputs[best]
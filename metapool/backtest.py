@@ -0,0 +1,260 @@
+"""Vectorized backtest of metapool configurations against a trade tape.
+
+A tape is replayed through the constant product of the metapool, with the fee assessed by
+assessFee, for many parameter sets at once: every configuration is one lane of NumPy arrays
+and the trades are applied in order, so the cost of a trade does not depend on the number of
+configurations. The lanes are int64 and the contract integer rounding (floor of the fee
+and of k // reserve) is reproduced exactly for trades below 2^63 / 10^4: the quotient is
+estimated in float64, then corrected by the remainder k - q * reserve, which the wrapping
+int64 products compute exactly as it is small. Like the uint64 * of the contract, a trade
+fails when k = given * other reaches 2^64. Far from the limit the float64 product decides,
+near it the wrapping int64 product, which is negative just below 2^64 and small just above.
+
+The nanopool legs (zap of a nanopool asset in, burn to a nanopool asset out) are modelled as
+a pool deep enough not to move with the metapool flow, at a fixed LP rate and with the swap
+fee charged on half of the amount, see nanopoolLegs. They only depend on the tape, so they
+are converted once for the whole tape before the replay.
+"""
+
+from typing import NamedTuple
+import numpy as np
+from .analyticsStore import SWAP_OPERATIONS
+from .metapoolMath import FEE_DENOMINATOR
+
+# Bounds of the float64 estimate of k around 2^64, between them the wrapping product decides
+K_LIMIT_LOW = 2.0**64 * (1 - 2.0**-40)
+K_LIMIT_HIGH = 2.0**64 * (1 + 2.0**-40)
+
+
+class Tape(NamedTuple):
+    """Trades at the metapool level, in order.
+
+    metaIn: True for a meta asset input (nanopool LP out), False for a nanopool LP input.
+    amount: input amount, meta asset or nanopool LP.
+    minAmountOut: minimum output, nanopool LP or meta asset, the trade fails below it.
+    """
+
+    metaIn: np.ndarray
+    amount: np.ndarray
+    minAmountOut: np.ndarray
+
+
+class BacktestResult(NamedTuple):
+    """Outcome of each configuration, indexed like the parameter arrays.
+
+    metaReserve, lpReserve: reserves at the end of the tape.
+    metaFees, lpFees: swap fees kept by the pool, in meta asset and in nanopool LP.
+    feeIncome: both fees valued in meta asset at the final pool price.
+    failed: number of trades rejected (output below the minimum or zero, k overflow).
+    impermanentLoss: loss of the pool against holding the initial reserves, fees excluded.
+    netReturn: value of the pool against holding the initial reserves, fees included.
+    pathIndex: index of the trades after which the reserves were recorded.
+    metaPath, lpPath: reserves after these trades, one row per record.
+    """
+
+    metaReserve: np.ndarray
+    lpReserve: np.ndarray
+    metaFees: np.ndarray
+    lpFees: np.ndarray
+    feeIncome: np.ndarray
+    failed: np.ndarray
+    impermanentLoss: np.ndarray
+    netReturn: np.ndarray
+    pathIndex: np.ndarray
+    metaPath: np.ndarray
+    lpPath: np.ndarray
+
+
+def nanopoolLegs(amount, lpPerAsset: float, nanopoolFeeBps: int, zap=True):
+    """Convert nanopool asset amounts to nanopool LP (zap), or nanopool LP to asset (burn).
+
+    The zap swaps about half of the input to the other asset of the pair and the burn swaps
+    about half of the withdrawn assets, so the nanopool fee is charged on half the amount.
+    Args:
+        amount: amounts of nanopool asset to zap, or of nanopool LP to burn.
+        lpPerAsset: nanopool LP per unit of nanopool asset, lp circulation / total reserves.
+        nanopoolFeeBps: swap fee of the nanopool.
+        zap: convert assets to LP if True, LP to assets otherwise.
+    """
+    kept = 1 - nanopoolFeeBps / (2 * FEE_DENOMINATOR)
+    amount = np.asarray(amount, dtype=np.float64)
+    if zap:
+        return np.floor(amount * lpPerAsset * kept)
+    return np.floor(amount / lpPerAsset * kept)
+
+
+def syntheticTape(n: int, meanSize: float, sigma=1.0, metaInShare=0.5, seed=0) -> Tape:
+    """Random tape of lognormal trade sizes, in both directions, without minimum output.
+    Args:
+        n: number of trades.
+        meanSize: mean input amount.
+        sigma: standard deviation of the log of the sizes.
+        metaInShare: probability of a meta asset input.
+        seed: seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    mu = np.log(meanSize) - sigma**2 / 2
+    return Tape(
+        metaIn=rng.random(n) < metaInShare,
+        amount=np.floor(rng.lognormal(mu, sigma, n)) + 1,
+        minAmountOut=np.zeros(n),
+    )
+
+
+def tapeFromColumns(
+    columns: dict,
+    metaAssetId: int,
+    nanopoolLpId: int,
+    lpPerAsset: float,
+    nanopoolFeeBps: int,
+) -> Tape:
+    """Tape of the swaps of an AnalyticsStore, the nanopool asset inputs zapped to LP.
+    The minimum outputs of the recorded calls are not stored, the trades never fail on them.
+    """
+    swaps = np.isin(columns["op"], list(SWAP_OPERATIONS))
+    assetIn = np.asarray(columns["asset_in"])[swaps]
+    amountIn = np.asarray(columns["amount_in"], dtype=np.float64)[swaps]
+    metaIn = assetIn == metaAssetId
+    zapped = ~metaIn & (assetIn != nanopoolLpId)
+    amount = np.where(
+        zapped, nanopoolLegs(amountIn, lpPerAsset, nanopoolFeeBps), amountIn
+    )
+    return Tape(metaIn=metaIn, amount=amount, minAmountOut=np.zeros(len(amount)))
+
+
+def swapBuffers(shape) -> tuple:
+    """Preallocated lanes of swapOutput, for a loop of swaps"""
+    return (
+        np.empty(shape, dtype=np.int64),
+        np.empty(shape, dtype=np.int64),
+        np.empty(shape, dtype=np.int64),
+        np.empty(shape, dtype=np.float64),
+        np.empty(shape, dtype=bool),
+        np.empty(shape, dtype=bool),
+    )
+
+
+def swapOutput(given, other, amountSubFee, buffers=None):
+    """Output other - given * other // (given + amountSubFee) of int64 lanes, as the contract.
+    Args:
+        given, other: reserves of the input and output tokens of each lane.
+        amountSubFee: input amounts net of the swap fee.
+        buffers: swapBuffers of the shape of the lanes, allocated if not given.
+    Returns:
+        The output and the mask of the lanes where k = given * other fits in uint64. The
+        output of the other lanes is meaningless, the contract rejects them. Both arrays
+        are buffers, overwritten by the next call with the same buffers.
+    """
+    if buffers is None:
+        buffers = swapBuffers(np.shape(given))
+    out, q, r, estimate, fits, negative = buffers
+    # The products of the remainder wrap around, only their difference is meaningful, and
+    # the quotient of an overflowing k is discarded
+    with np.errstate(over="ignore", invalid="ignore"):
+        np.add(given, amountSubFee, out=out)
+        # Float estimate of the quotient, within a few units
+        np.multiply(given, other, out=estimate, dtype=np.float64)
+        np.less(estimate, K_LIMIT_LOW, out=fits)
+        np.less(estimate, K_LIMIT_HIGH, out=negative)
+        np.divide(estimate, out, out=estimate, dtype=np.float64)
+        np.floor(estimate, out=estimate)
+        q[...] = estimate
+        # Exact remainder given * other - q * (given + amountSubFee), modulo 2^64
+        np.multiply(given, other, out=r)
+        # k < 2^64 near the limit when the wrapped product is negative
+        negative &= r < 0
+        fits |= negative
+        np.multiply(q, out, out=out)
+        r -= out
+        np.add(given, amountSubFee, out=out)
+        np.floor_divide(r, out, out=r)
+        q += r
+        np.subtract(other, q, out=out)
+    return out, fits
+
+
+def backtest(
+    tape: Tape, feeBps, metaReserve, lpReserve, records=1000
+) -> BacktestResult:
+    """Replay a tape through each configuration.
+    Args:
+        tape: trades to replay.
+        feeBps: swap fee of each configuration, an array or a scalar.
+        metaReserve: initial meta asset reserve of each configuration.
+        lpReserve: initial nanopool LP reserve of each configuration.
+        records: number of points of the reserve paths.
+    Returns:
+        A BacktestResult.
+    """
+    feeBps, meta, lp = np.broadcast_arrays(
+        np.asarray(feeBps, dtype=np.int64),
+        np.array(metaReserve, dtype=np.int64),
+        np.array(lpReserve, dtype=np.int64),
+    )
+    meta, lp = meta.copy(), lp.copy()
+    meta0, lp0 = meta.copy(), lp.copy()
+    feeComplement = FEE_DENOMINATOR - feeBps
+    metaFees, lpFees = np.zeros_like(meta), np.zeros_like(meta)
+    failed = np.zeros(meta.shape, dtype=np.int64)
+
+    n = len(tape.amount)
+    recordEvery = max(1, -(-n // records)) if n else 1
+    pathIndex = np.arange(recordEvery - 1, n, recordEvery)
+    metaPath = np.empty((len(pathIndex),) + meta.shape, dtype=np.int64)
+    lpPath = np.empty((len(pathIndex),) + meta.shape, dtype=np.int64)
+
+    metaIn = np.asarray(tape.metaIn, dtype=bool).tolist()
+    amounts = np.asarray(tape.amount, dtype=np.int64).tolist()
+    minAmountOut = np.maximum(np.asarray(tape.minAmountOut, dtype=np.float64), 1)
+    minAmountOut = minAmountOut.tolist()
+    # Preallocated lanes, every operation of the loop writes in place
+    amountSubFee, taken = np.empty_like(meta), np.empty_like(meta)
+    ok = np.empty(meta.shape, dtype=bool)
+    buffers = swapBuffers(meta.shape)
+    for t in range(n):
+        if metaIn[t]:
+            given, other, fees = meta, lp, metaFees
+        else:
+            given, other, fees = lp, meta, lpFees
+        amount = amounts[t]
+        # amountSubFee = assessFee(amount)
+        np.multiply(feeComplement, amount, out=amountSubFee)
+        np.floor_divide(amountSubFee, FEE_DENOMINATOR, out=amountSubFee)
+        out, fits = swapOutput(given, other, amountSubFee, buffers)
+        np.greater_equal(out, minAmountOut[t], out=ok)
+        ok &= fits
+        if ok.all():
+            given += amount
+            other -= out
+            fees += amount
+            fees -= amountSubFee
+        else:
+            # The rejected trades leave their lane unchanged
+            np.multiply(out, ok, out=out)
+            np.multiply(amountSubFee, ok, out=amountSubFee)
+            np.multiply(ok, amount, out=taken)
+            given += taken
+            other -= out
+            fees += taken
+            fees -= amountSubFee
+            failed += ~ok
+        if (t + 1) % recordEvery == 0:
+            metaPath[t // recordEvery] = meta
+            lpPath[t // recordEvery] = lp
+
+    price0, price = meta0 / lp0, meta / lp
+    ratio = price / price0
+    holdValue = meta0 + lp0 * price
+    return BacktestResult(
+        metaReserve=meta,
+        lpReserve=lp,
+        metaFees=metaFees,
+        lpFees=lpFees,
+        feeIncome=metaFees + lpFees * price,
+        failed=failed,
+        impermanentLoss=2 * np.sqrt(ratio) / (1 + ratio) - 1,
+        netReturn=(meta + lp * price) / holdValue - 1,
+        pathIndex=pathIndex,
+        metaPath=metaPath,
+        lpPath=lpPath,
+    )
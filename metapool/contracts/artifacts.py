@@ -0,0 +1,59 @@
+"""Prebuilt TEAL of the metapool contracts.
+
+The clients load the TEAL sources written here by `python -m metapool.contracts.artifacts`
+instead of importing PyTeal and building the contracts at runtime. The artifacts ship with
+the package (package_data of setup.py), a missing artifact is an error rather than a silent
+compile. Rebuild the artifacts after any change to the contracts.
+"""
+
+import os
+from importlib import import_module
+
+TEAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "teal")
+
+# artifact file name: (contract module, program)
+ARTIFACTS = {
+    "metapool_approval.teal": ("metapool.contracts.metapoolContract", "approval"),
+    "metapool_clear.teal": ("metapool.contracts.metapoolContract", "clear"),
+    "multi_metapool_approval.teal": (
+        "metapool.contracts.multiMetapoolContract",
+        "approval",
+    ),
+    "multi_metapool_clear.teal": ("metapool.contracts.multiMetapoolContract", "clear"),
+}
+
+
+def buildTeal(name: str) -> str:
+    """Compile an artifact from its PyTeal contract"""
+    from pyteal import compileTeal, MAX_TEAL_VERSION, Mode
+
+    module, program = ARTIFACTS[name]
+    return compileTeal(
+        getattr(import_module(module), program)(),
+        mode=Mode.Application,
+        version=MAX_TEAL_VERSION,
+    )
+
+
+def loadTeal(name: str) -> str:
+    """TEAL source of a prebuilt artifact"""
+    try:
+        with open(os.path.join(TEAL_DIR, name)) as f:
+            return f.read()
+    except FileNotFoundError:
+        raise RuntimeError(
+            "TEAL artifact %s not built, run `python -m metapool.contracts.artifacts`"
+            % name
+        ) from None
+
+
+def writeTeal() -> None:
+    os.makedirs(TEAL_DIR, exist_ok=True)
+    for name in ARTIFACTS:
+        teal = buildTeal(name)
+        with open(os.path.join(TEAL_DIR, name), "w") as f:
+            f.write(teal)
+
+
+if __name__ == "__main__":
+    writeTeal()
@@ -36,7 +36,7 @@ def nanoswap(asset_in, amount, asset_out) -> Expr:
                 ],  # Manager application ID in foreign apps field
                 TxnField.assets: [asset_out],  # asset to receive in foreign assets
                 TxnField.note: Itob(Global.latest_timestamp() * Int(1000000)),
-                TxnField.fee: Int(4000),  # Fee is imposed by the nanopool contract
+                TxnField.fee: NANOPOOL_CALL_FEE,  # Fee is imposed by the nanopool contract
             }
         ),
         InnerTxnBuilder.Submit(),
@@ -148,7 +148,7 @@ def nanoburn(burn_amount, desired_asset) -> Expr:
     )
 
 
-def nanozap(app_call_txn_index):
+def nanozap(app_call_txn_index, zap_amount):
     """
     Inner transaction call to the nanopool to zap the input asset by
     first calling the nanopool swap to obtain the correct ratio to
@@ -159,7 +159,7 @@ def nanozap(app_call_txn_index):
         # Swap for the second asset
         nanoswap(
             Gtxn[app_call_txn_index].assets[0],
-            Btoi(Gtxn[app_call_txn_index].application_args[1]),
+            zap_amount,
             Gtxn[app_call_txn_index].assets[2],
         ),
         # Add liquidity to the nanopool
@@ -200,7 +200,7 @@ def nanozap(app_call_txn_index):
                     1
                 ],  # Nanopool Application ID
                 TxnField.on_completion: OnComplete.NoOp,
-                TxnField.fee: Int(4000),  # Fee Imposed by nanopool contract
+                TxnField.fee: NANOPOOL_CALL_FEE,  # Fee Imposed by nanopool contract
                 TxnField.application_args: [
                     Bytes(algofi_pool_strings.pool),
                     Itob(Int(10000)),
@@ -265,6 +265,39 @@ def nanozap(app_call_txn_index):
     )
 
 
+def metapoolLPSwap(metapool_app_id, metapool_address, lp_amount, meta_asset, min_out):
+    """
+    Inner transaction call to another metapool of the same nanopool,
+    hand it the nanopool LP and swap it for its meta asset.
+    The other metapool sends the meta asset directly to the transaction sender
+    """
+    return Seq(
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(
+            {
+                # LP Asset Transfer to the other metapool
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: App.globalGet(NANOPOOL_LP_ID_KEY),
+                TxnField.asset_receiver: metapool_address,
+                TxnField.asset_amount: lp_amount,
+            }
+        ),
+        InnerTxnBuilder.Next(),
+        InnerTxnBuilder.SetFields(
+            {
+                # Other metapool call
+                TxnField.type_enum: TxnType.ApplicationCall,
+                TxnField.application_id: metapool_app_id,
+                TxnField.on_completion: OnComplete.NoOp,
+                TxnField.application_args: [OP_METASWAP_FROM_LP, Itob(min_out)],
+                TxnField.accounts: [Txn.sender()],  # meta asset receiver
+                TxnField.assets: [meta_asset, App.globalGet(NANOPOOL_LP_ID_KEY)],
+            }
+        ),
+        InnerTxnBuilder.Submit(),
+    )
+
+
 def validateAppCall(app_call_txn_index, in_swap_txn_index) -> Expr:
     """
     Validate the application call by comparing the transaction arguments to the global stored value
@@ -338,6 +371,20 @@ def event(
     )
 
 
+def methodArg(position: int) -> Expr:
+    """
+    Read the uint64 at the given position of the packed (uint64,...) ARC-4 argument tuple
+    """
+    return ExtractUint64(Txn.application_args[1], Int(8 * position))
+
+
+def abiReturn(encoded_value) -> Expr:
+    """
+    Log an ARC-4 return value, the return prefix followed by the encoded value
+    """
+    return Log(Concat(ABI_RETURN_PREFIX, encoded_value))
+
+
 def check_rekey_zero(num_transactions: int):
     return Assert(
         And(
@@ -422,6 +469,34 @@ def validateTokenReceived(transaction_index, asset_id) -> Expr:
     )
 
 
+def validatePaymentReceived(transaction_index) -> Expr:
+    return And(
+        Gtxn[transaction_index].type_enum() == TxnType.Payment,
+        Gtxn[transaction_index].sender() == Txn.sender(),
+        Gtxn[transaction_index].receiver() == Global.current_application_address(),
+        Gtxn[transaction_index].close_remainder_to() == Global.zero_address(),
+    )
+
+
+def innerFeeGuard(fee_payment_txn_index):
+    """
+    The nanopool imposes a fee on its inner app calls, which comes out of the metapool account.
+    The user group reimburses it with a payment to the metapool.
+    Returns the expressions to run at the start and at the end of the call,
+    the latter asserts that the metapool ALGO balance did not go down over the group.
+    """
+    balance_before = ScratchVar(TealType.uint64)
+    start = Seq(
+        Assert(validatePaymentReceived(fee_payment_txn_index)),
+        balance_before.store(
+            Balance(Global.current_application_address())
+            - Gtxn[fee_payment_txn_index].amount()
+        ),
+    )
+    end = Assert(Balance(Global.current_application_address()) >= balance_before.load())
+    return start, end
+
+
 @Subroutine(TealType.none)
 def mintAndSendPoolToken(receiver, amount) -> Expr:
     return Seq(
@@ -564,3 +639,40 @@ def computeOtherTokenOutputPerGivenTokenInput(
         previous_given_token_amount + amount_sub_fee
     )
     return to_send
+
+
+@Subroutine(TealType.uint64)
+def computeGivenTokenInputPerOtherTokenOutput(
+    output_amount,
+    previous_given_token_amount,
+    previous_other_token_amount,
+):
+    """
+    Smallest input for which computeOtherTokenOutputPerGivenTokenInput returns at least output_amount
+    """
+    amount_sub_fee = ScratchVar(TealType.uint64)
+    amount = ScratchVar(TealType.uint64)
+    return Seq(
+        # Smallest input after fee such that k / (given + input) <= other - output
+        amount_sub_fee.store(
+            xMulYDivZ(
+                previous_given_token_amount,
+                previous_other_token_amount,
+                previous_other_token_amount - output_amount + Int(1),
+            )
+            + Int(1)
+            - previous_given_token_amount
+        ),
+        # Smallest input such that assessFee(input) >= amount_sub_fee
+        amount.store(
+            xMulYDivZ(
+                amount_sub_fee.load(),
+                Int(10000),
+                Int(10000) - App.globalGet(FEE_BPS_KEY),
+            )
+        ),
+        If(assessFee(amount.load()) < amount_sub_fee.load()).Then(
+            amount.store(amount.load() + Int(1))
+        ),
+        Return(amount.load()),
+    )
@@ -15,7 +15,7 @@ def get_setup_program():
                 == Int(0),  # can only initialize once
                 Txn.sender() == Global.creator_address(),  # is_contract_admin
                 # Check that enough Args where passed
-                Txn.application_args.length() == Int(3),
+                Txn.application_args.length() == Int(2),
                 Txn.applications.length() == Int(2),
                 Txn.assets.length() == Int(4),
                 Balance(Global.current_application_address())
@@ -37,10 +37,11 @@ def get_setup_program():
         App.globalPut(META_ASSET_ID_KEY, Txn.assets[3]),
         optIn(Txn.assets[3]),
         # Store Pool configuration
-        App.globalPut(FEE_BPS_KEY, Btoi(Txn.application_args[1])),
-        App.globalPut(MIN_INCREMENT_KEY, Btoi(Txn.application_args[2])),
+        App.globalPut(FEE_BPS_KEY, methodArg(0)),
+        App.globalPut(MIN_INCREMENT_KEY, methodArg(1)),
         # Intitialize Pool LP token
         createPoolToken(POOL_TOKEN_DEFAULT_AMOUNT),
+        abiReturn(Itob(App.globalGet(META_LP_ID_KEY))),
         Approve(),
     )
 
@@ -53,6 +54,14 @@ token_b_holding = AssetHolding.balance(
 )
 
 
+def returnMintedPoolTokens():
+    # The pool token transfer is the last inner transaction of every add liquidity branch
+    return Seq(
+        abiReturn(Itob(InnerTxn.asset_amount())),
+        Approve(),
+    )
+
+
 def get_add_liquidity_program():
     token_a_txn_index = Int(0)
     token_b_txn_index = Int(1)
@@ -110,7 +119,7 @@ def get_add_liquidity_program():
                         * Gtxn[token_b_txn_index].asset_amount()
                     ),
                 ),
-                Approve(),
+                returnMintedPoolTokens(),
             ),
         )
         .ElseIf(
@@ -122,7 +131,7 @@ def get_add_liquidity_program():
                 token_b_before_txn.load(),
             )
         )
-        .Then(Approve())
+        .Then(returnMintedPoolTokens())
         .ElseIf(
             tryTakeAdjustedAmounts(
                 Gtxn[token_b_txn_index].asset_amount(),
@@ -132,7 +141,128 @@ def get_add_liquidity_program():
                 token_a_before_txn.load(),
             ),
         )
-        .Then(Approve())
+        .Then(returnMintedPoolTokens())
+        .Else(Reject()),
+    )
+
+
+def get_add_liquidity_single_program():
+    in_txn_index = Int(0)
+    fee_payment_txn_index = Int(1)
+    app_call_txn_index = Int(2)
+    zap_amount = methodArg(0)
+    # Part of the input (after the zap) swapped in the pool for the other token
+    swap_amount = methodArg(1)
+    meta_deposit = ScratchVar(TealType.uint64)
+    lp_deposit = ScratchVar(TealType.uint64)
+    meta_before_deposit = ScratchVar(TealType.uint64)
+    lp_before_deposit = ScratchVar(TealType.uint64)
+    swap_out = ScratchVar(TealType.uint64)
+
+    fee_guard_start, fee_guard_end = innerFeeGuard(fee_payment_txn_index)
+
+    return Seq(
+        check_self(Int(3), app_call_txn_index),
+        check_rekey_zero(3),
+        fee_guard_start,
+        Assert(
+            And(
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) > Int(0),
+                validateTokenReceived(in_txn_index, Gtxn[app_call_txn_index].assets[0]),
+                Gtxn[in_txn_index].asset_amount() >= App.globalGet(MIN_INCREMENT_KEY),
+                swap_amount > Int(0),
+            )
+        ),
+        If(Gtxn[in_txn_index].xfer_asset() == App.globalGet(META_ASSET_ID_KEY))
+        .Then(
+            Seq(
+                Assert(swap_amount < Gtxn[in_txn_index].asset_amount()),
+                meta_before_deposit.store(
+                    asset_balance(App.globalGet(META_ASSET_ID_KEY))
+                    - Gtxn[in_txn_index].asset_amount()
+                ),
+                lp_before_deposit.store(
+                    asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                ),
+                # Swap part of the meta asset for LP, the tokens stay in the pool
+                swap_out.store(
+                    computeOtherTokenOutputPerGivenTokenInput(
+                        swap_amount,
+                        meta_before_deposit.load(),
+                        lp_before_deposit.load(),
+                    )
+                ),
+                meta_deposit.store(Gtxn[in_txn_index].asset_amount() - swap_amount),
+                lp_deposit.store(swap_out.load()),
+                meta_before_deposit.store(meta_before_deposit.load() + swap_amount),
+                lp_before_deposit.store(lp_before_deposit.load() - swap_out.load()),
+            )
+        )
+        .ElseIf(
+            Or(
+                Gtxn[in_txn_index].xfer_asset()
+                == App.globalGet(NANOPOOL_ASSET_1_ID_KEY),
+                Gtxn[in_txn_index].xfer_asset()
+                == App.globalGet(NANOPOOL_ASSET_2_ID_KEY),
+            ),
+        )
+        .Then(
+            Seq(
+                lp_before_deposit.store(
+                    asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                ),
+                meta_before_deposit.store(
+                    asset_balance(App.globalGet(META_ASSET_ID_KEY))
+                ),
+                # Zap the asset to the LP token in one step
+                nanozap(app_call_txn_index, zap_amount),
+                lp_deposit.store(
+                    asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                    - lp_before_deposit.load()
+                ),
+                Assert(swap_amount < lp_deposit.load()),
+                # Swap part of the LP for meta asset, the tokens stay in the pool
+                swap_out.store(
+                    computeOtherTokenOutputPerGivenTokenInput(
+                        swap_amount,
+                        lp_before_deposit.load(),
+                        meta_before_deposit.load(),
+                    )
+                ),
+                lp_deposit.store(lp_deposit.load() - swap_amount),
+                meta_deposit.store(swap_out.load()),
+                lp_before_deposit.store(lp_before_deposit.load() + swap_amount),
+                meta_before_deposit.store(meta_before_deposit.load() - swap_out.load()),
+            )
+        )
+        .Else(Reject()),
+        Assert(
+            And(
+                meta_deposit.load() > Int(0),
+                lp_deposit.load() > Int(0),
+            )
+        ),
+        # Deposit both sides at the pool ratio after the swap, the residual is refunded
+        If(
+            tryTakeAdjustedAmounts(
+                meta_deposit.load(),
+                meta_before_deposit.load(),
+                App.globalGet(NANOPOOL_LP_ID_KEY),
+                lp_deposit.load(),
+                lp_before_deposit.load(),
+            )
+        )
+        .Then(Seq(fee_guard_end, returnMintedPoolTokens()))
+        .ElseIf(
+            tryTakeAdjustedAmounts(
+                lp_deposit.load(),
+                lp_before_deposit.load(),
+                App.globalGet(META_ASSET_ID_KEY),
+                meta_deposit.load(),
+                meta_before_deposit.load(),
+            ),
+        )
+        .Then(Seq(fee_guard_end, returnMintedPoolTokens()))
         .Else(Reject()),
     )
 
@@ -140,6 +270,7 @@ def get_add_liquidity_program():
 def get_withdraw_program():
     pool_token_txn_index = Int(0)
     app_call_txn_index = Int(1)
+    token_a_withdrawn = ScratchVar(TealType.uint64)
 
     return Seq(
         check_self(Int(2), app_call_txn_index),
@@ -164,6 +295,7 @@ def get_withdraw_program():
             Gtxn[pool_token_txn_index].asset_amount(),
             App.globalGet(POOL_TOKENS_OUTSTANDING_KEY),
         ),
+        token_a_withdrawn.store(InnerTxn.asset_amount()),
         withdrawGivenPoolToken(
             Txn.sender(),
             App.globalGet(NANOPOOL_LP_ID_KEY),
@@ -175,19 +307,106 @@ def get_withdraw_program():
             App.globalGet(POOL_TOKENS_OUTSTANDING_KEY)
             - Gtxn[pool_token_txn_index].asset_amount(),
         ),
+        abiReturn(
+            Concat(Itob(token_a_withdrawn.load()), Itob(InnerTxn.asset_amount()))
+        ),
+        Approve(),
+    )
+
+
+def get_withdraw_single_program():
+    pool_token_txn_index = Int(0)
+    fee_payment_txn_index = Int(1)
+    app_call_txn_index = Int(2)
+    min_amount_out = methodArg(0)
+    # Non zero to swap the meta asset share for nanopool LP inside the pool
+    swap_meta = methodArg(1)
+    pool_token_amount = Gtxn[pool_token_txn_index].asset_amount()
+    meta_share = ScratchVar(TealType.uint64)
+    lp_share = ScratchVar(TealType.uint64)
+    meta_withdrawn = ScratchVar(TealType.uint64)
+
+    fee_guard_start, fee_guard_end = innerFeeGuard(fee_payment_txn_index)
+
+    return Seq(
+        check_self(Int(3), app_call_txn_index),
+        check_rekey_zero(3),
+        fee_guard_start,
+        Assert(
+            And(
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) > Int(0),
+                validateTokenReceived(
+                    pool_token_txn_index, App.globalGet(META_LP_ID_KEY)
+                ),
+                Gtxn[app_call_txn_index].assets.length() == Int(4),
+            )
+        ),
+        meta_share.store(
+            xMulYDivZ(
+                asset_balance(App.globalGet(META_ASSET_ID_KEY)),
+                pool_token_amount,
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY),
+            )
+        ),
+        lp_share.store(
+            xMulYDivZ(
+                asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY)),
+                pool_token_amount,
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY),
+            )
+        ),
+        Assert(And(meta_share.load() > Int(0), lp_share.load() > Int(0))),
+        If(swap_meta)
+        .Then(
+            Seq(
+                # The meta share never leaves the pool, it buys nanopool LP from the remaining reserves
+                lp_share.store(
+                    lp_share.load()
+                    + computeOtherTokenOutputPerGivenTokenInput(
+                        meta_share.load(),
+                        asset_balance(App.globalGet(META_ASSET_ID_KEY))
+                        - meta_share.load(),
+                        asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                        - lp_share.load(),
+                    )
+                ),
+                meta_withdrawn.store(Int(0)),
+            )
+        )
+        .Else(
+            Seq(
+                sendToken(
+                    App.globalGet(META_ASSET_ID_KEY), Txn.sender(), meta_share.load()
+                ),
+                meta_withdrawn.store(meta_share.load()),
+            )
+        ),
+        App.globalPut(
+            POOL_TOKENS_OUTSTANDING_KEY,
+            App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) - pool_token_amount,
+        ),
+        # Burn the whole nanopool LP share for the desired asset
+        nanoburn(lp_share.load(), Gtxn[app_call_txn_index].assets[0]),
+        Assert(InnerTxn.asset_amount() >= min_amount_out),
+        fee_guard_end,
+        abiReturn(Concat(Itob(meta_withdrawn.load()), Itob(InnerTxn.asset_amount()))),
         Approve(),
     )
 
 
 def get_metaswap_program():
     in_swap_txn_index = Int(0)
-    app_call_txn_index = Int(1)
+    fee_payment_txn_index = Int(1)
+    app_call_txn_index = Int(2)
     token_b_before = ScratchVar(TealType.uint64)
     out_swap_amount = ScratchVar(TealType.uint64)
 
+    fee_guard_start, fee_guard_end = innerFeeGuard(fee_payment_txn_index)
+
     return Seq(
-        check_self(Int(2), app_call_txn_index),
-        check_rekey_zero(2),
+        check_self(Int(3), app_call_txn_index),
+        check_rekey_zero(3),
+        fee_guard_start,
         Assert(
             And(
                 App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) > Int(0),
@@ -232,7 +451,7 @@ def get_metaswap_program():
             Seq(
                 token_b_before.store(asset_balance(Gtxn[app_call_txn_index].assets[3])),
                 # Zap the asset to the LP token in one step, use that amount to compute the output
-                nanozap(app_call_txn_index),
+                nanozap(app_call_txn_index, methodArg(0)),
                 out_swap_amount.store(
                     computeOtherTokenOutputPerGivenTokenInput(
                         asset_balance(Gtxn[app_call_txn_index].assets[3])
@@ -256,6 +475,212 @@ def get_metaswap_program():
             ),
         )
         .Else(Reject()),
+        fee_guard_end,
+        # Both routes end by sending the output asset to the user
+        abiReturn(Itob(InnerTxn.asset_amount())),
+        Approve(),
+    )
+
+
+def get_metaswap_exact_out_program():
+    in_swap_txn_index = Int(0)
+    fee_payment_txn_index = Int(1)
+    app_call_txn_index = Int(2)
+    amount_out = methodArg(0)
+    # LP amount to burn for the meta asset input, zap amount for the nanopool asset input
+    route_amount = methodArg(1)
+    token_b_before = ScratchVar(TealType.uint64)
+    in_swap_amount = ScratchVar(TealType.uint64)
+
+    fee_guard_start, fee_guard_end = innerFeeGuard(fee_payment_txn_index)
+
+    return Seq(
+        check_self(Int(3), app_call_txn_index),
+        check_rekey_zero(3),
+        fee_guard_start,
+        Assert(
+            And(
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) > Int(0),
+                validateTokenReceived(
+                    in_swap_txn_index, Gtxn[app_call_txn_index].assets[0]
+                ),
+                amount_out > Int(0),
+            ),
+        ),
+        token_b_before.store(asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))),
+        If(Gtxn[in_swap_txn_index].xfer_asset() == App.globalGet(META_ASSET_ID_KEY))
+        .Then(
+            Seq(
+                Assert(
+                    And(
+                        route_amount > Int(0),
+                        route_amount < token_b_before.load(),
+                    ),
+                ),
+                # Compute how much meta asset the LP costs, the transfer is the max input
+                in_swap_amount.store(
+                    computeGivenTokenInputPerOtherTokenOutput(
+                        route_amount,
+                        asset_balance(App.globalGet(META_ASSET_ID_KEY))
+                        - Gtxn[in_swap_txn_index].asset_amount(),
+                        token_b_before.load(),
+                    ),
+                ),
+                Assert(in_swap_amount.load() <= Gtxn[in_swap_txn_index].asset_amount()),
+                returnRemainder(
+                    App.globalGet(META_ASSET_ID_KEY),
+                    Gtxn[in_swap_txn_index].asset_amount(),
+                    in_swap_amount.load(),
+                ),
+                # Burn the nanopool LP for the desired asset
+                nanoburn(route_amount, Gtxn[app_call_txn_index].assets[1]),
+                Assert(InnerTxn.asset_amount() >= amount_out),
+            ),
+        )
+        .ElseIf(
+            Or(
+                Gtxn[in_swap_txn_index].xfer_asset()
+                == App.globalGet(NANOPOOL_ASSET_1_ID_KEY),
+                Gtxn[in_swap_txn_index].xfer_asset()
+                == App.globalGet(NANOPOOL_ASSET_2_ID_KEY),
+            ),
+        )
+        .Then(
+            Seq(
+                Assert(amount_out < asset_balance(App.globalGet(META_ASSET_ID_KEY))),
+                # Zap the whole input, the unused part is refunded as nanopool LP
+                nanozap(app_call_txn_index, route_amount),
+                in_swap_amount.store(
+                    computeGivenTokenInputPerOtherTokenOutput(
+                        amount_out,
+                        token_b_before.load(),
+                        asset_balance(App.globalGet(META_ASSET_ID_KEY)),
+                    ),
+                ),
+                Assert(
+                    in_swap_amount.load()
+                    <= asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                    - token_b_before.load()
+                ),
+                returnRemainder(
+                    App.globalGet(NANOPOOL_LP_ID_KEY),
+                    asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                    - token_b_before.load(),
+                    in_swap_amount.load(),
+                ),
+                sendToken(
+                    App.globalGet(META_ASSET_ID_KEY),
+                    Txn.sender(),
+                    amount_out,
+                ),
+            ),
+        )
+        .Else(Reject()),
+        fee_guard_end,
+        # Both routes end by sending the output asset to the user
+        abiReturn(Itob(InnerTxn.asset_amount())),
+        Approve(),
+    )
+
+
+def get_metaswap_from_lp_program():
+    in_lp_txn_index = Int(0)
+    app_call_txn_index = Int(1)
+    lp_before = ScratchVar(TealType.uint64)
+    out_swap_amount = ScratchVar(TealType.uint64)
+
+    return Seq(
+        check_self(Int(2), app_call_txn_index),
+        check_rekey_zero(2),
+        Assert(
+            And(
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) > Int(0),
+                validateTokenReceived(
+                    in_lp_txn_index, App.globalGet(NANOPOOL_LP_ID_KEY)
+                ),
+                Txn.accounts.length() == Int(1),
+            ),
+        ),
+        lp_before.store(
+            asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+            - Gtxn[in_lp_txn_index].asset_amount()
+        ),
+        out_swap_amount.store(
+            computeOtherTokenOutputPerGivenTokenInput(
+                Gtxn[in_lp_txn_index].asset_amount(),
+                lp_before.load(),
+                asset_balance(App.globalGet(META_ASSET_ID_KEY)),
+            ),
+        ),
+        Assert(
+            And(
+                out_swap_amount.load() > Int(0),
+                out_swap_amount.load()
+                < asset_balance(App.globalGet(META_ASSET_ID_KEY)),
+                out_swap_amount.load() >= methodArg(0),  # min amount out
+            ),
+        ),
+        # The meta asset goes to the first account, the user or the caller of a sibling metapool
+        sendToken(
+            App.globalGet(META_ASSET_ID_KEY), Txn.accounts[1], out_swap_amount.load()
+        ),
+        abiReturn(Itob(out_swap_amount.load())),
+        Approve(),
+    )
+
+
+def get_metaswap_to_meta_program():
+    in_swap_txn_index = Int(0)
+    app_call_txn_index = Int(1)
+    other_metapool_address = AppParam.address(Txn.applications[1])
+    other_metapool_lp_id = App.globalGetEx(Txn.applications[1], NANOPOOL_LP_ID_KEY)
+    out_swap_amount = ScratchVar(TealType.uint64)
+
+    return Seq(
+        check_self(Int(2), app_call_txn_index),
+        check_rekey_zero(2),
+        other_metapool_address,
+        other_metapool_lp_id,
+        Assert(
+            And(
+                App.globalGet(POOL_TOKENS_OUTSTANDING_KEY) > Int(0),
+                validateTokenReceived(
+                    in_swap_txn_index, App.globalGet(META_ASSET_ID_KEY)
+                ),
+                Txn.applications.length() == Int(1),
+                Txn.assets.length() == Int(3),
+                other_metapool_address.hasValue(),
+                # The other metapool must trade against the same nanopool LP
+                other_metapool_lp_id.hasValue(),
+                other_metapool_lp_id.value() == App.globalGet(NANOPOOL_LP_ID_KEY),
+            ),
+        ),
+        # Compute how many LP asset to swap for
+        out_swap_amount.store(
+            computeOtherTokenOutputPerGivenTokenInput(
+                Gtxn[in_swap_txn_index].asset_amount(),
+                asset_balance(App.globalGet(META_ASSET_ID_KEY))
+                - Gtxn[in_swap_txn_index].asset_amount(),
+                asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY)),
+            ),
+        ),
+        Assert(
+            And(
+                out_swap_amount.load() > Int(0),
+                out_swap_amount.load()
+                < asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY)),
+            ),
+        ),
+        # Hand the LP to the other metapool without going through the nanopool
+        metapoolLPSwap(
+            Txn.applications[1],
+            other_metapool_address.value(),
+            out_swap_amount.load(),
+            Txn.assets[2],
+            methodArg(0),
+        ),
+        # Relay the return value of the other metapool
+        Log(InnerTxn.last_log()),
         Approve(),
     )
 
@@ -292,6 +717,11 @@ def approval():
     on_setup = get_setup_program()
     on_supply = get_add_liquidity_program()
     on_withdraw = get_withdraw_program()
+    on_swap_from_lp = get_metaswap_from_lp_program()
+    on_swap_to_meta = get_metaswap_to_meta_program()
+    on_swap_exact_out = get_metaswap_exact_out_program()
+    on_supply_single = get_add_liquidity_single_program()
+    on_withdraw_single = get_withdraw_single_program()
     on_call_method = Txn.application_args[0]
     on_call = Seq(
         Cond(
@@ -299,6 +729,11 @@ def approval():
             [on_call_method == OP_ADD_LIQUIDITY, on_supply],
             [on_call_method == OP_WITHDRAW, on_withdraw],
             [on_call_method == OP_SET_METAPOOL, on_setup],
+            [on_call_method == OP_METASWAP_FROM_LP, on_swap_from_lp],
+            [on_call_method == OP_METASWAP_TO_META, on_swap_to_meta],
+            [on_call_method == OP_METASWAP_EXACT_OUT, on_swap_exact_out],
+            [on_call_method == OP_ADD_LIQUIDITY_SINGLE, on_supply_single],
+            [on_call_method == OP_WITHDRAW_SINGLE, on_withdraw_single],
         ),
         Reject(),
     )
@@ -0,0 +1,556 @@
+"""
+Multi-asset metapool: several meta assets traded against the same nanopool LP in one app.
+Every meta asset lives in a slot with its own reserves, pool token and outstanding pool tokens.
+The nanopool opt-ins, configuration and ALGO fee balance are shared by all the slots.
+The nanopool LP held by the app is split between the slots, each slot tracks its own LP reserve.
+"""
+
+from pyteal import *
+from metapool.contracts.poolKeys import *
+from metapool.contracts.functions import *
+
+
+def slotKey(key, slot) -> Expr:
+    """Global state key of a meta asset slot, the key prefix followed by the slot index"""
+    return Concat(key, Itob(slot))
+
+
+def slotGet(key, slot) -> Expr:
+    return App.globalGet(slotKey(key, slot))
+
+
+def slotPut(key, slot, value) -> Expr:
+    return App.globalPut(slotKey(key, slot), value)
+
+
+def validSlot(slot) -> Expr:
+    return slot < App.globalGet(META_COUNT_KEY)
+
+
+def get_setup_program():
+    nanopool_address = AppParam.address(
+        Int(1)
+    )  # Address of the 1st foreign app, maybevalue
+    return Seq(
+        nanopool_address,
+        Assert(
+            And(
+                App.globalGet(NANOPOOL_APP_ID_KEY)
+                == Int(0),  # can only initialize once
+                Txn.sender() == Global.creator_address(),  # is_contract_admin
+                Txn.application_args.length() == Int(2),
+                Txn.applications.length() == Int(2),
+                Txn.assets.length() == Int(3),
+                Balance(Global.current_application_address())
+                >= Global.min_balance() * Int(4),  # Check that the contract is funded
+                nanopool_address.hasValue(),  # maybevalue
+            ),
+        ),
+        # Store relevant nanopool application info in global variables
+        App.globalPut(NANOPOOL_APP_ID_KEY, Txn.applications[1]),
+        App.globalPut(NANOPOOL_MANAGER_ID_KEY, Txn.applications[2]),
+        App.globalPut(NANOPOOL_ADDRESS_KEY, nanopool_address.value()),
+        # Opt in to the nanopool assets once for all the meta assets
+        App.globalPut(NANOPOOL_ASSET_1_ID_KEY, Txn.assets[0]),
+        optIn(Txn.assets[0]),
+        App.globalPut(NANOPOOL_ASSET_2_ID_KEY, Txn.assets[1]),
+        optIn(Txn.assets[1]),
+        App.globalPut(NANOPOOL_LP_ID_KEY, Txn.assets[2]),
+        optIn(Txn.assets[2]),
+        # Store Pool configuration, shared by all the meta assets
+        App.globalPut(FEE_BPS_KEY, methodArg(0)),
+        App.globalPut(MIN_INCREMENT_KEY, methodArg(1)),
+        Approve(),
+    )
+
+
+def get_register_meta_program():
+    slot = App.globalGet(META_COUNT_KEY)
+    meta_asset = Txn.assets[0]
+    i = ScratchVar(TealType.uint64)
+
+    return Seq(
+        Assert(
+            And(
+                App.globalGet(NANOPOOL_APP_ID_KEY) != Int(0),  # setup first
+                Txn.sender() == Global.creator_address(),  # is_contract_admin
+                Txn.assets.length() == Int(1),
+                slot < MAX_META_ASSETS,
+                meta_asset != App.globalGet(NANOPOOL_ASSET_1_ID_KEY),
+                meta_asset != App.globalGet(NANOPOOL_ASSET_2_ID_KEY),
+                meta_asset != App.globalGet(NANOPOOL_LP_ID_KEY),
+                # Min balance of the shared opt-ins and of every slot meta asset and pool token
+                Balance(Global.current_application_address())
+                >= Global.min_balance() * (Int(6) + Int(2) * slot),
+            ),
+        ),
+        # The meta asset reserve is the app balance, a meta asset can only have one slot
+        For(i.store(Int(0)), i.load() < slot, i.store(i.load() + Int(1))).Do(
+            Assert(slotGet(META_ASSET_ID_KEY, i.load()) != meta_asset)
+        ),
+        optIn(meta_asset),
+        slotPut(META_ASSET_ID_KEY, slot, meta_asset),
+        slotPut(POOL_TOKENS_OUTSTANDING_KEY, slot, Int(0)),
+        slotPut(LP_RESERVE_KEY, slot, Int(0)),
+        # Intitialize the slot pool token
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(
+            {
+                TxnField.type_enum: TxnType.AssetConfig,
+                TxnField.config_asset_total: POOL_TOKEN_DEFAULT_AMOUNT,
+                TxnField.config_asset_default_frozen: Int(0),
+                TxnField.config_asset_decimals: Int(0),
+                TxnField.config_asset_reserve: Global.current_application_address(),
+            }
+        ),
+        InnerTxnBuilder.Submit(),
+        slotPut(META_LP_ID_KEY, slot, InnerTxn.created_asset_id()),
+        abiReturn(Concat(Itob(slot), Itob(InnerTxn.created_asset_id()))),
+        App.globalPut(META_COUNT_KEY, slot + Int(1)),
+        Approve(),
+    )
+
+
+def get_add_liquidity_program():
+    token_a_txn_index = Int(0)
+    token_b_txn_index = Int(1)
+    app_call_txn_index = Int(2)
+    slot = methodArg(0)
+    token_a_amount = Gtxn[token_a_txn_index].asset_amount()
+    token_b_amount = Gtxn[token_b_txn_index].asset_amount()
+
+    token_a_before_txn = ScratchVar(TealType.uint64)
+    token_b_before_txn = ScratchVar(TealType.uint64)
+    token_a_kept = ScratchVar(TealType.uint64)
+    token_b_kept = ScratchVar(TealType.uint64)
+    minted = ScratchVar(TealType.uint64)
+
+    return Seq(
+        check_self(Int(3), app_call_txn_index),
+        check_rekey_zero(3),
+        Assert(
+            And(
+                validSlot(slot),
+                validateTokenReceived(
+                    token_a_txn_index, slotGet(META_ASSET_ID_KEY, slot)
+                ),
+                validateTokenReceived(
+                    token_b_txn_index, App.globalGet(NANOPOOL_LP_ID_KEY)
+                ),
+                token_a_amount >= App.globalGet(MIN_INCREMENT_KEY),
+                token_b_amount >= App.globalGet(MIN_INCREMENT_KEY),
+            )
+        ),
+        token_a_before_txn.store(
+            asset_balance(slotGet(META_ASSET_ID_KEY, slot)) - token_a_amount
+        ),
+        token_b_before_txn.store(slotGet(LP_RESERVE_KEY, slot)),
+        If(
+            Or(
+                token_a_before_txn.load() == Int(0),
+                token_b_before_txn.load() == Int(0),
+            )
+        )
+        .Then(
+            # no liquidity yet, take everything
+            Seq(
+                token_a_kept.store(token_a_amount),
+                token_b_kept.store(token_b_amount),
+                minted.store(Sqrt(token_a_amount * token_b_amount)),
+            )
+        )
+        .ElseIf(
+            xMulYDivZ(
+                token_a_amount, token_b_before_txn.load(), token_a_before_txn.load()
+            )
+            <= token_b_amount
+        )
+        .Then(
+            # keep all of the meta asset and the corresponding nanopool LP
+            Seq(
+                token_a_kept.store(token_a_amount),
+                token_b_kept.store(
+                    xMulYDivZ(
+                        token_a_amount,
+                        token_b_before_txn.load(),
+                        token_a_before_txn.load(),
+                    )
+                ),
+                minted.store(
+                    xMulYDivZ(
+                        slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot),
+                        token_a_amount,
+                        token_a_before_txn.load(),
+                    )
+                ),
+            )
+        )
+        .Else(
+            # keep all of the nanopool LP and the corresponding meta asset
+            Seq(
+                token_b_kept.store(token_b_amount),
+                token_a_kept.store(
+                    xMulYDivZ(
+                        token_b_amount,
+                        token_a_before_txn.load(),
+                        token_b_before_txn.load(),
+                    )
+                ),
+                minted.store(
+                    xMulYDivZ(
+                        slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot),
+                        token_b_amount,
+                        token_b_before_txn.load(),
+                    )
+                ),
+            )
+        ),
+        Assert(
+            And(
+                token_a_kept.load() > Int(0),
+                token_a_kept.load() <= token_a_amount,
+                token_b_kept.load() > Int(0),
+                minted.load() > Int(0),
+            )
+        ),
+        returnRemainder(
+            slotGet(META_ASSET_ID_KEY, slot), token_a_amount, token_a_kept.load()
+        ),
+        returnRemainder(
+            App.globalGet(NANOPOOL_LP_ID_KEY), token_b_amount, token_b_kept.load()
+        ),
+        slotPut(
+            LP_RESERVE_KEY, slot, slotGet(LP_RESERVE_KEY, slot) + token_b_kept.load()
+        ),
+        slotPut(
+            POOL_TOKENS_OUTSTANDING_KEY,
+            slot,
+            slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot) + minted.load(),
+        ),
+        sendToken(slotGet(META_LP_ID_KEY, slot), Txn.sender(), minted.load()),
+        abiReturn(Itob(minted.load())),
+        Approve(),
+    )
+
+
+def get_withdraw_program():
+    pool_token_txn_index = Int(0)
+    app_call_txn_index = Int(1)
+    slot = methodArg(0)
+    pool_token_amount = Gtxn[pool_token_txn_index].asset_amount()
+    token_a_withdrawn = ScratchVar(TealType.uint64)
+    token_b_withdrawn = ScratchVar(TealType.uint64)
+
+    return Seq(
+        check_self(Int(2), app_call_txn_index),
+        check_rekey_zero(2),
+        Assert(
+            And(
+                validSlot(slot),
+                validateTokenReceived(
+                    pool_token_txn_index, slotGet(META_LP_ID_KEY, slot)
+                ),
+            )
+        ),
+        token_a_withdrawn.store(
+            xMulYDivZ(
+                asset_balance(slotGet(META_ASSET_ID_KEY, slot)),
+                pool_token_amount,
+                slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot),
+            )
+        ),
+        token_b_withdrawn.store(
+            xMulYDivZ(
+                slotGet(LP_RESERVE_KEY, slot),
+                pool_token_amount,
+                slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot),
+            )
+        ),
+        Assert(
+            And(
+                token_a_withdrawn.load() > Int(0),
+                token_b_withdrawn.load() > Int(0),
+            )
+        ),
+        sendToken(
+            slotGet(META_ASSET_ID_KEY, slot), Txn.sender(), token_a_withdrawn.load()
+        ),
+        sendToken(
+            App.globalGet(NANOPOOL_LP_ID_KEY), Txn.sender(), token_b_withdrawn.load()
+        ),
+        slotPut(
+            LP_RESERVE_KEY,
+            slot,
+            slotGet(LP_RESERVE_KEY, slot) - token_b_withdrawn.load(),
+        ),
+        slotPut(
+            POOL_TOKENS_OUTSTANDING_KEY,
+            slot,
+            slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot) - pool_token_amount,
+        ),
+        abiReturn(
+            Concat(Itob(token_a_withdrawn.load()), Itob(token_b_withdrawn.load()))
+        ),
+        Approve(),
+    )
+
+
+def get_metaswap_program():
+    in_swap_txn_index = Int(0)
+    fee_payment_txn_index = Int(1)
+    app_call_txn_index = Int(2)
+    slot = methodArg(0)
+    zap_amount = methodArg(1)
+    in_swap_amount = Gtxn[in_swap_txn_index].asset_amount()
+    lp_before = ScratchVar(TealType.uint64)
+    out_swap_amount = ScratchVar(TealType.uint64)
+
+    fee_guard_start, fee_guard_end = innerFeeGuard(fee_payment_txn_index)
+
+    return Seq(
+        check_self(Int(3), app_call_txn_index),
+        check_rekey_zero(3),
+        fee_guard_start,
+        Assert(
+            And(
+                validSlot(slot),
+                slotGet(POOL_TOKENS_OUTSTANDING_KEY, slot) > Int(0),
+                validateTokenReceived(
+                    in_swap_txn_index, Gtxn[app_call_txn_index].assets[0]
+                ),
+            ),
+        ),
+        If(Gtxn[in_swap_txn_index].xfer_asset() == slotGet(META_ASSET_ID_KEY, slot))
+        .Then(
+            Seq(
+                # Compute how many LP asset to swap for
+                out_swap_amount.store(
+                    computeOtherTokenOutputPerGivenTokenInput(
+                        in_swap_amount,
+                        asset_balance(slotGet(META_ASSET_ID_KEY, slot))
+                        - in_swap_amount,
+                        slotGet(LP_RESERVE_KEY, slot),
+                    ),
+                ),
+                Assert(
+                    And(
+                        out_swap_amount.load() > Int(0),
+                        out_swap_amount.load() < slotGet(LP_RESERVE_KEY, slot),
+                    ),
+                ),
+                slotPut(
+                    LP_RESERVE_KEY,
+                    slot,
+                    slotGet(LP_RESERVE_KEY, slot) - out_swap_amount.load(),
+                ),
+                # Burn the nanopool LP for the desired asset
+                nanoburn(out_swap_amount.load(), Gtxn[app_call_txn_index].assets[1]),
+            ),
+        )
+        .ElseIf(
+            Or(
+                Gtxn[in_swap_txn_index].xfer_asset()
+                == App.globalGet(NANOPOOL_ASSET_1_ID_KEY),
+                Gtxn[in_swap_txn_index].xfer_asset()
+                == App.globalGet(NANOPOOL_ASSET_2_ID_KEY),
+            ),
+        )
+        .Then(
+            Seq(
+                # The zap reads the nanopool from the foreign arrays
+                Assert(
+                    And(
+                        Txn.applications[1] == App.globalGet(NANOPOOL_APP_ID_KEY),
+                        Txn.applications[2] == App.globalGet(NANOPOOL_MANAGER_ID_KEY),
+                        Txn.accounts[1] == App.globalGet(NANOPOOL_ADDRESS_KEY),
+                        Txn.assets[3] == App.globalGet(NANOPOOL_LP_ID_KEY),
+                    )
+                ),
+                lp_before.store(asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))),
+                # Zap the asset to the LP token in one step, use that amount to compute the output
+                nanozap(app_call_txn_index, zap_amount),
+                out_swap_amount.store(
+                    computeOtherTokenOutputPerGivenTokenInput(
+                        asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                        - lp_before.load(),
+                        slotGet(LP_RESERVE_KEY, slot),
+                        asset_balance(slotGet(META_ASSET_ID_KEY, slot)),
+                    ),
+                ),
+                Assert(
+                    And(
+                        out_swap_amount.load() > Int(0),
+                        out_swap_amount.load()
+                        < asset_balance(slotGet(META_ASSET_ID_KEY, slot)),
+                    ),
+                ),
+                slotPut(
+                    LP_RESERVE_KEY,
+                    slot,
+                    slotGet(LP_RESERVE_KEY, slot)
+                    + asset_balance(App.globalGet(NANOPOOL_LP_ID_KEY))
+                    - lp_before.load(),
+                ),
+                sendToken(
+                    slotGet(META_ASSET_ID_KEY, slot),
+                    Txn.sender(),
+                    out_swap_amount.load(),
+                ),
+            ),
+        )
+        .Else(Reject()),
+        fee_guard_end,
+        # Both routes end by sending the output asset to the user
+        abiReturn(Itob(InnerTxn.asset_amount())),
+        Approve(),
+    )
+
+
+def get_metaswap_to_meta_program():
+    in_swap_txn_index = Int(0)
+    app_call_txn_index = Int(1)
+    from_slot = methodArg(0)
+    to_slot = methodArg(1)
+    min_amount_out = methodArg(2)
+    in_swap_amount = Gtxn[in_swap_txn_index].asset_amount()
+    lp_amount = ScratchVar(TealType.uint64)
+    out_swap_amount = ScratchVar(TealType.uint64)
+
+    return Seq(
+        check_self(Int(2), app_call_txn_index),
+        check_rekey_zero(2),
+        Assert(
+            And(
+                validSlot(from_slot),
+                validSlot(to_slot),
+                from_slot != to_slot,
+                slotGet(POOL_TOKENS_OUTSTANDING_KEY, from_slot) > Int(0),
+                slotGet(POOL_TOKENS_OUTSTANDING_KEY, to_slot) > Int(0),
+                validateTokenReceived(
+                    in_swap_txn_index, slotGet(META_ASSET_ID_KEY, from_slot)
+                ),
+            ),
+        ),
+        # Meta asset to nanopool LP in the first slot
+        lp_amount.store(
+            computeOtherTokenOutputPerGivenTokenInput(
+                in_swap_amount,
+                asset_balance(slotGet(META_ASSET_ID_KEY, from_slot)) - in_swap_amount,
+                slotGet(LP_RESERVE_KEY, from_slot),
+            ),
+        ),
+        Assert(
+            And(
+                lp_amount.load() > Int(0),
+                lp_amount.load() < slotGet(LP_RESERVE_KEY, from_slot),
+            ),
+        ),
+        # The nanopool LP stays in the app, it only changes slot
+        out_swap_amount.store(
+            computeOtherTokenOutputPerGivenTokenInput(
+                lp_amount.load(),
+                slotGet(LP_RESERVE_KEY, to_slot),
+                asset_balance(slotGet(META_ASSET_ID_KEY, to_slot)),
+            ),
+        ),
+        Assert(
+            And(
+                out_swap_amount.load() > Int(0),
+                out_swap_amount.load() >= min_amount_out,
+                out_swap_amount.load()
+                < asset_balance(slotGet(META_ASSET_ID_KEY, to_slot)),
+            ),
+        ),
+        slotPut(
+            LP_RESERVE_KEY,
+            from_slot,
+            slotGet(LP_RESERVE_KEY, from_slot) - lp_amount.load(),
+        ),
+        slotPut(
+            LP_RESERVE_KEY,
+            to_slot,
+            slotGet(LP_RESERVE_KEY, to_slot) + lp_amount.load(),
+        ),
+        sendToken(
+            slotGet(META_ASSET_ID_KEY, to_slot), Txn.sender(), out_swap_amount.load()
+        ),
+        abiReturn(Itob(out_swap_amount.load())),
+        Approve(),
+    )
+
+
+def approval():
+    # Initial Sequence
+    on_creation = Seq(
+        Assert(Txn.application_args.length() == Int(0)),
+        App.globalPut(NANOPOOL_APP_ID_KEY, Int(0)),
+        App.globalPut(NANOPOOL_MANAGER_ID_KEY, Int(0)),
+        App.globalPut(NANOPOOL_ASSET_1_ID_KEY, Int(0)),
+        App.globalPut(NANOPOOL_ASSET_2_ID_KEY, Int(0)),
+        App.globalPut(NANOPOOL_LP_ID_KEY, Int(0)),
+        App.globalPut(NANOPOOL_ADDRESS_KEY, Bytes("")),
+        App.globalPut(FEE_BPS_KEY, Int(0)),
+        App.globalPut(MIN_INCREMENT_KEY, Int(0)),
+        App.globalPut(META_COUNT_KEY, Int(0)),
+        Approve(),
+    )
+
+    is_contract_admin = Seq(
+        Assert(Txn.sender() == Global.creator_address()),
+        Approve(),
+    )
+
+    # Can only be deleted once every slot is empty
+    i = ScratchVar(TealType.uint64)
+    on_delete = Seq(
+        For(
+            i.store(Int(0)),
+            i.load() < App.globalGet(META_COUNT_KEY),
+            i.store(i.load() + Int(1)),
+        ).Do(Assert(slotGet(POOL_TOKENS_OUTSTANDING_KEY, i.load()) == Int(0))),
+        is_contract_admin,
+    )
+
+    on_setup = get_setup_program()
+    on_register = get_register_meta_program()
+    on_supply = get_add_liquidity_program()
+    on_withdraw = get_withdraw_program()
+    on_swap = get_metaswap_program()
+    on_swap_to_meta = get_metaswap_to_meta_program()
+    on_call_method = Txn.application_args[0]
+    on_call = Seq(
+        Cond(
+            [on_call_method == MULTI_OP_METASWAP, on_swap],
+            [on_call_method == MULTI_OP_ADD_LIQUIDITY, on_supply],
+            [on_call_method == MULTI_OP_WITHDRAW, on_withdraw],
+            [on_call_method == MULTI_OP_METASWAP_TO_META, on_swap_to_meta],
+            [on_call_method == MULTI_OP_REGISTER_META, on_register],
+            [on_call_method == MULTI_OP_SET_METAPOOL, on_setup],
+        ),
+        Reject(),
+    )
+
+    return event(
+        init=on_creation,
+        delete=on_delete,
+        update=is_contract_admin,
+        opt_in=Reject(),
+        close_out=Reject(),
+        no_op=on_call,
+    )
+
+
+def clear():
+    return Approve()
+
+
+if __name__ == "__main__":
+    with open("multi_metapool_approval.teal", "w") as f:
+        compiled = compileTeal(
+            approval(), mode=Mode.Application, version=MAX_TEAL_VERSION
+        )
+        f.write(compiled)
+
+    with open("clear_state.teal", "w") as f:
+        compiled = compileTeal(clear(), mode=Mode.Application, version=MAX_TEAL_VERSION)
+        f.write(compiled)
@@ -1,25 +1,5 @@
-from pyteal import Bytes, Int
-
-
-class metapool_strings:
-    nanopool_app_id = "nanopool app id"
-    nanopool_manager_id = "nanopool manager id"
-    nanopool_address = "nanopool address"
-    nanopool_asset_1_id = "nanopool asset 1 id"
-    nanopool_asset_2_id = "nanopool asset 2 id"
-    nanopool_lp_id = "nanopool lp id"
-    meta_asset_id = "meta asset id"
-    meta_lp_id = "meta lp id"
-    fee_bps = "fee bps"
-    min_increment = "min increment"
-    pool_token_outstanding = "pool tokens outstanding"
-    op_metaswap = "swap"
-    op_set_metapool = "set metapool"
-    op_add_liquidity = "add liquidity"
-    op_withdraw = "withdraw"
-    scaling_factor = 10**13
-    pool_token_default_amount = 10**13
-
+from pyteal import Bytes, Int, MethodSignature
+from metapool.contracts.poolStrings import metapool_strings, multi_metapool_strings
 
 # Contract Global variables (10 global ints, 1 global byteslice)
 NANOPOOL_APP_ID_KEY = Bytes(metapool_strings.nanopool_app_id)  # Int
@@ -34,12 +14,32 @@ FEE_BPS_KEY = Bytes(metapool_strings.fee_bps)  # Int
 MIN_INCREMENT_KEY = Bytes(metapool_strings.min_increment)  # Int
 POOL_TOKENS_OUTSTANDING_KEY = Bytes(metapool_strings.pool_token_outstanding)  # Int
 
+# Multi-asset contract global variables (8 + 4 per slot global ints, 1 global byteslice)
+META_COUNT_KEY = Bytes(multi_metapool_strings.meta_count)  # Int
+LP_RESERVE_KEY = Bytes(multi_metapool_strings.lp_reserve)  # Int, slot key prefix
+
 # Constants
 SCALING_FACTOR = Int(metapool_strings.scaling_factor)
 POOL_TOKEN_DEFAULT_AMOUNT = Int(metapool_strings.pool_token_default_amount)
+ABI_RETURN_PREFIX = Bytes("base16", metapool_strings.abi_return_prefix)
+NANOPOOL_CALL_FEE = Int(metapool_strings.nanopool_call_fee)
+MAX_META_ASSETS = Int(multi_metapool_strings.max_meta_assets)
+
+# Operations (4 bytes method selectors)
+OP_METASWAP = MethodSignature(metapool_strings.op_metaswap)
+OP_SET_METAPOOL = MethodSignature(metapool_strings.op_set_metapool)
+OP_ADD_LIQUIDITY = MethodSignature(metapool_strings.op_add_liquidity)
+OP_WITHDRAW = MethodSignature(metapool_strings.op_withdraw)
+OP_METASWAP_FROM_LP = MethodSignature(metapool_strings.op_metaswap_from_lp)
+OP_METASWAP_TO_META = MethodSignature(metapool_strings.op_metaswap_to_meta)
+OP_METASWAP_EXACT_OUT = MethodSignature(metapool_strings.op_metaswap_exact_out)
+OP_ADD_LIQUIDITY_SINGLE = MethodSignature(metapool_strings.op_add_liquidity_single)
+OP_WITHDRAW_SINGLE = MethodSignature(metapool_strings.op_withdraw_single)
 
-# Operations
-OP_METASWAP = Bytes(metapool_strings.op_metaswap)
-OP_SET_METAPOOL = Bytes(metapool_strings.op_set_metapool)
-OP_ADD_LIQUIDITY = Bytes(metapool_strings.op_add_liquidity)
-OP_WITHDRAW = Bytes(metapool_strings.op_withdraw)
+# Multi-asset contract operations
+MULTI_OP_SET_METAPOOL = MethodSignature(multi_metapool_strings.op_set_metapool)
+MULTI_OP_REGISTER_META = MethodSignature(multi_metapool_strings.op_register_meta)
+MULTI_OP_ADD_LIQUIDITY = MethodSignature(multi_metapool_strings.op_add_liquidity)
+MULTI_OP_WITHDRAW = MethodSignature(multi_metapool_strings.op_withdraw)
+MULTI_OP_METASWAP = MethodSignature(multi_metapool_strings.op_metaswap)
+MULTI_OP_METASWAP_TO_META = MethodSignature(multi_metapool_strings.op_metaswap_to_meta)
@@ -0,0 +1,43 @@
+"""Global state keys, method signatures and constants of the metapool contracts, without PyTeal"""
+
+
+class metapool_strings:
+    nanopool_app_id = "nanopool app id"
+    nanopool_manager_id = "nanopool manager id"
+    nanopool_address = "nanopool address"
+    nanopool_asset_1_id = "nanopool asset 1 id"
+    nanopool_asset_2_id = "nanopool asset 2 id"
+    nanopool_lp_id = "nanopool lp id"
+    meta_asset_id = "meta asset id"
+    meta_lp_id = "meta lp id"
+    fee_bps = "fee bps"
+    min_increment = "min increment"
+    pool_token_outstanding = "pool tokens outstanding"
+    # ARC-4 method signatures, the scalar arguments are packed in a single static tuple
+    op_metaswap = "metaswap(axfer,pay,(uint64))uint64"
+    op_set_metapool = "set_metapool(pay,(uint64,uint64))uint64"
+    op_add_liquidity = "add_liquidity(axfer,axfer)uint64"
+    op_withdraw = "withdraw(axfer)(uint64,uint64)"
+    op_metaswap_from_lp = "metaswap_from_lp(axfer,(uint64))uint64"
+    op_metaswap_to_meta = "metaswap_to_meta(axfer,(uint64))uint64"
+    op_metaswap_exact_out = "metaswap_exact_out(axfer,pay,(uint64,uint64))uint64"
+    op_add_liquidity_single = "add_liquidity_single(axfer,pay,(uint64,uint64))uint64"
+    op_withdraw_single = "withdraw_single(axfer,pay,(uint64,uint64))(uint64,uint64)"
+    abi_return_prefix = "151f7c75"
+    # Fee imposed by the nanopool contract on its app calls, reimbursed by the user group
+    nanopool_call_fee = 4000
+    scaling_factor = 10**13
+    pool_token_default_amount = 10**13
+
+
+class multi_metapool_strings:
+    # Per meta asset keys are the metapool_strings key followed by the 8 bytes slot index
+    meta_count = "meta count"
+    lp_reserve = "lp reserve"
+    max_meta_assets = 12
+    op_set_metapool = "set_metapool(pay,(uint64,uint64))void"
+    op_register_meta = "register_meta(pay)(uint64,uint64)"
+    op_add_liquidity = "add_liquidity(axfer,axfer,(uint64))uint64"
+    op_withdraw = "withdraw(axfer,(uint64))(uint64,uint64)"
+    op_metaswap = "metaswap(axfer,pay,(uint64,uint64))uint64"
+    op_metaswap_to_meta = "metaswap_to_meta(axfer,(uint64,uint64,uint64))uint64"
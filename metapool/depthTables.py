@@ -0,0 +1,169 @@
+"""Precomputed price impact curves of the metaswap routes of a metapool.
+
+Each route (meta asset to a nanopool asset, nanopool asset to the meta asset) is quoted
+exactly on a log-spaced grid of input sizes, from a small fraction to a large fraction of
+the input reserve, and the outputs stored as a table. Between two grid sizes the output is
+interpolated linearly: the metaswap output is concave in the input, so the interpolation
+never overestimates it, and both the output and the average price stay monotone. Every
+query is then a bisection over the table:
+
+    table.output(amount)          output of a trade of size amount
+    table.impact_bps(amount)      price impact of that trade, in basis points
+    table.max_size(impactBps)     largest trade with at most impactBps of impact
+
+The impact is measured against the average price of the smallest grid size. The tables are
+only valid for the state they were built from, rebuild them every round and quote exactly
+before executing a trade.
+"""
+
+from bisect import bisect_left, bisect_right
+from .metapoolMath import FEE_DENOMINATOR
+
+
+class DepthTable:
+    def __init__(self, inTokenId: int, outTokenId: int, sizes: list, outputs: list):
+        """Constructor method for :class:`DepthTable`
+        Args:
+            inTokenId: asset Id of the token swapped.
+            outTokenId: asset Id of the token received.
+            sizes: increasing input sizes of the grid.
+            outputs: exact output of each size.
+        """
+        self.inTokenId = inTokenId
+        self.outTokenId = outTokenId
+        self.sizes = []
+        self.outputs = []
+        for size, output in zip(sizes, outputs):
+            if self.sizes:
+                # Clamp the integer rounding noise: output up, average price down
+                previousSize, previousOutput = self.sizes[-1], self.outputs[-1]
+                output = max(
+                    previousOutput, min(output, previousOutput * size // previousSize)
+                )
+            elif output <= 0:
+                continue
+            self.sizes.append(size)
+            self.outputs.append(output)
+        # Average price of each grid size, decreasing, negated for bisect
+        self.prices = [output / size for size, output in zip(self.sizes, self.outputs)]
+        self.negatedPrices = [-price for price in self.prices]
+
+    @property
+    def max_amount(self) -> int:
+        """Largest size covered by the table"""
+        return self.sizes[-1] if self.sizes else 0
+
+    def output(self, amount: int) -> int:
+        """Interpolated output of a trade, never above the exact quote.
+        Args:
+            amount: input size, at most max_amount.
+        """
+        if amount > self.max_amount:
+            raise ValueError("Amount beyond the depth table, quote it exactly")
+        if amount <= 0:
+            return 0
+        i = bisect_left(self.sizes, amount)
+        if self.sizes[i] == amount:
+            return self.outputs[i]
+        if i == 0:
+            return self.outputs[0] * amount // self.sizes[0]
+        x0, x1 = self.sizes[i - 1], self.sizes[i]
+        y0, y1 = self.outputs[i - 1], self.outputs[i]
+        return y0 + (y1 - y0) * (amount - x0) // (x1 - x0)
+
+    def impact_bps(self, amount: int) -> float:
+        """Price impact of a trade in basis points, relative to the smallest grid size.
+        The interpolated output is not rounded down here, so that it is consistent with max_size.
+        """
+        if not self.sizes or amount <= self.sizes[0]:
+            return 0.0
+        if amount > self.max_amount:
+            raise ValueError("Amount beyond the depth table, quote it exactly")
+        i = bisect_left(self.sizes, amount)
+        x0, x1 = self.sizes[i - 1], self.sizes[i]
+        y0, y1 = self.outputs[i - 1], self.outputs[i]
+        price = (y0 + (y1 - y0) * (amount - x0) / (x1 - x0)) / amount
+        return (1 - price / self.prices[0]) * FEE_DENOMINATOR
+
+    def max_size(self, impactBps: float) -> int:
+        """Largest trade with a price impact of at most impactBps.
+        Returns:
+            The size, capped at max_amount when the whole table is within the impact.
+        """
+        if not self.sizes:
+            return 0
+        target = self.prices[0] * (1 - impactBps / FEE_DENOMINATOR)
+        # Number of grid sizes within the impact, the prices are decreasing
+        i = bisect_right(self.negatedPrices, -target)
+        if i == 0:
+            return 0
+        if i == len(self.sizes):
+            return self.max_amount
+        # Solve (y0 + s * (x - x0)) / x = target on the segment that crosses the target
+        x0, x1 = self.sizes[i - 1], self.sizes[i]
+        y0, y1 = self.outputs[i - 1], self.outputs[i]
+        slope = (y1 - y0) / (x1 - x0)
+        if target <= slope:
+            return x1
+        return min(x1, max(x0, int((y0 - slope * x0) / (target - slope))))
+
+
+def routes(metapool) -> list:
+    """The (inTokenId, outTokenId, input reserve) of the four metaswap routes"""
+    meta = metapool.meta_asset_id
+    asset1 = metapool.nanopool.asset1.asset_id
+    asset2 = metapool.nanopool.asset2.asset_id
+    return [
+        (meta, asset1, metapool.meta_asset_balance),
+        (meta, asset2, metapool.meta_asset_balance),
+        (asset1, meta, metapool.nanopool.asset1_balance),
+        (asset2, meta, metapool.nanopool.asset2_balance),
+    ]
+
+
+def logGrid(reserve: int, points: int, minFraction: float, maxFraction: float) -> list:
+    """Distinct integer sizes spaced evenly in log scale between two fractions of the reserve"""
+    low = max(1.0, reserve * minFraction)
+    high = max(low, reserve * maxFraction)
+    ratio = (high / low) ** (1 / max(points - 1, 1))
+    sizes = []
+    for i in range(points):
+        size = int(high) if i == points - 1 else round(low * ratio**i)
+        if not sizes or size > sizes[-1]:
+            sizes.append(size)
+    return sizes
+
+
+def buildDepthTables(
+    metapool, points=48, minFraction=1e-5, maxFraction=0.5, refresh=True
+) -> dict:
+    """Quote the metaswap routes of a metapool on a log grid of sizes.
+    Args:
+        metapool: MetapoolAMMClient.
+        points: number of sizes of the grid of each route.
+        minFraction: smallest size, as a fraction of the input reserve of the route.
+        maxFraction: largest size, as a fraction of the input reserve of the route.
+        refresh: reload the metapool and nanopool state first.
+    Returns:
+        The DepthTable of each route, keyed by (inTokenId, outTokenId).
+    """
+    if refresh:
+        metapool.refresh_state()
+        metapool.nanopool.refresh_state()
+    tables = {}
+    for inTokenId, outTokenId, reserve in routes(metapool):
+        sizes, outputs = [], []
+        for size in logGrid(reserve, points, minFraction, maxFraction):
+            try:
+                output = metapool.get_metaswap_quote(
+                    inTokenId, size, outTokenId, refresh=False
+                )
+            except (ValueError, ArithmeticError):
+                # Beyond the depth of the pools, the table stops at the previous size
+                break
+            sizes.append(size)
+            outputs.append(int(output))
+        tables[(inTokenId, outTokenId)] = DepthTable(
+            inTokenId, outTokenId, sizes, outputs
+        )
+    return tables
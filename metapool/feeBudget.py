@@ -0,0 +1,154 @@
+"""Minimum fee of the metapool app calls.
+
+With fee pooling, what the outer app call pays above the minimum fee is a credit that pays
+for the inner transactions left with the default fee, including the inner transactions the
+nanopool issues while serving the metapool inner calls. An inner transaction with an explicit
+fee (the nanopool calls) is paid by the metapool account, reimbursed by the fee payment of the
+group, and adds its surplus to the credit.
+
+A route is the list of the inner transactions of a call, in execution order, as
+(explicit fee or None, nanopool method or None) tuples. The route builders below follow the
+structure of metapool/contracts/metapoolContract.py.
+"""
+
+from base64 import b64decode
+from types import MappingProxyType
+from algosdk import constants
+from .contracts.poolStrings import metapool_strings
+
+# Inner transactions issued by the nanopool while serving each of its methods, the transfer
+# of its output. A client keeps its own copy, updated from its confirmed calls with
+# observeNanopoolInnerTxns.
+NANOPOOL_INNER_TXNS = MappingProxyType(
+    {
+        "swap": 1,
+        "burn": 1,
+        "pool": 1,
+        "redeem": 1,
+    }
+)
+
+SEND = (None, None)
+NANOSWAP = [SEND, (metapool_strings.nanopool_call_fee, "swap")]
+NANOBURN = [SEND, (None, "burn"), (None, "burn")] + NANOSWAP + [SEND]
+NANOZAP = NANOSWAP + [
+    SEND,
+    SEND,
+    (metapool_strings.nanopool_call_fee, "pool"),
+    (None, "redeem"),
+    (None, "redeem"),
+]
+# Residuals of the zap, each sent back when not zero, see MetapoolAMMClient.get_zap_residuals
+NANOZAP_RESIDUALS = [SEND, SEND]
+
+
+def addLiquidityRoute(refunds: int = 1) -> list:
+    """Refunds of the excess tokens, then the pool token transfer"""
+    return [SEND] * refunds + [SEND]
+
+
+def withdrawRoute() -> list:
+    return [SEND, SEND]
+
+
+def metaswapRoute(burn: bool, residuals: int = 2) -> list:
+    """Meta asset input burns the nanopool LP, nanopool asset input is zapped.
+    Args:
+        burn: the input is the meta asset.
+        residuals: residual transfers of the zap, 0 to 2, all of them by default.
+    """
+    if burn:
+        return NANOBURN
+    return NANOZAP + NANOZAP_RESIDUALS[:residuals] + [SEND]
+
+
+def metaswapFromLpRoute() -> list:
+    return [SEND]
+
+
+def metaswapToMetaRoute() -> list:
+    """LP transfer and call to the other metapool, which sends the meta asset"""
+    return [SEND, SEND, SEND]
+
+
+def metaswapExactOutRoute(burn: bool, refund: bool = True, residuals: int = 2) -> list:
+    if burn:
+        return [SEND] * refund + NANOBURN
+    return NANOZAP + NANOZAP_RESIDUALS[:residuals] + [SEND] * refund + [SEND]
+
+
+def addLiquiditySingleRoute(zap: bool, refund: bool = True, residuals: int = 2) -> list:
+    route = NANOZAP + NANOZAP_RESIDUALS[:residuals] if zap else []
+    return route + addLiquidityRoute(int(refund))
+
+
+def withdrawSingleRoute(swapMeta: bool) -> list:
+    return ([] if swapMeta else [SEND]) + NANOBURN
+
+
+def minimumFeeCredit(
+    route: list, minFee: int = constants.MIN_TXN_FEE, innerTxns=NANOPOOL_INNER_TXNS
+) -> int:
+    """Smallest credit for which no default fee inner transaction is paid by the metapool account.
+    innerTxns is the number of inner transactions of each nanopool method."""
+    credit, needed = 0, 0
+    for fee, method in route:
+        if fee is None:
+            default = 1
+        else:
+            default = 0
+            credit += fee - minFee
+        if method is not None:
+            default += innerTxns[method]
+        for _ in range(default):
+            if credit >= minFee:
+                credit -= minFee
+            else:
+                # Any shortfall has to be there from the start
+                needed += minFee - credit
+                credit = 0
+    return needed
+
+
+def minimumFee(
+    route: list, minFee: int = constants.MIN_TXN_FEE, innerTxns=NANOPOOL_INNER_TXNS
+) -> int:
+    """Flat fee of the outer app call: its own minimum fee plus the credit the route needs"""
+    return minFee + minimumFeeCredit(route, minFee, innerTxns)
+
+
+def nanopoolFeePayment(route: list) -> int:
+    """Explicit inner fees paid by the metapool account, reimbursed by the fee payment"""
+    return sum(fee for fee, _ in route if fee is not None)
+
+
+def observeNanopoolInnerTxns(txinfo: dict, nanopoolAppID: int, innerTxns: dict) -> None:
+    """Update innerTxns with the inner transactions of the nanopool calls of a confirmed metapool call.
+
+    Args:
+        txinfo: the confirmed transaction information of the metapool app call.
+        nanopoolAppID: application ID of the nanopool.
+        innerTxns: number of inner transactions of each nanopool method, updated in place.
+    """
+    from algofi_amm.contract_strings import algofi_pool_strings
+
+    methods = {
+        algofi_pool_strings.swap_exact_for: "swap",
+        algofi_pool_strings.burn_asset1_out: "burn",
+        algofi_pool_strings.burn_asset2_out: "burn",
+        algofi_pool_strings.pool: "pool",
+        algofi_pool_strings.redeem_pool_asset1_residual: "redeem",
+        algofi_pool_strings.redeem_pool_asset2_residual: "redeem",
+    }
+    for inner in txinfo.get("inner-txns", []):
+        txn = inner["txn"]["txn"]
+        if txn.get("type") != "appl" or txn.get("apid") != nanopoolAppID:
+            continue
+        method = methods.get(b64decode(txn["apaa"][0]).decode())
+        if method is not None:
+            innerTxns[method] = max(innerTxns[method], countInnerTxns(inner))
+
+
+def countInnerTxns(txinfo: dict) -> int:
+    """Number of inner transactions in the tree of a confirmed transaction"""
+    return sum(1 + countInnerTxns(inner) for inner in txinfo.get("inner-txns", []))
@@ -0,0 +1,239 @@
+"""Sweep of the fee_bps and min_increment settings of a metapool over a trade flow.
+
+Every (fee bps, min increment) point of a grid replays the same flow, one NumPy lane per
+point, with vectorized replicas of computeOtherTokenOutputPerGivenTokenInput for the swaps
+and tryTakeAdjustedAmounts for the deposits. A deposit is lost when either of its amounts
+is below the min increment, as add_liquidity rejects it; the swaps are not checked against
+the min increment. A swap is lost when its cost (fee and price impact against the pool
+price before the trade) is above what the trader accepts, as the trader goes elsewhere.
+The revenue of a point is the swap fees kept by the pool, its volume the value of the
+swaps it executed, and the frontier lists the points that no other point beats on both
+revenue and volume.
+
+The grid is split in chunks run on a process pool, the flow is sent once to each worker.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+import numpy as np
+from .backtest import Tape
+from .metapoolMath import FEE_DENOMINATOR
+
+# Kinds of the flow events
+SWAP_META_IN, SWAP_LP_IN, DEPOSIT = 0, 1, 2
+
+
+class Flow(NamedTuple):
+    """Events replayed through the grid, in order.
+
+    kind: SWAP_META_IN, SWAP_LP_IN or DEPOSIT.
+    amount: swap input, or meta asset amount of a deposit.
+    amountLp: nanopool LP amount of a deposit, 0 for a swap.
+    maxCostBps: highest cost the trader accepts for a swap, fee and price impact.
+    """
+
+    kind: np.ndarray
+    amount: np.ndarray
+    amountLp: np.ndarray
+    maxCostBps: np.ndarray
+
+
+class SweepResult(NamedTuple):
+    """Outcome of each grid point, values in meta asset at the pool price of the trade.
+
+    revenue: swap fees kept by the pool, valued at the final pool price.
+    volume: value of the swaps executed.
+    lostToPricing: value of the swaps whose cost was above the trader tolerance.
+    lostToMinIncrement: value of the deposits below the min increment.
+    frontier: indices of the points on the revenue and volume frontier, by volume.
+    """
+
+    feeBps: np.ndarray
+    minIncrement: np.ndarray
+    revenue: np.ndarray
+    volume: np.ndarray
+    lostToPricing: np.ndarray
+    lostToMinIncrement: np.ndarray
+    frontier: np.ndarray
+
+
+def flowFromTape(tape: Tape, maxCostBps) -> Flow:
+    """Flow of the swaps of a backtest tape, with a cost tolerance per trade or for all"""
+    n = len(tape.amount)
+    return Flow(
+        kind=np.where(tape.metaIn, SWAP_META_IN, SWAP_LP_IN),
+        amount=np.asarray(tape.amount, dtype=np.float64),
+        amountLp=np.zeros(n),
+        maxCostBps=np.broadcast_to(np.asarray(maxCostBps, dtype=np.float64), (n,)),
+    )
+
+
+def syntheticFlow(
+    n: int,
+    meanSize: float,
+    sigma=1.0,
+    toleranceBps=50.0,
+    toleranceSigma=0.5,
+    depositShare=0.0,
+    seed=0,
+) -> Flow:
+    """Random flow of lognormal sizes and lognormal cost tolerances.
+    Args:
+        n: number of events.
+        meanSize: mean input amount, in meta asset or nanopool LP.
+        sigma: standard deviation of the log of the sizes.
+        toleranceBps: median cost tolerance of the traders, the cost of their alternative.
+        toleranceSigma: standard deviation of the log of the tolerances.
+        depositShare: share of balanced deposits among the events, at a 1:1 ratio.
+        seed: seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    size = np.floor(rng.lognormal(np.log(meanSize) - sigma**2 / 2, sigma, n)) + 1
+    kind = np.where(rng.random(n) < 0.5, SWAP_META_IN, SWAP_LP_IN)
+    deposits = rng.random(n) < depositShare
+    return Flow(
+        kind=np.where(deposits, DEPOSIT, kind),
+        amount=size,
+        amountLp=np.where(deposits, size, 0),
+        maxCostBps=toleranceBps * rng.lognormal(0, toleranceSigma, n),
+    )
+
+
+def sweepLanes(
+    flow: Flow, feeBps, minIncrement, metaReserve: int, lpReserve: int
+) -> tuple:
+    """Replay the flow for each (feeBps, minIncrement) lane.
+    Returns:
+        The revenue, volume, lostToPricing and lostToMinIncrement of each lane.
+    """
+    feeComplement = FEE_DENOMINATOR - np.asarray(feeBps, dtype=np.float64)
+    minIncrement = np.asarray(minIncrement, dtype=np.float64)
+    lanes = feeComplement.shape
+    meta, lp = np.full(lanes, float(metaReserve)), np.full(lanes, float(lpReserve))
+    metaFees, lpFees = np.zeros(lanes), np.zeros(lanes)
+    volume, lostToPricing, lostToMinIncrement = (np.zeros(lanes) for _ in range(3))
+
+    kinds = np.asarray(flow.kind).tolist()
+    amounts = np.asarray(flow.amount, dtype=np.float64).tolist()
+    amountsLp = np.asarray(flow.amountLp, dtype=np.float64).tolist()
+    maxCost = (np.asarray(flow.maxCostBps, dtype=np.float64) / FEE_DENOMINATOR).tolist()
+    for t, kind in enumerate(kinds):
+        amount = amounts[t]
+        if kind == DEPOSIT:
+            amountLp = amountsLp[t]
+            # add_liquidity checks both transfers against the min increment
+            sized = (amount >= minIncrement) & (amountLp >= minIncrement)
+            # tryTakeAdjustedAmounts keeping all of the meta asset, else all of the LP
+            lpCorresponding = np.floor_divide(amount * lp, meta)
+            keepMeta = (lpCorresponding > 0) & (lpCorresponding <= amountLp)
+            metaCorresponding = np.floor_divide(amountLp * meta, lp)
+            keepLp = (metaCorresponding > 0) & (metaCorresponding <= amount)
+            taken = sized & (keepMeta | keepLp)
+            lostToMinIncrement += ~sized * (amount + amountLp * meta / lp)
+            meta += np.where(keepMeta, amount, metaCorresponding) * taken
+            lp += np.where(keepMeta, lpCorresponding, amountLp) * taken
+            continue
+
+        if kind == SWAP_META_IN:
+            given, other, fees = meta, lp, metaFees
+        else:
+            given, other, fees = lp, meta, lpFees
+        # Value of the input in meta asset at the pool price
+        value = amount if kind == SWAP_META_IN else amount * meta / lp
+        amountSubFee = np.floor_divide(feeComplement * amount, FEE_DENOMINATOR)
+        out = other - np.floor_divide(given * other, given + amountSubFee)
+        # Cost against the pool price: 1 - out / (amount * other / given)
+        priced = out * given >= (1 - maxCost[t]) * amount * other
+        taken = priced & (out >= 1)
+        lostToPricing += ~priced * value
+        volume += taken * value
+        given += taken * amount
+        other -= taken * out
+        fees += taken * (amount - amountSubFee)
+
+    revenue = metaFees + lpFees * meta / lp
+    return revenue, volume, lostToPricing, lostToMinIncrement
+
+
+def frontier(revenue: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """Indices of the points not dominated in revenue and volume, by decreasing volume"""
+    order = np.lexsort((-revenue, -volume))
+    points, best = [], -np.inf
+    for i in order:
+        if revenue[i] > best:
+            points.append(i)
+            best = revenue[i]
+    return np.array(points, dtype=np.int64)
+
+
+# Flow of the worker processes, set once by the pool initializer
+workerFlow = None
+
+
+def setWorkerFlow(flow: Flow) -> None:
+    global workerFlow
+    workerFlow = flow
+
+
+def sweepChunk(feeBps, minIncrement, metaReserve: int, lpReserve: int) -> tuple:
+    return sweepLanes(workerFlow, feeBps, minIncrement, metaReserve, lpReserve)
+
+
+def sweep(
+    flow: Flow,
+    feeGrid,
+    minIncrementGrid,
+    metaReserve: int,
+    lpReserve: int,
+    chunkSize=64,
+    maxWorkers=None,
+) -> SweepResult:
+    """Evaluate every combination of the fee and min increment grids over a flow.
+    Args:
+        flow: Flow to replay.
+        feeGrid: fee settings to evaluate, in bps.
+        minIncrementGrid: min increment settings to evaluate.
+        metaReserve, lpReserve: initial reserves of the metapool.
+        chunkSize: grid points replayed together in one process.
+        maxWorkers: number of processes, all the cores by default, 0 to run in this process.
+    Returns:
+        A SweepResult, the points in the order of the fee grid then of the min increment grid.
+    """
+    feeBps, minIncrement = (
+        grid.ravel() for grid in np.meshgrid(feeGrid, minIncrementGrid, indexing="ij")
+    )
+    chunks = [
+        (feeBps[i : i + chunkSize], minIncrement[i : i + chunkSize])
+        for i in range(0, len(feeBps), chunkSize)
+    ]
+    if maxWorkers == 0:
+        results = [
+            sweepLanes(flow, fees, increments, metaReserve, lpReserve)
+            for fees, increments in chunks
+        ]
+    else:
+        with ProcessPoolExecutor(
+            maxWorkers or os.cpu_count(), initializer=setWorkerFlow, initargs=(flow,)
+        ) as executor:
+            results = list(
+                executor.map(
+                    sweepChunk,
+                    [fees for fees, _ in chunks],
+                    [increments for _, increments in chunks],
+                    [metaReserve] * len(chunks),
+                    [lpReserve] * len(chunks),
+                )
+            )
+    revenue, volume, lostToPricing, lostToMinIncrement = (
+        np.concatenate(column) for column in zip(*results)
+    )
+    return SweepResult(
+        feeBps=feeBps,
+        minIncrement=minIncrement,
+        revenue=revenue,
+        volume=volume,
+        lostToPricing=lostToPricing,
+        lostToMinIncrement=lostToMinIncrement,
+        frontier=frontier(revenue, volume),
+    )
@@ -1,10 +1,42 @@
-from .utils import MIN_BALANCE_REQUIREMENT, compiledContract, getPoolTokenId, Account
-from .contracts.poolKeys import metapool_strings
+from .utils import (
+    MIN_BALANCE_REQUIREMENT,
+    compiledContract,
+    getPoolTokenId,
+    encodeMethodCall,
+    decodeMethodReturn,
+    Account,
+)
+from .contracts.poolStrings import metapool_strings
+from .metapoolMath import (
+    FEE_DENOMINATOR,
+    computeOtherTokenOutputPerGivenTokenInput,
+    computeGivenTokenInputPerOtherTokenOutput,
+    computeBurnInputPerOutput,
+    computeZapInputPerLpOutput,
+    computeSingleSidedSwapAmount,
+    tryTakeAdjustedAmounts,
+    planAddLiquidity,
+    xMulYDivZ,
+)
+from .feeBudget import (
+    NANOPOOL_INNER_TXNS,
+    observeNanopoolInnerTxns,
+    minimumFee,
+    nanopoolFeePayment,
+    addLiquidityRoute,
+    addLiquiditySingleRoute,
+    withdrawRoute,
+    withdrawSingleRoute,
+    metaswapRoute,
+    metaswapExactOutRoute,
+    metaswapFromLpRoute,
+    metaswapToMetaRoute,
+)
 from algofi_amm.v0.client import AlgofiAMMClient
 from algofi_amm.v0.pool import Pool
+from algofi_amm.v0.asset import Asset
 from algofi_amm.v0.config import PoolType
 from algofi_amm.utils import (
-    int_to_bytes,
     wait_for_confirmation,
     get_application_global_state,
     get_account_balances,
@@ -13,8 +45,62 @@ from algofi_amm.utils import (
 from algosdk.future import transaction
 from algosdk.logic import get_application_address
 from algosdk.encoding import msgpack_encode
-from algosdk import constants
 from base64 import b64decode
+from enum import Enum
+from importlib import import_module
+
+# Attributes of the Algofi Pool and Asset objects that hold the clients
+CLIENT_ATTRIBUTES = ("amm_client", "algod", "indexer", "historical_indexer")
+
+
+def snapshotFields(obj) -> dict:
+    """JSON serializable copy of the attributes of an Algofi Pool or Asset.
+    The numbers and strings are copied, the enums stored by class and name, the clients and
+    the nested objects left out."""
+    fields = {}
+    for name, value in vars(obj).items():
+        if name in CLIENT_ATTRIBUTES:
+            continue
+        if isinstance(value, Enum):
+            fields[name] = {
+                "enum": "%s:%s" % (type(value).__module__, type(value).__qualname__),
+                "name": value.name,
+            }
+        elif value is None or isinstance(value, (bool, int, float, str)):
+            fields[name] = value
+    return fields
+
+
+def restoreFields(obj, fields: dict, client: AlgofiAMMClient):
+    """Set the attributes of snapshotFields on an object, and its clients from client"""
+    for name in CLIENT_ATTRIBUTES:
+        setattr(
+            obj, name, client if name == "amm_client" else getattr(client, name, None)
+        )
+    for name, value in fields.items():
+        if isinstance(value, dict):
+            module, qualname = value["enum"].split(":")
+            enum = import_module(module)
+            for attribute in qualname.split("."):
+                enum = getattr(enum, attribute)
+            value = enum[value["name"]]
+        setattr(obj, name, value)
+    return obj
+
+
+def nanopoolFromSnapshot(client: AlgofiAMMClient, snapshot: dict) -> Pool:
+    """Nanopool Pool object with all the fields of the snapshot, the quotes run on it
+    without a refresh_state. The SDK constructors of Pool and Asset query the network.
+    """
+    nanopool = restoreFields(Pool.__new__(Pool), snapshot["pool"], client)
+    nanopool.asset1 = restoreFields(Asset.__new__(Asset), snapshot["asset1"], client)
+    nanopool.asset2 = restoreFields(Asset.__new__(Asset), snapshot["asset2"], client)
+    return nanopool
+
+
+def nanopoolFeeBps(nanopool: Pool) -> int:
+    """Swap fee of the nanopool in bps, the Algofi Pool holds it as a fraction"""
+    return int(getattr(nanopool, "swap_fee", 0) * FEE_DENOMINATOR + 0.5)
 
 
 class MetapoolAMMClient:
@@ -42,6 +128,7 @@ class MetapoolAMMClient:
             self.metapool_address = get_application_address(metapoolAppID)
         self.nanopool = nanopool
         self.meta_asset_id = metaAssetID
+        self.nanopool_inner_txns = dict(NANOPOOL_INNER_TXNS)
 
     @classmethod
     def fromMetapoolId(cls, client: AlgofiAMMClient, metapoolAppID: int):
@@ -67,6 +154,42 @@ class MetapoolAMMClient:
         except KeyError:
             raise RuntimeError("Make sure the metapool app has been set up")
 
+    def to_snapshot(self) -> dict:
+        """Descriptor of the metapool and of its nanopool, JSON serializable.
+        The nanopool is stored with all the fields of its Pool and Asset objects, its state
+        included. Restore it with from_snapshot."""
+        return {
+            "metapool_application_id": self.metapool_application_id,
+            "metapool_address": self.metapool_address,
+            "metapool_lp_asset_id": self.metapool_lp_asset_id,
+            "meta_asset_id": self.meta_asset_id,
+            "nanopool": {
+                "pool": snapshotFields(self.nanopool),
+                "asset1": snapshotFields(self.nanopool.asset1),
+                "asset2": snapshotFields(self.nanopool.asset2),
+            },
+        }
+
+    @classmethod
+    def from_snapshot(cls, client: AlgofiAMMClient, snapshot: dict):
+        """Alternative constructor for class MetapoolAMMClient, without any network call.
+
+        The nanopool has the state of the snapshot. The reserves of the metapool are not
+        loaded, they are read on the first refresh_state, or by the quotes with refresh=True.
+        Args:
+            client: An Algofi AMM Client.
+            snapshot: the output of to_snapshot.
+        """
+        metapool = cls(
+            client,
+            nanopoolFromSnapshot(client, snapshot["nanopool"]),
+            snapshot["meta_asset_id"],
+        )
+        metapool.metapool_application_id = snapshot["metapool_application_id"]
+        metapool.metapool_address = snapshot["metapool_address"]
+        metapool.metapool_lp_asset_id = snapshot["metapool_lp_asset_id"]
+        return metapool
+
     def createMetapool(self, user: Account) -> int:
         """Create a new metapool amm.
         Args:
@@ -74,21 +197,7 @@ class MetapoolAMMClient:
         Returns:
             The app ID of the newly created metapool amm.
         """
-
-        global_schema = transaction.StateSchema(num_uints=10, num_byte_slices=1)
-        local_schema = transaction.StateSchema(num_uints=0, num_byte_slices=0)
-        approval_program, clear_program = compiledContract(self.client.algod)
-
-        create_txn = transaction.ApplicationCreateTxn(
-            sender=user.getAddress(),
-            sp=self.client.algod.suggested_params(),
-            on_complete=transaction.OnComplete.NoOpOC,
-            approval_program=approval_program,
-            clear_program=clear_program,
-            global_schema=global_schema,
-            local_schema=local_schema,
-            extra_pages=1,
-        )
+        create_txn = self.get_create_txn(user, self.client.algod.suggested_params())
 
         s_create_txn = create_txn.sign(user.getPrivateKey())
         # Send the transaction to the network and retrieve the txid.
@@ -103,6 +212,26 @@ class MetapoolAMMClient:
         self.metapool_address = get_application_address(self.metapool_application_id)
         return metapool_contract_id
 
+    def get_create_txn(self, user: Account, params, programs=None, note=None):
+        """App creation transaction, programs is the compiled (approval, clear) pair, compiled here when None"""
+        global_schema = transaction.StateSchema(num_uints=10, num_byte_slices=1)
+        local_schema = transaction.StateSchema(num_uints=0, num_byte_slices=0)
+        approval_program, clear_program = programs or compiledContract(
+            self.client.algod
+        )
+
+        return transaction.ApplicationCreateTxn(
+            sender=user.getAddress(),
+            sp=params,
+            on_complete=transaction.OnComplete.NoOpOC,
+            approval_program=approval_program,
+            clear_program=clear_program,
+            global_schema=global_schema,
+            local_schema=local_schema,
+            extra_pages=1,
+            note=note,
+        )
+
     def setupMetapool(self, user: Account, feeBps: int, minIncrement: int) -> int:
         """Finish setting up a metapool amm.
 
@@ -118,17 +247,35 @@ class MetapoolAMMClient:
             minIncrement: minimum quantity to add liquidity to the pool
         Return: metapool LP token id
         """
-        params = self.client.algod.suggested_params()
+        fundAppTxn, setupTxn = self.get_setup_txns(
+            user, feeBps, minIncrement, self.client.algod.suggested_params()
+        )
+        # Group Transaction
+        transaction.assign_group_id([fundAppTxn, setupTxn])
+        # Sign Transaction
+        signedFundAppTxn = fundAppTxn.sign(user.getPrivateKey())
+        signedSetupTxn = setupTxn.sign(user.getPrivateKey())
+        # Send Transaction
+        self.client.algod.send_transactions([signedFundAppTxn, signedSetupTxn])
+        # Wait for response
+        txinfo = wait_for_confirmation(self.client.algod, signedSetupTxn.get_txid())
+        # Return Pool token ID
+        metaLPID = decodeMethodReturn(metapool_strings.op_set_metapool, txinfo)
+        self.metapool_lp_asset_id = metaLPID
+        return metaLPID
+
+    def get_setup_txns(
+        self, user: Account, feeBps: int, minIncrement: int, params, extraFunding=0
+    ) -> list:
+        """Funding payment and setup call of setupMetapool, the payment also carries extraFunding."""
         fundingAmount = (
             MIN_BALANCE_REQUIREMENT
             # additional balance to create pool token and opt into assets (4)
             + 1_000 * 5
         )
-        app_args = [
-            bytes(metapool_strings.op_set_metapool, "utf-8"),
-            feeBps.to_bytes(8, "big"),
-            minIncrement.to_bytes(8, "big"),
-        ]
+        app_args = encodeMethodCall(
+            metapool_strings.op_set_metapool, [feeBps, minIncrement]
+        )
         assets = [
             self.nanopool.asset1.asset_id,
             self.nanopool.asset2.asset_id,
@@ -143,7 +290,7 @@ class MetapoolAMMClient:
         fundAppTxn = transaction.PaymentTxn(
             sender=user.getAddress(),
             receiver=self.metapool_address,
-            amt=fundingAmount,
+            amt=fundingAmount + extraFunding,
             sp=params,
         )
 
@@ -156,24 +303,56 @@ class MetapoolAMMClient:
             foreign_apps=applications,
             sp=params,
         )
-        # Group Transaction
-        transaction.assign_group_id([fundAppTxn, setupTxn])
-        # Sign Transaction
-        signedFundAppTxn = fundAppTxn.sign(user.getPrivateKey())
-        signedSetupTxn = setupTxn.sign(user.getPrivateKey())
-        # Send Transaction
-        self.client.algod.send_transactions([signedFundAppTxn, signedSetupTxn])
-        # Wait for response
-        wait_for_confirmation(self.client.algod, signedFundAppTxn.get_txid())
-        # Return Pool token ID
-        appGlobalState = get_application_global_state(
-            self.client.indexer, self.metapool_application_id
+        return [fundAppTxn, setupTxn]
+
+    def deploy_metapool(
+        self, user: Account, feeBps: int, minIncrement: int, extraFunding=0
+    ) -> list:
+        """Create, fund and set up a metapool and opt the creator in to its pool token.
+
+        Takes three groups, each sent as soon as the previous one is confirmed: the app
+        creation, the funding payment with the setup call, and the pool token opt-in.
+        The app ID and the pool token ID are only assigned on confirmation, so no step can
+        be folded into the previous group. They are read from the confirmed transactions,
+        without any indexer query.
+
+        Args:
+            user: Creator Account
+            feeBps: The basis point fee to be charged per swap
+            minIncrement: minimum quantity to add liquidity to the pool
+            extraFunding: Algos sent to the app on top of its minimum balance requirement
+        Returns:
+            The app ID and the pool token ID of the metapool.
+        """
+        params = self.client.algod.suggested_params()
+
+        createTxn = self.get_create_txn(user, params).sign(user.getPrivateKey())
+        self.client.algod.send_transaction(createTxn)
+        txinfo = wait_for_confirmation(self.client.algod, createTxn.get_txid())
+        self.metapool_application_id = txinfo["application-index"]
+        self.metapool_address = get_application_address(self.metapool_application_id)
+
+        setupTxns = self.get_setup_txns(
+            user, feeBps, minIncrement, params, extraFunding
+        )
+        transaction.assign_group_id(setupTxns)
+        signedSetupTxns = [txn.sign(user.getPrivateKey()) for txn in setupTxns]
+        self.client.algod.send_transactions(signedSetupTxns)
+        txinfo = wait_for_confirmation(self.client.algod, signedSetupTxns[1].get_txid())
+        self.metapool_lp_asset_id = decodeMethodReturn(
+            metapool_strings.op_set_metapool, txinfo
         )
-        metaLPID = appGlobalState[metapool_strings.meta_lp_id]
-        self.metapool_lp_asset_id = metaLPID
-        return metaLPID
 
-    def add_liquidity(self, user: Account, qA: int, qB: int) -> None:
+        optInTxn = transaction.AssetOptInTxn(
+            sender=user.getAddress(),
+            index=self.metapool_lp_asset_id,
+            sp=params,
+        ).sign(user.getPrivateKey())
+        self.client.algod.send_transaction(optInTxn)
+        wait_for_confirmation(self.client.algod, optInTxn.get_txid())
+        return self.metapool_application_id, self.metapool_lp_asset_id
+
+    def add_liquidity(self, user: Account, qA: int, qB: int, exact=False) -> int:
         """Supply liquidity to the pool.
         Let rA, rB denote the existing pool reserves of token A (meta asset) and token B (nanopool LP) respectively.
 
@@ -188,8 +367,14 @@ class MetapoolAMMClient:
             user: user Account
             qA: amount of meta asset to supply the pool.
             qB: amount of nanopool LP token to supply to the pool.
+            exact: send the amounts given by plan_add_liquidity(qA, qB) instead, which the pool takes
+                in full, so no refund fee is paid.
+        Returns:
+            The amount of pool token minted.
         """
         self.assertSetup()
+        if exact:
+            qA, qB, _ = self.plan_add_liquidity(qA, qB)
         params = self.client.algod.suggested_params()
 
         tokenATxn = transaction.AssetTransferTxn(
@@ -206,14 +391,14 @@ class MetapoolAMMClient:
             amt=qB,
             sp=params,
         )
-        # pay for the fee incurred by AMM for sending back the pool token
-        params.fee = constants.MIN_TXN_FEE * 3
+        # pay for the fee incurred by AMM for sending back the excess token and the pool token
+        params.fee = minimumFee(addLiquidityRoute(refunds=int(not exact)))
         params.flat_fee = True
         appCallTxn = transaction.ApplicationCallTxn(
             sender=user.getAddress(),
             index=self.metapool_application_id,
             on_complete=transaction.OnComplete.NoOpOC,
-            app_args=[bytes(metapool_strings.op_add_liquidity, "utf-8")],
+            app_args=encodeMethodCall(metapool_strings.op_add_liquidity),
             foreign_assets=[
                 self.meta_asset_id,
                 self.nanopool.lp_asset_id,
@@ -229,15 +414,173 @@ class MetapoolAMMClient:
         self.client.algod.send_transactions(
             [signedTokenATxn, signedTokenBTxn, signedAppCallTxn]
         )
-        wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_add_liquidity, txinfo)
+
+    def plan_add_liquidity(self, maxA: int, maxB: int, refresh=True):
+        """Largest deposit within maxA and maxB that the pool takes in full, with the same rounding as the contract.
+        Args:
+            maxA: maximum amount of meta asset to supply.
+            maxB: maximum amount of nanopool LP token to supply.
+            refresh: reload the metapool state first.
+        Returns:
+            The amounts of meta asset and nanopool LP to send and the expected pool tokens minted.
+        """
+        if refresh:
+            self.refresh_state()
+        qA, qB, minted = planAddLiquidity(
+            maxA,
+            maxB,
+            self.meta_asset_balance,
+            self.lp_asset_balance,
+            self.pool_tokens_outstanding,
+            self.min_increment,
+        )
+        return qA, qB, minted
+
+    def add_liquidity_single(self, user: Account, inTokenId: int, amount: int) -> int:
+        """Supply liquidity to the pool from a single asset, in one atomic group.
+        A nanopool asset is first zapped into nanopool LP by the contract. Then the contract swaps part of
+        the input for the other pool token, without it leaving the pool, and deposits both sides at the pool ratio.
+        Any residual is refunded in the same call.
+
+        Args:
+            user: user Account
+            inTokenId: asset Id of the token to supply, either the meta asset or one of the nanopool pair.
+            amount: amount to supply.
+        Returns:
+            The amount of pool token minted.
+        """
+        self.assertSetup()
+        zap_amount, swap_amount, _ = self.get_add_liquidity_single_quote(
+            inTokenId, amount
+        )
+        params = self.client.algod.suggested_params()
 
-    def withdraw(self, user: Account, poolTokenAmount: int) -> None:
+        inTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=inTokenId,
+            amt=amount,
+            sp=params,
+        )
+        zap = inTokenId != self.meta_asset_id
+        residuals = self.get_zap_residuals(inTokenId, amount, zap_amount) if zap else 0
+        route = addLiquiditySingleRoute(zap, residuals=residuals)
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        # pay for the zap, the refunds and the pool token transfer
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
+        params.flat_fee = True
+        if inTokenId == self.meta_asset_id:
+            foreign_apps = []
+            assets = [
+                self.meta_asset_id,
+                self.nanopool.lp_asset_id,
+                self.metapool_lp_asset_id,
+            ]
+            accounts = []
+        else:
+            foreign_apps = [
+                self.nanopool.application_id,
+                self.nanopool.manager_application_id,
+            ]
+            assets = self.get_swap_assets(inTokenId, self.meta_asset_id) + [
+                self.metapool_lp_asset_id
+            ]
+            accounts = [self.nanopool.address]
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                metapool_strings.op_add_liquidity_single,
+                [int(zap_amount), swap_amount],
+            ),
+            foreign_apps=foreign_apps,
+            foreign_assets=assets,
+            accounts=accounts,
+        )
+
+        transaction.assign_group_id([inTxn, feePaymentTxn, appCallTxn])
+        signedInTxn = inTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions(
+            [signedInTxn, signedFeePaymentTxn, signedAppCallTxn]
+        )
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_add_liquidity_single, txinfo)
+
+    def get_add_liquidity_single_quote(self, inTokenId: int, amount: int, refresh=True):
+        """Arguments and expected result of a single asset deposit.
+        Args:
+            inTokenId: asset Id of the token to supply, either the meta asset or one of the nanopool pair.
+            amount: amount to supply.
+            refresh: reload the metapool and nanopool state first.
+        Returns:
+            The zap amount, the amount swapped in the pool and the expected pool tokens minted.
+        """
+        if refresh:
+            self.refresh_state()
+        if inTokenId == self.meta_asset_id:
+            zap_amount = 0
+            swap_amount = computeSingleSidedSwapAmount(
+                amount, self.meta_asset_balance, self.fee_bps
+            )
+            swap_out = computeOtherTokenOutputPerGivenTokenInput(
+                swap_amount,
+                self.meta_asset_balance,
+                self.lp_asset_balance,
+                self.fee_bps,
+            )
+            meta_deposit, meta_before = amount - swap_amount, (
+                self.meta_asset_balance + swap_amount
+            )
+            lp_deposit, lp_before = swap_out, self.lp_asset_balance - swap_out
+        else:
+            self.get_swap_assets(inTokenId, self.meta_asset_id)
+            lp_amount, zap_amount = self.get_zap_output(inTokenId, amount, refresh)
+            swap_amount = computeSingleSidedSwapAmount(
+                lp_amount, self.lp_asset_balance, self.fee_bps
+            )
+            swap_out = computeOtherTokenOutputPerGivenTokenInput(
+                swap_amount,
+                self.lp_asset_balance,
+                self.meta_asset_balance,
+                self.fee_bps,
+            )
+            meta_deposit, meta_before = swap_out, self.meta_asset_balance - swap_out
+            lp_deposit, lp_before = lp_amount - swap_amount, (
+                self.lp_asset_balance + swap_amount
+            )
+        # Same branches as the contract
+        minted = tryTakeAdjustedAmounts(
+            meta_deposit,
+            meta_before,
+            lp_deposit,
+            lp_before,
+            self.pool_tokens_outstanding,
+        ) or tryTakeAdjustedAmounts(
+            lp_deposit,
+            lp_before,
+            meta_deposit,
+            meta_before,
+            self.pool_tokens_outstanding,
+        )
+        if minted is None:
+            raise ValueError("Deposit too small")
+        return zap_amount, swap_amount, minted[0]
+
+    def withdraw(self, user: Account, poolTokenAmount: int) -> list:
         """Withdraw liquidity  + rewards from the pool back to supplier.
         Supplier should receive tokenA, tokenB + fees proportional to the liquidity share in the pool they choose to withdraw.
 
         Args:
             user: user Account
             poolTokenAmount: pool token quantity.
+        Returns:
+            The withdrawn amounts of meta asset and nanopool LP token.
         """
         self.assertSetup()
         params = self.client.algod.suggested_params()
@@ -250,13 +593,13 @@ class MetapoolAMMClient:
             sp=params,
         )
         # pay for the fee incurred by AMM for sending back the tokens
-        params.fee = constants.MIN_TXN_FEE * 3
+        params.fee = minimumFee(withdrawRoute())
         params.flat_fee = True
         appCallTxn = transaction.ApplicationCallTxn(
             sender=user.getAddress(),
             index=self.metapool_application_id,
             on_complete=transaction.OnComplete.NoOpOC,
-            app_args=[bytes(metapool_strings.op_withdraw, "utf-8")],
+            app_args=encodeMethodCall(metapool_strings.op_withdraw),
             foreign_assets=[
                 self.meta_asset_id,
                 self.nanopool.lp_asset_id,
@@ -270,7 +613,107 @@ class MetapoolAMMClient:
         signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
 
         self.client.algod.send_transactions([signedPoolTokenTxn, signedAppCallTxn])
-        wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_withdraw, txinfo)
+
+    def withdraw_single(
+        self,
+        user: Account,
+        poolTokenAmount: int,
+        outTokenId: int,
+        swapMeta: bool = False,
+        minAmountOut: int = 0,
+    ) -> list:
+        """Withdraw liquidity to one nanopool asset in a single group.
+        The nanopool LP share is burned and the other asset of the pair swapped through the nanopool.
+        The meta asset share is either paid out or, with swapMeta, swapped in the pool for more nanopool LP first.
+
+        Args:
+            user: user Account
+            poolTokenAmount: pool token quantity.
+            outTokenId: asset Id of the nanopool asset to receive.
+            swapMeta: also convert the meta asset share, so that only outTokenId is received.
+            minAmountOut: minimum amount of outTokenId to receive, the call fails otherwise.
+        Returns:
+            The withdrawn amounts of meta asset and outTokenId.
+        """
+        self.assertSetup()
+        assets = self.get_swap_assets(outTokenId, self.meta_asset_id)
+        params = self.client.algod.suggested_params()
+
+        poolTokenTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=self.metapool_lp_asset_id,
+            amt=poolTokenAmount,
+            sp=params,
+        )
+        route = withdrawSingleRoute(swapMeta)
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        # pay for the meta asset transfer, the burn, the nanopool swap and the output transfer
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                metapool_strings.op_withdraw_single,
+                [minAmountOut, int(swapMeta)],
+            ),
+            foreign_apps=[
+                self.nanopool.application_id,
+                self.nanopool.manager_application_id,
+            ],
+            foreign_assets=assets,
+            accounts=[self.nanopool.address],
+        )
+
+        transaction.assign_group_id([poolTokenTxn, feePaymentTxn, appCallTxn])
+        signedPoolTokenTxn = poolTokenTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions(
+            [signedPoolTokenTxn, signedFeePaymentTxn, signedAppCallTxn]
+        )
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_withdraw_single, txinfo)
+
+    def get_withdraw_single_quote(
+        self,
+        poolTokenAmount: int,
+        outTokenId: int,
+        swapMeta: bool = False,
+        refresh=True,
+    ):
+        """Expected result of a single asset withdrawal.
+        Args:
+            poolTokenAmount: pool token quantity.
+            outTokenId: asset Id of the nanopool asset to receive.
+            swapMeta: also convert the meta asset share.
+            refresh: reload the metapool and nanopool state first.
+        Returns:
+            The expected amounts of meta asset and outTokenId.
+        """
+        if refresh:
+            self.refresh_state()
+            self.nanopool.refresh_state()
+        meta_share = xMulYDivZ(
+            self.meta_asset_balance, poolTokenAmount, self.pool_tokens_outstanding
+        )
+        lp_share = xMulYDivZ(
+            self.lp_asset_balance, poolTokenAmount, self.pool_tokens_outstanding
+        )
+        if swapMeta:
+            lp_share += computeOtherTokenOutputPerGivenTokenInput(
+                meta_share,
+                self.meta_asset_balance - meta_share,
+                self.lp_asset_balance - lp_share,
+                self.fee_bps,
+            )
+            meta_share = 0
+        return meta_share, self.get_burn_output(lp_share, outTokenId)
 
     def metaswap(self, user: Account, inTokenId: int, amount: int, outTokenId: int):
         """Swap tokenId token for the outTokenId in the pool. If the in token is the meta-asset, then the out token can be one of the nanopool assets pair.
@@ -282,10 +725,12 @@ class MetapoolAMMClient:
             inTokenId: asset Id of the token to swap, must be either meta-asset or one of the nanopool pair
             amount: amount to swap.
             outTokenId: asset if of the token to receive.
+        Returns:
+            The amount of outTokenId received.
         """
         self.assertSetup()
         params = self.client.algod.suggested_params()
-        app_args = [bytes(metapool_strings.op_metaswap, "utf-8")]
+        zap_amount = residuals = 0
         # Verify that we have the correct assets pair
         if (
             inTokenId == self.nanopool.asset1.asset_id
@@ -297,7 +742,7 @@ class MetapoolAMMClient:
             assert amount > niggle, "Swap too little"
             # For the zap operation, we calculate the amount in the client and pass it as an argument to the transaction
             zap_amount = self.get_zap_amount(inTokenId, amount)
-            app_args.append(int_to_bytes(int(zap_amount)))
+            residuals = self.get_zap_residuals(inTokenId, amount, zap_amount)
         if inTokenId == self.nanopool.asset1.asset_id:
             other_asset = self.nanopool.asset2.asset_id
         elif inTokenId == self.nanopool.asset2.asset_id:
@@ -311,6 +756,7 @@ class MetapoolAMMClient:
                 raise ValueError("Invalid Output token")
         else:
             raise ValueError("Invalid Input token")
+        app_args = encodeMethodCall(metapool_strings.op_metaswap, [int(zap_amount)])
         # Verify the user balance
         assert (
             get_account_balances(self.client.indexer, user.getAddress())[inTokenId]
@@ -326,7 +772,9 @@ class MetapoolAMMClient:
             amt=amount,
             sp=params,
         )
-        params.fee = constants.MIN_TXN_FEE * 8
+        route = metaswapRoute(burn=inTokenId == self.meta_asset_id, residuals=residuals)
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
         params.flat_fee = True
 
         appCallTxn = transaction.ApplicationNoOpTxn(
@@ -342,16 +790,402 @@ class MetapoolAMMClient:
             accounts=[self.nanopool.address],
         )
 
+        transaction.assign_group_id([inSwapTxn, feePaymentTxn, appCallTxn])
+        signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions(
+            [signedInSwapTxn, signedFeePaymentTxn, signedAppCallTxn]
+        )
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_metaswap, txinfo)
+
+    def metaswap_from_lp(
+        self, user: Account, amount: int, minAmountOut: int = 0, receiver=None
+    ) -> int:
+        """Swap nanopool LP token for the meta asset, without going through the nanopool.
+        Args:
+            user: user Account
+            amount: amount of nanopool LP token to swap.
+            minAmountOut: minimum amount of meta asset to receive, the call is rejected otherwise.
+            receiver: address receiving the meta asset, defaults to the user.
+        Returns:
+            The amount of meta asset received.
+        """
+        self.assertSetup()
+        params = self.client.algod.suggested_params()
+
+        inSwapTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=self.nanopool.lp_asset_id,
+            amt=amount,
+            sp=params,
+        )
+        # pay for the fee incurred by AMM for sending the meta asset
+        params.fee = minimumFee(metaswapFromLpRoute())
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                metapool_strings.op_metaswap_from_lp, [minAmountOut]
+            ),
+            foreign_assets=[self.meta_asset_id, self.nanopool.lp_asset_id],
+            accounts=[receiver or user.getAddress()],
+        )
+
         transaction.assign_group_id([inSwapTxn, appCallTxn])
         signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
         signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
 
         self.client.algod.send_transactions([signedInSwapTxn, signedAppCallTxn])
-        wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_metaswap_from_lp, txinfo)
+
+    def metaswap_to_meta(
+        self,
+        user: Account,
+        otherMetapool: "MetapoolAMMClient",
+        amount: int,
+        minAmountOut: int = 0,
+    ) -> int:
+        """Swap this pool meta asset for the meta asset of another metapool of the same nanopool, in one atomic group.
+        The nanopool LP obtained in this metapool is handed to the other metapool by an inner application call,
+        it is never burned and re-pooled in the nanopool.
+        Args:
+            user: user Account
+            otherMetapool: client of the metapool of the meta asset to receive.
+            amount: amount of meta asset to swap.
+            minAmountOut: minimum amount of the other meta asset to receive, the call is rejected otherwise.
+        Returns:
+            The amount of the other meta asset received.
+        """
+        self.assertSetup()
+        if otherMetapool.nanopool.lp_asset_id != self.nanopool.lp_asset_id:
+            raise ValueError("The metapools must share the same nanopool")
+        params = self.client.algod.suggested_params()
 
-    def get_zap_amount(self, asset_id, in_swap_amt):
+        inSwapTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=self.meta_asset_id,
+            amt=amount,
+            sp=params,
+        )
+        # pay for the LP transfer, the other metapool call and its meta asset transfer
+        params.fee = minimumFee(metaswapToMetaRoute())
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                metapool_strings.op_metaswap_to_meta, [minAmountOut]
+            ),
+            foreign_apps=[otherMetapool.metapool_application_id],
+            foreign_assets=[
+                self.meta_asset_id,
+                self.nanopool.lp_asset_id,
+                otherMetapool.meta_asset_id,
+            ],
+            accounts=[otherMetapool.metapool_address],
+        )
+
+        transaction.assign_group_id([inSwapTxn, appCallTxn])
+        signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions([signedInSwapTxn, signedAppCallTxn])
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_metaswap_to_meta, txinfo)
+
+    def metaswap_exact_out(
+        self,
+        user: Account,
+        inTokenId: int,
+        amountOut: int,
+        outTokenId: int,
+        maxAmountIn: int = None,
+    ) -> int:
+        """Swap inTokenId for an exact amount of outTokenId. The routes are the same as the metaswap operation.
+        The contract takes only the input needed for the requested output: the unused meta asset is refunded,
+        and the unused part of a zapped nanopool asset is refunded as nanopool LP token.
+        Args:
+            user: user Account
+            inTokenId: asset Id of the token to swap, must be either meta-asset or one of the nanopool pair
+            amountOut: exact amount of outTokenId to receive.
+            outTokenId: asset if of the token to receive.
+            maxAmountIn: maximum amount of inTokenId to spend, defaults to the quoted input.
+        Returns:
+            The amount of outTokenId received.
+        """
+        self.assertSetup()
+        assets = self.get_swap_assets(inTokenId, outTokenId)
+        amountIn, routeAmount = self.get_metaswap_exact_out_quote(
+            inTokenId, amountOut, outTokenId
+        )
+        if maxAmountIn is None:
+            maxAmountIn = amountIn
+        elif maxAmountIn < amountIn:
+            raise ValueError("Maximum input too low, %i needed" % amountIn)
+        elif inTokenId != self.meta_asset_id:
+            # The whole input is zapped, the LP beyond the quote is refunded
+            reserve = (
+                self.nanopool.asset1_balance
+                if inTokenId == self.nanopool.asset1.asset_id
+                else self.nanopool.asset2_balance
+            )
+            routeAmount = computeSingleSidedSwapAmount(
+                maxAmountIn, reserve, nanopoolFeeBps(self.nanopool)
+            )
+        # Verify the user balance
+        assert (
+            get_account_balances(self.client.indexer, user.getAddress())[inTokenId]
+            >= maxAmountIn
+        ), "Not Enough Balance"
+
+        params = self.client.algod.suggested_params()
+        inSwapTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=inTokenId,
+            amt=maxAmountIn,
+            sp=params,
+        )
+        burn = inTokenId == self.meta_asset_id
+        residuals = (
+            0 if burn else self.get_zap_residuals(inTokenId, maxAmountIn, routeAmount)
+        )
+        route = metaswapExactOutRoute(
+            burn, refund=maxAmountIn > amountIn, residuals=residuals
+        )
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
+        params.flat_fee = True
+
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                metapool_strings.op_metaswap_exact_out,
+                [amountOut, int(routeAmount)],
+            ),
+            foreign_apps=[
+                self.nanopool.application_id,
+                self.nanopool.manager_application_id,
+            ],
+            foreign_assets=assets,
+            accounts=[self.nanopool.address],
+        )
+
+        transaction.assign_group_id([inSwapTxn, feePaymentTxn, appCallTxn])
+        signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions(
+            [signedInSwapTxn, signedFeePaymentTxn, signedAppCallTxn]
+        )
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(metapool_strings.op_metaswap_exact_out, txinfo)
+
+    def get_fee_payment_txn(self, user: Account, route: list, params):
+        """Payment reimbursing the metapool for the fee the nanopool imposes on its inner app calls.
+        The contract checks that its ALGO balance did not go down over the group.
+        Args:
+            user: user Account
+            route: inner transactions of the call, see metapool.feeBudget.
+            params: suggested params of the group.
+        """
+        return transaction.PaymentTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            amt=nanopoolFeePayment(route),
+            sp=params,
+        )
+
+    def observe_nanopool_inner_txns(self, txinfo: dict) -> None:
+        """Update the inner transaction counts of the nanopool methods used for the fees of this client.
+        Args:
+            txinfo: the confirmed transaction information of a metapool app call.
+        """
+        observeNanopoolInnerTxns(
+            txinfo, self.nanopool.application_id, self.nanopool_inner_txns
+        )
+
+    def get_swap_assets(self, inTokenId: int, outTokenId: int) -> list:
+        """Foreign assets of a metaswap call: input, output, other nanopool asset and nanopool LP."""
+        if inTokenId == self.meta_asset_id:
+            if outTokenId == self.nanopool.asset1.asset_id:
+                other_asset = self.nanopool.asset2.asset_id
+            elif outTokenId == self.nanopool.asset2.asset_id:
+                other_asset = self.nanopool.asset1.asset_id
+            else:
+                raise ValueError("Invalid Output token")
+        elif inTokenId == self.nanopool.asset1.asset_id:
+            other_asset = self.nanopool.asset2.asset_id
+        elif inTokenId == self.nanopool.asset2.asset_id:
+            other_asset = self.nanopool.asset1.asset_id
+        else:
+            raise ValueError("Invalid Input token")
+        if inTokenId != self.meta_asset_id and outTokenId != self.meta_asset_id:
+            raise ValueError("Invalid Output token")
+        return [inTokenId, outTokenId, other_asset, self.nanopool.lp_asset_id]
+
+    def refresh_state(self) -> None:
+        """Load the metapool reserves and configuration."""
+        appGlobalState = get_application_global_state(
+            self.client.indexer, self.metapool_application_id
+        )
+        balances = get_account_balances(self.client.indexer, self.metapool_address)
+        self.load_state(appGlobalState, balances)
+
+    def load_state(self, appGlobalState: dict, balances: dict) -> None:
+        """Set the metapool reserves and configuration from its global state and asset balances."""
+        self.fee_bps = appGlobalState[metapool_strings.fee_bps]
+        self.min_increment = appGlobalState[metapool_strings.min_increment]
+        self.pool_tokens_outstanding = appGlobalState[
+            metapool_strings.pool_token_outstanding
+        ]
+        self.meta_asset_balance = balances.get(self.meta_asset_id, 0)
+        self.lp_asset_balance = balances.get(self.nanopool.lp_asset_id, 0)
+
+    def get_burn_output(self, lpAmount: int, outTokenId: int) -> int:
+        """Nanopool asset received for burning nanopool LP and swapping the other asset of the pair."""
+        burn_quote = self.nanopool.get_burn_quote(lpAmount)
+        if outTokenId == self.nanopool.asset1.asset_id:
+            swap_quote = self.nanopool.get_swap_exact_for_quote(
+                self.nanopool.asset2.asset_id, burn_quote.asset2_delta
+            )
+            return burn_quote.asset1_delta + swap_quote.asset1_delta
+        elif outTokenId == self.nanopool.asset2.asset_id:
+            swap_quote = self.nanopool.get_swap_exact_for_quote(
+                self.nanopool.asset1.asset_id, burn_quote.asset1_delta
+            )
+            return burn_quote.asset2_delta + swap_quote.asset2_delta
+        raise ValueError("Invalid Output token")
+
+    def get_zap_output(self, inTokenId: int, amount: int, refresh=True):
+        """Nanopool LP received for zapping a nanopool asset.
+        Returns:
+            The LP amount and the zap amount to pass to the contract.
+        """
+        zap_amount = self.get_zap_amount(inTokenId, amount, refresh)
+        swap_quote = self.nanopool.get_swap_exact_for_quote(inTokenId, zap_amount)
+        if inTokenId == self.nanopool.asset1.asset_id:
+            pool_quote = self.nanopool.get_pool_quote(
+                self.nanopool.asset2.asset_id, swap_quote.asset2_delta
+            )
+        else:
+            pool_quote = self.nanopool.get_pool_quote(
+                self.nanopool.asset1.asset_id, swap_quote.asset1_delta
+            )
+        return pool_quote.lp_delta, zap_amount
+
+    def get_zap_residuals(self, inTokenId: int, amount: int, zapAmount: int) -> int:
+        """Number of residual transfers the contract sends back after a zap, for its fee.
+        The nanopool pools the limiting side whole, so the residual is on one side at most.
+        Args:
+            inTokenId: nanopool asset zapped.
+            amount: amount zapped.
+            zapAmount: part of the amount swapped for the other asset, from get_zap_amount.
+        """
+        swap_quote = self.nanopool.get_swap_exact_for_quote(inTokenId, zapAmount)
+        # Nanopool balances after the swap
+        asset1_balance = self.nanopool.asset1_balance - swap_quote.asset1_delta
+        asset2_balance = self.nanopool.asset2_balance - swap_quote.asset2_delta
+        if inTokenId == self.nanopool.asset1.asset_id:
+            other_out, in_balance, other_balance = (
+                swap_quote.asset2_delta,
+                asset1_balance,
+                asset2_balance,
+            )
+        else:
+            other_out, in_balance, other_balance = (
+                swap_quote.asset1_delta,
+                asset2_balance,
+                asset1_balance,
+            )
+        # Input pooled with the whole swap output, rounded up as the nanopool does
+        in_needed = -(-other_out * in_balance // other_balance)
+        return int(in_needed != amount - int(zapAmount))
+
+    def get_metaswap_quote(
+        self, inTokenId: int, amount: int, outTokenId: int, refresh=True
+    ) -> int:
+        """Expected output of a metaswap.
+        Args:
+            inTokenId: asset Id of the token to swap.
+            amount: amount to swap.
+            outTokenId: asset if of the token to receive.
+            refresh: reload the metapool and nanopool state first.
+        """
+        self.get_swap_assets(inTokenId, outTokenId)
+        if refresh:
+            self.refresh_state()
+            self.nanopool.refresh_state()
+        if inTokenId == self.meta_asset_id:
+            lp_amount = computeOtherTokenOutputPerGivenTokenInput(
+                amount, self.meta_asset_balance, self.lp_asset_balance, self.fee_bps
+            )
+            return self.get_burn_output(lp_amount, outTokenId)
+        lp_amount, _ = self.get_zap_output(inTokenId, amount, refresh=False)
+        return computeOtherTokenOutputPerGivenTokenInput(
+            lp_amount, self.lp_asset_balance, self.meta_asset_balance, self.fee_bps
+        )
+
+    def get_metaswap_exact_out_quote(
+        self, inTokenId: int, amountOut: int, outTokenId: int, refresh=True
+    ):
+        """Input needed to receive an exact amount out of a metaswap, in closed form.
+        The metapool leg is inverted with the contract rounding. The nanopool legs are inverted
+        as constant product pools, which a stableswap nanopool matches or beats: the burn route
+        returns at least amountOut, the surplus going to the user, and the zap route mints at
+        least the LP the metapool leg needs.
+        Args:
+            inTokenId: asset Id of the token to swap.
+            amountOut: exact amount to receive.
+            outTokenId: asset if of the token to receive.
+            refresh: reload the metapool and nanopool state first.
+        Returns:
+            The input amount and the route amount argument of the contract
+            (nanopool LP to burn for the meta asset input, zap amount for the nanopool asset input).
+        """
+        self.get_swap_assets(inTokenId, outTokenId)
+        if refresh:
+            self.refresh_state()
+            self.nanopool.refresh_state()
+        nanopool_fee_bps = nanopoolFeeBps(self.nanopool)
+        if inTokenId == self.meta_asset_id:
+            balances = (self.nanopool.asset1_balance, self.nanopool.asset2_balance)
+            if outTokenId == self.nanopool.asset2.asset_id:
+                balances = balances[::-1]
+            lp_amount = computeBurnInputPerOutput(
+                amountOut, *balances, self.nanopool.lp_circulation, nanopool_fee_bps
+            )
+            amountIn = computeGivenTokenInputPerOtherTokenOutput(
+                lp_amount, self.meta_asset_balance, self.lp_asset_balance, self.fee_bps
+            )
+            return amountIn, lp_amount
+
+        lp_required = computeGivenTokenInputPerOtherTokenOutput(
+            amountOut, self.lp_asset_balance, self.meta_asset_balance, self.fee_bps
+        )
+        balances = (self.nanopool.asset1_balance, self.nanopool.asset2_balance)
+        if inTokenId == self.nanopool.asset2.asset_id:
+            balances = balances[::-1]
+        return computeZapInputPerLpOutput(
+            lp_required, *balances, self.nanopool.lp_circulation, nanopool_fee_bps
+        )
+
+    def get_zap_amount(self, asset_id, in_swap_amt, refresh=True):
         """Iteratively find the optimal amount to swap in the nanopool such that the resulting balances have the same assets ratio."""
-        self.nanopool.refresh_state()
+        if refresh:
+            self.nanopool.refresh_state()
         # First take a best guess that holds true if the exchange ratio is 1:1 (ignoring fees)
         if asset_id == self.nanopool.asset1.asset_id:
             y = (in_swap_amt * self.nanopool.asset2_balance) / (
@@ -488,14 +1322,15 @@ class MetapoolAMMClient:
         """Metaswap operation but it write the transaction context to a dryrun file instead of sending the transaction."""
         self.assertSetup()
         params = self.client.algod.suggested_params()
-        app_args = [bytes(metapool_strings.op_metaswap, "utf-8")]
+        zap_amount = residuals = 0
         if (
             inTokenId == self.nanopool.asset1.asset_id
             or inTokenId == self.nanopool.asset2.asset_id
         ):
             assert outTokenId == self.meta_asset_id
             zap_amount = self.get_zap_amount(inTokenId, amount)
-            app_args.append(int_to_bytes(int(zap_amount)))
+            residuals = self.get_zap_residuals(inTokenId, amount, zap_amount)
+        app_args = encodeMethodCall(metapool_strings.op_metaswap, [int(zap_amount)])
         if inTokenId == self.nanopool.asset1.asset_id:
             other_asset = self.nanopool.asset2.asset_id
         elif inTokenId == self.nanopool.asset2.asset_id:
@@ -518,7 +1353,9 @@ class MetapoolAMMClient:
             amt=amount,
             sp=params,
         )
-        params.fee = constants.MIN_TXN_FEE * 8
+        route = metaswapRoute(burn=inTokenId == self.meta_asset_id, residuals=residuals)
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
         params.flat_fee = True
 
         appCallTxn = transaction.ApplicationNoOpTxn(
@@ -534,11 +1371,12 @@ class MetapoolAMMClient:
             accounts=[self.nanopool.address],
         )
 
-        transaction.assign_group_id([inSwapTxn, appCallTxn])
+        transaction.assign_group_id([inSwapTxn, feePaymentTxn, appCallTxn])
         signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
         signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
         drr = transaction.create_dryrun(
-            self.client.algod, [signedInSwapTxn, signedAppCallTxn]
+            self.client.algod, [signedInSwapTxn, signedFeePaymentTxn, signedAppCallTxn]
         )
         filename = "dryrun.msgp"
         with open(filename, "wb") as f:
@@ -550,7 +1388,7 @@ class MetapoolAMMClient:
         """Same as meta-swap but it allows to send ill-transaction. For testing only."""
         self.assertSetup()
         params = self.client.algod.suggested_params()
-        app_args = [bytes(metapool_strings.op_metaswap, "utf-8")]
+        zap_amount = 0
         # Verify that we have the correct assets pair
         if (
             inTokenId == self.nanopool.asset1.asset_id
@@ -559,7 +1397,6 @@ class MetapoolAMMClient:
             # assert outTokenId==self.meta_asset_id, "Invalid Output token"
             # For the zap operation, we calculate the amount in the client and pass it as an argument to the transaction
             zap_amount = self.get_zap_amount(inTokenId, amount)
-            app_args.append(int_to_bytes(int(zap_amount)))
             # Small amounts have difficulty going through the zap
             # niggle = 100
             # assert amount > niggle, "Swaped too little"
@@ -578,6 +1415,7 @@ class MetapoolAMMClient:
         else:
             other_asset = self.nanopool.asset2.asset_id
             # raise ValueError("Invalid Input token")
+        app_args = encodeMethodCall(metapool_strings.op_metaswap, [int(zap_amount)])
         # Verify the user balance
         # assert get_account_balances(self.client.indexer, user.getAddress()[inTokenId]) > amount, ValueError("Not Enough Balance")
 
@@ -590,7 +1428,9 @@ class MetapoolAMMClient:
             amt=amount,
             sp=params,
         )
-        params.fee = constants.MIN_TXN_FEE * 8
+        route = metaswapRoute(burn=inTokenId == self.meta_asset_id)
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
         params.flat_fee = True
 
         appCallTxn = transaction.ApplicationNoOpTxn(
@@ -606,9 +1446,12 @@ class MetapoolAMMClient:
             accounts=[self.nanopool.address],
         )
 
-        transaction.assign_group_id([inSwapTxn, appCallTxn])
+        transaction.assign_group_id([inSwapTxn, feePaymentTxn, appCallTxn])
         signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
         signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
 
-        self.client.algod.send_transactions([signedInSwapTxn, signedAppCallTxn])
+        self.client.algod.send_transactions(
+            [signedInSwapTxn, signedFeePaymentTxn, signedAppCallTxn]
+        )
         wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
@@ -0,0 +1,203 @@
+"""Bulk deployment of metapools.
+
+Every step of the deployment is submitted for all the pools at once and the confirmations
+are awaited concurrently, so a whole batch takes the same three groups as a single
+deploy_metapool: the app creations, the funding and setup groups, and the pool token
+opt-ins of the creator. The registry is updated as each step confirms, a pool that fails
+a step is left out of the next ones and reported by a PartialDeploymentError.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from .utils import compiledContract, decodeMethodReturn, Account
+from .contracts.poolStrings import metapool_strings
+from .metapoolAMMClient import MetapoolAMMClient
+from algofi_amm.v0.client import AlgofiAMMClient
+from algofi_amm.v0.config import PoolType
+from algofi_amm.utils import wait_for_confirmation
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+
+
+class MetapoolSpec(NamedTuple):
+    """Nanopool pair, meta asset and configuration of a metapool to deploy"""
+
+    asset1Id: int
+    asset2Id: int
+    metaAssetId: int
+    feeBps: int
+    minIncrement: int
+
+
+class PartialDeploymentError(RuntimeError):
+    def __init__(self, failed: dict, metapools: list):
+        """Constructor method for :class:`PartialDeploymentError`
+        Args:
+            failed: position of a failed spec in the batch: exception of the step it
+                failed at. Identical specs are told apart by their position.
+            metapools: client of each spec, in the order of the specs, None when its app
+                was not created. The clients of the failed specs are partially deployed.
+        """
+        super().__init__(
+            "%i of %i metapools failed to deploy" % (len(failed), len(metapools))
+        )
+        self.failed = failed
+        self.metapools = metapools
+
+
+class MetapoolFactory:
+    def __init__(self, client: AlgofiAMMClient, user: Account, maxWorkers=16):
+        """Constructor method for :class:`MetapoolFactory`
+        Args:
+            client: An Algofi AMM Client.
+            user: Creator Account of the metapools.
+            maxWorkers: number of confirmations awaited concurrently.
+        """
+        self.client = client
+        self.user = user
+        self.maxWorkers = maxWorkers
+        self.programs = None
+        # (meta asset id, nanopool asset 1 id, nanopool asset 2 id) -> (app id, pool token id),
+        # the pool token id is None until the app is set up
+        self.registry = {}
+
+    def deploy(self, specs: list, extraFunding=0) -> list:
+        """Deploy a metapool for each spec.
+        Args:
+            specs: list of MetapoolSpec.
+            extraFunding: Algos sent to each app on top of its minimum balance requirement.
+        Returns:
+            The clients of the new metapools, in the order of the specs.
+        Raises:
+            PartialDeploymentError: when a step failed for some of the specs, after the
+                other specs went through all the steps.
+        """
+        if self.programs is None:
+            self.programs = compiledContract(self.client.algod)
+        params = self.client.algod.suggested_params()
+        nanopools = {}
+        metapools = []
+        for spec in specs:
+            pair = (spec.asset1Id, spec.asset2Id)
+            if pair not in nanopools:
+                nanopools[pair] = self.client.get_pool(PoolType.NANOSWAP, *pair)
+            metapools.append(
+                MetapoolAMMClient(self.client, nanopools[pair], spec.metaAssetId)
+            )
+        failed = {}
+
+        # The creations are otherwise identical, the note keeps their IDs distinct,
+        # within the batch and across runs
+        nonce = os.urandom(8).hex()
+        pending = list(range(len(specs)))
+        results = self.sendAndWait(
+            [
+                [
+                    metapools[i].get_create_txn(
+                        self.user,
+                        params,
+                        self.programs,
+                        note=f"metapool {i} {specs[i].metaAssetId} {nonce}".encode(),
+                    )
+                ]
+                for i in pending
+            ]
+        )
+        for i, txinfo in self.confirmed(pending, results, failed):
+            metapool = metapools[i]
+            metapool.metapool_application_id = txinfo["application-index"]
+            metapool.metapool_address = get_application_address(
+                metapool.metapool_application_id
+            )
+            self.registry[self.key(specs[i])] = (metapool.metapool_application_id, None)
+
+        pending = [i for i in pending if i not in failed]
+        results = self.sendAndWait(
+            [
+                metapools[i].get_setup_txns(
+                    self.user,
+                    specs[i].feeBps,
+                    specs[i].minIncrement,
+                    params,
+                    extraFunding,
+                )
+                for i in pending
+            ]
+        )
+        for i, txinfo in self.confirmed(pending, results, failed):
+            metapool = metapools[i]
+            metapool.metapool_lp_asset_id = decodeMethodReturn(
+                metapool_strings.op_set_metapool, txinfo
+            )
+            self.registry[self.key(specs[i])] = (
+                metapool.metapool_application_id,
+                metapool.metapool_lp_asset_id,
+            )
+
+        pending = [i for i in pending if i not in failed]
+        results = self.sendAndWait(
+            [
+                [
+                    transaction.AssetOptInTxn(
+                        sender=self.user.getAddress(),
+                        index=metapools[i].metapool_lp_asset_id,
+                        sp=params,
+                    )
+                ]
+                for i in pending
+            ]
+        )
+        # Only the failures of the last step matter
+        list(self.confirmed(pending, results, failed))
+
+        if failed:
+            raise PartialDeploymentError(
+                failed,
+                [
+                    metapool if hasattr(metapool, "metapool_application_id") else None
+                    for metapool in metapools
+                ],
+            )
+        return metapools
+
+    @staticmethod
+    def key(spec: MetapoolSpec) -> tuple:
+        return spec.metaAssetId, spec.asset1Id, spec.asset2Id
+
+    @staticmethod
+    def confirmed(pending: list, results: list, failed: dict):
+        """Index and transaction information of the confirmed groups of a step,
+        the exceptions of the others are recorded in failed by index"""
+        for i, result in zip(pending, results):
+            if isinstance(result, Exception):
+                failed[i] = result
+            else:
+                yield i, result
+
+    def sendAndWait(self, groups: list) -> list:
+        """Send all the groups, then wait for them concurrently.
+        Returns:
+            The confirmed transaction information of the last transaction of each group,
+            or the exception raised while sending or confirming it.
+        """
+        results = []
+        for group in groups:
+            if len(group) > 1:
+                transaction.assign_group_id(group)
+            signed = [txn.sign(self.user.getPrivateKey()) for txn in group]
+            try:
+                self.client.algod.send_transactions(signed)
+                results.append(signed[-1].get_txid())
+            except Exception as e:
+                results.append(e)
+        with ThreadPoolExecutor(self.maxWorkers) as executor:
+            return list(executor.map(self.wait, results))
+
+    def wait(self, txid):
+        if isinstance(txid, Exception):
+            return txid
+        try:
+            return wait_for_confirmation(self.client.algod, txid)
+        except Exception as e:
+            return e
@@ -0,0 +1,192 @@
+"""Pure python replica of the metapool contract math.
+
+Every function mirrors the subroutine of the same name in
+metapool/contracts/functions.py, with the same integer rounding, so the client
+can predict the contract results exactly without a node.
+"""
+
+FEE_DENOMINATOR = 10_000
+
+
+def xMulYDivZ(x: int, y: int, z: int) -> int:
+    """floor(x * y / z), the contract computes it with 128 bits intermediate precision"""
+    return x * y // z
+
+
+def assessFee(amount: int, feeBps: int) -> int:
+    """Amount left after taking the swap fee out"""
+    return xMulYDivZ(amount, FEE_DENOMINATOR - feeBps, FEE_DENOMINATOR)
+
+
+def computeOtherTokenOutputPerGivenTokenInput(
+    inputAmount: int,
+    previousGivenTokenAmount: int,
+    previousOtherTokenAmount: int,
+    feeBps: int,
+) -> int:
+    """Constant product output for an exact input amount"""
+    k = previousGivenTokenAmount * previousOtherTokenAmount
+    amountSubFee = assessFee(inputAmount, feeBps)
+    return previousOtherTokenAmount - k // (previousGivenTokenAmount + amountSubFee)
+
+
+def computeGivenTokenInputPerOtherTokenOutput(
+    outputAmount: int,
+    previousGivenTokenAmount: int,
+    previousOtherTokenAmount: int,
+    feeBps: int,
+) -> int:
+    """Smallest input amount for which computeOtherTokenOutputPerGivenTokenInput returns at least outputAmount"""
+    if not 0 < outputAmount < previousOtherTokenAmount:
+        raise ValueError("Output amount must be positive and lower than the reserve")
+    # Smallest input after fee such that k // (given + input) <= other - output
+    amountSubFee = (
+        xMulYDivZ(
+            previousGivenTokenAmount,
+            previousOtherTokenAmount,
+            previousOtherTokenAmount - outputAmount + 1,
+        )
+        + 1
+        - previousGivenTokenAmount
+    )
+    # Smallest input such that assessFee(input) >= amountSubFee
+    amount = xMulYDivZ(amountSubFee, FEE_DENOMINATOR, FEE_DENOMINATOR - feeBps)
+    if assessFee(amount, feeBps) < amountSubFee:
+        amount += 1
+    return amount
+
+
+def sqrt(x: int) -> int:
+    """Integer square root, rounded down like the sqrt opcode"""
+    if x < 0:
+        raise ValueError("Square root of a negative number")
+    if x == 0:
+        return 0
+    r = 1 << ((x.bit_length() + 1) // 2)
+    while True:
+        y = (r + x // r) // 2
+        if y >= r:
+            return r
+        r = y
+
+
+def tryTakeAdjustedAmounts(
+    toKeepTokenTxnAmt: int,
+    toKeepTokenBeforeTxnAmt: int,
+    otherTokenTxnAmt: int,
+    otherTokenBeforeTxnAmt: int,
+    poolTokensOutstanding: int,
+):
+    """Keep all of one token and the corresponding amount of the other token.
+    Returns:
+        The pool tokens minted and the amount of the other token refunded,
+        None if the contract would not take this branch.
+    """
+    otherCorrespondingAmount = xMulYDivZ(
+        toKeepTokenTxnAmt, otherTokenBeforeTxnAmt, toKeepTokenBeforeTxnAmt
+    )
+    if 0 < otherCorrespondingAmount <= otherTokenTxnAmt:
+        minted = xMulYDivZ(
+            poolTokensOutstanding, toKeepTokenTxnAmt, toKeepTokenBeforeTxnAmt
+        )
+        return minted, otherTokenTxnAmt - otherCorrespondingAmount
+    return None
+
+
+def computeSingleSidedSwapAmount(amount: int, reserve: int, feeBps: int) -> int:
+    """Part of a single sided deposit to swap in the pool so that the rest matches the pool ratio after the swap.
+
+    Solves g*s^2 + R*(1 + g)*s - R*amount = 0 for s, with g = 1 - fee.
+    """
+    g = FEE_DENOMINATOR - feeBps
+    b = reserve * (FEE_DENOMINATOR + g)
+    return (sqrt(b * b + 4 * g * reserve * amount * FEE_DENOMINATOR) - b) // (2 * g)
+
+
+def planAddLiquidity(
+    maxTokenA: int,
+    maxTokenB: int,
+    tokenABefore: int,
+    tokenBBefore: int,
+    poolTokensOutstanding: int,
+    minIncrement: int = 0,
+):
+    """Largest deposit within the maximum amounts that the contract takes in full, without refund.
+
+    The contract first tries to keep all of token A and the corresponding
+    xMulYDivZ(qA, tokenBBefore, tokenABefore) of token B, so the deposit is exact
+    when qB is that amount, and qA is the largest input for which it does not exceed maxTokenB.
+    Returns:
+        The amounts of token A and token B to send and the pool tokens minted.
+    Raises:
+        ValueError: when either amount is 0 or below minIncrement, the contract rejects it.
+    """
+    if tokenABefore == 0 or tokenBBefore == 0:
+        # no liquidity yet, everything is taken
+        tokenAAmount, tokenBAmount = maxTokenA, maxTokenB
+        minted = sqrt(maxTokenA * maxTokenB)
+    else:
+        tokenAAmount = min(
+            maxTokenA, ((maxTokenB + 1) * tokenABefore - 1) // tokenBBefore
+        )
+        tokenBAmount = xMulYDivZ(tokenAAmount, tokenBBefore, tokenABefore)
+        minted = xMulYDivZ(poolTokensOutstanding, tokenAAmount, tokenABefore)
+    if min(tokenAAmount, tokenBAmount) < max(minIncrement, 1):
+        raise ValueError("Deposit too small")
+    return tokenAAmount, tokenBAmount, minted
+
+
+def computeBurnInputPerOutput(
+    outputAmount: int,
+    outTokenReserve: int,
+    otherTokenReserve: int,
+    lpCirculation: int,
+    feeBps: int,
+) -> int:
+    """Nanopool LP to burn so that the burn and the swap of the other asset return at least outputAmount.
+
+    Closed form on a constant product nanopool: with s the share of the LP burnt and
+    g = 1 - fee, s*out + g*s*(1 - s)*out / (1 - s + g*s) = outputAmount, the smaller
+    root of s^2 - (1 + g + r*(1 - g))*s + r = 0 with r = outputAmount / out.
+    The target is raised by the most the roundings of the burn and the swap can lose,
+    so the output may exceed outputAmount by a few units. A stableswap nanopool returns
+    at least the constant product output.
+    """
+    g = FEE_DENOMINATOR - feeBps
+    target = outputAmount + 2 + 2 * -(-outTokenReserve // otherTokenReserve)
+    if not 0 < outputAmount or target >= outTokenReserve:
+        raise ValueError("Output amount must be positive and lower than the reserve")
+    a = FEE_DENOMINATOR * outTokenReserve
+    b = lpCirculation * (
+        outTokenReserve * (FEE_DENOMINATOR + g) + target * (FEE_DENOMINATOR - g)
+    )
+    c = FEE_DENOMINATOR * target * lpCirculation * lpCirculation
+    # Rounding the root down raises the LP amount
+    return -(-(b - sqrt(b * b - 4 * a * c)) // (2 * a))
+
+
+def computeZapInputPerLpOutput(
+    lpAmount: int,
+    inTokenReserve: int,
+    otherTokenReserve: int,
+    lpCirculation: int,
+    feeBps: int,
+) -> tuple:
+    """Nanopool asset to zap for at least lpAmount of nanopool LP, and the zap amount.
+
+    Closed form on a constant product nanopool: with q = lpAmount / lpCirculation and
+    g = 1 - fee, swapping q * in / g leaves the pool ratio at the input left, and the
+    input is q * in * (1 + (1 + q) / g). The zap amount is raised by the most the roundings
+    of the swap can lose, so the input asset is the limiting side when pooling.
+    Returns:
+        The input amount and the zap amount to pass to the contract.
+    """
+    g = FEE_DENOMINATOR - feeBps
+    zapAmount = (
+        -(-lpAmount * inTokenReserve * FEE_DENOMINATOR // (g * lpCirculation))
+        + 2
+        + 2 * -(-inTokenReserve // otherTokenReserve)
+    )
+    # The nanopool holds the whole zap amount when pooling, fee included
+    amount = zapAmount - (-lpAmount * (inTokenReserve + zapAmount) // lpCirculation)
+    return amount, zapAmount
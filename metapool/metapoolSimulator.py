@@ -0,0 +1,988 @@
+"""In-memory replica of the metapool approval program.
+
+MetapoolSimulator runs the branches of metapool/contracts/metapoolContract.py on a local
+state: the configuration, the pool tokens outstanding and the asset holdings of the
+metapool account. Every computation goes through the uint64 semantics of the AVM, so the
+simulator rejects exactly where the contract does, an assert that fails or an opcode that
+panics (an overflow of *, the 128 bits intermediate and the 64 bits result of xMulYDivZ, an
+underflow of -, a division by zero), and a transfer of more than the account holds. A
+rejected call leaves the simulator unchanged. The simulator and the contract share the
+same rounding, so a call that passes returns the same value as on chain.
+
+The nanopool is a pluggable model, called like the inner transactions of the contract:
+
+    swap(assetIn, amount) -> amount out         swap_exact_for
+    burn(lpAmount) -> (amount1, amount2)        burn_asset1_out and burn_asset2_out
+    pool(amount1, amount2) -> (lp, residual1, residual2)
+                                                pool, then redeem both residuals
+
+with asset1Id, asset2Id, lpId, and snapshot() and restore(state) to undo the calls of a
+rejected group. A model raises MetapoolReject where the nanopool would reject.
+
+The differential mode replays the app call of a dry-run request through a simulator loaded
+from the same request and compares the outcome with the dry-run response, see replayDryrun.
+"""
+
+import copy
+from base64 import b64decode
+from typing import NamedTuple
+from algosdk import abi
+from algosdk.atomic_transaction_composer import ABI_RETURN_HASH
+from algosdk.future.transaction import ApplicationCallTxn, AssetTransferTxn, PaymentTxn
+from algosdk.logic import get_application_address
+from .analyticsStore import OP_CODES, OPERATIONS
+from .contracts.poolStrings import metapool_strings
+from .metapoolMath import FEE_DENOMINATOR, sqrt
+
+UINT64 = 1 << 64
+UINT128 = 1 << 128
+SCALING_FACTOR = metapool_strings.scaling_factor
+POOL_TOKEN_TOTAL = metapool_strings.pool_token_default_amount
+NANOPOOL_CALL_FEE = metapool_strings.nanopool_call_fee
+# Global.min_balance(), the setup asserts the account holds 5 times more
+MIN_BALANCE = 100_000
+
+
+class MetapoolReject(RuntimeError):
+    """The group is rejected: an assert failed, an opcode panicked or a transfer failed"""
+
+
+def require(condition: bool, reason: str) -> None:
+    if not condition:
+        raise MetapoolReject(reason)
+
+
+def mul(x: int, y: int) -> int:
+    product = x * y
+    if product >= UINT64:
+        raise MetapoolReject("* overflow")
+    return product
+
+
+def sub(x: int, y: int) -> int:
+    if y > x:
+        raise MetapoolReject("- underflow")
+    return x - y
+
+
+def xMulYDivZ(x: int, y: int, z: int) -> int:
+    """WideRatio([x, y, SCALING_FACTOR], [z, SCALING_FACTOR]) with the checks of its opcodes"""
+    if z == 0:
+        raise MetapoolReject("xMulYDivZ division by zero")
+    product = x * y
+    if product * SCALING_FACTOR >= UINT128:
+        raise MetapoolReject("xMulYDivZ numerator overflow")
+    result = product // z
+    if result >= UINT64:
+        raise MetapoolReject("xMulYDivZ result overflow")
+    return result
+
+
+def assessFee(amount: int, feeBps: int) -> int:
+    return xMulYDivZ(amount, sub(FEE_DENOMINATOR, feeBps), FEE_DENOMINATOR)
+
+
+def computeOtherTokenOutputPerGivenTokenInput(
+    inputAmount: int,
+    previousGivenTokenAmount: int,
+    previousOtherTokenAmount: int,
+    feeBps: int,
+) -> int:
+    k = mul(previousGivenTokenAmount, previousOtherTokenAmount)
+    amountSubFee = assessFee(inputAmount, feeBps)
+    denominator = previousGivenTokenAmount + amountSubFee
+    if denominator >= UINT64:
+        raise MetapoolReject("+ overflow")
+    if denominator == 0:
+        raise MetapoolReject("/ division by zero")
+    return sub(previousOtherTokenAmount, k // denominator)
+
+
+def computeGivenTokenInputPerOtherTokenOutput(
+    outputAmount: int,
+    previousGivenTokenAmount: int,
+    previousOtherTokenAmount: int,
+    feeBps: int,
+) -> int:
+    amountSubFee = sub(
+        xMulYDivZ(
+            previousGivenTokenAmount,
+            previousOtherTokenAmount,
+            sub(previousOtherTokenAmount, outputAmount) + 1,
+        )
+        + 1,
+        previousGivenTokenAmount,
+    )
+    amount = xMulYDivZ(amountSubFee, FEE_DENOMINATOR, sub(FEE_DENOMINATOR, feeBps))
+    if assessFee(amount, feeBps) < amountSubFee:
+        amount += 1
+    return amount
+
+
+class ConstantProductNanopool:
+    def __init__(
+        self,
+        asset1Id: int,
+        asset2Id: int,
+        lpId: int,
+        asset1Balance: int,
+        asset2Balance: int,
+        lpCirculation: int,
+        feeBps=25,
+    ):
+        """Constructor method for :class:`ConstantProductNanopool`
+        Args:
+            asset1Id, asset2Id, lpId: asset IDs of the nanopool assets and of its LP token.
+            asset1Balance, asset2Balance: reserves of the nanopool.
+            lpCirculation: LP tokens in circulation.
+            feeBps: swap fee, taken out of the input.
+        """
+        self.asset1Id = asset1Id
+        self.asset2Id = asset2Id
+        self.lpId = lpId
+        self.asset1Balance = asset1Balance
+        self.asset2Balance = asset2Balance
+        self.lpCirculation = lpCirculation
+        self.feeBps = feeBps
+
+    def snapshot(self) -> tuple:
+        return self.asset1Balance, self.asset2Balance, self.lpCirculation
+
+    def restore(self, state: tuple) -> None:
+        self.asset1Balance, self.asset2Balance, self.lpCirculation = state
+
+    def swap(self, assetIn: int, amount: int) -> int:
+        require(amount > 0, "nanopool swap of nothing")
+        inSubFee = amount * (FEE_DENOMINATOR - self.feeBps) // FEE_DENOMINATOR
+        if assetIn == self.asset1Id:
+            out = self.asset2Balance * inSubFee // (self.asset1Balance + inSubFee)
+            require(out > 0, "nanopool swap output is zero")
+            self.asset1Balance += amount
+            self.asset2Balance -= out
+        elif assetIn == self.asset2Id:
+            out = self.asset1Balance * inSubFee // (self.asset2Balance + inSubFee)
+            require(out > 0, "nanopool swap output is zero")
+            self.asset2Balance += amount
+            self.asset1Balance -= out
+        else:
+            raise MetapoolReject("nanopool swap of an unknown asset")
+        return out
+
+    def burn(self, lpAmount: int) -> tuple:
+        require(0 < lpAmount <= self.lpCirculation, "nanopool burn amount")
+        amount1 = self.asset1Balance * lpAmount // self.lpCirculation
+        amount2 = self.asset2Balance * lpAmount // self.lpCirculation
+        self.asset1Balance -= amount1
+        self.asset2Balance -= amount2
+        self.lpCirculation -= lpAmount
+        return amount1, amount2
+
+    def pool(self, amount1: int, amount2: int) -> tuple:
+        if self.lpCirculation == 0:
+            lp, used1, used2 = sqrt(amount1 * amount2), amount1, amount2
+        elif amount1 * self.asset2Balance <= amount2 * self.asset1Balance:
+            # Asset 1 is the limiting side, the asset 2 residual is redeemed
+            lp = amount1 * self.lpCirculation // self.asset1Balance
+            used1 = amount1
+            used2 = -(-amount1 * self.asset2Balance // self.asset1Balance)
+        else:
+            lp = amount2 * self.lpCirculation // self.asset2Balance
+            used1 = -(-amount2 * self.asset1Balance // self.asset2Balance)
+            used2 = amount2
+        require(lp > 0, "nanopool pool output is zero")
+        self.asset1Balance += used1
+        self.asset2Balance += used2
+        self.lpCirculation += lp
+        return lp, amount1 - used1, amount2 - used2
+
+
+class AlgofiNanopoolModel:
+    def __init__(self, pool):
+        """Constructor method for :class:`AlgofiNanopoolModel`
+        Args:
+            pool: Algofi Pool of the nanopool, copied, its state is the starting state.
+        """
+        self.pool = copy.copy(pool)
+        self.asset1Id = pool.asset1.asset_id
+        self.asset2Id = pool.asset2.asset_id
+        self.lpId = pool.lp_asset_id
+
+    def snapshot(self) -> tuple:
+        return (
+            self.pool.asset1_balance,
+            self.pool.asset2_balance,
+            self.pool.lp_circulation,
+        )
+
+    def restore(self, state: tuple) -> None:
+        (
+            self.pool.asset1_balance,
+            self.pool.asset2_balance,
+            self.pool.lp_circulation,
+        ) = state
+
+    def swap(self, assetIn: int, amount: int) -> int:
+        require(amount > 0, "nanopool swap of nothing")
+        quote = self.pool.get_swap_exact_for_quote(assetIn, amount)
+        if assetIn == self.asset1Id:
+            out = abs(quote.asset2_delta)
+            self.pool.asset1_balance += amount
+            self.pool.asset2_balance -= out
+        else:
+            out = abs(quote.asset1_delta)
+            self.pool.asset2_balance += amount
+            self.pool.asset1_balance -= out
+        require(out > 0, "nanopool swap output is zero")
+        return out
+
+    def burn(self, lpAmount: int) -> tuple:
+        require(0 < lpAmount <= self.pool.lp_circulation, "nanopool burn amount")
+        quote = self.pool.get_burn_quote(lpAmount)
+        amount1, amount2 = abs(quote.asset1_delta), abs(quote.asset2_delta)
+        self.pool.asset1_balance -= amount1
+        self.pool.asset2_balance -= amount2
+        self.pool.lp_circulation -= lpAmount
+        return amount1, amount2
+
+    def pool(self, amount1: int, amount2: int) -> tuple:
+        require(amount1 > 0 and amount2 > 0, "nanopool pool of nothing")
+        quote = self.pool.get_pool_quote(self.asset1Id, amount1)
+        if abs(quote.asset2_delta) > amount2:
+            quote = self.pool.get_pool_quote(self.asset2Id, amount2)
+        used1, used2 = abs(quote.asset1_delta), abs(quote.asset2_delta)
+        lp = abs(quote.lp_delta)
+        require(lp > 0, "nanopool pool output is zero")
+        self.pool.asset1_balance += used1
+        self.pool.asset2_balance += used2
+        self.pool.lp_circulation += lp
+        return lp, amount1 - used1, amount2 - used2
+
+
+class MetapoolSimulator:
+    def __init__(self, nanopool, metaAssetId: int, algoBalance=5 * MIN_BALANCE):
+        """Constructor method for :class:`MetapoolSimulator`, a metapool created but not set up
+        Args:
+            nanopool: nanopool model, see ConstantProductNanopool.
+            metaAssetId: asset ID of the meta asset.
+            algoBalance: ALGO balance of the metapool account.
+        """
+        self.nanopool = nanopool
+        self.meta_asset_id = metaAssetId
+        self.lp_asset_id = nanopool.lpId
+        self.metapool_lp_asset_id = None
+        self.fee_bps = 0
+        self.min_increment = 0
+        self.pool_tokens_outstanding = 0
+        self.meta_asset_balance = 0
+        self.lp_asset_balance = 0
+        self.pool_token_balance = 0
+        self.algo_balance = algoBalance
+        # Transfers of the last call to its sender, (asset ID, amount)
+        self.sent = []
+
+    @classmethod
+    def from_client(cls, metapool, nanopool=None):
+        """Simulator in the state last loaded by a MetapoolAMMClient, without any network call.
+        Args:
+            metapool: MetapoolAMMClient, its state and the nanopool state loaded.
+            nanopool: nanopool model, an AlgofiNanopoolModel of the client nanopool by default.
+        """
+        simulator = cls(
+            nanopool or AlgofiNanopoolModel(metapool.nanopool), metapool.meta_asset_id
+        )
+        simulator.metapool_lp_asset_id = metapool.metapool_lp_asset_id
+        simulator.fee_bps = metapool.fee_bps
+        simulator.min_increment = metapool.min_increment
+        simulator.pool_tokens_outstanding = metapool.pool_tokens_outstanding
+        simulator.meta_asset_balance = metapool.meta_asset_balance
+        simulator.lp_asset_balance = metapool.lp_asset_balance
+        simulator.pool_token_balance = (
+            POOL_TOKEN_TOTAL - metapool.pool_tokens_outstanding
+        )
+        return simulator
+
+    def state(self) -> tuple:
+        """Everything a call can change, the nanopool state last"""
+        return (
+            self.fee_bps,
+            self.min_increment,
+            self.pool_tokens_outstanding,
+            self.meta_asset_balance,
+            self.lp_asset_balance,
+            self.pool_token_balance,
+            self.algo_balance,
+            self.nanopool.snapshot(),
+        )
+
+    def holding(self, assetId: int) -> int:
+        """asset_balance of the metapool account, the nanopool assets never stay in it"""
+        if assetId == self.meta_asset_id:
+            return self.meta_asset_balance
+        if assetId == self.lp_asset_id:
+            return self.lp_asset_balance
+        if assetId == self.metapool_lp_asset_id:
+            return self.pool_token_balance
+        return 0
+
+    def call(self, operation, *args, **kwargs):
+        """Run an operation on the nanopool model, undo its nanopool calls if it rejects"""
+        snapshot = self.nanopool.snapshot()
+        self.sent = []
+        try:
+            return operation(*args, **kwargs)
+        except MetapoolReject:
+            self.nanopool.restore(snapshot)
+            raise
+
+    def setup(self, feeBps: int, minIncrement: int, poolTokenId=None) -> int:
+        """set_metapool, store the configuration and create the pool token.
+        Returns:
+            The pool token ID.
+        """
+        require(self.metapool_lp_asset_id is None, "already set up")
+        require(self.algo_balance >= 5 * MIN_BALANCE, "not funded")
+        self.fee_bps = feeBps
+        self.min_increment = minIncrement
+        self.metapool_lp_asset_id = poolTokenId if poolTokenId is not None else -1
+        self.pool_token_balance = POOL_TOKEN_TOTAL
+        return self.metapool_lp_asset_id
+
+    def add_liquidity(self, metaAmount: int, lpAmount: int) -> int:
+        """add_liquidity, the refund of the excess is in sent.
+        Returns:
+            The pool tokens minted.
+        """
+        self.sent = []
+        require(self.pool_token_balance > 0, "no pool token held")
+        require(metaAmount > 0 and lpAmount > 0, "invalid transfer")
+        require(
+            metaAmount >= self.min_increment and lpAmount >= self.min_increment,
+            "below min increment",
+        )
+        metaBefore, lpBefore = self.meta_asset_balance, self.lp_asset_balance
+        meta, lp = metaBefore + metaAmount, lpBefore + lpAmount
+        if metaBefore == 0 or lpBefore == 0:
+            # no liquidity yet, take everything
+            minted = sqrt(mul(metaAmount, lpAmount))
+        else:
+            minted = None
+            for keepAmount, keepBefore, otherAmount, otherBefore, otherId in (
+                (metaAmount, metaBefore, lpAmount, lpBefore, self.lp_asset_id),
+                (lpAmount, lpBefore, metaAmount, metaBefore, self.meta_asset_id),
+            ):
+                corresponding = xMulYDivZ(keepAmount, otherBefore, keepBefore)
+                if 0 < corresponding <= otherAmount:
+                    minted = xMulYDivZ(
+                        self.pool_tokens_outstanding, keepAmount, keepBefore
+                    )
+                    refund = otherAmount - corresponding
+                    if refund > 0:
+                        self.sent.append((otherId, refund))
+                        if otherId == self.meta_asset_id:
+                            meta -= refund
+                        else:
+                            lp -= refund
+                    break
+            require(minted is not None, "no add liquidity branch")
+        self.mint(minted)
+        self.meta_asset_balance, self.lp_asset_balance = meta, lp
+        return minted
+
+    def mint(self, amount: int) -> None:
+        """mintAndSendPoolToken, the last step of the add liquidity branches"""
+        require(amount <= self.pool_token_balance, "pool token transfer overdraws")
+        outstanding = self.pool_tokens_outstanding + amount
+        require(outstanding < UINT64, "+ overflow")
+        self.pool_token_balance -= amount
+        self.pool_tokens_outstanding = outstanding
+        self.sent.append((self.metapool_lp_asset_id, amount))
+
+    def add_liquidity_single(
+        self,
+        inTokenId: int,
+        amount: int,
+        zapAmount: int,
+        swapAmount: int,
+        feePayment=None,
+    ) -> int:
+        """add_liquidity_single of the meta asset or of a nanopool asset.
+        Args:
+            inTokenId: asset ID of the input.
+            amount: input amount.
+            zapAmount, swapAmount: the method arguments, see get_add_liquidity_single_quote.
+            feePayment: ALGO paid to the metapool for the nanopool fees, what they cost by default.
+        Returns:
+            The pool tokens minted.
+        """
+        return self.call(
+            self.run_add_liquidity_single,
+            inTokenId,
+            amount,
+            zapAmount,
+            swapAmount,
+            feePayment,
+        )
+
+    def run_add_liquidity_single(
+        self, inTokenId, amount, zapAmount, swapAmount, feePayment
+    ) -> int:
+        feeBps = self.fee_bps
+        require(
+            self.pool_tokens_outstanding > 0
+            and amount > 0
+            and amount >= self.min_increment
+            and swapAmount > 0,
+            "invalid add liquidity single",
+        )
+        fees = 0
+        if inTokenId == self.meta_asset_id:
+            require(swapAmount < amount, "swap amount above the input")
+            metaBefore, lpBefore = self.meta_asset_balance, self.lp_asset_balance
+            meta, lp = metaBefore + amount, lpBefore
+            # Swap part of the meta asset for LP, the tokens stay in the pool
+            swapOut = computeOtherTokenOutputPerGivenTokenInput(
+                swapAmount, metaBefore, lpBefore, feeBps
+            )
+            metaDeposit, lpDeposit = amount - swapAmount, swapOut
+            metaBefore, lpBefore = metaBefore + swapAmount, sub(lpBefore, swapOut)
+        elif inTokenId == self.nanopool.asset1Id or inTokenId == self.nanopool.asset2Id:
+            metaBefore, lpBefore = self.meta_asset_balance, self.lp_asset_balance
+            lpDeposit, fees = self.nanozap(inTokenId, amount, zapAmount)
+            meta, lp = metaBefore, lpBefore + lpDeposit
+            require(swapAmount < lpDeposit, "swap amount above the zapped LP")
+            # Swap part of the LP for meta asset, the tokens stay in the pool
+            swapOut = computeOtherTokenOutputPerGivenTokenInput(
+                swapAmount, lpBefore, metaBefore, feeBps
+            )
+            lpDeposit, metaDeposit = lpDeposit - swapAmount, swapOut
+            lpBefore, metaBefore = lpBefore + swapAmount, sub(metaBefore, swapOut)
+        else:
+            raise MetapoolReject("invalid input asset")
+        require(metaDeposit > 0 and lpDeposit > 0, "nothing to deposit")
+        # Deposit both sides at the pool ratio after the swap, the residual is refunded
+        corresponding = xMulYDivZ(metaDeposit, lpBefore, metaBefore)
+        if 0 < corresponding <= lpDeposit:
+            refund = lpDeposit - corresponding
+            if refund > 0:
+                lp -= refund
+                self.sent.append((self.lp_asset_id, refund))
+            minted = xMulYDivZ(self.pool_tokens_outstanding, metaDeposit, metaBefore)
+        else:
+            corresponding = xMulYDivZ(lpDeposit, metaBefore, lpBefore)
+            require(0 < corresponding <= metaDeposit, "no add liquidity branch")
+            refund = metaDeposit - corresponding
+            if refund > 0:
+                meta -= refund
+                self.sent.append((self.meta_asset_id, refund))
+            minted = xMulYDivZ(self.pool_tokens_outstanding, lpDeposit, lpBefore)
+        algoBalance = self.fee_guard(fees, feePayment)
+        self.mint(minted)
+        self.meta_asset_balance, self.lp_asset_balance = meta, lp
+        self.algo_balance = algoBalance
+        return minted
+
+    def withdraw(self, poolTokenAmount: int) -> tuple:
+        """withdraw, burn pool tokens for both assets.
+        Returns:
+            The meta asset and nanopool LP withdrawn.
+        """
+        self.sent = []
+        meta, lp = self.meta_asset_balance, self.lp_asset_balance
+        outstanding = self.pool_tokens_outstanding
+        require(meta > 0 and lp > 0, "empty pool")
+        require(poolTokenAmount > 0, "invalid transfer")
+        if outstanding == 0:
+            raise MetapoolReject("no pool token outstanding")
+        metaOut = xMulYDivZ(meta, poolTokenAmount, outstanding)
+        require(metaOut > 0, "nothing to withdraw")
+        require(metaOut <= meta, "meta asset transfer overdraws")
+        lpOut = xMulYDivZ(lp, poolTokenAmount, outstanding)
+        require(lpOut > 0, "nothing to withdraw")
+        require(lpOut <= lp, "LP transfer overdraws")
+        self.pool_tokens_outstanding = sub(outstanding, poolTokenAmount)
+        self.pool_token_balance += poolTokenAmount
+        self.meta_asset_balance, self.lp_asset_balance = meta - metaOut, lp - lpOut
+        self.sent.append((self.meta_asset_id, metaOut))
+        self.sent.append((self.lp_asset_id, lpOut))
+        return metaOut, lpOut
+
+    def withdraw_single(
+        self,
+        poolTokenAmount: int,
+        outTokenId: int,
+        minAmountOut=0,
+        swapMeta=False,
+        feePayment=None,
+    ) -> tuple:
+        """withdraw_single, the LP share is burnt for a nanopool asset.
+        Args:
+            poolTokenAmount: pool tokens to burn.
+            outTokenId: nanopool asset to receive.
+            minAmountOut: smallest amount of the nanopool asset accepted.
+            swapMeta: swap the meta asset share for LP inside the pool.
+            feePayment: ALGO paid to the metapool for the nanopool fees, what they cost by default.
+        Returns:
+            The meta asset and nanopool asset withdrawn.
+        """
+        return self.call(
+            self.run_withdraw_single,
+            poolTokenAmount,
+            outTokenId,
+            minAmountOut,
+            swapMeta,
+            feePayment,
+        )
+
+    def run_withdraw_single(
+        self, poolTokenAmount, outTokenId, minAmountOut, swapMeta, feePayment
+    ) -> tuple:
+        meta, lp = self.meta_asset_balance, self.lp_asset_balance
+        outstanding = self.pool_tokens_outstanding
+        require(outstanding > 0 and poolTokenAmount > 0, "invalid withdraw single")
+        metaShare = xMulYDivZ(meta, poolTokenAmount, outstanding)
+        lpShare = xMulYDivZ(lp, poolTokenAmount, outstanding)
+        require(metaShare > 0 and lpShare > 0, "nothing to withdraw")
+        if swapMeta:
+            # The meta share never leaves the pool, it buys nanopool LP from the remaining reserves
+            lpShare += computeOtherTokenOutputPerGivenTokenInput(
+                metaShare, sub(meta, metaShare), sub(lp, lpShare), self.fee_bps
+            )
+            metaWithdrawn = 0
+        else:
+            require(metaShare <= meta, "meta asset transfer overdraws")
+            self.sent.append((self.meta_asset_id, metaShare))
+            metaWithdrawn = metaShare
+        outstanding = sub(outstanding, poolTokenAmount)
+        require(lpShare <= lp, "LP transfer overdraws")
+        out, fees = self.nanoburn(lpShare, outTokenId)
+        require(out >= minAmountOut, "below min amount out")
+        algoBalance = self.fee_guard(fees, feePayment)
+        self.pool_tokens_outstanding = outstanding
+        self.pool_token_balance += poolTokenAmount
+        self.meta_asset_balance = meta - metaWithdrawn
+        self.lp_asset_balance = lp - lpShare
+        self.algo_balance = algoBalance
+        return metaWithdrawn, out
+
+    def metaswap(
+        self, inTokenId: int, amount: int, outTokenId: int, zapAmount=0, feePayment=None
+    ) -> int:
+        """metaswap, meta asset to a nanopool asset or a nanopool asset to the meta asset.
+        Args:
+            inTokenId: asset ID of the input.
+            amount: input amount.
+            outTokenId: asset ID of the output, the second foreign asset of the call.
+            zapAmount: the method argument of a nanopool asset input, see get_zap_amount.
+            feePayment: ALGO paid to the metapool for the nanopool fees, what they cost by default.
+        Returns:
+            The amount received.
+        """
+        return self.call(
+            self.run_metaswap, inTokenId, amount, outTokenId, zapAmount, feePayment
+        )
+
+    def run_metaswap(self, inTokenId, amount, outTokenId, zapAmount, feePayment) -> int:
+        meta, lp = self.meta_asset_balance, self.lp_asset_balance
+        poolTokenBalance = self.pool_token_balance
+        require(self.pool_tokens_outstanding > 0 and amount > 0, "invalid metaswap")
+        if inTokenId == self.meta_asset_id:
+            lpOut = computeOtherTokenOutputPerGivenTokenInput(
+                amount, meta, lp, self.fee_bps
+            )
+            require(0 < lpOut < lp, "invalid swap output")
+            # Burn the nanopool LP for the desired asset
+            out, fees = self.nanoburn(lpOut, outTokenId)
+            meta, lp = meta + amount, lp - lpOut
+        elif inTokenId == self.nanopool.asset1Id or inTokenId == self.nanopool.asset2Id:
+            lpGained, fees = self.nanozap(inTokenId, amount, zapAmount)
+            lp += lpGained
+            # The output asset is the second foreign asset of the call
+            reserveOut = (
+                self.holding(outTokenId) if outTokenId != self.lp_asset_id else lp
+            )
+            out = computeOtherTokenOutputPerGivenTokenInput(
+                lpGained, lp - lpGained, reserveOut, self.fee_bps
+            )
+            require(0 < out < reserveOut, "invalid swap output")
+            self.sent.append((outTokenId, out))
+            if outTokenId == self.meta_asset_id:
+                meta -= out
+            elif outTokenId == self.lp_asset_id:
+                lp -= out
+            elif outTokenId == self.metapool_lp_asset_id:
+                # Pool tokens leave the account without being counted as outstanding
+                poolTokenBalance -= out
+        else:
+            raise MetapoolReject("invalid input asset")
+        algoBalance = self.fee_guard(fees, feePayment)
+        self.meta_asset_balance, self.lp_asset_balance = meta, lp
+        self.pool_token_balance = poolTokenBalance
+        self.algo_balance = algoBalance
+        return out
+
+    def metaswap_exact_out(
+        self,
+        inTokenId: int,
+        amount: int,
+        outTokenId: int,
+        amountOut: int,
+        routeAmount: int,
+        feePayment=None,
+    ) -> int:
+        """metaswap_exact_out, the unused input is refunded.
+        Args:
+            inTokenId: asset ID of the input.
+            amount: maximum input amount, the transfer.
+            outTokenId: asset ID of the output.
+            amountOut: amount to receive.
+            routeAmount: LP to burn for a meta asset input, zap amount for a nanopool asset input.
+            feePayment: ALGO paid to the metapool for the nanopool fees, what they cost by default.
+        Returns:
+            The amount received.
+        """
+        return self.call(
+            self.run_metaswap_exact_out,
+            inTokenId,
+            amount,
+            outTokenId,
+            amountOut,
+            routeAmount,
+            feePayment,
+        )
+
+    def run_metaswap_exact_out(
+        self, inTokenId, amount, outTokenId, amountOut, routeAmount, feePayment
+    ) -> int:
+        meta, lp = self.meta_asset_balance, self.lp_asset_balance
+        require(
+            self.pool_tokens_outstanding > 0 and amount > 0 and amountOut > 0,
+            "invalid metaswap exact out",
+        )
+        if inTokenId == self.meta_asset_id:
+            require(0 < routeAmount < lp, "invalid route amount")
+            # Compute how much meta asset the LP costs, the transfer is the max input
+            amountIn = computeGivenTokenInputPerOtherTokenOutput(
+                routeAmount, meta, lp, self.fee_bps
+            )
+            require(amountIn <= amount, "input above the transfer")
+            if amount > amountIn:
+                self.sent.append((self.meta_asset_id, amount - amountIn))
+            out, fees = self.nanoburn(routeAmount, outTokenId)
+            require(out >= amountOut, "below amount out")
+            meta, lp = meta + amountIn, lp - routeAmount
+        elif inTokenId == self.nanopool.asset1Id or inTokenId == self.nanopool.asset2Id:
+            require(amountOut < meta, "amount out above the reserve")
+            # Zap the whole input, the unused part is refunded as nanopool LP
+            lpGained, fees = self.nanozap(inTokenId, amount, routeAmount)
+            amountIn = computeGivenTokenInputPerOtherTokenOutput(
+                amountOut, lp, meta, self.fee_bps
+            )
+            require(amountIn <= lpGained, "input above the zapped LP")
+            if lpGained > amountIn:
+                self.sent.append((self.lp_asset_id, lpGained - amountIn))
+            self.sent.append((self.meta_asset_id, amountOut))
+            out = amountOut
+            meta, lp = meta - amountOut, lp + amountIn
+        else:
+            raise MetapoolReject("invalid input asset")
+        algoBalance = self.fee_guard(fees, feePayment)
+        self.meta_asset_balance, self.lp_asset_balance = meta, lp
+        self.algo_balance = algoBalance
+        return out
+
+    def metaswap_from_lp(self, amount: int, minAmountOut=0) -> int:
+        """metaswap_from_lp, nanopool LP to the meta asset.
+        Returns:
+            The meta asset received.
+        """
+        self.sent = []
+        meta, lp = self.meta_asset_balance, self.lp_asset_balance
+        require(
+            self.pool_tokens_outstanding > 0 and amount > 0, "invalid metaswap from lp"
+        )
+        out = computeOtherTokenOutputPerGivenTokenInput(amount, lp, meta, self.fee_bps)
+        require(0 < out < meta, "invalid swap output")
+        require(out >= minAmountOut, "below min amount out")
+        self.meta_asset_balance, self.lp_asset_balance = meta - out, lp + amount
+        self.sent.append((self.meta_asset_id, out))
+        return out
+
+    def metaswap_to_meta(self, amount: int, other, minAmountOut=0) -> int:
+        """metaswap_to_meta, the meta asset to the meta asset of another metapool.
+        Args:
+            amount: meta asset input.
+            other: MetapoolSimulator of the other metapool, on the same nanopool LP.
+            minAmountOut: smallest amount of the other meta asset accepted.
+        Returns:
+            The other meta asset received.
+        """
+        self.sent = []
+        meta, lp = self.meta_asset_balance, self.lp_asset_balance
+        require(
+            self.pool_tokens_outstanding > 0 and amount > 0, "invalid metaswap to meta"
+        )
+        require(other.lp_asset_id == self.lp_asset_id, "different nanopool LP")
+        lpOut = computeOtherTokenOutputPerGivenTokenInput(
+            amount, meta, lp, self.fee_bps
+        )
+        require(0 < lpOut < lp, "invalid swap output")
+        # The other metapool rejects the whole group if its swap fails
+        out = other.metaswap_from_lp(lpOut, minAmountOut)
+        self.meta_asset_balance, self.lp_asset_balance = meta + amount, lp - lpOut
+        self.sent = other.sent
+        return out
+
+    def nanoburn(self, lpAmount: int, outTokenId: int) -> tuple:
+        """Burn nanopool LP, then swap the other asset of the pair for the desired one.
+        Returns:
+            The desired asset received and the explicit inner fees paid.
+        """
+        nanopool = self.nanopool
+        amount1, amount2 = nanopool.burn(lpAmount)
+        require(amount1 > 0 and amount2 > 0, "nanopool burn returned nothing")
+        if outTokenId == nanopool.asset1Id:
+            out = amount1 + nanopool.swap(nanopool.asset2Id, amount2)
+        elif outTokenId == nanopool.asset2Id:
+            out = amount2 + nanopool.swap(nanopool.asset1Id, amount1)
+        else:
+            raise MetapoolReject("invalid output asset")
+        self.sent.append((outTokenId, out))
+        return out, NANOPOOL_CALL_FEE
+
+    def nanozap(self, inTokenId: int, amount: int, zapAmount: int) -> tuple:
+        """Swap part of a nanopool asset for the other, pool both, refund the residuals.
+        Returns:
+            The nanopool LP received and the explicit inner fees paid.
+        """
+        nanopool = self.nanopool
+        require(zapAmount <= amount, "zap transfer overdraws")
+        swapOut = nanopool.swap(inTokenId, zapAmount)
+        if inTokenId == nanopool.asset1Id:
+            otherId = nanopool.asset2Id
+            lp, residualIn, residualOther = nanopool.pool(amount - zapAmount, swapOut)
+        else:
+            otherId = nanopool.asset1Id
+            lp, residualOther, residualIn = nanopool.pool(swapOut, amount - zapAmount)
+        if residualIn > 0:
+            self.sent.append((inTokenId, residualIn))
+        if residualOther > 0:
+            self.sent.append((otherId, residualOther))
+        return lp, 2 * NANOPOOL_CALL_FEE
+
+    def fee_guard(self, fees: int, feePayment) -> int:
+        """innerFeeGuard, the payment covers the nanopool fees paid by the metapool account.
+        Returns:
+            The ALGO balance after the call.
+        """
+        if feePayment is None:
+            feePayment = fees
+        require(feePayment >= fees, "fee payment below the nanopool fees")
+        return self.algo_balance + feePayment - fees
+
+
+class DryrunComparison(NamedTuple):
+    """Outcome of an app call in the simulator and in a dry-run.
+
+    simulated, dryrun: the decoded return value, or None when the call is rejected.
+    reason: the reject reason of the simulator, or the dry-run messages when it rejects.
+    match: both reject, or both pass with the same return value and pool tokens outstanding.
+    """
+
+    operation: str
+    simulated: object
+    dryrun: object
+    simulatedOutstanding: int
+    dryrunOutstanding: int
+    reason: str
+    match: bool
+
+
+def decodeGlobalState(globalState: list) -> dict:
+    """Global state of an app info, the keys decoded, uint or bytes values"""
+    state = {}
+    for entry in globalState:
+        value = entry["value"]
+        key = b64decode(entry["key"]).decode()
+        state[key] = value["uint"] if value["type"] == 2 else b64decode(value["bytes"])
+    return state
+
+
+def simulatorFromDryrun(request, metapoolAppId: int, nanopool) -> MetapoolSimulator:
+    """Simulator in the state of a metapool given to a dry-run request.
+    Args:
+        request: DryrunRequest of create_dryrun.
+        metapoolAppId: application ID of the metapool.
+        nanopool: nanopool model, in the state of the nanopool given to the request.
+    """
+    app = next(app for app in request.apps if app["id"] == metapoolAppId)
+    state = decodeGlobalState(app["params"].get("global-state", []))
+    address = get_application_address(metapoolAppId)
+    account = next(acct for acct in request.accounts if acct["address"] == address)
+    balances = {
+        asset["asset-id"]: asset["amount"] for asset in account.get("assets", [])
+    }
+    simulator = MetapoolSimulator(
+        nanopool, state[metapool_strings.meta_asset_id], account["amount"]
+    )
+    if state.get(metapool_strings.nanopool_app_id):
+        simulator.metapool_lp_asset_id = state[metapool_strings.meta_lp_id]
+        simulator.pool_token_balance = balances.get(simulator.metapool_lp_asset_id, 0)
+    simulator.fee_bps = state[metapool_strings.fee_bps]
+    simulator.min_increment = state[metapool_strings.min_increment]
+    simulator.pool_tokens_outstanding = state[metapool_strings.pool_token_outstanding]
+    simulator.meta_asset_balance = balances.get(simulator.meta_asset_id, 0)
+    simulator.lp_asset_balance = balances.get(simulator.lp_asset_id, 0)
+    return simulator
+
+
+def simulateGroup(simulator: MetapoolSimulator, txns: list, request, nanopool):
+    """Run the metapool app call of a group of transactions through the simulator.
+    Returns:
+        The method signature, the index of the app call, the return value (None if the
+        call is rejected) and the reject reason.
+    """
+    appId = next(
+        stxn.transaction.index
+        for stxn in txns
+        if isinstance(stxn.transaction, ApplicationCallTxn)
+    )
+    address = get_application_address(appId)
+    index = next(
+        i
+        for i, stxn in enumerate(txns)
+        if isinstance(stxn.transaction, ApplicationCallTxn)
+        and stxn.transaction.index == appId
+    )
+    call = txns[index].transaction
+    signature = OPERATIONS[OP_CODES[call.app_args[0]]]
+    method = abi.Method.from_signature(signature)
+    tupleTypes = [
+        arg.type for arg in method.args if isinstance(arg.type, abi.TupleType)
+    ]
+    args = tupleTypes[0].decode(call.app_args[1]) if tupleTypes else []
+    transfers = [
+        (stxn.transaction.index, stxn.transaction.amount)
+        for stxn in txns[:index]
+        if isinstance(stxn.transaction, AssetTransferTxn)
+        and stxn.transaction.receiver == address
+    ]
+    payments = [
+        stxn.transaction.amt
+        for stxn in txns[:index]
+        if isinstance(stxn.transaction, PaymentTxn)
+        and stxn.transaction.receiver == address
+    ]
+    feePayment = payments[0] if payments else None
+    assets = call.foreign_assets or []
+
+    def transfer(assetId=None):
+        require(transfers, "no transfer")
+        inTokenId, amount = transfers[0]
+        require(assetId is None or inTokenId == assetId, "invalid transfer")
+        return inTokenId, amount
+
+    result = None
+    try:
+        if signature == metapool_strings.op_set_metapool:
+            result = simulator.setup(args[0], args[1])
+        elif signature == metapool_strings.op_add_liquidity:
+            require(len(transfers) == 2, "invalid transfers")
+            require(
+                transfers[0][0] == simulator.meta_asset_id
+                and transfers[1][0] == simulator.lp_asset_id,
+                "invalid transfers",
+            )
+            result = simulator.add_liquidity(transfers[0][1], transfers[1][1])
+        elif signature == metapool_strings.op_add_liquidity_single:
+            inTokenId, amount = transfer()
+            result = simulator.add_liquidity_single(
+                inTokenId, amount, args[0], args[1], feePayment
+            )
+        elif signature == metapool_strings.op_withdraw:
+            _, amount = transfer(simulator.metapool_lp_asset_id)
+            result = list(simulator.withdraw(amount))
+        elif signature == metapool_strings.op_withdraw_single:
+            _, amount = transfer(simulator.metapool_lp_asset_id)
+            result = list(
+                simulator.withdraw_single(
+                    amount, assets[0], args[0], bool(args[1]), feePayment
+                )
+            )
+        elif signature == metapool_strings.op_metaswap:
+            inTokenId, amount = transfer()
+            result = simulator.metaswap(
+                inTokenId, amount, assets[1], args[0], feePayment
+            )
+        elif signature == metapool_strings.op_metaswap_exact_out:
+            inTokenId, amount = transfer()
+            result = simulator.metaswap_exact_out(
+                inTokenId, amount, assets[1], args[0], args[1], feePayment
+            )
+        elif signature == metapool_strings.op_metaswap_from_lp:
+            _, amount = transfer(simulator.lp_asset_id)
+            result = simulator.metaswap_from_lp(amount, args[0])
+        elif signature == metapool_strings.op_metaswap_to_meta:
+            _, amount = transfer(simulator.meta_asset_id)
+            other = simulatorFromDryrun(request, call.foreign_apps[0], nanopool)
+            result = simulator.metaswap_to_meta(amount, other, args[0])
+        reason = ""
+    except MetapoolReject as reject:
+        result, reason = None, str(reject)
+    return signature, index, result, reason
+
+
+def replayDryrun(request, response: dict, nanopool) -> DryrunComparison:
+    """Differential check of the simulator against a dry-run of a metapool app call.
+
+    The simulator is loaded from the metapool state given to the request, the group app
+    call is run through it and its outcome compared with the dry-run of the same group.
+    Args:
+        request: DryrunRequest of create_dryrun for the group.
+        response: the result of algod dryrun for the request.
+        nanopool: nanopool model, in the state of the nanopool given to the request.
+    """
+    txns = request.txns
+    appId = next(
+        stxn.transaction.index
+        for stxn in txns
+        if isinstance(stxn.transaction, ApplicationCallTxn)
+    )
+    simulator = simulatorFromDryrun(request, appId, nanopool)
+    outstandingBefore = simulator.pool_tokens_outstanding
+    signature, index, simulated, reason = simulateGroup(
+        simulator, txns, request, nanopool
+    )
+
+    result = response["txns"][index]
+    messages = result.get("app-call-messages", [])
+    dryrun = None
+    dryrunOutstanding = outstandingBefore
+    if "PASS" in messages:
+        method = abi.Method.from_signature(signature)
+        logs = [b64decode(log) for log in result.get("logs") or []]
+        if logs and logs[-1][:4] == ABI_RETURN_HASH:
+            dryrun = method.returns.type.decode(logs[-1][4:])
+        for delta in result.get("global-delta") or []:
+            if (
+                b64decode(delta["key"]).decode()
+                == metapool_strings.pool_token_outstanding
+            ):
+                dryrunOutstanding = delta["value"].get("uint", 0)
+    else:
+        reason = reason or " ".join(messages)
+    if simulated is None or dryrun is None:
+        match = simulated is None and dryrun is None
+    else:
+        match = (
+            simulated == dryrun
+            and simulator.pool_tokens_outstanding == dryrunOutstanding
+        )
+    return DryrunComparison(
+        operation=signature,
+        simulated=simulated,
+        dryrun=dryrun,
+        simulatedOutstanding=simulator.pool_tokens_outstanding,
+        dryrunOutstanding=dryrunOutstanding,
+        reason=reason,
+        match=match,
+    )
@@ -0,0 +1,325 @@
+"""Monte Carlo stress test of a metapool under random order flow and nanopool price shocks.
+
+Every path starts from the same metapool and runs a number of steps. At each step a user
+metaswap of lognormal size goes through the nanopool in a random direction (burn for a meta
+asset input, zap for a nanopool asset input), the value of the nanopool LP in meta asset
+moves by a gaussian return and, with some probability, a shock, and an arbitrageur swaps
+nanopool LP directly against the metapool to bring its price back within the fee band.
+The swaps use the int64 lanes of backtest, vectorized over the paths of a shard: the
+contract rounding is exact and a swap fails where k = meta * lp reaches 2^64, as the uint64
+* of the contract does.
+
+The paths are split in shards of shardSize paths, run on a process pool. Each shard is
+seeded from (seed, shard index), so the result only depends on the seed and the shard size,
+not on the number of workers. A shard returns mergeable histograms and counters instead of
+its paths, the percentiles are read from the merged histograms, to the width of a bin.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+import numpy as np
+from .backtest import swapOutput
+from .feeBudget import metaswapRoute, nanopoolFeePayment
+from .metapoolMath import FEE_DENOMINATOR
+
+
+class MonteCarloConfig(NamedTuple):
+    """Metapool, order flow and price process of a simulation.
+
+    feeBps, metaReserve, lpReserve: metapool configuration and initial reserves.
+    steps: user trades per path.
+    tradeSize: mean size of the user trades, in meta asset value.
+    tradeSigma: standard deviation of the log of the user trade sizes.
+    volatility: standard deviation of the LP price log return per step.
+    shockProbability, shockSize: probability per step of a shock of the LP price, and
+        standard deviation of its log return.
+    algoBalance, minBalance: ALGO balance of the metapool account and its minimum balance.
+    reimbursedShare: share of the inner fees paid by the metapool reimbursed by the users,
+        1 with the fee payment the contract requires.
+    """
+
+    feeBps: int
+    metaReserve: int
+    lpReserve: int
+    steps: int = 1000
+    tradeSize: float = 10**6
+    tradeSigma: float = 1.0
+    volatility: float = 0.001
+    shockProbability: float = 0.001
+    shockSize: float = 0.1
+    algoBalance: int = 10**6
+    minBalance: int = 5 * 10**5
+    reimbursedShare: float = 1.0
+
+
+class StreamingHistogram:
+    def __init__(self, low: float, high: float, bins=16384):
+        """Constructor method for :class:`StreamingHistogram`
+        Fixed bins between low and high, the values outside are counted in the first and last bins.
+        """
+        self.low = low
+        self.high = high
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        scaled = (values - self.low) / (self.high - self.low) * len(self.counts)
+        index = np.clip(np.floor(scaled), 0, len(self.counts) - 1).astype(np.int64)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def merge(self, other: "StreamingHistogram") -> None:
+        self.counts += other.counts
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def percentile(self, q: float) -> float:
+        """Percentile q in [0, 100], interpolated within its bin, exact at 0 and 100"""
+        if self.count == 0:
+            return np.nan
+        if q <= 0:
+            return self.min
+        if q >= 100:
+            return self.max
+        rank = q / 100 * self.count
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, rank))
+        below = cumulative[i - 1] if i else 0
+        width = (self.high - self.low) / len(self.counts)
+        value = self.low + width * (i + (rank - below) / self.counts[i])
+        return float(min(max(value, self.min), self.max))
+
+
+class MonteCarloResult(NamedTuple):
+    """Distributions and counters over all the paths.
+
+    netReturn: value of the LP position against holding the initial reserves, at the final
+        LP price, fees included.
+    impermanentLoss: loss against holding from the pool price move alone, fees excluded.
+    feeReturn: swap fees kept by the pool, relative to the initial value.
+    headroomBits: bits left between the largest k = meta * lp of the path and 2^64.
+    innerFees: inner transaction fees paid by the metapool account, in µAlgo.
+    paths, trades, failed: number of paths, of swaps attempted and of swaps rejected.
+    nearLimit: paths whose k came within nearLimitBits of 2^64, where the swaps fail.
+    drained: paths whose ALGO balance went below the minimum balance.
+    """
+
+    netReturn: StreamingHistogram
+    impermanentLoss: StreamingHistogram
+    feeReturn: StreamingHistogram
+    headroomBits: StreamingHistogram
+    innerFees: StreamingHistogram
+    paths: int
+    trades: int
+    failed: int
+    nearLimit: int
+    drained: int
+
+    def summary(self, percentiles=(1, 5, 50, 95, 99)) -> dict:
+        distributions = [
+            "netReturn",
+            "impermanentLoss",
+            "feeReturn",
+            "headroomBits",
+            "innerFees",
+        ]
+        summary = {
+            name: {q: getattr(self, name).percentile(q) for q in percentiles}
+            for name in distributions
+        }
+        summary.update(
+            paths=self.paths,
+            failedShare=self.failed / max(self.trades, 1),
+            nearLimitShare=self.nearLimit / max(self.paths, 1),
+            drainedShare=self.drained / max(self.paths, 1),
+        )
+        return summary
+
+
+def emptyResult(config: MonteCarloConfig) -> MonteCarloResult:
+    return MonteCarloResult(
+        netReturn=StreamingHistogram(-1, 1),
+        impermanentLoss=StreamingHistogram(-1, 0),
+        feeReturn=StreamingHistogram(0, 1),
+        headroomBits=StreamingHistogram(0, 64, 256),
+        innerFees=StreamingHistogram(0, 8000 * max(config.steps, 1), 1024),
+        paths=0,
+        trades=0,
+        failed=0,
+        nearLimit=0,
+        drained=0,
+    )
+
+
+def mergeResults(result: MonteCarloResult, other: MonteCarloResult) -> MonteCarloResult:
+    for name in [
+        "netReturn",
+        "impermanentLoss",
+        "feeReturn",
+        "headroomBits",
+        "innerFees",
+    ]:
+        getattr(result, name).merge(getattr(other, name))
+    return result._replace(
+        paths=result.paths + other.paths,
+        trades=result.trades + other.trades,
+        failed=result.failed + other.failed,
+        nearLimit=result.nearLimit + other.nearLimit,
+        drained=result.drained + other.drained,
+    )
+
+
+def swapLanes(meta, lp, metaIn, amount, feeComplement):
+    """Apply one swap per lane with the contract math, in place.
+    Returns:
+        The output of each lane, the mask of the rejected swaps (zero output or k beyond
+        uint64) and the swap fee kept by the pool. Lanes with a zero amount do not trade
+        and are not rejected.
+    """
+    given = np.where(metaIn, meta, lp)
+    other = np.where(metaIn, lp, meta)
+    amount = amount.astype(np.int64)
+    amountSubFee = np.floor_divide(feeComplement * amount, FEE_DENOMINATOR)
+    out, fits = swapOutput(given, other, amountSubFee)
+    rejected = (amount > 0) & ((out < 1) | ~fits)
+    taken = (amount > 0) & ~rejected
+    out = out * taken
+    amount = amount * taken
+    meta += np.where(metaIn, amount, -out)
+    lp += np.where(metaIn, -out, amount)
+    return out, rejected, amount - amountSubFee * taken
+
+
+def runShard(
+    config: MonteCarloConfig, seed: int, shard: int, paths: int, nearLimitBits: float
+) -> MonteCarloResult:
+    """Simulate the paths of a shard, vectorized over the paths"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+    meta = np.full(paths, config.metaReserve, dtype=np.int64)
+    lp = np.full(paths, config.lpReserve, dtype=np.int64)
+    price0 = config.metaReserve / config.lpReserve
+    # Value of the nanopool LP in meta asset outside of the metapool
+    price = np.full(paths, price0)
+    feeComplement = FEE_DENOMINATOR - config.feeBps
+    g = feeComplement / FEE_DENOMINATOR
+    metaFees, lpFees = np.zeros(paths, dtype=np.int64), np.zeros(paths, dtype=np.int64)
+    maxK = np.multiply(meta, lp, dtype=np.float64)
+    algo = np.full(paths, float(config.algoBalance))
+    innerFees = np.zeros(paths)
+    drained = np.zeros(paths, dtype=bool)
+    burnFee = nanopoolFeePayment(metaswapRoute(burn=True))
+    zapFee = nanopoolFeePayment(metaswapRoute(burn=False))
+    mu = np.log(config.tradeSize) - config.tradeSigma**2 / 2
+    trades = failed = 0
+
+    for _ in range(config.steps):
+        # User metaswap through the nanopool
+        metaIn = rng.random(paths) < 0.5
+        size = np.floor(rng.lognormal(mu, config.tradeSigma, paths)) + 1
+        amount = np.where(metaIn, size, np.floor(size / price) + 1)
+        _, rejected, fees = swapLanes(meta, lp, metaIn, amount, feeComplement)
+        metaFees += np.where(metaIn, fees, 0)
+        lpFees += np.where(metaIn, 0, fees)
+        paid = np.where(metaIn, burnFee, zapFee) * ~rejected
+        innerFees += paid
+        algo -= paid * (1 - config.reimbursedShare)
+        drained |= algo < config.minBalance
+        trades += paths
+        failed += int(rejected.sum())
+
+        # LP price move
+        returns = rng.normal(0, config.volatility, paths)
+        shocks = rng.random(paths) < config.shockProbability
+        returns += shocks * rng.normal(0, config.shockSize, paths)
+        price *= np.exp(returns)
+
+        # Arbitrage back to the edge of the fee band, nanopool LP traded directly
+        poolPrice = meta / lp
+        k = np.multiply(meta, lp, dtype=np.float64)
+        sellLp = poolPrice * g > price
+        buyLp = poolPrice < price * g
+        lpTarget = np.sqrt(k * g / np.where(sellLp, price, 1))
+        metaTarget = np.sqrt(k * np.where(buyLp, price, 1) * g)
+        amount = np.where(
+            sellLp,
+            np.floor((lpTarget - lp) / g),
+            np.where(buyLp, np.floor((metaTarget - meta) / g), 0),
+        )
+        amount = np.maximum(amount, 0)
+        _, rejected, fees = swapLanes(meta, lp, buyLp, amount, feeComplement)
+        metaFees += np.where(buyLp, fees, 0)
+        lpFees += np.where(buyLp, 0, fees)
+        trades += int((amount > 0).sum())
+        failed += int(rejected.sum())
+        np.maximum(maxK, np.multiply(meta, lp, dtype=np.float64), out=maxK)
+
+    holdValue = config.metaReserve + config.lpReserve * price
+    ratio = (meta / lp) / price0
+    headroom = 64 - np.log2(maxK)
+    result = emptyResult(config)
+    result.netReturn.add((meta + lp * price) / holdValue - 1)
+    result.impermanentLoss.add(2 * np.sqrt(ratio) / (1 + ratio) - 1)
+    result.feeReturn.add(
+        (metaFees + lpFees * price) / (config.metaReserve + config.lpReserve * price0)
+    )
+    result.headroomBits.add(headroom)
+    result.innerFees.add(innerFees)
+    return result._replace(
+        paths=paths,
+        trades=trades,
+        failed=failed,
+        nearLimit=int((headroom <= nearLimitBits).sum()),
+        drained=int(drained.sum()),
+    )
+
+
+def simulate(
+    config: MonteCarloConfig,
+    paths: int,
+    seed=0,
+    shardSize=1000,
+    maxWorkers=None,
+    nearLimitBits=4,
+) -> MonteCarloResult:
+    """Run the paths of a configuration on a process pool.
+    Args:
+        config: MonteCarloConfig.
+        paths: number of paths.
+        seed: seed of the simulation.
+        shardSize: paths per shard, simulated together in one process.
+        maxWorkers: number of processes, all the cores by default, 0 to run in this process.
+        nearLimitBits: headroom below which a path counts as near the uint64 limit.
+    Returns:
+        The merged MonteCarloResult.
+    """
+    shards = [
+        (shard, min(shardSize, paths - start))
+        for shard, start in enumerate(range(0, paths, shardSize))
+    ]
+    result = emptyResult(config)
+    if maxWorkers == 0:
+        for shard, size in shards:
+            result = mergeResults(
+                result, runShard(config, seed, shard, size, nearLimitBits)
+            )
+        return result
+    with ProcessPoolExecutor(maxWorkers or os.cpu_count()) as executor:
+        # Shard results are merged in shard order, the paths never leave their process
+        for shardResult in executor.map(
+            runShard,
+            *zip(
+                *[(config, seed, shard, size, nearLimitBits) for shard, size in shards]
+            ),
+        ):
+            result = mergeResults(result, shardResult)
+    return result
@@ -0,0 +1,573 @@
+from .utils import (
+    MULTI_MIN_BALANCE_REQUIREMENT,
+    SLOT_MIN_BALANCE_REQUIREMENT,
+    compiledMultiContract,
+    encodeMethodCall,
+    decodeMethodReturn,
+    Account,
+)
+from .contracts.poolStrings import metapool_strings, multi_metapool_strings
+from .metapoolAMMClient import MetapoolAMMClient
+from .metapoolMath import computeOtherTokenOutputPerGivenTokenInput
+from .feeBudget import (
+    NANOPOOL_INNER_TXNS,
+    minimumFee,
+    addLiquidityRoute,
+    withdrawRoute,
+    metaswapRoute,
+    metaswapFromLpRoute,
+)
+from algofi_amm.v0.client import AlgofiAMMClient
+from algofi_amm.v0.pool import Pool
+from algofi_amm.v0.config import PoolType
+from algofi_amm.utils import (
+    wait_for_confirmation,
+    get_application_global_state,
+    get_account_balances,
+)
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+
+
+def slotKey(key: str, slot: int) -> str:
+    """Global state key of a meta asset slot, as decoded from the app global state"""
+    return key + slot.to_bytes(8, "big").decode()
+
+
+class MetaSlot:
+    """State of one meta asset of a multi-asset metapool"""
+
+    def __init__(self, slot: int, appGlobalState: dict) -> None:
+        self.slot = slot
+        self.meta_asset_id = appGlobalState[
+            slotKey(metapool_strings.meta_asset_id, slot)
+        ]
+        self.metapool_lp_asset_id = appGlobalState[
+            slotKey(metapool_strings.meta_lp_id, slot)
+        ]
+        self.pool_tokens_outstanding = appGlobalState.get(
+            slotKey(metapool_strings.pool_token_outstanding, slot), 0
+        )
+        self.lp_asset_balance = appGlobalState.get(
+            slotKey(multi_metapool_strings.lp_reserve, slot), 0
+        )
+        self.meta_asset_balance = 0
+
+
+class MultiMetapoolAMMClient:
+    """Client of a multi-asset metapool, several meta assets traded against one nanopool LP in a single app.
+
+    Every meta asset has its own slot, with its own reserves and pool token.
+    The methods take the meta asset ID to select the slot.
+    """
+
+    # The nanopool helpers only depend on the nanopool and the metapool address
+    get_zap_amount = MetapoolAMMClient.get_zap_amount
+    get_zap_output = MetapoolAMMClient.get_zap_output
+    get_zap_residuals = MetapoolAMMClient.get_zap_residuals
+    get_burn_output = MetapoolAMMClient.get_burn_output
+    fundMetapool = MetapoolAMMClient.fundMetapool
+    closeMetapool = MetapoolAMMClient.closeMetapool
+    get_fee_payment_txn = MetapoolAMMClient.get_fee_payment_txn
+    observe_nanopool_inner_txns = MetapoolAMMClient.observe_nanopool_inner_txns
+
+    def __init__(
+        self,
+        client: AlgofiAMMClient,
+        nanopool: Pool,
+        metapoolAppID=None,
+    ):
+        """Constructor method for :class:`MultiMetapoolAMMClient`
+        Args:
+            client: An Algofi AMM Client.
+            nanopool: Algofi AMM nanopool Pool object.
+            metapoolAppID: Application ID of the metapool, leave none for a new pool.
+        """
+        self.client = client
+        self.nanopool = nanopool
+        self.nanopool_inner_txns = dict(NANOPOOL_INNER_TXNS)
+        self.slots = {}
+        if metapoolAppID:
+            self.metapool_application_id = metapoolAppID
+            self.metapool_address = get_application_address(metapoolAppID)
+            self.refresh_state()
+
+    @classmethod
+    def fromMetapoolId(cls, client: AlgofiAMMClient, metapoolAppID: int):
+        """Alternative constructor for class MultiMetapoolAMMClient.
+        Load the nanopool from the app global state
+        Args:
+            client: An Algofi AMM Client.
+            metapoolAppID: Application ID of the metapool,
+        """
+        appGlobalState = get_application_global_state(client.indexer, metapoolAppID)
+        try:
+            nanopool = client.get_pool(
+                PoolType.NANOSWAP,
+                appGlobalState[metapool_strings.nanopool_asset_1_id],
+                appGlobalState[metapool_strings.nanopool_asset_2_id],
+            )
+        except KeyError:
+            raise RuntimeError("Make sure the metapool app has been set up")
+        return cls(client, nanopool, metapoolAppID)
+
+    def createMetapool(self, user: Account) -> int:
+        """Create a new multi-asset metapool amm.
+        Args:
+            user: Creator Account
+        Returns:
+            The app ID of the newly created metapool amm.
+        """
+        global_schema = transaction.StateSchema(
+            num_uints=8 + 4 * multi_metapool_strings.max_meta_assets,
+            num_byte_slices=1,
+        )
+        local_schema = transaction.StateSchema(num_uints=0, num_byte_slices=0)
+        approval_program, clear_program = compiledMultiContract(self.client.algod)
+
+        create_txn = transaction.ApplicationCreateTxn(
+            sender=user.getAddress(),
+            sp=self.client.algod.suggested_params(),
+            on_complete=transaction.OnComplete.NoOpOC,
+            approval_program=approval_program,
+            clear_program=clear_program,
+            global_schema=global_schema,
+            local_schema=local_schema,
+            extra_pages=1,
+        )
+
+        s_create_txn = create_txn.sign(user.getPrivateKey())
+        txid = self.client.algod.send_transaction(s_create_txn)
+        response = wait_for_confirmation(self.client.algod, txid)
+        metapool_contract_id = response["application-index"]
+
+        assert metapool_contract_id is not None and metapool_contract_id > 0
+        self.metapool_application_id = metapool_contract_id
+        self.metapool_address = get_application_address(self.metapool_application_id)
+        return metapool_contract_id
+
+    def setupMetapool(self, user: Account, feeBps: int, minIncrement: int) -> None:
+        """Finish setting up a multi-asset metapool amm.
+
+        This operation funds the pool account and opts the app into the nanopool assets
+        and LP token, once for all the meta assets registered later.
+
+        Args:
+            user: Creator Account
+            feeBps: The basis point fee to be charged per swap, in every slot
+            minIncrement: minimum quantity to add liquidity to the pool, in every slot
+        """
+        params = self.client.algod.suggested_params()
+        fundingAmount = (
+            MULTI_MIN_BALANCE_REQUIREMENT
+            # additional balance to opt into assets (3)
+            + 1_000 * 3
+        )
+        fundAppTxn = transaction.PaymentTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            amt=fundingAmount,
+            sp=params,
+        )
+        setupTxn = transaction.ApplicationCallTxn(
+            sender=user.getAddress(),
+            index=self.metapool_application_id,
+            on_complete=transaction.OnComplete.NoOpOC,
+            app_args=encodeMethodCall(
+                multi_metapool_strings.op_set_metapool, [feeBps, minIncrement]
+            ),
+            foreign_assets=[
+                self.nanopool.asset1.asset_id,
+                self.nanopool.asset2.asset_id,
+                self.nanopool.lp_asset_id,
+            ],
+            foreign_apps=[
+                self.nanopool.application_id,
+                self.nanopool.manager_application_id,
+            ],
+            sp=params,
+        )
+        transaction.assign_group_id([fundAppTxn, setupTxn])
+        signedFundAppTxn = fundAppTxn.sign(user.getPrivateKey())
+        signedSetupTxn = setupTxn.sign(user.getPrivateKey())
+        self.client.algod.send_transactions([signedFundAppTxn, signedSetupTxn])
+        wait_for_confirmation(self.client.algod, signedSetupTxn.get_txid())
+
+    def registerMetaAsset(self, user: Account, metaAssetID: int) -> int:
+        """Add a meta asset to the metapool, in the next free slot.
+
+        This operation funds the min balance of the slot, opts the app into the
+        meta asset and creates the slot pool token.
+
+        Args:
+            user: Creator Account
+            metaAssetID: The asset ID of the meta asset to trade against the nanopool LP.
+        Returns:
+            The pool token ID of the meta asset slot.
+        """
+        params = self.client.algod.suggested_params()
+        fundAppTxn = transaction.PaymentTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            # additional balance to create pool token and opt into the meta asset
+            amt=SLOT_MIN_BALANCE_REQUIREMENT + 1_000 * 2,
+            sp=params,
+        )
+        registerTxn = transaction.ApplicationCallTxn(
+            sender=user.getAddress(),
+            index=self.metapool_application_id,
+            on_complete=transaction.OnComplete.NoOpOC,
+            app_args=encodeMethodCall(multi_metapool_strings.op_register_meta),
+            foreign_assets=[metaAssetID],
+            sp=params,
+        )
+        transaction.assign_group_id([fundAppTxn, registerTxn])
+        signedFundAppTxn = fundAppTxn.sign(user.getPrivateKey())
+        signedRegisterTxn = registerTxn.sign(user.getPrivateKey())
+        self.client.algod.send_transactions([signedFundAppTxn, signedRegisterTxn])
+        txinfo = wait_for_confirmation(self.client.algod, signedRegisterTxn.get_txid())
+        _, metaLPID = decodeMethodReturn(
+            multi_metapool_strings.op_register_meta, txinfo
+        )
+        self.refresh_state()
+        return metaLPID
+
+    def refresh_state(self) -> None:
+        """Load the configuration and the reserves of every slot."""
+        appGlobalState = get_application_global_state(
+            self.client.indexer, self.metapool_application_id
+        )
+        balances = get_account_balances(self.client.indexer, self.metapool_address)
+        self.fee_bps = appGlobalState.get(metapool_strings.fee_bps, 0)
+        self.slots = {}
+        for slot in range(appGlobalState.get(multi_metapool_strings.meta_count, 0)):
+            metaSlot = MetaSlot(slot, appGlobalState)
+            metaSlot.meta_asset_balance = balances.get(metaSlot.meta_asset_id, 0)
+            self.slots[metaSlot.meta_asset_id] = metaSlot
+
+    def get_slot(self, metaAssetID: int) -> MetaSlot:
+        """State of the slot of a meta asset, as of the last refresh."""
+        try:
+            return self.slots[metaAssetID]
+        except KeyError:
+            raise ValueError("Meta asset %i is not registered" % metaAssetID)
+
+    def assertSetup(self) -> None:
+        try:
+            balances = get_account_balances(self.client.indexer, self.metapool_address)
+            assert balances[1] >= MULTI_MIN_BALANCE_REQUIREMENT + (
+                SLOT_MIN_BALANCE_REQUIREMENT * len(self.slots)
+            )
+        except:
+            raise Exception("AMM must be set up and funded first.")
+
+    def optInToPoolToken(self, user: Account, metaAssetID: int):
+        self.assertSetup()
+        optInTxn = transaction.AssetOptInTxn(
+            sender=user.getAddress(),
+            index=self.get_slot(metaAssetID).metapool_lp_asset_id,
+            sp=self.client.algod.suggested_params(),
+        )
+        signedOptInTxn = optInTxn.sign(user.getPrivateKey())
+        self.client.algod.send_transaction(signedOptInTxn)
+        wait_for_confirmation(self.client.algod, signedOptInTxn.get_txid())
+
+    def add_liquidity(self, user: Account, metaAssetID: int, qA: int, qB: int) -> int:
+        """Supply liquidity to the slot of a meta asset.
+        Same rules as :meth:`MetapoolAMMClient.add_liquidity`, against the slot reserves.
+
+        Args:
+            user: user Account
+            metaAssetID: meta asset of the slot.
+            qA: amount of meta asset to supply the pool.
+            qB: amount of nanopool LP token to supply to the pool.
+        Returns:
+            The amount of pool token minted.
+        """
+        self.assertSetup()
+        metaSlot = self.get_slot(metaAssetID)
+        params = self.client.algod.suggested_params()
+
+        tokenATxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=metaAssetID,
+            amt=qA,
+            sp=params,
+        )
+        tokenBTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=self.nanopool.lp_asset_id,
+            amt=qB,
+            sp=params,
+        )
+        # pay for the refunds and the pool token transfer
+        params.fee = minimumFee(addLiquidityRoute(refunds=2))
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationCallTxn(
+            sender=user.getAddress(),
+            index=self.metapool_application_id,
+            on_complete=transaction.OnComplete.NoOpOC,
+            app_args=encodeMethodCall(
+                multi_metapool_strings.op_add_liquidity, [metaSlot.slot]
+            ),
+            foreign_assets=[
+                metaAssetID,
+                self.nanopool.lp_asset_id,
+                metaSlot.metapool_lp_asset_id,
+            ],
+            sp=params,
+        )
+        transaction.assign_group_id([tokenATxn, tokenBTxn, appCallTxn])
+        signedTokenATxn = tokenATxn.sign(user.getPrivateKey())
+        signedTokenBTxn = tokenBTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions(
+            [signedTokenATxn, signedTokenBTxn, signedAppCallTxn]
+        )
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(multi_metapool_strings.op_add_liquidity, txinfo)
+
+    def withdraw(self, user: Account, metaAssetID: int, poolTokenAmount: int) -> list:
+        """Withdraw liquidity + rewards from the slot of a meta asset.
+
+        Args:
+            user: user Account
+            metaAssetID: meta asset of the slot.
+            poolTokenAmount: pool token quantity.
+        Returns:
+            The withdrawn amounts of meta asset and nanopool LP token.
+        """
+        self.assertSetup()
+        metaSlot = self.get_slot(metaAssetID)
+        params = self.client.algod.suggested_params()
+
+        poolTokenTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=metaSlot.metapool_lp_asset_id,
+            amt=poolTokenAmount,
+            sp=params,
+        )
+        # pay for the fee incurred by AMM for sending back the tokens
+        params.fee = minimumFee(withdrawRoute())
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationCallTxn(
+            sender=user.getAddress(),
+            index=self.metapool_application_id,
+            on_complete=transaction.OnComplete.NoOpOC,
+            app_args=encodeMethodCall(
+                multi_metapool_strings.op_withdraw, [metaSlot.slot]
+            ),
+            foreign_assets=[
+                metaAssetID,
+                self.nanopool.lp_asset_id,
+                metaSlot.metapool_lp_asset_id,
+            ],
+            sp=params,
+        )
+
+        transaction.assign_group_id([poolTokenTxn, appCallTxn])
+        signedPoolTokenTxn = poolTokenTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions([signedPoolTokenTxn, signedAppCallTxn])
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(multi_metapool_strings.op_withdraw, txinfo)
+
+    def metaswap(
+        self,
+        user: Account,
+        metaAssetID: int,
+        inTokenId: int,
+        amount: int,
+        outTokenId: int,
+    ) -> int:
+        """Swap between a meta asset and one of the nanopool pair, through the slot of the meta asset.
+        Same routes as :meth:`MetapoolAMMClient.metaswap`.
+
+        Args:
+            user: user Account
+            metaAssetID: meta asset of the slot.
+            inTokenId: asset Id of the token to swap.
+            amount: amount to swap.
+            outTokenId: asset if of the token to receive.
+        Returns:
+            The amount of outTokenId received.
+        """
+        self.assertSetup()
+        metaSlot = self.get_slot(metaAssetID)
+        assets = self.get_swap_assets(metaAssetID, inTokenId, outTokenId)
+        zap_amount = residuals = 0
+        if inTokenId != metaAssetID:
+            zap_amount = self.get_zap_amount(inTokenId, amount)
+            residuals = self.get_zap_residuals(inTokenId, amount, zap_amount)
+        params = self.client.algod.suggested_params()
+
+        inSwapTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=inTokenId,
+            amt=amount,
+            sp=params,
+        )
+        route = metaswapRoute(burn=inTokenId == metaAssetID, residuals=residuals)
+        feePaymentTxn = self.get_fee_payment_txn(user, route, params)
+        params.fee = minimumFee(route, innerTxns=self.nanopool_inner_txns)
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                multi_metapool_strings.op_metaswap,
+                [metaSlot.slot, int(zap_amount)],
+            ),
+            foreign_apps=[
+                self.nanopool.application_id,
+                self.nanopool.manager_application_id,
+            ],
+            foreign_assets=assets,
+            accounts=[self.nanopool.address],
+        )
+
+        transaction.assign_group_id([inSwapTxn, feePaymentTxn, appCallTxn])
+        signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedFeePaymentTxn = feePaymentTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions(
+            [signedInSwapTxn, signedFeePaymentTxn, signedAppCallTxn]
+        )
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(multi_metapool_strings.op_metaswap, txinfo)
+
+    def metaswap_to_meta(
+        self,
+        user: Account,
+        fromMetaAssetID: int,
+        toMetaAssetID: int,
+        amount: int,
+        minAmountOut: int = 0,
+    ) -> int:
+        """Swap a meta asset for another meta asset of the same app.
+        The nanopool LP only moves between the two slots, there is no nanopool call.
+
+        Args:
+            user: user Account
+            fromMetaAssetID: meta asset to swap.
+            toMetaAssetID: meta asset to receive.
+            amount: amount to swap.
+            minAmountOut: minimum amount of toMetaAssetID to receive, the call fails otherwise.
+        Returns:
+            The amount of toMetaAssetID received.
+        """
+        self.assertSetup()
+        fromSlot = self.get_slot(fromMetaAssetID)
+        toSlot = self.get_slot(toMetaAssetID)
+        params = self.client.algod.suggested_params()
+
+        inSwapTxn = transaction.AssetTransferTxn(
+            sender=user.getAddress(),
+            receiver=self.metapool_address,
+            index=fromMetaAssetID,
+            amt=amount,
+            sp=params,
+        )
+        # pay for the output transfer
+        params.fee = minimumFee(metaswapFromLpRoute())
+        params.flat_fee = True
+        appCallTxn = transaction.ApplicationNoOpTxn(
+            sender=user.getAddress(),
+            sp=params,
+            index=self.metapool_application_id,
+            app_args=encodeMethodCall(
+                multi_metapool_strings.op_metaswap_to_meta,
+                [fromSlot.slot, toSlot.slot, minAmountOut],
+            ),
+            foreign_assets=[fromMetaAssetID, toMetaAssetID],
+        )
+
+        transaction.assign_group_id([inSwapTxn, appCallTxn])
+        signedInSwapTxn = inSwapTxn.sign(user.getPrivateKey())
+        signedAppCallTxn = appCallTxn.sign(user.getPrivateKey())
+
+        self.client.algod.send_transactions([signedInSwapTxn, signedAppCallTxn])
+        txinfo = wait_for_confirmation(self.client.algod, signedAppCallTxn.get_txid())
+        return decodeMethodReturn(multi_metapool_strings.op_metaswap_to_meta, txinfo)
+
+    def get_swap_assets(
+        self, metaAssetID: int, inTokenId: int, outTokenId: int
+    ) -> list:
+        """Foreign assets of a metaswap call: input, output, other nanopool asset, nanopool LP."""
+        nanopool_assets = [
+            self.nanopool.asset1.asset_id,
+            self.nanopool.asset2.asset_id,
+        ]
+        if inTokenId == metaAssetID and outTokenId in nanopool_assets:
+            other = nanopool_assets[1 - nanopool_assets.index(outTokenId)]
+        elif inTokenId in nanopool_assets and outTokenId == metaAssetID:
+            other = nanopool_assets[1 - nanopool_assets.index(inTokenId)]
+        else:
+            raise ValueError("Invalid token pair")
+        return [inTokenId, outTokenId, other, self.nanopool.lp_asset_id]
+
+    def get_metaswap_quote(
+        self,
+        metaAssetID: int,
+        inTokenId: int,
+        amount: int,
+        outTokenId: int,
+        refresh=True,
+    ) -> int:
+        """Expected output of a metaswap through the slot of a meta asset.
+        Args:
+            metaAssetID: meta asset of the slot.
+            inTokenId: asset Id of the token to swap.
+            amount: amount to swap.
+            outTokenId: asset if of the token to receive.
+            refresh: reload the metapool and nanopool state first.
+        """
+        self.get_swap_assets(metaAssetID, inTokenId, outTokenId)
+        if refresh:
+            self.refresh_state()
+            self.nanopool.refresh_state()
+        metaSlot = self.get_slot(metaAssetID)
+        if inTokenId == metaAssetID:
+            lp_amount = computeOtherTokenOutputPerGivenTokenInput(
+                amount,
+                metaSlot.meta_asset_balance,
+                metaSlot.lp_asset_balance,
+                self.fee_bps,
+            )
+            return self.get_burn_output(lp_amount, outTokenId)
+        lp_amount, _ = self.get_zap_output(inTokenId, amount, refresh=False)
+        return computeOtherTokenOutputPerGivenTokenInput(
+            lp_amount,
+            metaSlot.lp_asset_balance,
+            metaSlot.meta_asset_balance,
+            self.fee_bps,
+        )
+
+    def get_metaswap_to_meta_quote(
+        self, fromMetaAssetID: int, toMetaAssetID: int, amount: int, refresh=True
+    ) -> int:
+        """Expected output of a swap between two meta assets of the app."""
+        if refresh:
+            self.refresh_state()
+        fromSlot = self.get_slot(fromMetaAssetID)
+        toSlot = self.get_slot(toMetaAssetID)
+        lp_amount = computeOtherTokenOutputPerGivenTokenInput(
+            amount,
+            fromSlot.meta_asset_balance,
+            fromSlot.lp_asset_balance,
+            self.fee_bps,
+        )
+        return computeOtherTokenOutputPerGivenTokenInput(
+            lp_amount,
+            toSlot.lp_asset_balance,
+            toSlot.meta_asset_balance,
+            self.fee_bps,
+        )
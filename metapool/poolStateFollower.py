@@ -0,0 +1,218 @@
+"""Follow the state of metapool and nanopool apps block by block.
+
+The follower reads the global state and asset balances of the followed apps once, then
+waits for each new round with algod's status-after-block and applies the transactions of
+the block that touch them: global state deltas of the app calls, asset transfers to and
+from the app accounts, inner transactions included. The state is only read again after a
+gap (more rounds behind than maxGap, or a block that could not be fetched) or for an app
+that created or destroyed an asset.
+"""
+
+import asyncio
+import msgpack
+from algosdk.encoding import decode_address
+from algosdk.error import AlgodHTTPError
+from algosdk.logic import get_application_address
+from .registry import decodeGlobalState
+
+# Global state delta actions
+SET_BYTES, SET_UINT, DELETE = 1, 2, 3
+
+
+class AppState:
+    """Global state and asset balances of an app, as of round"""
+
+    def __init__(self, appId: int) -> None:
+        self.appId = appId
+        self.address = get_application_address(appId)
+        self.globalState = {}
+        self.balances = {}
+        self.round = 0
+
+
+class PoolStateFollower:
+    def __init__(self, algod, appIds=(), maxGap=8):
+        """Constructor method for :class:`PoolStateFollower`
+        Args:
+            algod: algod client.
+            appIds: IDs of the apps to follow.
+            maxGap: number of rounds behind above which the state is read again instead of
+                applying the blocks.
+        """
+        self.algod = algod
+        self.maxGap = maxGap
+        self.apps = {}
+        self.accounts = {}
+        self.round = None
+        self.metapools = []
+        # IDs of the metapools whose nanopool client is refreshed from algod
+        self.refreshedNanopools = set()
+        self.callbacks = []
+        for appId in appIds:
+            self.add_app(appId)
+
+    def add_app(self, appId: int) -> AppState:
+        if appId not in self.apps:
+            app = AppState(appId)
+            self.apps[appId] = app
+            self.accounts[decode_address(app.address)] = app
+            if self.round is not None:
+                self.read_state([appId])
+        return self.apps[appId]
+
+    def follow(self, metapool, refreshNanopool=False) -> None:
+        """Keep the state of a MetapoolAMMClient up to date.
+
+        The metapool reserves are set from the followed state. The nanopool app is followed
+        too, its updates are reported to the callbacks, but the nanopool client is only
+        refreshed with refreshNanopool, by nanopool.refresh_state in the rounds that touched
+        the nanopool: one algod request per such round.
+        """
+        self.add_app(metapool.metapool_application_id)
+        self.add_app(metapool.nanopool.application_id)
+        self.metapools.append(metapool)
+        if refreshNanopool:
+            self.refreshedNanopools.add(metapool.metapool_application_id)
+        if self.round is not None:
+            self.update_metapools(set(self.apps))
+
+    def subscribe(self, callback) -> None:
+        """Call callback(round, changed) after each step, changed is the set of the IDs of the updated apps"""
+        self.callbacks.append(callback)
+
+    def read_state(self, appIds) -> None:
+        """Read the whole state of the apps, at least as recent as the current round"""
+        for appId in appIds:
+            app = self.apps[appId]
+            info = self.algod.application_info(appId)
+            app.globalState = decodeGlobalState(info["params"].get("global-state", []))
+            account = self.algod.account_info(app.address)
+            app.balances = {
+                asset["asset-id"]: asset["amount"]
+                for asset in account.get("assets", [])
+            }
+            app.round = account["round"]
+
+    def step(self):
+        """Wait for a new round and bring the followed state up to it.
+        Returns:
+            The round reached and the set of the IDs of the apps updated.
+        """
+        return self.advance(self.wait())
+
+    def wait(self) -> int:
+        """Wait for a round after the current one, without changing the state.
+        Returns:
+            The last round of the node.
+        """
+        if self.round is None:
+            return self.algod.status()["last-round"]
+        return self.algod.status_after_block(self.round)["last-round"]
+
+    def advance(self, lastRound: int):
+        """Bring the followed state up to lastRound, see step."""
+        if self.round is None:
+            self.round = lastRound
+            changed = set(self.apps)
+            self.read_state(changed)
+        else:
+            changed = self.apply_blocks(lastRound)
+        self.update_metapools(changed)
+        for callback in self.callbacks:
+            callback(self.round, changed)
+        return self.round, changed
+
+    def apply_blocks(self, lastRound: int) -> set:
+        if lastRound - self.round > self.maxGap:
+            self.round = lastRound
+            self.read_state(self.apps)
+            return set(self.apps)
+        changed, stale = set(), set()
+        for rnd in range(self.round + 1, lastRound + 1):
+            try:
+                block = msgpack.unpackb(
+                    self.algod.block_info(round_num=rnd, response_format="msgpack"),
+                    raw=False,
+                    strict_map_key=False,
+                    unicode_errors="surrogateescape",
+                )["block"]
+            except AlgodHTTPError:
+                self.round = lastRound
+                self.read_state(self.apps)
+                return set(self.apps)
+            for stxn in block.get("txns", []):
+                self.apply_txn(stxn, changed, stale)
+            self.round = rnd
+        for appId in changed:
+            self.apps[appId].round = self.round
+        self.read_state(stale)
+        return changed | stale
+
+    def apply_txn(self, stxn: dict, changed: set, stale: set) -> None:
+        """Apply a transaction of a block and its inner transactions to the followed apps"""
+        txn = stxn["txn"]
+        txnType = txn.get("type")
+        if txnType == "appl":
+            app = self.apps.get(txn.get("apid", 0))
+            if app is not None:
+                for key, delta in stxn.get("dt", {}).get("gd", {}).items():
+                    if delta["at"] == SET_BYTES:
+                        app.globalState[key] = delta.get("bs", "").encode(
+                            errors="surrogateescape"
+                        )
+                    elif delta["at"] == SET_UINT:
+                        app.globalState[key] = delta.get("ui", 0)
+                    else:
+                        app.globalState.pop(key, None)
+                changed.add(app.appId)
+        elif txnType == "axfer":
+            assetId = txn.get("xaid", 0)
+            amount = txn.get("aamt", 0)
+            sender = self.accounts.get(txn.get("asnd") or txn["snd"])
+            receiver = self.accounts.get(txn.get("arcv"))
+            closeTo = self.accounts.get(txn.get("aclose"))
+            if sender is not None:
+                if txn.get("aclose"):
+                    sender.balances.pop(assetId, None)
+                else:
+                    sender.balances[assetId] = sender.balances.get(assetId, 0) - amount
+                changed.add(sender.appId)
+            if receiver is not None:
+                receiver.balances[assetId] = receiver.balances.get(assetId, 0) + amount
+                changed.add(receiver.appId)
+            if closeTo is not None:
+                closeTo.balances[assetId] = closeTo.balances.get(assetId, 0) + stxn.get(
+                    "aca", 0
+                )
+                changed.add(closeTo.appId)
+        elif txnType == "acfg":
+            # Asset creation or destruction, the new holding is read again
+            creator = self.accounts.get(txn["snd"])
+            if creator is not None:
+                stale.add(creator.appId)
+        for inner in stxn.get("dt", {}).get("itx", []):
+            self.apply_txn(inner, changed, stale)
+
+    def update_metapools(self, changed: set) -> None:
+        for metapool in self.metapools:
+            app = self.apps[metapool.metapool_application_id]
+            if app.appId in changed and app.globalState:
+                metapool.load_state(app.globalState, app.balances)
+            if (
+                app.appId in self.refreshedNanopools
+                and metapool.nanopool.application_id in changed
+            ):
+                metapool.nanopool.refresh_state()
+
+    def run(self, rounds=None) -> None:
+        """Follow the chain, for a number of rounds or forever"""
+        while rounds is None or rounds > 0:
+            self.step()
+            if rounds is not None:
+                rounds -= 1
+
+    async def updates(self):
+        """Asynchronous iterator over the steps, the blocking algod requests run in the default executor"""
+        loop = asyncio.get_event_loop()
+        while True:
+            yield await loop.run_in_executor(None, self.step)
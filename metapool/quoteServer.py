@@ -0,0 +1,256 @@
+"""Local HTTP quote server for metapools.
+
+The server keeps the state of the configured metapools and their nanopools in memory with a
+PoolStateFollower, advanced once per round, and answers from it:
+
+    GET /quote?app=<id>&in=<asset>&out=<asset>&amount=<n>   metaswap output
+    GET /zap_amount?app=<id>&asset=<asset>&amount=<n>       nanopool zap amount
+    GET /lp_preview?app=<id>&in=<asset>&amount=<n>          single asset deposit
+    GET /depth?app=<id>&in=<asset>&out=<asset>&impact_bps=<x>
+                                                            largest size within an impact
+    GET /metrics                                            counters and latency
+
+The app parameter can be left out when a single metapool is served. Identical requests in
+flight at the same time are computed once, and results are cached for the round. Run it with
+`python -m metapool.quoteServer config.json`, see main for the configuration file.
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+from .poolStateFollower import PoolStateFollower
+from .depthTables import buildDepthTables
+
+
+class QuoteServer:
+    def __init__(self, metapools: list, algod, maxGap=8):
+        """Constructor method for :class:`QuoteServer`
+        Args:
+            metapools: the MetapoolAMMClient of the metapools to quote.
+            algod: algod client.
+            maxGap: see PoolStateFollower.
+        """
+        self.metapools = {
+            metapool.metapool_application_id: metapool for metapool in metapools
+        }
+        self.follower = PoolStateFollower(algod, maxGap=maxGap)
+        for metapool in metapools:
+            # The quotes run through the nanopool, its reserves must be current
+            self.follower.follow(metapool, refreshNanopool=True)
+        self.routes = {
+            "quote": self.quote,
+            "zap_amount": self.zap_amount,
+            "lp_preview": self.lp_preview,
+            "depth": self.depth,
+        }
+        # The quotes and the state updates run in executor threads, never concurrently
+        self.stateLock = threading.Lock()
+        self.cache = {}
+        self.inflight = {}
+        # metapool app id -> (round, depth tables of the round)
+        self.depthTables = {}
+        self.metrics = {
+            "requests": {route: 0 for route in self.routes},
+            "cache_hits": 0,
+            "coalesced": 0,
+            "computed": 0,
+            "errors": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    @property
+    def round(self):
+        return self.follower.round
+
+    async def follow(self) -> None:
+        """Advance the pool state at every round and drop the cached results"""
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                lastRound = await loop.run_in_executor(None, self.follower.wait)
+                await loop.run_in_executor(None, self.advance, lastRound)
+            except Exception:
+                # Node unavailable, the state of the last round is served meanwhile
+                await asyncio.sleep(1)
+                continue
+            self.cache.clear()
+
+    def advance(self, lastRound: int) -> None:
+        with self.stateLock:
+            self.follower.advance(lastRound)
+
+    def get_metapool(self, params: dict):
+        if "app" not in params and len(self.metapools) == 1:
+            return next(iter(self.metapools.values()))
+        try:
+            return self.metapools[int(params["app"])]
+        except (KeyError, ValueError):
+            raise ValueError("Unknown metapool app")
+
+    def quote(self, params: dict) -> dict:
+        metapool = self.get_metapool(params)
+        amountOut = metapool.get_metaswap_quote(
+            int(params["in"]), int(params["amount"]), int(params["out"]), refresh=False
+        )
+        return {"amount_out": int(amountOut)}
+
+    def zap_amount(self, params: dict) -> dict:
+        metapool = self.get_metapool(params)
+        zapAmount = metapool.get_zap_amount(
+            int(params["asset"]), int(params["amount"]), refresh=False
+        )
+        return {"zap_amount": int(zapAmount)}
+
+    def lp_preview(self, params: dict) -> dict:
+        metapool = self.get_metapool(params)
+        zapAmount, swapAmount, minted = metapool.get_add_liquidity_single_quote(
+            int(params["in"]), int(params["amount"]), refresh=False
+        )
+        return {
+            "zap_amount": int(zapAmount),
+            "swap_amount": int(swapAmount),
+            "minted": int(minted),
+        }
+
+    def depth(self, params: dict) -> dict:
+        metapool = self.get_metapool(params)
+        built = self.depthTables.get(metapool.metapool_application_id)
+        if built is None or built[0] != self.round:
+            built = (self.round, buildDepthTables(metapool, refresh=False))
+            self.depthTables[metapool.metapool_application_id] = built
+        table = built[1][(int(params["in"]), int(params["out"]))]
+        return {
+            "max_size": table.max_size(float(params["impact_bps"])),
+            "max_amount": table.max_amount,
+        }
+
+    def compute(self, route: str, params: dict) -> dict:
+        with self.stateLock:
+            return dict(self.routes[route](params), round=self.round)
+
+    async def answer(self, route: str, params: dict) -> dict:
+        """Result of a request, from the cache of the round, the identical request in flight, or computed"""
+        key = (self.round, route, tuple(sorted(params.items())))
+        if key in self.cache:
+            self.metrics["cache_hits"] += 1
+            return self.cache[key]
+        if key in self.inflight:
+            self.metrics["coalesced"] += 1
+            return await asyncio.shield(self.inflight[key])
+        future = asyncio.get_event_loop().run_in_executor(
+            None, self.compute, route, params
+        )
+        self.inflight[key] = future
+        try:
+            result = await future
+        finally:
+            del self.inflight[key]
+        self.metrics["computed"] += 1
+        if result["round"] == self.round:
+            self.cache[key] = result
+        return result
+
+    def get_metrics(self) -> dict:
+        requests = sum(self.metrics["requests"].values())
+        return dict(
+            self.metrics,
+            round=self.round,
+            cache_hit_rate=self.metrics["cache_hits"] / requests if requests else 0.0,
+            latency_mean=self.metrics["latency_total"] / requests if requests else 0.0,
+        )
+
+    async def handle(self, path: str) -> tuple:
+        """Status and JSON body of the response to a GET request"""
+        url = urlsplit(path)
+        route = url.path.strip("/")
+        if route == "metrics":
+            return 200, self.get_metrics()
+        if route not in self.routes:
+            return 404, {"error": "Unknown route"}
+        if self.round is None:
+            return 503, {"error": "Pool state not loaded yet"}
+        start = time.perf_counter()
+        self.metrics["requests"][route] += 1
+        try:
+            return 200, await self.answer(route, dict(parse_qsl(url.query)))
+        except (KeyError, ValueError) as e:
+            self.metrics["errors"] += 1
+            return 400, {"error": "Invalid request: %s" % e}
+        except Exception as e:
+            self.metrics["errors"] += 1
+            return 500, {"error": str(e)}
+        finally:
+            latency = time.perf_counter() - start
+            self.metrics["latency_total"] += latency
+            self.metrics["latency_max"] = max(self.metrics["latency_max"], latency)
+
+    async def on_connection(self, reader, writer) -> None:
+        try:
+            requestLine = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in [b"\r\n", b"\n", b""]:
+                pass
+            if len(requestLine) < 2 or requestLine[0] != "GET":
+                status, body = 405, {"error": "Only GET is supported"}
+            else:
+                status, body = await self.handle(requestLine[1])
+            payload = json.dumps(body).encode()
+            writer.write(
+                b"HTTP/1.1 %d %s\r\n" % (status, b"OK" if status == 200 else b"Error")
+                + b"Content-Type: application/json\r\n"
+                + b"Content-Length: %d\r\n" % len(payload)
+                + b"Connection: close\r\n\r\n"
+                + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080) -> None:
+        """Load the pool state, then serve requests and follow the rounds forever"""
+        loop = asyncio.get_event_loop()
+        lastRound = await loop.run_in_executor(None, self.follower.wait)
+        await loop.run_in_executor(None, self.advance, lastRound)
+        server = await asyncio.start_server(self.on_connection, host, port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.follow())
+
+
+def main(configPath: str) -> None:
+    """Serve the metapools of a JSON configuration file:
+    {
+        "network": "testnet" or "mainnet",
+        "algod_address": ..., "algod_token": ...,
+        "indexer_address": ..., "indexer_token": ...,
+        "host": "127.0.0.1", "port": 8080,
+        "metapools": [MetapoolAMMClient.to_snapshot() of each metapool]
+    }
+    """
+    from algosdk.v2client.algod import AlgodClient
+    from algosdk.v2client.indexer import IndexerClient
+    from algofi_amm.v0.client import AlgofiAMMMainnetClient, AlgofiAMMTestnetClient
+    from .metapoolAMMClient import MetapoolAMMClient
+
+    with open(configPath) as f:
+        config = json.load(f)
+    algod = AlgodClient(config["algod_token"], config["algod_address"])
+    indexer = IndexerClient(config["indexer_token"], config["indexer_address"])
+    clientClass = (
+        AlgofiAMMMainnetClient
+        if config.get("network") == "mainnet"
+        else AlgofiAMMTestnetClient
+    )
+    client = clientClass(algod_client=algod, indexer_client=indexer, user_address=None)
+    metapools = [
+        MetapoolAMMClient.from_snapshot(client, snapshot)
+        for snapshot in config["metapools"]
+    ]
+    server = QuoteServer(metapools, algod)
+    asyncio.run(server.serve(config.get("host", "127.0.0.1"), config.get("port", 8080)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
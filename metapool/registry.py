@@ -0,0 +1,239 @@
+"""Local index of the deployed metapools.
+
+The metapool apps are discovered with paginated indexer queries, either by creator or by
+approval program hash, and their decoded global state is kept in a SQLite database keyed
+by meta asset and nanopool pair. Each source keeps the indexer cursor where its last scan
+ended, so a refresh only pages through the apps created since. Lookups are local queries.
+"""
+
+import sqlite3
+from base64 import b64decode
+from hashlib import sha256
+from typing import NamedTuple
+from .contracts.poolStrings import metapool_strings, multi_metapool_strings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metapools (
+    app_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    meta_asset_id INTEGER NOT NULL,
+    meta_lp_id INTEGER NOT NULL,
+    asset1_id INTEGER NOT NULL,
+    asset2_id INTEGER NOT NULL,
+    nanopool_app_id INTEGER NOT NULL,
+    nanopool_lp_id INTEGER NOT NULL,
+    fee_bps INTEGER NOT NULL,
+    min_increment INTEGER NOT NULL,
+    pool_tokens_outstanding INTEGER NOT NULL,
+    creator TEXT NOT NULL,
+    updated_round INTEGER NOT NULL,
+    PRIMARY KEY (app_id, slot)
+);
+CREATE INDEX IF NOT EXISTS metapools_by_meta ON metapools (meta_asset_id, asset1_id, asset2_id);
+CREATE INDEX IF NOT EXISTS metapools_by_pair ON metapools (asset1_id, asset2_id);
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    next_token TEXT,
+    scanned_round INTEGER NOT NULL
+);
+"""
+
+
+class MetapoolRecord(NamedTuple):
+    """One meta asset of a metapool app, slot is always 0 for a single asset metapool.
+    The nanopool pair is stored in ascending asset ID order."""
+
+    appId: int
+    slot: int
+    metaAssetId: int
+    metaLpId: int
+    asset1Id: int
+    asset2Id: int
+    nanopoolAppId: int
+    nanopoolLpId: int
+    feeBps: int
+    minIncrement: int
+    poolTokensOutstanding: int
+    creator: str
+    updatedRound: int
+
+
+def programHash(program: bytes) -> str:
+    """Hash of a compiled program, as matched against the approval program of the indexed apps"""
+    return sha256(program).hexdigest()
+
+
+def decodeGlobalState(globalState: list) -> dict:
+    """Decode the global-state of an indexer application, bytes values are left undecoded."""
+    state = {}
+    for entry in globalState:
+        key = b64decode(entry["key"]).decode(errors="surrogateescape")
+        value = entry["value"]
+        if value["type"] == 1:
+            state[key] = b64decode(value.get("bytes", ""))
+        else:
+            state[key] = value.get("uint", 0)
+    return state
+
+
+def metapoolRecords(app: dict, currentRound: int) -> list:
+    """Records of an indexer application, empty if it is not a metapool."""
+    state = decodeGlobalState(app["params"].get("global-state", []))
+    if metapool_strings.nanopool_app_id not in state:
+        return []
+    if multi_metapool_strings.meta_count in state:
+        slots = range(state[multi_metapool_strings.meta_count])
+
+        def get(key, slot):
+            return state.get(key + slot.to_bytes(8, "big").decode(), 0)
+
+    elif metapool_strings.meta_asset_id in state:
+        slots = [0]
+
+        def get(key, slot):
+            return state.get(key, 0)
+
+    else:
+        return []
+    asset1, asset2 = sorted(
+        [
+            state.get(metapool_strings.nanopool_asset_1_id, 0),
+            state.get(metapool_strings.nanopool_asset_2_id, 0),
+        ]
+    )
+    return [
+        MetapoolRecord(
+            appId=app["id"],
+            slot=slot,
+            metaAssetId=get(metapool_strings.meta_asset_id, slot),
+            metaLpId=get(metapool_strings.meta_lp_id, slot),
+            asset1Id=asset1,
+            asset2Id=asset2,
+            nanopoolAppId=state[metapool_strings.nanopool_app_id],
+            nanopoolLpId=state.get(metapool_strings.nanopool_lp_id, 0),
+            feeBps=state.get(metapool_strings.fee_bps, 0),
+            minIncrement=state.get(metapool_strings.min_increment, 0),
+            poolTokensOutstanding=get(metapool_strings.pool_token_outstanding, slot),
+            creator=app["params"]["creator"],
+            updatedRound=currentRound,
+        )
+        for slot in slots
+    ]
+
+
+class MetapoolRegistry:
+    def __init__(self, indexer, path=":memory:", pageSize=1000):
+        """Constructor method for :class:`MetapoolRegistry`
+        Args:
+            indexer: indexer client.
+            path: SQLite database file, kept in memory by default.
+            pageSize: number of applications per indexer query.
+        """
+        self.indexer = indexer
+        self.pageSize = pageSize
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def refresh_by_creator(self, creator: str, full=False) -> int:
+        """Index the metapools created by an account since the last refresh.
+        Args:
+            creator: address of the creator.
+            full: scan all the apps of the creator again, to update the state of the known pools.
+        Returns:
+            The number of metapool records written.
+        """
+        return self.refresh(
+            "creator:" + creator,
+            lambda nextPage: self.indexer.search_applications(
+                creator=creator,
+                limit=self.pageSize,
+                next_page=nextPage,
+                include_all=True,
+            ),
+            full=full,
+        )
+
+    def refresh_by_program(self, approvalProgram: bytes, full=False) -> int:
+        """Index the apps running an approval program since the last refresh.
+
+        The indexer can't filter on the program, every application created since the last
+        refresh is fetched and matched here.
+        Args:
+            approvalProgram: compiled approval program, see utils.compiledContract.
+            full: scan all the apps again, to update the state of the known pools.
+        Returns:
+            The number of metapool records written.
+        """
+        digest = programHash(approvalProgram)
+        return self.refresh(
+            "program:" + digest,
+            lambda nextPage: self.indexer.search_applications(
+                limit=self.pageSize, next_page=nextPage, include_all=True
+            ),
+            lambda app: programHash(b64decode(app["params"]["approval-program"]))
+            == digest,
+            full,
+        )
+
+    def refresh(self, source: str, query, match=None, full=False) -> int:
+        """Page through a query from the cursor of the source, upsert the metapools found and drop the deleted ones."""
+        row = self.db.execute(
+            "SELECT next_token FROM sources WHERE source = ?", (source,)
+        ).fetchone()
+        nextPage = None if full or row is None else row[0]
+        written, currentRound = 0, 0
+        while True:
+            response = query(nextPage)
+            currentRound = response.get("current-round", currentRound)
+            apps = response.get("applications", [])
+            for app in apps:
+                if app.get("deleted"):
+                    self.db.execute(
+                        "DELETE FROM metapools WHERE app_id = ?", (app["id"],)
+                    )
+                    continue
+                if match is not None and not match(app):
+                    continue
+                records = metapoolRecords(app, currentRound)
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO metapools VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    records,
+                )
+                written += len(records)
+            if not apps or "next-token" not in response:
+                break
+            nextPage = response["next-token"]
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+            (source, nextPage, currentRound),
+        )
+        self.db.commit()
+        return written
+
+    def lookup(self, metaAssetId: int, asset1Id=None, asset2Id=None) -> list:
+        """Metapools of a meta asset, optionally against a nanopool pair given in any order"""
+        if asset1Id is None:
+            return self.select("WHERE meta_asset_id = ?", metaAssetId)
+        return self.select(
+            "WHERE meta_asset_id = ? AND asset1_id = ? AND asset2_id = ?",
+            metaAssetId,
+            *sorted([asset1Id, asset2Id]),
+        )
+
+    def pools_for_pair(self, asset1Id: int, asset2Id: int) -> list:
+        """Metapools built on the nanopool of a pair given in any order"""
+        return self.select(
+            "WHERE asset1_id = ? AND asset2_id = ?", *sorted([asset1Id, asset2Id])
+        )
+
+    def all(self) -> list:
+        return self.select("")
+
+    def select(self, where: str, *args) -> list:
+        return [
+            MetapoolRecord(*row)
+            for row in self.db.execute(
+                "SELECT * FROM metapools " + where + " ORDER BY app_id, slot", args
+            )
+        ]
@@ -0,0 +1,289 @@
+"""Pool state records shared by the worker processes through shared memory.
+
+One updater process follows the chain with a PoolStateFollower and writes the state of each
+metapool and nanopool as a fixed layout record in a multiprocessing.shared_memory segment.
+The workers attach to the segment by name and read the records in place, instead of each
+polling algod and holding its own copy of the state.
+
+Each record is guarded by a sequence number (a seqlock): the writer makes it odd before
+changing the record and even again after, a reader retries while the number is odd or
+changed during its read. The writer never waits for the readers. There must be a single
+writer per segment.
+
+Python issues no memory fences around the reads and writes of the buffer, so the seqlock
+relies on the stores and the loads each being seen in program order by the other cores, as
+on x86. On weakly ordered CPUs (ARM, POWER) a reader may see the sequence and the fields out
+of order and return a torn record.
+
+    segment layout: header, then capacity records of RECORD_SIZE bytes
+    header:  magic, capacity, count, round of the last update
+    record:  sequence, then the PoolRecord fields, all unsigned 64 bits little endian
+
+The records of the metapools hold the meta asset and nanopool LP reserves, the pool tokens
+outstanding, fee_bps and min_increment. The records of the nanopools hold the asset 1 and
+asset 2 reserves, the LP circulation, the swap fee in bps and the amplification ramp.
+"""
+
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple
+from .contracts.poolStrings import metapool_strings
+
+MAGIC = b"MPSTATE1"
+HEADER = struct.Struct("<8sQQQ")
+HEADER_SIZE = 64
+# Sequence number and the 12 fields of a PoolRecord
+RECORD = struct.Struct("<13Q")
+# Two cache lines, the writer of a record does not invalidate its neighbours
+RECORD_SIZE = 128
+SEQUENCE = struct.Struct("<Q")
+ROUND_OFFSET = 24
+
+# Kinds of the records
+METAPOOL, NANOPOOL = 1, 2
+# Attributes of the Algofi Pool of a nanopool holding its amplification ramp
+AMPLIFICATION_ATTRIBUTES = (
+    "initial_amplification_factor",
+    "future_amplification_factor",
+    "initial_amplification_factor_time",
+    "future_amplification_factor_time",
+)
+
+
+class PoolRecord(NamedTuple):
+    """State of a pool as of round.
+
+    reserve1, reserve2: meta asset and nanopool LP of a metapool, asset 1 and asset 2 of a
+        nanopool.
+    supply: pool tokens outstanding of a metapool, LP circulation of a nanopool.
+    minIncrement: min_increment of a metapool, 0 for a nanopool.
+    amplification, futureAmplification, amplificationTime, futureAmplificationTime:
+        amplification ramp of a nanopool, 0 for a metapool.
+    """
+
+    appId: int
+    kind: int
+    round: int
+    reserve1: int
+    reserve2: int
+    supply: int
+    feeBps: int
+    minIncrement: int
+    amplification: int
+    futureAmplification: int
+    amplificationTime: int
+    futureAmplificationTime: int
+
+
+def metapoolRecord(metapool, round: int) -> PoolRecord:
+    """Record of the loaded state of a MetapoolAMMClient"""
+    return PoolRecord(
+        appId=metapool.metapool_application_id,
+        kind=METAPOOL,
+        round=round,
+        reserve1=metapool.meta_asset_balance,
+        reserve2=metapool.lp_asset_balance,
+        supply=metapool.pool_tokens_outstanding,
+        feeBps=metapool.fee_bps,
+        minIncrement=metapool.min_increment,
+        amplification=0,
+        futureAmplification=0,
+        amplificationTime=0,
+        futureAmplificationTime=0,
+    )
+
+
+def nanopoolRecord(nanopool, round: int) -> PoolRecord:
+    """Record of the loaded state of the Algofi Pool of a nanopool"""
+    amplification = [
+        int(getattr(nanopool, attribute, 0) or 0)
+        for attribute in AMPLIFICATION_ATTRIBUTES
+    ]
+    return PoolRecord(
+        nanopool.application_id,
+        NANOPOOL,
+        round,
+        nanopool.asset1_balance,
+        nanopool.asset2_balance,
+        nanopool.lp_circulation,
+        # Swap fee of the Algofi Pool, a fraction
+        int(getattr(nanopool, "swap_fee", 0) * 10_000 + 0.5),
+        0,
+        *amplification,
+    )
+
+
+def attachSegment(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without registering it with the resource tracker,
+    which would unlink it when this process exits: the segment belongs to the writer"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13 attaching always registers the segment
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedStateWriter:
+    def __init__(self, capacity=64, name=None):
+        """Constructor method for :class:`SharedStateWriter`, creates the segment
+        Args:
+            capacity: largest number of pools, the segment does not grow.
+            name: name of the segment, a random name by default, see name.
+        """
+        self.capacity = capacity
+        self.memory = shared_memory.SharedMemory(
+            name=name, create=True, size=HEADER_SIZE + capacity * RECORD_SIZE
+        )
+        self.name = self.memory.name
+        # app ID: slot of its record
+        self.slots = {}
+        HEADER.pack_into(self.memory.buf, 0, MAGIC, capacity, 0, 0)
+
+    def write(self, record: PoolRecord) -> None:
+        """Write the record of a pool, in a new slot for a new app ID"""
+        slot = self.slots.get(record.appId)
+        if slot is None:
+            if len(self.slots) == self.capacity:
+                raise RuntimeError(
+                    "Shared state segment full, %i pools" % self.capacity
+                )
+            slot = len(self.slots)
+        offset = HEADER_SIZE + slot * RECORD_SIZE
+        buf = self.memory.buf
+        sequence = SEQUENCE.unpack_from(buf, offset)[0]
+        SEQUENCE.pack_into(buf, offset, sequence + 1)
+        RECORD.pack_into(buf, offset, sequence + 1, *record)
+        SEQUENCE.pack_into(buf, offset, sequence + 2)
+        if record.appId not in self.slots:
+            # Published once the record is complete
+            self.slots[record.appId] = slot
+            HEADER.pack_into(buf, 0, MAGIC, self.capacity, len(self.slots), 0)
+
+    def set_round(self, round: int) -> None:
+        """Publish the round of the last update, after its records"""
+        SEQUENCE.pack_into(self.memory.buf, ROUND_OFFSET, round)
+
+    def write_metapool(self, metapool, round: int) -> None:
+        """Write the records of a metapool and of its nanopool"""
+        self.write(metapoolRecord(metapool, round))
+        self.write(nanopoolRecord(metapool.nanopool, round))
+
+    def attach(self, follower) -> None:
+        """Write the records of the metapools of a PoolStateFollower after each of its steps.
+        The nanopool records are current for the metapools followed with refreshNanopool.
+        """
+        if follower.round is not None:
+            for metapool in follower.metapools:
+                self.write_metapool(metapool, follower.round)
+            self.set_round(follower.round)
+        follower.subscribe(
+            lambda round, changed: self.on_step(follower, round, changed)
+        )
+
+    def on_step(self, follower, round: int, changed: set) -> None:
+        for metapool in follower.metapools:
+            if metapool.metapool_application_id in changed:
+                self.write(metapoolRecord(metapool, round))
+            if metapool.nanopool.application_id in changed:
+                self.write(nanopoolRecord(metapool.nanopool, round))
+        self.set_round(round)
+
+    def close(self) -> None:
+        """Release the segment, the readers keep their mapping until they close"""
+        self.memory.close()
+        self.memory.unlink()
+
+
+class SharedStateReader:
+    def __init__(self, name: str, retries=10_000):
+        """Constructor method for :class:`SharedStateReader`, attaches to the segment
+        Args:
+            name: name of the segment, SharedStateWriter.name.
+            retries: reads of a record while the writer is changing it before giving up.
+        """
+        self.memory = attachSegment(name)
+        magic, self.capacity, _, _ = HEADER.unpack_from(self.memory.buf, 0)
+        if magic != MAGIC:
+            self.memory.close()
+            raise RuntimeError("%s is not a pool state segment" % name)
+        self.retries = retries
+        self.slots = {}
+
+    @property
+    def round(self) -> int:
+        """Round of the last update, a cheap way to poll for a new state"""
+        return SEQUENCE.unpack_from(self.memory.buf, ROUND_OFFSET)[0]
+
+    def app_ids(self) -> list:
+        self.scan()
+        return list(self.slots)
+
+    def scan(self) -> None:
+        """Index the records written since the last scan"""
+        count = HEADER.unpack_from(self.memory.buf, 0)[2]
+        for slot in range(len(self.slots), count):
+            offset = HEADER_SIZE + slot * RECORD_SIZE
+            self.slots[self.read_slot(offset).appId] = slot
+
+    def find(self, appId: int):
+        """Slot of the record of an app, None if it has not been written"""
+        if appId not in self.slots:
+            self.scan()
+        return self.slots.get(appId)
+
+    def read_slot(self, offset: int) -> PoolRecord:
+        buf = self.memory.buf
+        for _ in range(self.retries):
+            sequence = SEQUENCE.unpack_from(buf, offset)[0]
+            if sequence % 2:
+                # The writer is changing the record
+                continue
+            values = RECORD.unpack_from(buf, offset)
+            # Unchanged after the fields were read: no write overlapped the read
+            if SEQUENCE.unpack_from(buf, offset)[0] == sequence:
+                return PoolRecord(*values[1:])
+        raise RuntimeError("Pool state record busy after %i reads" % self.retries)
+
+    def read(self, appId: int) -> PoolRecord:
+        """Consistent copy of the record of an app"""
+        slot = self.find(appId)
+        if slot is None:
+            raise KeyError(appId)
+        return self.read_slot(HEADER_SIZE + slot * RECORD_SIZE)
+
+    def load(self, metapool) -> int:
+        """Set the state of a MetapoolAMMClient and of its nanopool from their records,
+        the quotes then run with refresh=False.
+        Returns:
+            The oldest round of the two records.
+        """
+        record = self.read(metapool.metapool_application_id)
+        metapool.load_state(
+            {
+                metapool_strings.fee_bps: record.feeBps,
+                metapool_strings.min_increment: record.minIncrement,
+                metapool_strings.pool_token_outstanding: record.supply,
+            },
+            {
+                metapool.meta_asset_id: record.reserve1,
+                metapool.nanopool.lp_asset_id: record.reserve2,
+            },
+        )
+        nanopool = metapool.nanopool
+        nanoRecord = self.read(nanopool.application_id)
+        nanopool.asset1_balance = nanoRecord.reserve1
+        nanopool.asset2_balance = nanoRecord.reserve2
+        nanopool.lp_circulation = nanoRecord.supply
+        nanopool.swap_fee = nanoRecord.feeBps / 10_000
+        for attribute, value in zip(AMPLIFICATION_ATTRIBUTES, nanoRecord[8:]):
+            setattr(nanopool, attribute, value)
+        return min(record.round, nanoRecord.round)
+
+    def close(self) -> None:
+        self.memory.close()
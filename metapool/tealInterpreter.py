@@ -0,0 +1,1413 @@
+"""Local executor of the metapool TEAL programs, without a node.
+
+The TEAL source compiled by PyTeal (the artifacts of metapool/contracts/artifacts.py) is
+assembled by `assemble` into a list of instructions and run by the interpreter below, which
+covers the opcode subset of the metapool contracts with the AVM v6 semantics: uint64
+arithmetic that panics on overflow, wide math, subroutines, scratch space, global state,
+asset holdings, group and inner transactions, logs, and the opcode cost against the budget
+pooled over the app calls of the group.
+
+LocalLedger holds the accounts, assets and apps. A group is given as py-algorand-sdk
+transactions and applied atomically: payments, asset transfers, asset creations and app
+calls, with the fee pooling and credit of the inner transactions, the asset opt-ins and the
+minimum balances. Resource availability (the foreign arrays) is not enforced.
+
+StubNanopool is an app written in Python that serves the NanoSwap methods the metapool calls
+(swap_exact_for, burn_asset1_out and burn_asset2_out, pool and the residual redemptions)
+with constant product math, in the group layout of the real nanopool.
+
+    ledger = LocalLedger()
+    nanopool = StubNanopool.deploy(ledger, asset1, asset2, 10**10, 10**10)
+    appId = ledger.create_app(creator, loadTeal("metapool_approval.teal"))
+    result = ledger.send(signedOrUnsignedTxns)
+    result.passed, result.cost, decodeMethodReturn(signature, result.txinfo())
+"""
+
+import base64
+from collections import Counter
+from math import isqrt
+from typing import NamedTuple
+from algosdk import abi, encoding
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+from .metapoolSimulator import ConstantProductNanopool, MetapoolReject
+
+UINT64 = 1 << 64
+MIN_TXN_FEE = 1000
+MIN_BALANCE = 100_000
+# Opcode budget added to the pool by every app call, top level or inner
+APP_CALL_BUDGET = 700
+MAX_LOGS = 32
+MAX_LOG_SIZE = 1024
+MAX_BYTES = 4096
+ZERO_ADDRESS = bytes(32)
+
+TYPE_ENUMS = {"pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6}
+NAMED_INTS = dict(
+    TYPE_ENUMS,
+    unknown=0,
+    NoOp=0,
+    OptIn=1,
+    CloseOut=2,
+    ClearState=3,
+    UpdateApplication=4,
+    DeleteApplication=5,
+)
+# Opcodes of more than one unit of cost
+COSTS = {
+    "sha256": 35,
+    "keccak256": 130,
+    "sha512_256": 45,
+    "divmodw": 20,
+    "sqrt": 4,
+    "expw": 10,
+}
+# Transaction fields read from an array with an index
+ARRAY_FIELDS = {"ApplicationArgs", "Accounts", "Assets", "Applications", "Logs"}
+ADDRESS_FIELDS = {
+    "Sender",
+    "Receiver",
+    "CloseRemainderTo",
+    "AssetReceiver",
+    "AssetCloseTo",
+    "AssetSender",
+    "RekeyTo",
+    "ConfigAssetManager",
+    "ConfigAssetReserve",
+    "ConfigAssetFreeze",
+    "ConfigAssetClawback",
+}
+
+
+class TealReject(RuntimeError):
+    """The program failed, or a transaction of the group could not be applied"""
+
+
+class Instruction(NamedTuple):
+    op: str
+    args: tuple
+    cost: int
+    line: int
+
+
+class TealProgram(NamedTuple):
+    version: int
+    instructions: list
+    source: str
+
+
+class AppCallReport(NamedTuple):
+    """Outcome of one app call of a group, top level or inner.
+
+    depth: 0 for a call of the group, 1 for an inner call of a top level call, etc.
+    cost: opcode cost of the program, 0 for a Python app.
+    """
+
+    appId: int
+    depth: int
+    passed: bool
+    cost: int
+    logs: list
+    reason: str
+
+
+class GroupResult(NamedTuple):
+    """Outcome of a group, the ledger is unchanged when it did not pass.
+
+    cost, budget: opcode cost of all the programs run, and the pooled budget.
+    innerTxns: number of inner transactions submitted.
+    profile: opcode cost by source line, when the ledger profiles.
+    """
+
+    passed: bool
+    reason: str
+    reports: list
+    cost: int
+    budget: int
+    innerTxns: int
+    profile: Counter
+
+    def txinfo(self) -> dict:
+        """Logs of the last app call of the group, as decodeMethodReturn reads them"""
+        top = [report for report in self.reports if report.depth == 0]
+        logs = top[-1].logs if top else []
+        return {"logs": [base64.b64encode(log).decode() for log in logs]}
+
+
+def parseBytes(text: str) -> bytes:
+    """Immediate of byte, as PyTeal writes it"""
+    if text.startswith('"'):
+        raw = text[1:-1].encode().decode("unicode_escape")
+        return raw.encode("latin-1")
+    if text.startswith("0x"):
+        return bytes.fromhex(text[2:])
+    encodingName, _, value = text.partition(" ")
+    if encodingName in ("base64", "b64"):
+        return base64.b64decode(value)
+    if encodingName in ("base32", "b32"):
+        return base64.b32decode(value + "=" * (-len(value) % 8))
+    raise ValueError("Invalid byte constant %s" % text)
+
+
+def parseInt(text: str) -> int:
+    if text in NAMED_INTS:
+        return NAMED_INTS[text]
+    return int(text, 0)
+
+
+def assemble(source: str) -> TealProgram:
+    """Parse a TEAL source into a program, the labels resolved to instruction indices"""
+    lines = []
+    labels = {}
+    version = 1
+    for number, line in enumerate(source.splitlines(), start=1):
+        line = line.strip()
+        if line.startswith("#pragma version"):
+            version = int(line.split()[-1])
+            continue
+        if not line or line.startswith("//"):
+            continue
+        if line.endswith(":") and " " not in line:
+            labels[line[:-1]] = len(lines)
+            continue
+        lines.append((number, line))
+
+    instructions = []
+    for number, line in lines:
+        op, _, rest = line.partition(" ")
+        rest = rest.strip()
+        if op not in OPCODES:
+            raise ValueError(
+                "Line %i: %s is not supported by the local interpreter" % (number, op)
+            )
+        if op in ("int", "pushint"):
+            args = (parseInt(rest),)
+        elif op in ("byte", "pushbytes"):
+            args = (parseBytes(rest),)
+        elif op == "addr":
+            args = (encoding.decode_address(rest),)
+        elif op == "method":
+            args = (
+                abi.Method.from_signature(parseBytes(rest).decode()).get_selector(),
+            )
+        elif op in ("b", "bz", "bnz", "callsub"):
+            if rest not in labels:
+                raise ValueError("Line %i: unknown label %s" % (number, rest))
+            args = (labels[rest],)
+        else:
+            args = tuple(
+                int(value) if value.isdigit() else value for value in rest.split()
+            )
+        instructions.append(Instruction(op, args, COSTS.get(op, 1), number))
+    return TealProgram(version, instructions, source)
+
+
+class Account:
+    def __init__(self, microAlgos=0):
+        """Constructor method for :class:`Account`
+        Args:
+            microAlgos: ALGO balance.
+        """
+        self.microAlgos = microAlgos
+        # Asset ID: amount, the key exists once the account opted in
+        self.assets = {}
+
+    def copy(self):
+        account = Account(self.microAlgos)
+        account.assets = dict(self.assets)
+        return account
+
+    def min_balance(self) -> int:
+        return MIN_BALANCE * (1 + len(self.assets))
+
+
+class App:
+    def __init__(self, appId: int, creator: bytes, program=None, handler=None):
+        """Constructor method for :class:`App`
+        Args:
+            appId: application ID.
+            creator: address of the creator.
+            program: approval TealProgram, for a TEAL app.
+            handler: callable(call) -> logs, for a Python app, see StubNanopool.
+        """
+        self.appId = appId
+        self.creator = creator
+        self.program = program
+        self.handler = handler
+        self.globalState = {}
+        self.address = encoding.decode_address(get_application_address(appId))
+
+
+class Execution:
+    """State of a group being applied: fee credit, pooled budget and the reports"""
+
+    def __init__(self, budget: int, profile: bool):
+        self.credit = 0
+        self.budget = budget
+        self.cost = 0
+        self.innerTxns = 0
+        self.reports = []
+        self.profile = Counter() if profile else None
+
+
+def newTxn(sender: bytes) -> dict:
+    """Transaction with the default value of every field, keyed by the TEAL field names"""
+    return {
+        "Sender": sender,
+        "GroupIndex": 0,
+        "Fee": None,
+        "TypeEnum": 0,
+        "Note": b"",
+        "RekeyTo": ZERO_ADDRESS,
+        "Receiver": ZERO_ADDRESS,
+        "Amount": 0,
+        "CloseRemainderTo": ZERO_ADDRESS,
+        "XferAsset": 0,
+        "AssetAmount": 0,
+        "AssetReceiver": ZERO_ADDRESS,
+        "AssetCloseTo": ZERO_ADDRESS,
+        "AssetSender": ZERO_ADDRESS,
+        "ApplicationID": 0,
+        "OnCompletion": 0,
+        "ApplicationArgs": [],
+        "Accounts": [],
+        "Assets": [],
+        "Applications": [],
+        "ApprovalProgram": None,
+        "ConfigAsset": 0,
+        "ConfigAssetTotal": 0,
+        "ConfigAssetDecimals": 0,
+        "ConfigAssetDefaultFrozen": 0,
+        "ConfigAssetName": b"",
+        "ConfigAssetUnitName": b"",
+        "ConfigAssetManager": ZERO_ADDRESS,
+        "ConfigAssetReserve": ZERO_ADDRESS,
+        "ConfigAssetFreeze": ZERO_ADDRESS,
+        "ConfigAssetClawback": ZERO_ADDRESS,
+        "Logs": [],
+        "CreatedAssetID": 0,
+        "CreatedApplicationID": 0,
+    }
+
+
+def txnFromSdk(txn) -> dict:
+    """Local transaction of a py-algorand-sdk transaction, signed or not"""
+    txn = getattr(txn, "transaction", txn)
+    address = lambda value: encoding.decode_address(value) if value else ZERO_ADDRESS
+    local = newTxn(address(txn.sender))
+    local["Fee"] = txn.fee
+    local["Note"] = txn.note or b""
+    local["RekeyTo"] = address(txn.rekey_to)
+    if isinstance(txn, transaction.PaymentTxn):
+        local["TypeEnum"] = TYPE_ENUMS["pay"]
+        local["Receiver"] = address(txn.receiver)
+        local["Amount"] = txn.amt
+        local["CloseRemainderTo"] = address(txn.close_remainder_to)
+    elif isinstance(txn, transaction.AssetTransferTxn):
+        local["TypeEnum"] = TYPE_ENUMS["axfer"]
+        local["XferAsset"] = txn.index
+        local["AssetAmount"] = txn.amount
+        local["AssetReceiver"] = address(txn.receiver)
+        local["AssetCloseTo"] = address(txn.close_assets_to)
+        local["AssetSender"] = address(txn.revocation_target)
+    elif isinstance(txn, transaction.ApplicationCallTxn):
+        local["TypeEnum"] = TYPE_ENUMS["appl"]
+        local["ApplicationID"] = txn.index
+        local["OnCompletion"] = int(txn.on_complete)
+        local["ApplicationArgs"] = list(txn.app_args or [])
+        local["Accounts"] = [address(account) for account in txn.accounts or []]
+        local["Assets"] = list(txn.foreign_assets or [])
+        local["Applications"] = list(txn.foreign_apps or [])
+    elif isinstance(txn, transaction.AssetConfigTxn):
+        local["TypeEnum"] = TYPE_ENUMS["acfg"]
+        local["ConfigAsset"] = txn.index or 0
+        local["ConfigAssetTotal"] = txn.total or 0
+        local["ConfigAssetDecimals"] = txn.decimals
+        local["ConfigAssetDefaultFrozen"] = int(txn.default_frozen)
+        local["ConfigAssetReserve"] = address(txn.reserve)
+    else:
+        raise ValueError("Unsupported transaction type %s" % type(txn).__name__)
+    return local
+
+
+class LocalLedger:
+    def __init__(self, latestTimestamp=1_650_000_000, profile=False):
+        """Constructor method for :class:`LocalLedger`
+        Args:
+            latestTimestamp: Global.latest_timestamp of the programs.
+            profile: count the opcode cost of each source line in GroupResult.profile.
+        """
+        self.accounts = {}
+        self.apps = {}
+        # Asset ID: (creator address, total, decimals)
+        self.assets = {}
+        self.nextId = 1000
+        self.round = 1
+        self.latestTimestamp = latestTimestamp
+        self.profile = profile
+
+    def account(self, address) -> Account:
+        if isinstance(address, str):
+            address = encoding.decode_address(address)
+        if address not in self.accounts:
+            self.accounts[address] = Account()
+        return self.accounts[address]
+
+    def new_id(self) -> int:
+        self.nextId += 1
+        return self.nextId
+
+    def fund(self, address, microAlgos: int) -> None:
+        """Credit ALGO to an account, outside of any transaction"""
+        self.account(address).microAlgos += microAlgos
+
+    def mint(self, address, assetId: int, amount: int) -> None:
+        """Opt an account in to an asset and credit it, outside of any transaction"""
+        assets = self.account(address).assets
+        assets[assetId] = assets.get(assetId, 0) + amount
+
+    def create_asset(self, creator, total: int, decimals=0) -> int:
+        assetId = self.new_id()
+        if isinstance(creator, str):
+            creator = encoding.decode_address(creator)
+        self.assets[assetId] = (creator, total, decimals)
+        self.mint(creator, assetId, total)
+        return assetId
+
+    def balance(self, address, assetId=None) -> int:
+        """ALGO balance of an account, or its holding of an asset"""
+        account = self.account(address)
+        if assetId is None:
+            return account.microAlgos
+        return account.assets.get(assetId, 0)
+
+    def global_state(self, appId: int) -> dict:
+        """Global state of an app, the keys decoded like get_application_global_state"""
+        return {
+            key.decode(errors="replace"): value
+            for key, value in self.apps[appId].globalState.items()
+        }
+
+    def create_app(self, creator, approvalTeal: str, args=None) -> int:
+        """Create a TEAL app, the ledger pays the fee and the creation call has to pass.
+        Returns:
+            The application ID.
+        """
+        txn = newTxn(encoding.decode_address(creator))
+        txn.update(
+            TypeEnum=TYPE_ENUMS["appl"],
+            Fee=MIN_TXN_FEE,
+            ApprovalProgram=assemble(approvalTeal),
+            ApplicationArgs=list(args or []),
+        )
+        self.fund(creator, MIN_TXN_FEE)
+        result = self.apply_group([txn])
+        if not result.passed:
+            raise TealReject("App creation failed: %s" % result.reason)
+        return txn["CreatedApplicationID"]
+
+    def add_python_app(self, creator, handler) -> int:
+        """Register an app served by a Python handler(call), see StubNanopool"""
+        appId = self.new_id()
+        self.apps[appId] = App(appId, encoding.decode_address(creator), handler=handler)
+        return appId
+
+    def snapshot(self) -> tuple:
+        return (
+            {address: account.copy() for address, account in self.accounts.items()},
+            {appId: dict(app.globalState) for appId, app in self.apps.items()},
+            dict(self.apps),
+            dict(self.assets),
+            self.nextId,
+            {
+                appId: app.handler.snapshot()
+                for appId, app in self.apps.items()
+                if hasattr(app.handler, "snapshot")
+            },
+        )
+
+    def restore(self, state: tuple) -> None:
+        self.accounts, globalStates, self.apps, self.assets, self.nextId, handlers = (
+            state
+        )
+        for appId, app in self.apps.items():
+            app.globalState = globalStates[appId]
+        for appId, handlerState in handlers.items():
+            self.apps[appId].handler.restore(handlerState)
+
+    def send(self, txns: list) -> GroupResult:
+        """Apply a group of py-algorand-sdk transactions, all or nothing"""
+        return self.apply_group([txnFromSdk(txn) for txn in txns])
+
+    def apply_group(self, group: list) -> GroupResult:
+        """Apply a group of local transactions, see newTxn, all or nothing"""
+        appCalls = sum(txn["TypeEnum"] == TYPE_ENUMS["appl"] for txn in group)
+        execution = Execution(APP_CALL_BUDGET * appCalls, self.profile)
+        state = self.snapshot()
+        try:
+            fees = sum(txn["Fee"] or 0 for txn in group)
+            if fees < MIN_TXN_FEE * len(group):
+                raise TealReject("fee too small")
+            execution.credit = fees - MIN_TXN_FEE * len(group)
+            for index, txn in enumerate(group):
+                txn["GroupIndex"] = index
+            for index, txn in enumerate(group):
+                self.apply_txn(txn, group, index, execution, depth=0)
+            self.round += 1
+            passed, reason = True, ""
+        except TealReject as reject:
+            self.restore(state)
+            passed, reason = False, str(reject)
+        return GroupResult(
+            passed=passed,
+            reason=reason,
+            reports=execution.reports,
+            cost=execution.cost,
+            budget=execution.budget,
+            innerTxns=execution.innerTxns,
+            profile=execution.profile,
+        )
+
+    def apply_txn(
+        self, txn: dict, group: list, index: int, execution: Execution, depth: int
+    ) -> None:
+        sender = self.account(txn["Sender"])
+        if sender.microAlgos < txn["Fee"]:
+            raise TealReject("overspend of the fee")
+        sender.microAlgos -= txn["Fee"]
+        if txn["RekeyTo"] != ZERO_ADDRESS:
+            raise TealReject("rekey is not supported")
+        kind = txn["TypeEnum"]
+        touched = [sender]
+        if kind == TYPE_ENUMS["pay"]:
+            receiver = self.account(txn["Receiver"])
+            if sender.microAlgos < txn["Amount"]:
+                raise TealReject("overspend of ALGO")
+            sender.microAlgos -= txn["Amount"]
+            receiver.microAlgos += txn["Amount"]
+            touched.append(receiver)
+            if txn["CloseRemainderTo"] != ZERO_ADDRESS:
+                self.account(txn["CloseRemainderTo"]).microAlgos += sender.microAlgos
+                sender.microAlgos = 0
+        elif kind == TYPE_ENUMS["axfer"]:
+            touched.append(self.apply_asset_transfer(txn, sender))
+        elif kind == TYPE_ENUMS["acfg"]:
+            if txn["ConfigAsset"] != 0:
+                raise TealReject("only asset creations are supported")
+            assetId = self.new_id()
+            self.assets[assetId] = (
+                txn["Sender"],
+                txn["ConfigAssetTotal"],
+                txn["ConfigAssetDecimals"],
+            )
+            sender.assets[assetId] = txn["ConfigAssetTotal"]
+            txn["CreatedAssetID"] = assetId
+        elif kind == TYPE_ENUMS["appl"]:
+            self.apply_app_call(txn, group, index, execution, depth)
+        else:
+            raise TealReject("unsupported transaction type %i" % kind)
+        for account in touched:
+            # A closed account has no balance left to check
+            closed = account.microAlgos == 0 and not account.assets
+            if account.microAlgos < account.min_balance() and not closed:
+                raise TealReject("balance below the minimum balance")
+
+    def apply_asset_transfer(self, txn: dict, sender: Account) -> Account:
+        assetId, amount = txn["XferAsset"], txn["AssetAmount"]
+        if assetId not in self.assets:
+            raise TealReject("asset %i does not exist" % assetId)
+        receiver = self.account(txn["AssetReceiver"])
+        if receiver is sender and amount == 0 and assetId not in sender.assets:
+            # Opt-in
+            sender.assets[assetId] = 0
+            return receiver
+        if assetId not in sender.assets:
+            raise TealReject("sender not opted in to asset %i" % assetId)
+        if assetId not in receiver.assets:
+            raise TealReject("receiver not opted in to asset %i" % assetId)
+        if sender.assets[assetId] < amount:
+            raise TealReject("overspend of asset %i" % assetId)
+        sender.assets[assetId] -= amount
+        receiver.assets[assetId] += amount
+        if txn["AssetCloseTo"] != ZERO_ADDRESS:
+            closeTo = self.account(txn["AssetCloseTo"])
+            if assetId not in closeTo.assets:
+                raise TealReject("close to account not opted in")
+            closeTo.assets[assetId] += sender.assets.pop(assetId)
+        return receiver
+
+    def apply_app_call(
+        self, txn: dict, group: list, index: int, execution: Execution, depth: int
+    ) -> None:
+        if txn["ApplicationID"] == 0:
+            if txn["ApprovalProgram"] is None:
+                raise TealReject("create apps with LocalLedger.create_app")
+            appId = self.new_id()
+            app = App(appId, txn["Sender"], program=txn["ApprovalProgram"])
+            self.apps[appId] = app
+            txn["CreatedApplicationID"] = appId
+        elif txn["ApplicationID"] in self.apps:
+            app = self.apps[txn["ApplicationID"]]
+        else:
+            raise TealReject("app %i does not exist" % txn["ApplicationID"])
+        # Reports are in call order, the inner calls follow the call that issued them
+        position = len(execution.reports)
+        execution.reports.append(None)
+        evaluation = None
+        try:
+            if app.handler is not None:
+                logs = app.handler(Call(self, app, txn, group, index, execution, depth))
+            else:
+                evaluation = Evaluation(self, app, txn, group, index, execution, depth)
+                evaluation.run()
+                logs = evaluation.logs
+        except TealReject as reject:
+            execution.reports[position] = AppCallReport(
+                app.appId,
+                depth,
+                False,
+                evaluation.cost if evaluation else 0,
+                evaluation.logs if evaluation else [],
+                str(reject),
+            )
+            raise
+        txn["Logs"] = logs
+        execution.reports[position] = AppCallReport(
+            app.appId, depth, True, evaluation.cost if evaluation else 0, logs, ""
+        )
+        if txn["OnCompletion"] == NAMED_INTS["DeleteApplication"]:
+            del self.apps[app.appId]
+        elif txn["OnCompletion"] == NAMED_INTS["UpdateApplication"]:
+            app.program = txn["ApprovalProgram"] or app.program
+
+    def submit_inner(
+        self, app: App, group: list, execution: Execution, depth: int
+    ) -> None:
+        """Apply an inner group submitted by an app, its default fees paid from the credit"""
+        if depth >= 8:
+            raise TealReject("inner app calls nested too deep")
+        for index, txn in enumerate(group):
+            txn["GroupIndex"] = index
+            if txn["Fee"] is None:
+                if execution.credit >= MIN_TXN_FEE:
+                    txn["Fee"] = 0
+                    execution.credit -= MIN_TXN_FEE
+                else:
+                    txn["Fee"] = MIN_TXN_FEE
+            else:
+                execution.credit += txn["Fee"] - MIN_TXN_FEE
+                if execution.credit < 0:
+                    raise TealReject("inner fee too small")
+            if txn["TypeEnum"] == TYPE_ENUMS["appl"]:
+                if txn["ApplicationID"] == app.appId:
+                    raise TealReject("an app cannot call itself")
+                execution.budget += APP_CALL_BUDGET
+        execution.innerTxns += len(group)
+        for index, txn in enumerate(group):
+            self.apply_txn(txn, group, index, execution, depth + 1)
+
+
+class Call:
+    """App call context given to the Python apps"""
+
+    def __init__(self, ledger, app, txn, group, index, execution, depth):
+        self.ledger = ledger
+        self.app = app
+        self.txn = txn
+        self.group = group
+        self.index = index
+        self.execution = execution
+        self.depth = depth
+
+    def send(self, assetId: int, receiver: bytes, amount: int) -> None:
+        """Inner asset transfer from the app account"""
+        txn = newTxn(self.app.address)
+        txn.update(
+            TypeEnum=TYPE_ENUMS["axfer"],
+            XferAsset=assetId,
+            AssetReceiver=receiver,
+            AssetAmount=amount,
+        )
+        self.ledger.submit_inner(self.app, [txn], self.execution, self.depth)
+
+
+class Evaluation:
+    """Run of an approval program for one app call"""
+
+    def __init__(self, ledger, app, txn, group, index, execution, depth):
+        self.ledger = ledger
+        self.app = app
+        self.txn = txn
+        self.group = group
+        self.index = index
+        self.execution = execution
+        self.depth = depth
+        self.stack = []
+        self.scratch = [0] * 256
+        self.callstack = []
+        self.logs = []
+        self.cost = 0
+        self.pc = 0
+        # Inner group being built, and the last one submitted
+        self.innerGroup = None
+        self.lastInner = None
+
+    def run(self) -> None:
+        program = self.app.program
+        instructions = program.instructions
+        execution = self.execution
+        profile = execution.profile
+        stack = self.stack
+        end = len(instructions)
+        while self.pc < end:
+            instruction = instructions[self.pc]
+            self.pc += 1
+            self.cost += instruction.cost
+            execution.cost += instruction.cost
+            if execution.cost > execution.budget:
+                raise TealReject("dynamic cost budget exceeded")
+            if profile is not None:
+                profile[instruction.line] += instruction.cost
+            try:
+                done = OPCODES[instruction.op](self, instruction.args)
+            except TealReject as reject:
+                raise TealReject(
+                    "line %i %s: %s" % (instruction.line, instruction.op, reject)
+                ) from None
+            except IndexError:
+                raise TealReject(
+                    "line %i %s: stack underflow" % (instruction.line, instruction.op)
+                ) from None
+            if done is not None:
+                stack.append(done)
+                break
+        if len(stack) != 1:
+            raise TealReject("stack has %i values at the end" % len(stack))
+        result = stack[0]
+        if not isinstance(result, int) or result == 0:
+            raise TealReject("rejected")
+
+    # Operand helpers
+
+    def pop_int(self) -> int:
+        value = self.stack.pop()
+        if not isinstance(value, int):
+            raise TealReject("expected uint64, got bytes")
+        return value
+
+    def pop_bytes(self) -> bytes:
+        value = self.stack.pop()
+        if not isinstance(value, bytes):
+            raise TealReject("expected bytes, got uint64")
+        return value
+
+    def push_int(self, value: int) -> None:
+        if not 0 <= value < UINT64:
+            raise TealReject("uint64 overflow")
+        self.stack.append(value)
+
+    def push_bytes(self, value: bytes) -> None:
+        if len(value) > MAX_BYTES:
+            raise TealReject("byte array too long")
+        self.stack.append(value)
+
+    def txn_field(self, txn: dict, field: str, index=None):
+        if field in ARRAY_FIELDS:
+            values = txn[field]
+            if field == "Accounts":
+                values = [txn["Sender"]] + values
+            elif field == "Applications":
+                values = [txn["ApplicationID"]] + values
+            if index >= len(values):
+                raise TealReject("%s index %i out of range" % (field, index))
+            return values[index]
+        if field.startswith("Num"):
+            name = {"NumAppArgs": "ApplicationArgs"}.get(field, field[3:])
+            return len(txn[name])
+        if field == "Type":
+            return {value: key for key, value in TYPE_ENUMS.items()}[
+                txn["TypeEnum"]
+            ].encode()
+        if field == "LastLog":
+            return txn["Logs"][-1] if txn["Logs"] else b""
+        if field == "Fee":
+            return txn["Fee"] or 0
+        if field == "ApprovalProgram":
+            return b""
+        if field not in txn:
+            raise TealReject("unsupported field %s" % field)
+        return txn[field]
+
+    def push_value(self, value) -> None:
+        if isinstance(value, bytes):
+            self.push_bytes(value)
+        else:
+            self.push_int(int(value))
+
+    def account_ref(self, ref) -> Account:
+        if isinstance(ref, bytes):
+            return self.ledger.account(ref)
+        return self.ledger.account(self.txn_field(self.txn, "Accounts", ref))
+
+    def app_ref(self, ref: int) -> int:
+        """Application of an ID, or of an index in Applications, 0 being the current app"""
+        applications = [self.app.appId] + self.txn["Applications"]
+        if ref < len(applications) and ref not in applications:
+            return applications[ref]
+        return ref
+
+    def asset_ref(self, ref: int) -> int:
+        """Asset of an ID, or of an index in Assets"""
+        assets = self.txn["Assets"]
+        if ref < len(assets) and ref not in assets:
+            return assets[ref]
+        return ref
+
+
+def opInt(ev, args):
+    ev.stack.append(args[0])
+
+
+def opBytes(ev, args):
+    ev.stack.append(args[0])
+
+
+def binaryInt(function):
+    def op(ev, args):
+        b = ev.pop_int()
+        a = ev.pop_int()
+        ev.push_int(function(a, b))
+
+    return op
+
+
+def checkedDiv(a, b):
+    if b == 0:
+        raise TealReject("division by zero")
+    return a // b
+
+
+def checkedMod(a, b):
+    if b == 0:
+        raise TealReject("modulo by zero")
+    return a % b
+
+
+def checkedSub(a, b):
+    if b > a:
+        raise TealReject("- would result negative")
+    return a - b
+
+
+def opEquals(negate):
+    def op(ev, args):
+        b = ev.stack.pop()
+        a = ev.stack.pop()
+        if type(a) is not type(b):
+            raise TealReject("comparison of uint64 and bytes")
+        ev.stack.append(int((a == b) != negate))
+
+    return op
+
+
+def opNot(ev, args):
+    ev.stack.append(int(ev.pop_int() == 0))
+
+
+def opMulw(ev, args):
+    b = ev.pop_int()
+    a = ev.pop_int()
+    product = a * b
+    ev.stack.append(product >> 64)
+    ev.stack.append(product & (UINT64 - 1))
+
+
+def opAddw(ev, args):
+    b = ev.pop_int()
+    a = ev.pop_int()
+    total = a + b
+    ev.stack.append(total >> 64)
+    ev.stack.append(total & (UINT64 - 1))
+
+
+def opDivmodw(ev, args):
+    divisorLow = ev.pop_int()
+    divisorHigh = ev.pop_int()
+    dividendLow = ev.pop_int()
+    dividendHigh = ev.pop_int()
+    divisor = (divisorHigh << 64) | divisorLow
+    if divisor == 0:
+        raise TealReject("divmodw by zero")
+    quotient, remainder = divmod((dividendHigh << 64) | dividendLow, divisor)
+    ev.stack.extend(
+        [
+            quotient >> 64,
+            quotient & (UINT64 - 1),
+            remainder >> 64,
+            remainder & (UINT64 - 1),
+        ]
+    )
+
+
+def opSqrt(ev, args):
+    ev.stack.append(isqrt(ev.pop_int()))
+
+
+def opItob(ev, args):
+    ev.stack.append(ev.pop_int().to_bytes(8, "big"))
+
+
+def opBtoi(ev, args):
+    value = ev.pop_bytes()
+    if len(value) > 8:
+        raise TealReject("btoi of more than 8 bytes")
+    ev.stack.append(int.from_bytes(value, "big"))
+
+
+def opLen(ev, args):
+    ev.stack.append(len(ev.pop_bytes()))
+
+
+def opConcat(ev, args):
+    b = ev.pop_bytes()
+    a = ev.pop_bytes()
+    ev.push_bytes(a + b)
+
+
+def opExtractUint64(ev, args):
+    start = ev.pop_int()
+    value = ev.pop_bytes()
+    if start + 8 > len(value):
+        raise TealReject("extract_uint64 out of range")
+    ev.stack.append(int.from_bytes(value[start : start + 8], "big"))
+
+
+def opExtract(ev, args):
+    start, length = args
+    value = ev.pop_bytes()
+    end = len(value) if length == 0 else start + length
+    if end > len(value) or start > len(value):
+        raise TealReject("extract out of range")
+    ev.stack.append(value[start:end])
+
+
+def opSubstring3(ev, args):
+    end = ev.pop_int()
+    start = ev.pop_int()
+    value = ev.pop_bytes()
+    if start > end or end > len(value):
+        raise TealReject("substring out of range")
+    ev.stack.append(value[start:end])
+
+
+def opBranch(condition):
+    def op(ev, args):
+        if condition is None or (ev.pop_int() != 0) == condition:
+            ev.pc = args[0]
+
+    return op
+
+
+def opCallsub(ev, args):
+    ev.callstack.append(ev.pc)
+    ev.pc = args[0]
+
+
+def opRetsub(ev, args):
+    if not ev.callstack:
+        raise TealReject("retsub with an empty call stack")
+    ev.pc = ev.callstack.pop()
+
+
+def opReturn(ev, args):
+    value = ev.stack.pop()
+    ev.stack.clear()
+    return value
+
+
+def opErr(ev, args):
+    raise TealReject("err")
+
+
+def opAssert(ev, args):
+    if ev.pop_int() == 0:
+        raise TealReject("assert failed")
+
+
+def opPop(ev, args):
+    ev.stack.pop()
+
+
+def opDup(ev, args):
+    ev.stack.append(ev.stack[-1])
+
+
+def opDup2(ev, args):
+    ev.stack.extend(ev.stack[-2:])
+
+
+def opSwap(ev, args):
+    ev.stack[-1], ev.stack[-2] = ev.stack[-2], ev.stack[-1]
+
+
+def opSelect(ev, args):
+    condition = ev.pop_int()
+    b = ev.stack.pop()
+    a = ev.stack.pop()
+    ev.stack.append(b if condition else a)
+
+
+def opDig(ev, args):
+    ev.stack.append(ev.stack[-1 - args[0]])
+
+
+def opCover(ev, args):
+    value = ev.stack.pop()
+    if args[0] > len(ev.stack):
+        raise TealReject("cover beyond the stack")
+    ev.stack.insert(len(ev.stack) - args[0], value)
+
+
+def opUncover(ev, args):
+    if args[0] >= len(ev.stack):
+        raise TealReject("uncover beyond the stack")
+    ev.stack.append(ev.stack.pop(-1 - args[0]))
+
+
+def opLoad(ev, args):
+    ev.stack.append(ev.scratch[args[0]])
+
+
+def opStore(ev, args):
+    ev.scratch[args[0]] = ev.stack.pop()
+
+
+def opTxn(ev, args):
+    ev.push_value(ev.txn_field(ev.txn, args[0], args[1] if len(args) > 1 else None))
+
+
+def opGtxn(ev, args):
+    if args[0] >= len(ev.group):
+        raise TealReject("gtxn index out of the group")
+    txn = ev.group[args[0]]
+    ev.push_value(ev.txn_field(txn, args[1], args[2] if len(args) > 2 else None))
+
+
+def opGtxns(ev, args):
+    index = ev.pop_int()
+    if index >= len(ev.group):
+        raise TealReject("gtxns index out of the group")
+    ev.push_value(
+        ev.txn_field(ev.group[index], args[0], args[1] if len(args) > 1 else None)
+    )
+
+
+def opGlobal(ev, args):
+    field = args[0]
+    ledger = ev.ledger
+    if field == "MinTxnFee":
+        value = MIN_TXN_FEE
+    elif field == "MinBalance":
+        value = MIN_BALANCE
+    elif field == "MaxTxnLife":
+        value = 1000
+    elif field == "ZeroAddress":
+        value = ZERO_ADDRESS
+    elif field == "GroupSize":
+        value = len(ev.group)
+    elif field == "LogicSigVersion":
+        value = 6
+    elif field == "Round":
+        value = ledger.round
+    elif field == "LatestTimestamp":
+        value = ledger.latestTimestamp
+    elif field == "CurrentApplicationID":
+        value = ev.app.appId
+    elif field == "CreatorAddress":
+        value = ev.app.creator
+    elif field == "CurrentApplicationAddress":
+        value = ev.app.address
+    elif field == "GroupID":
+        value = bytes(32)
+    else:
+        raise TealReject("unsupported global %s" % field)
+    ev.push_value(value)
+
+
+def opAppGlobalGet(ev, args):
+    key = ev.pop_bytes()
+    ev.stack.append(ev.app.globalState.get(key, 0))
+
+
+def opAppGlobalPut(ev, args):
+    value = ev.stack.pop()
+    key = ev.pop_bytes()
+    if len(key) > 64:
+        raise TealReject("global state key too long")
+    ev.app.globalState[key] = value
+
+
+def opAppGlobalDel(ev, args):
+    ev.app.globalState.pop(ev.pop_bytes(), None)
+
+
+def opAppGlobalGetEx(ev, args):
+    key = ev.pop_bytes()
+    appId = ev.app_ref(ev.pop_int())
+    app = ev.ledger.apps.get(appId)
+    if app is None or key not in app.globalState:
+        ev.stack.extend([0, 0])
+    else:
+        ev.stack.extend([app.globalState[key], 1])
+
+
+def opAssetHoldingGet(ev, args):
+    assetId = ev.asset_ref(ev.pop_int())
+    account = ev.account_ref(ev.stack.pop())
+    if args[0] == "AssetBalance":
+        value = account.assets.get(assetId, 0)
+    elif args[0] == "AssetFrozen":
+        value = 0
+    else:
+        raise TealReject("unsupported holding field %s" % args[0])
+    ev.stack.extend([value, int(assetId in account.assets)])
+
+
+def opAssetParamsGet(ev, args):
+    assetId = ev.asset_ref(ev.pop_int())
+    if assetId not in ev.ledger.assets:
+        ev.stack.extend([0, 0])
+        return
+    creator, total, decimals = ev.ledger.assets[assetId]
+    fields = {"AssetTotal": total, "AssetDecimals": decimals}
+    if args[0] not in fields:
+        raise TealReject("unsupported asset params field %s" % args[0])
+    ev.stack.extend([fields[args[0]], 1])
+
+
+def opAppParamsGet(ev, args):
+    app = ev.ledger.apps.get(ev.app_ref(ev.pop_int()))
+    if app is None:
+        ev.stack.extend([0, 0])
+        return
+    if args[0] == "AppAddress":
+        value = app.address
+    elif args[0] == "AppCreator":
+        value = app.creator
+    else:
+        raise TealReject("unsupported app params field %s" % args[0])
+    ev.stack.extend([value, 1])
+
+
+def opBalance(ev, args):
+    ev.stack.append(ev.account_ref(ev.stack.pop()).microAlgos)
+
+
+def opMinBalance(ev, args):
+    ev.stack.append(ev.account_ref(ev.stack.pop()).min_balance())
+
+
+def opLog(ev, args):
+    value = ev.pop_bytes()
+    if len(ev.logs) >= MAX_LOGS:
+        raise TealReject("too many log calls")
+    if sum(map(len, ev.logs)) + len(value) > MAX_LOG_SIZE:
+        raise TealReject("logs too large")
+    ev.logs.append(value)
+
+
+def opItxnBegin(ev, args):
+    if ev.innerGroup is not None:
+        raise TealReject("itxn_begin without itxn_submit")
+    ev.innerGroup = [newTxn(ev.app.address)]
+
+
+def opItxnNext(ev, args):
+    if ev.innerGroup is None:
+        raise TealReject("itxn_next without itxn_begin")
+    ev.innerGroup.append(newTxn(ev.app.address))
+
+
+def opItxnField(ev, args):
+    if ev.innerGroup is None:
+        raise TealReject("itxn_field without itxn_begin")
+    field = args[0]
+    value = ev.stack.pop()
+    txn = ev.innerGroup[-1]
+    if field in ADDRESS_FIELDS and (not isinstance(value, bytes) or len(value) != 32):
+        raise TealReject("%s is not an address" % field)
+    if field in ARRAY_FIELDS:
+        txn[field].append(value)
+    elif field == "Type":
+        txn["TypeEnum"] = TYPE_ENUMS[value.decode()]
+    elif field in txn:
+        txn[field] = value
+    else:
+        raise TealReject("unsupported itxn_field %s" % field)
+
+
+def opItxnSubmit(ev, args):
+    if ev.innerGroup is None:
+        raise TealReject("itxn_submit without itxn_begin")
+    group, ev.innerGroup = ev.innerGroup, None
+    ev.ledger.submit_inner(ev.app, group, ev.execution, ev.depth)
+    ev.lastInner = group
+
+
+def opItxn(ev, args):
+    if not ev.lastInner:
+        raise TealReject("no inner transaction submitted")
+    ev.push_value(
+        ev.txn_field(ev.lastInner[-1], args[0], args[1] if len(args) > 1 else None)
+    )
+
+
+def opGitxn(ev, args):
+    if not ev.lastInner or args[0] >= len(ev.lastInner):
+        raise TealReject("gitxn index out of the inner group")
+    txn = ev.lastInner[args[0]]
+    ev.push_value(ev.txn_field(txn, args[1], args[2] if len(args) > 2 else None))
+
+
+def opAndOr(isAnd):
+    def op(ev, args):
+        b = ev.pop_int()
+        a = ev.pop_int()
+        ev.stack.append(int(bool(a and b) if isAnd else bool(a or b)))
+
+    return op
+
+
+OPCODES = {
+    "int": opInt,
+    "pushint": opInt,
+    "byte": opBytes,
+    "pushbytes": opBytes,
+    "addr": opBytes,
+    "method": opBytes,
+    "+": binaryInt(lambda a, b: a + b),
+    "-": binaryInt(checkedSub),
+    "*": binaryInt(lambda a, b: a * b),
+    "/": binaryInt(checkedDiv),
+    "%": binaryInt(checkedMod),
+    "<": binaryInt(lambda a, b: int(a < b)),
+    ">": binaryInt(lambda a, b: int(a > b)),
+    "<=": binaryInt(lambda a, b: int(a <= b)),
+    ">=": binaryInt(lambda a, b: int(a >= b)),
+    "&": binaryInt(lambda a, b: a & b),
+    "|": binaryInt(lambda a, b: a | b),
+    "^": binaryInt(lambda a, b: a ^ b),
+    "&&": opAndOr(True),
+    "||": opAndOr(False),
+    "==": opEquals(False),
+    "!=": opEquals(True),
+    "!": opNot,
+    "mulw": opMulw,
+    "addw": opAddw,
+    "divmodw": opDivmodw,
+    "sqrt": opSqrt,
+    "itob": opItob,
+    "btoi": opBtoi,
+    "len": opLen,
+    "concat": opConcat,
+    "extract_uint64": opExtractUint64,
+    "extract": opExtract,
+    "substring3": opSubstring3,
+    "b": opBranch(None),
+    "bz": opBranch(False),
+    "bnz": opBranch(True),
+    "callsub": opCallsub,
+    "retsub": opRetsub,
+    "return": opReturn,
+    "err": opErr,
+    "assert": opAssert,
+    "pop": opPop,
+    "dup": opDup,
+    "dup2": opDup2,
+    "swap": opSwap,
+    "select": opSelect,
+    "dig": opDig,
+    "cover": opCover,
+    "uncover": opUncover,
+    "load": opLoad,
+    "store": opStore,
+    "txn": opTxn,
+    "txna": opTxn,
+    "gtxn": opGtxn,
+    "gtxna": opGtxn,
+    "gtxns": opGtxns,
+    "gtxnsa": opGtxns,
+    "global": opGlobal,
+    "app_global_get": opAppGlobalGet,
+    "app_global_put": opAppGlobalPut,
+    "app_global_del": opAppGlobalDel,
+    "app_global_get_ex": opAppGlobalGetEx,
+    "asset_holding_get": opAssetHoldingGet,
+    "asset_params_get": opAssetParamsGet,
+    "app_params_get": opAppParamsGet,
+    "balance": opBalance,
+    "min_balance": opMinBalance,
+    "log": opLog,
+    "itxn_begin": opItxnBegin,
+    "itxn_next": opItxnNext,
+    "itxn_field": opItxnField,
+    "itxn_submit": opItxnSubmit,
+    "itxn": opItxn,
+    "itxna": opItxn,
+    "gitxn": opGitxn,
+}
+
+
+class StubNanopool:
+    """NanoSwap pool served as a Python app, its math is a ConstantProductNanopool"""
+
+    def __init__(self, ledger, model):
+        """Constructor method for :class:`StubNanopool`, see deploy
+        Args:
+            ledger: LocalLedger of the app.
+            model: ConstantProductNanopool holding the reserves and the LP circulation.
+        """
+        from algofi_amm.contract_strings import algofi_pool_strings
+
+        self.methods = {
+            algofi_pool_strings.swap_exact_for: self.swap_exact_for,
+            algofi_pool_strings.burn_asset1_out: self.burn_asset1_out,
+            algofi_pool_strings.burn_asset2_out: self.burn_asset2_out,
+            algofi_pool_strings.pool: self.pool,
+            algofi_pool_strings.redeem_pool_asset1_residual: self.redeem_residual1,
+            algofi_pool_strings.redeem_pool_asset2_residual: self.redeem_residual2,
+        }
+        self.ledger = ledger
+        self.model = model
+        # Amounts owed to each account by the calls following a burn or a pool call:
+        # the asset 2 share of a burn, and the asset 1 and asset 2 residuals of a pool
+        self.owed = {}
+
+    @classmethod
+    def deploy(
+        cls,
+        ledger,
+        asset1Id: int,
+        asset2Id: int,
+        reserve1: int,
+        reserve2: int,
+        feeBps=25,
+        lpHolder=None,
+    ):
+        """Register the nanopool and its manager app and create the LP token.
+        Args:
+            ledger: LocalLedger of the app.
+            asset1Id, asset2Id: nanopool assets, created on the ledger.
+            reserve1, reserve2: initial reserves, the LP circulation is their geometric mean.
+            feeBps: swap fee, taken out of the input.
+            lpHolder: address receiving the LP circulation, else the nanopool keeps it.
+        Returns:
+            The StubNanopool, with application_id, manager_application_id, address and
+            lp_asset_id like an Algofi Pool.
+        """
+        creator = encoding.encode_address(ZERO_ADDRESS)
+        applicationId = ledger.new_id()
+        address = get_application_address(applicationId)
+        ledger.fund(address, 10 * MIN_BALANCE)
+        lpAssetId = ledger.create_asset(address, UINT64 - 1)
+        ledger.mint(address, asset1Id, reserve1)
+        ledger.mint(address, asset2Id, reserve2)
+        model = ConstantProductNanopool(
+            asset1Id,
+            asset2Id,
+            lpAssetId,
+            reserve1,
+            reserve2,
+            isqrt(reserve1 * reserve2),
+            feeBps,
+        )
+        nanopool = cls(ledger, model)
+        ledger.apps[applicationId] = App(applicationId, ZERO_ADDRESS, handler=nanopool)
+        nanopool.application_id = applicationId
+        nanopool.manager_application_id = ledger.add_python_app(
+            creator, lambda call: []
+        )
+        nanopool.address = address
+        nanopool.lp_asset_id = lpAssetId
+        if lpHolder is not None:
+            ledger.account(address).assets[lpAssetId] -= model.lpCirculation
+            ledger.mint(lpHolder, lpAssetId, model.lpCirculation)
+        return nanopool
+
+    def snapshot(self) -> tuple:
+        return self.model.snapshot(), {
+            sender: list(owed) for sender, owed in self.owed.items()
+        }
+
+    def restore(self, state: tuple) -> None:
+        self.model.restore(state[0])
+        self.owed = state[1]
+
+    def __call__(self, call: Call) -> list:
+        args = call.txn["ApplicationArgs"]
+        method = self.methods.get(args[0].decode(errors="replace") if args else None)
+        if method is None:
+            raise TealReject("nanopool: unknown method")
+        try:
+            method(call)
+        except MetapoolReject as reject:
+            raise TealReject("nanopool: %s" % reject) from None
+        return []
+
+    def received(self, call: Call, offset: int, assetIds) -> tuple:
+        """Asset transfer to the nanopool at an offset before the call"""
+        position = call.index - offset
+        txn = call.group[position] if position >= 0 else None
+        if (
+            txn is None
+            or txn["TypeEnum"] != TYPE_ENUMS["axfer"]
+            or txn["AssetReceiver"] != call.app.address
+            or txn["XferAsset"] not in assetIds
+        ):
+            raise TealReject("nanopool: missing transfer")
+        return txn["XferAsset"], txn["AssetAmount"]
+
+    def owed_to(self, call: Call) -> list:
+        return self.owed.setdefault(call.txn["Sender"], [0, 0])
+
+    def swap_exact_for(self, call: Call) -> None:
+        model = self.model
+        assetIn, amount = self.received(call, 1, (model.asset1Id, model.asset2Id))
+        minOut = int.from_bytes(call.txn["ApplicationArgs"][1], "big")
+        out = model.swap(assetIn, amount)
+        if out < minOut:
+            raise TealReject("nanopool: swap output below the minimum")
+        assetOut = model.asset2Id if assetIn == model.asset1Id else model.asset1Id
+        call.send(assetOut, call.txn["Sender"], out)
+
+    def burn_asset1_out(self, call: Call) -> None:
+        _, amount = self.received(call, 1, (self.model.lpId,))
+        amount1, amount2 = self.model.burn(amount)
+        self.owed_to(call)[1] = amount2
+        call.send(self.model.asset1Id, call.txn["Sender"], amount1)
+
+    def burn_asset2_out(self, call: Call) -> None:
+        # The LP transfer precedes the asset 1 call, which burnt it
+        self.received(call, 2, (self.model.lpId,))
+        owed = self.owed_to(call)
+        call.send(self.model.asset2Id, call.txn["Sender"], owed[1])
+        owed[1] = 0
+
+    def pool(self, call: Call) -> None:
+        _, amount1 = self.received(call, 2, (self.model.asset1Id,))
+        _, amount2 = self.received(call, 1, (self.model.asset2Id,))
+        lp, residual1, residual2 = self.model.pool(amount1, amount2)
+        self.owed[call.txn["Sender"]] = [residual1, residual2]
+        call.send(self.model.lpId, call.txn["Sender"], lp)
+
+    def redeem_residual(self, call: Call, side: int, assetId: int) -> None:
+        owed = self.owed_to(call)
+        if owed[side] > 0:
+            call.send(assetId, call.txn["Sender"], owed[side])
+            owed[side] = 0
+
+    def redeem_residual1(self, call: Call) -> None:
+        self.redeem_residual(call, 0, self.model.asset1Id)
+
+    def redeem_residual2(self, call: Call) -> None:
+        self.redeem_residual(call, 1, self.model.asset2Id)
@@ -0,0 +1,181 @@
+from base64 import b64encode
+import pytest
+from algosdk.encoding import decode_address
+from algosdk.logic import get_application_address
+from metapool.analyticsStore import AnalyticsStore, OPERATIONS
+from metapool.contracts.poolStrings import metapool_strings
+from metapool.utils import encodeMethodCall
+
+np = pytest.importorskip("numpy")
+
+APP_ID = 7
+ADDRESS = get_application_address(APP_ID)
+NANOPOOL = get_application_address(8)
+USER = get_application_address(99)
+META, LP, ASSET1 = 100, 200, 1
+
+
+def axfer(sender, receiver, asset, amount, fee=0):
+    return {
+        "tx-type": "axfer",
+        "sender": sender,
+        "fee": fee,
+        "asset-transfer-transaction": {
+            "receiver": receiver,
+            "asset-id": asset,
+            "amount": amount,
+        },
+    }
+
+
+def call(signature, args, inner=(), delta=(), fee=1000):
+    return {
+        "tx-type": "appl",
+        "sender": USER,
+        "fee": fee,
+        "application-transaction": {
+            "application-id": APP_ID,
+            "application-args": [
+                b64encode(arg).decode() for arg in encodeMethodCall(signature, *args)
+            ],
+        },
+        "inner-txns": list(inner),
+        "global-state-delta": list(delta),
+    }
+
+
+def uint_delta(key, value):
+    return {
+        "key": b64encode(key.encode()).decode(),
+        "value": {"action": 2, "uint": value},
+    }
+
+
+def group(rnd, group_id, txns):
+    for i, txn in enumerate(txns):
+        txn.update({"confirmed-round": rnd, "intra-round-offset": i, "group": group_id})
+    return txns
+
+
+def history():
+    setup = call(
+        metapool_strings.op_set_metapool,
+        [[25, 1000]],
+        delta=[
+            uint_delta(metapool_strings.meta_asset_id, META),
+            uint_delta(metapool_strings.nanopool_lp_id, LP),
+            uint_delta(metapool_strings.fee_bps, 25),
+            {
+                "key": b64encode(metapool_strings.nanopool_address.encode()).decode(),
+                "value": {
+                    "action": 1,
+                    "bytes": b64encode(decode_address(NANOPOOL)).decode(),
+                },
+            },
+        ],
+    )
+    add = [
+        axfer(USER, ADDRESS, META, 2000, fee=1000),
+        axfer(USER, ADDRESS, LP, 1500, fee=1000),
+        call(
+            metapool_strings.op_add_liquidity,
+            [],
+            inner=[axfer(ADDRESS, USER, LP, 500), axfer(ADDRESS, USER, 300, 1414)],
+        ),
+    ]
+    # Zap route: asset 1 zapped into 80 nanopool LP, swapped for meta asset
+    zap = [
+        axfer(USER, ADDRESS, ASSET1, 100, fee=1000),
+        {
+            "tx-type": "pay",
+            "sender": USER,
+            "fee": 1000,
+            "payment-transaction": {"receiver": ADDRESS, "amount": 8000},
+        },
+        call(
+            metapool_strings.op_metaswap,
+            [[40]],
+            inner=[
+                axfer(ADDRESS, NANOPOOL, ASSET1, 100),
+                {
+                    "tx-type": "appl",
+                    "sender": ADDRESS,
+                    "application-transaction": {"application-id": 8},
+                    "inner-txns": [axfer(NANOPOOL, ADDRESS, LP, 80)],
+                },
+                axfer(ADDRESS, USER, META, 90),
+            ],
+            fee=7000,
+        ),
+    ]
+    return group(10, "setup", [setup]) + group(11, "add", add) + group(12, "zap", zap)
+
+
+class FakeIndexer:
+    def __init__(self, txns):
+        self.txns = txns
+        self.current_round = 12
+
+    def search_transactions(self, address, min_round, max_round, limit, next_page):
+        # Address searches return the newest transactions first
+        start = int(next_page or 0)
+        txns = [
+            t
+            for t in reversed(self.txns)
+            if min_round <= t["confirmed-round"] <= max_round
+        ]
+        page = txns[start : start + limit]
+        response = {"current-round": self.current_round, "transactions": page}
+        if page:
+            response["next-token"] = str(start + len(page))
+        return response
+
+
+def test_ingest(tmp_path):
+    indexer = FakeIndexer(history())
+    # Pages split the groups, windows split the history
+    store = AnalyticsStore(str(tmp_path), APP_ID)
+    assert store.ingest(indexer, pageSize=2, roundsPerQuery=6) == 3
+    columns = store.columns()
+    assert list(columns["op"]) == [
+        OPERATIONS.index(metapool_strings.op_set_metapool),
+        OPERATIONS.index(metapool_strings.op_add_liquidity),
+        OPERATIONS.index(metapool_strings.op_metaswap),
+    ]
+    add, zap = 1, 2
+    assert columns["amount_in"][add] == 2000
+    assert (columns["asset_out"][add], columns["amount_out"][add]) == (300, 1414)
+    assert (columns["meta_reserve"][add], columns["lp_reserve"][add]) == (2000, 1000)
+    assert columns["txn_fee"][add] == 3000
+
+    assert (columns["asset_in"][zap], columns["amount_in"][zap]) == (ASSET1, 100)
+    assert (columns["asset_out"][zap], columns["amount_out"][zap]) == (META, 90)
+    assert columns["zap"][zap] == 40
+    # 25 bps of the 80 nanopool LP swapped in, rounded in favor of the pool
+    assert columns["pool_fee"][zap] == 1
+    assert columns["txn_fee"][zap] == 1000 + 1000 + 8000 + 7000
+    assert (columns["meta_reserve"][zap], columns["lp_reserve"][zap]) == (1910, 1080)
+
+    # Only the new rounds are fetched, the reserves carry over
+    indexer.txns += group(
+        13,
+        "burn",
+        [
+            axfer(USER, ADDRESS, META, 10, fee=1000),
+            call(
+                metapool_strings.op_metaswap,
+                [[0]],
+                inner=[axfer(ADDRESS, NANOPOOL, LP, 9)],
+            ),
+        ],
+    )
+    indexer.current_round = 13
+    store = AnalyticsStore(str(tmp_path), APP_ID)
+    assert store.ingest(indexer) == 1
+    columns = store.columns()
+    assert store.rows == 3 + 1
+    assert columns["zap"][3] == 0
+    assert (columns["meta_reserve"][3], columns["lp_reserve"][3]) == (1920, 1071)
+
+    with pytest.raises(ValueError):
+        AnalyticsStore(str(tmp_path), APP_ID + 1)
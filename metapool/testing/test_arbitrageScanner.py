@@ -0,0 +1,113 @@
+from metapool.arbitrageScanner import ArbitrageScanner
+from metapool.metapoolMath import computeOtherTokenOutputPerGivenTokenInput
+from types import SimpleNamespace
+
+META, ASSET1, ASSET2 = 1, 2, 3
+
+
+class ConstantProduct:
+    """Venue of the meta asset against one asset"""
+
+    application_id = 20
+
+    def __init__(self, assetId, metaReserve, assetReserve, feeBps=30):
+        self.reserves = {META: metaReserve, assetId: assetReserve}
+        self.feeBps = feeBps
+        self.refreshed = 0
+
+    def refresh_state(self):
+        self.refreshed += 1
+
+    def quote(self, inTokenId, amount, outTokenId):
+        return computeOtherTokenOutputPerGivenTokenInput(
+            amount, self.reserves[inTokenId], self.reserves[outTokenId], self.feeBps
+        )
+
+
+class FakeMetapool:
+    """Meta asset against each nanopool asset at 1:1"""
+
+    meta_asset_id = META
+    metapool_application_id = 10
+    min_increment = 1000
+
+    def __init__(self):
+        self.nanopool = SimpleNamespace(
+            application_id=11,
+            asset1=SimpleNamespace(asset_id=ASSET1),
+            asset2=SimpleNamespace(asset_id=ASSET2),
+            asset1_balance=10**10,
+            asset2_balance=10**10,
+        )
+        self.venues = {
+            ASSET1: ConstantProduct(ASSET1, 10**10, 10**10),
+            ASSET2: ConstantProduct(ASSET2, 10**10, 10**10),
+        }
+
+    def get_metaswap_quote(self, inTokenId, amount, outTokenId, refresh=True):
+        assert not refresh
+        return self.venues[outTokenId if inTokenId == META else inTokenId].quote(
+            inTokenId, amount, outTokenId
+        )
+
+
+class FakeFollower:
+    def __init__(self):
+        self.metapools, self.apps, self.callbacks = [], set(), []
+
+    def follow(self, metapool, refreshNanopool=False):
+        assert refreshNanopool
+        self.metapools.append(metapool)
+
+    def add_app(self, appId):
+        self.apps.add(appId)
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+
+def test_scan():
+    metapool = FakeMetapool()
+    follower = FakeFollower()
+    # The venue sells the meta asset at about half the price of the metapool
+    venue = ConstantProduct(ASSET1, 2 * 10**9, 10**9)
+    scanner = ArbitrageScanner(follower, metapool, {ASSET1: venue})
+    assert follower.metapools == [metapool] and follower.apps == {20}
+    found = []
+    scanner.subscribe(found.append)
+
+    follower.callbacks[0](5, {99})
+    assert found == []
+    follower.callbacks[0](6, {20})
+    assert venue.refreshed == 1
+    [opportunity] = found[0]
+    assert opportunity.round == 6 and opportunity.route == "burn"
+    assert opportunity.assetId == ASSET1
+
+    def roundTrip(amount):
+        return metapool.get_metaswap_quote(
+            META, venue.quote(ASSET1, amount, META), ASSET1, refresh=False
+        )
+
+    assert opportunity.amountOut == roundTrip(opportunity.amountIn)
+    assert opportunity.profit == opportunity.amountOut - opportunity.amountIn
+    # No size on a grid does better
+    best = max(roundTrip(size) - size for size in range(10**6, 2 * 10**9, 10**6))
+    assert best <= opportunity.profit
+    assert scanner.latency > 0
+
+
+def test_no_opportunity_within_fees():
+    metapool = FakeMetapool()
+    venues = {
+        ASSET1: ConstantProduct(ASSET1, 10**10, 10**10 + 10**7),
+        ASSET2: ConstantProduct(ASSET2, 10**10, 10**10),
+    }
+    scanner = ArbitrageScanner(FakeFollower(), metapool, venues)
+    assert scanner.scan() == []
+    # A profit below the minimum is not reported
+    venues[ASSET2].reserves[ASSET2] = 10**10 + 10**9
+    [opportunity] = scanner.scan()
+    assert opportunity.route == "zap" and opportunity.assetId == ASSET2
+    scanner.minProfit = {ASSET2: opportunity.profit}
+    assert scanner.scan() == []
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import pytest
+from metapool.contracts.artifacts import ARTIFACTS, TEAL_DIR, buildTeal
+
+
+def imported_modules(module: str) -> set:
+    """Modules loaded by importing a module in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", "import sys, %s; print(*sys.modules)" % module],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(output.split())
+
+
+def test_runtime_imports_without_pyteal():
+    for module in ["metapool.utils", "metapool.feeBudget", "metapool.registry"]:
+        modules = imported_modules(module)
+        assert "pyteal" not in modules
+        assert "metapool.contracts.poolKeys" not in modules
+
+
+def test_client_imports_without_pyteal():
+    pytest.importorskip("algofi_amm")
+    assert "pyteal" not in imported_modules("metapool.metapoolAMMClient")
+
+
+@pytest.mark.parametrize("name", sorted(ARTIFACTS))
+def test_artifacts_up_to_date(name):
+    path = os.path.join(TEAL_DIR, name)
+    # The artifacts ship with the package, the clients do not compile a missing one
+    assert os.path.exists(path), "%s not built" % name
+    pytest.importorskip("algofi_amm")
+    with open(path) as f:
+        assert f.read() == buildTeal(name)
@@ -0,0 +1,121 @@
+from metapool.backtest import (
+    Tape,
+    backtest,
+    nanopoolLegs,
+    syntheticTape,
+    tapeFromColumns,
+)
+from metapool.metapoolMath import assessFee
+from metapool.metapoolSimulator import (
+    MetapoolReject,
+    computeOtherTokenOutputPerGivenTokenInput,
+)
+import numpy as np
+
+
+def replay(tape, feeBps, meta, lp):
+    """Scalar replay with the uint64 contract math of the simulator"""
+    failed = metaFees = lpFees = 0
+    for metaIn, amount, minAmountOut in zip(*tape):
+        amount = int(amount)
+        given, other = (meta, lp) if metaIn else (lp, meta)
+        try:
+            out = computeOtherTokenOutputPerGivenTokenInput(
+                amount, given, other, feeBps
+            )
+        except MetapoolReject:
+            out = 0
+        if out < max(minAmountOut, 1):
+            failed += 1
+            continue
+        fee = amount - assessFee(amount, feeBps)
+        if metaIn:
+            meta, lp, metaFees = meta + amount, lp - out, metaFees + fee
+        else:
+            lp, meta, lpFees = lp + amount, meta - out, lpFees + fee
+    return meta, lp, metaFees, lpFees, failed
+
+
+def test_backtest_matches_contract_math():
+    tape = syntheticTape(2000, 10**8, sigma=2, seed=1)
+    rng = np.random.default_rng(2)
+    # Some trades ask for more than they can get
+    minAmountOut = np.where(rng.random(2000) < 0.1, tape.amount * 2, 0)
+    tape = tape._replace(minAmountOut=minAmountOut)
+    feeBps = np.array([0, 5, 30, 100, 1000])
+    metaReserve = np.array([10**9, 10**9, 2 * 10**9, 10**9, 10**9])
+    lpReserve = np.array([10**9, 3 * 10**9, 2 * 10**9, 10**8, 10**9])
+
+    result = backtest(tape, feeBps, metaReserve, lpReserve, records=10)
+    for i in range(len(feeBps)):
+        meta, lp, metaFees, lpFees, failed = replay(
+            tape, int(feeBps[i]), int(metaReserve[i]), int(lpReserve[i])
+        )
+        assert result.metaReserve[i] == meta
+        assert result.lpReserve[i] == lp
+        assert result.metaFees[i] == metaFees
+        assert result.lpFees[i] == lpFees
+        assert result.failed[i] == failed > 0
+    assert list(result.pathIndex) == list(range(199, 2000, 200))
+    assert result.metaPath.shape == (10, 5)
+    assert (result.metaPath[-1] == result.metaReserve).all()
+    # Fees are income, impermanent loss is not
+    assert (result.feeIncome[1:] > 0).all() and result.feeIncome[0] == 0
+    assert (result.impermanentLoss <= 0).all()
+    assert result.netReturn[4] > result.netReturn[0]
+
+
+def test_backtest_exact_near_uint64_limit():
+    # k is far above 2^53, float64 alone drifts by several units over the tape
+    tape = syntheticTape(20_000, 10**7, sigma=1, seed=3)
+    feeBps = np.array([0, 30, 100])
+    metaReserve = np.array([4 * 10**9, 2**40, 10**12])
+    lpReserve = np.array([4 * 10**9, 2**23, 10**7])
+    result = backtest(tape, feeBps, metaReserve, lpReserve)
+    for i in range(len(feeBps)):
+        meta, lp, metaFees, lpFees, failed = replay(
+            tape, int(feeBps[i]), int(metaReserve[i]), int(lpReserve[i])
+        )
+        assert (result.metaReserve[i], result.lpReserve[i]) == (meta, lp)
+        assert (result.metaFees[i], result.lpFees[i]) == (metaFees, lpFees)
+        assert result.failed[i] == failed
+
+
+def test_backtest_rejects_k_overflow():
+    # k just below, at and just above 2^64, the fees push the first lanes over the limit
+    tape = syntheticTape(2000, 10**6, sigma=1, seed=4)
+    metaReserve = np.array([2**32, 2**32, 2**32 + 15, 2**32 + 1, 3 * 10**9])
+    lpReserve = np.array([2**32 - 1, 2**32, 2**32 - 17, 2**32, 3 * 10**9])
+    feeBps = np.array([30, 30, 100, 0, 30])
+    result = backtest(tape, feeBps, metaReserve, lpReserve)
+    for i in range(len(feeBps)):
+        meta, lp, metaFees, lpFees, failed = replay(
+            tape, int(feeBps[i]), int(metaReserve[i]), int(lpReserve[i])
+        )
+        assert (result.metaReserve[i], result.lpReserve[i]) == (meta, lp)
+        assert (result.metaFees[i], result.lpFees[i]) == (metaFees, lpFees)
+        assert result.failed[i] == failed
+    # k = 2^64 rejects every trade, the fees of the other lanes reach the limit
+    assert result.failed[1] == len(tape.amount)
+    assert result.failed[3] == len(tape.amount)
+    assert 0 < result.failed[0] < len(tape.amount)
+    assert result.failed[4] == 0
+
+
+def test_tape_from_columns():
+    META, LP, ASSET = 1, 2, 3
+    columns = {
+        "op": np.array([1, 5, 3, 1]),  # metaswap, add_liquidity, from_lp, metaswap
+        "asset_in": np.array([META, META, LP, ASSET]),
+        "amount_in": np.array([1000, 500, 2000, 4000]),
+    }
+    tape = tapeFromColumns(columns, META, LP, lpPerAsset=0.5, nanopoolFeeBps=20)
+    assert list(tape.metaIn) == [True, False, False]
+    assert list(tape.amount) == [1000, 2000, 1998]
+    assert list(nanopoolLegs([1998], 0.5, 20, zap=False)) == [3992]
+
+
+def test_empty_tape():
+    result = backtest(Tape(np.zeros(0, bool), np.zeros(0), np.zeros(0)), 30, 10, 10)
+    assert result.metaReserve == 10 and result.failed == 0
+    assert result.metaPath.shape == (0,)
@@ -0,0 +1,90 @@
+from metapool.depthTables import DepthTable, buildDepthTables, logGrid
+from metapool.metapoolMath import computeOtherTokenOutputPerGivenTokenInput
+from random import Random
+from types import SimpleNamespace
+import pytest
+
+META, ASSET1, ASSET2 = 1, 2, 3
+
+
+class FakeMetapool:
+    """Constant product routes between the meta asset and each nanopool asset"""
+
+    meta_asset_id = META
+    meta_asset_balance = 10**12
+    fee_bps = 30
+
+    def __init__(self, maxAmount=None):
+        self.nanopool = SimpleNamespace(
+            asset1=SimpleNamespace(asset_id=ASSET1),
+            asset2=SimpleNamespace(asset_id=ASSET2),
+            asset1_balance=4 * 10**11,
+            asset2_balance=6 * 10**11,
+        )
+        self.maxAmount = maxAmount
+
+    def reserve(self, assetId):
+        return {
+            META: self.meta_asset_balance,
+            ASSET1: self.nanopool.asset1_balance,
+            ASSET2: self.nanopool.asset2_balance,
+        }[assetId]
+
+    def get_metaswap_quote(self, inTokenId, amount, outTokenId, refresh=True):
+        if self.maxAmount is not None and amount > self.maxAmount:
+            raise ValueError("Not enough liquidity")
+        return computeOtherTokenOutputPerGivenTokenInput(
+            amount, self.reserve(inTokenId), self.reserve(outTokenId), self.fee_bps
+        )
+
+
+def test_log_grid():
+    sizes = logGrid(10**6, 48, 1e-5, 0.5)
+    assert sizes[0] == 10 and sizes[-1] == 500_000
+    assert all(a < b for a, b in zip(sizes, sizes[1:]))
+    assert logGrid(0, 8, 1e-5, 0.5) == [1]
+
+
+def test_depth_tables():
+    metapool = FakeMetapool()
+    tables = buildDepthTables(metapool, refresh=False)
+    assert set(tables) == {
+        (META, ASSET1),
+        (META, ASSET2),
+        (ASSET1, META),
+        (ASSET2, META),
+    }
+    rng = Random(0)
+    for (inTokenId, outTokenId), table in tables.items():
+        assert table.max_amount == metapool.reserve(inTokenId) // 2
+
+        def exact(amount):
+            return metapool.get_metaswap_quote(inTokenId, amount, outTokenId)
+
+        for size, output in zip(table.sizes, table.outputs):
+            assert output == exact(size)
+        for _ in range(200):
+            amount = rng.randint(1, table.max_amount)
+            # Below the exact quote, and close to it
+            assert 0.99 * exact(amount) <= table.output(amount) <= exact(amount)
+        with pytest.raises(ValueError):
+            table.output(table.max_amount + 1)
+
+        impacts = [table.impact_bps(size) for size in table.sizes]
+        assert impacts == sorted(impacts)
+        for impactBps in [1, 10, 50, 100, 1000]:
+            size = table.max_size(impactBps)
+            assert table.impact_bps(size) <= impactBps + 1e-6
+            assert table.impact_bps(size + size // 1000 + 1) > impactBps
+        assert table.max_size(-1) == 0
+        assert table.max_size(10_000) == table.max_amount
+
+
+def test_depth_table_stops_at_failed_quote():
+    metapool = FakeMetapool(maxAmount=10**9)
+    table = buildDepthTables(metapool, refresh=False)[(META, ASSET1)]
+    assert 0 < table.max_amount <= 10**9
+    assert table.max_size(10_000) == table.max_amount
+
+    empty = DepthTable(META, ASSET1, [], [])
+    assert empty.max_amount == 0 and empty.max_size(100) == 0
@@ -0,0 +1,91 @@
+from base64 import b64encode
+import pytest
+from metapool.feeBudget import (
+    NANOPOOL_INNER_TXNS,
+    SEND,
+    minimumFee,
+    minimumFeeCredit,
+    nanopoolFeePayment,
+    metaswapRoute,
+    metaswapExactOutRoute,
+    withdrawSingleRoute,
+    addLiquidityRoute,
+    addLiquiditySingleRoute,
+    countInnerTxns,
+    observeNanopoolInnerTxns,
+)
+
+
+def pays_defaults(route, credit, minFee=1000, innerTxns=NANOPOOL_INNER_TXNS):
+    """Replay the route, True if the credit covers every default fee"""
+    for fee, method in route:
+        if fee is not None:
+            credit += fee - minFee
+        default = (fee is None) + (innerTxns[method] if method else 0)
+        credit -= default * minFee
+        if credit < 0:
+            return False
+    return True
+
+
+def test_minimum_credit():
+    routes = [
+        metaswapRoute(burn=True),
+        metaswapRoute(burn=False),
+        metaswapExactOutRoute(burn=True, refund=False),
+        metaswapExactOutRoute(burn=False),
+        metaswapExactOutRoute(burn=False, residuals=0),
+        addLiquiditySingleRoute(zap=True, residuals=1),
+        withdrawSingleRoute(swapMeta=True),
+        addLiquidityRoute(refunds=0),
+    ]
+    for route in routes:
+        credit = minimumFeeCredit(route)
+        assert pays_defaults(route, credit)
+        assert credit == 0 or not pays_defaults(route, credit - 1)
+
+
+def test_explicit_fee_surplus():
+    # The surplus of an explicit fee pays for the transactions after it, not before
+    assert minimumFeeCredit([(4000, None), SEND, SEND, SEND]) == 0
+    assert minimumFeeCredit([SEND, SEND, SEND, (4000, None)]) == 3000
+    assert minimumFee([SEND, SEND]) == 3000
+    assert nanopoolFeePayment(metaswapRoute(burn=False)) == 8000
+    assert nanopoolFeePayment(addLiquidityRoute()) == 0
+
+
+def test_zap_residuals():
+    # Each residual the zap does not send back saves one minimum fee
+    full = minimumFee(metaswapRoute(burn=False))
+    assert minimumFee(metaswapRoute(burn=False, residuals=1)) == full - 1000
+    assert minimumFee(metaswapRoute(burn=False, residuals=0)) == full - 2000
+    assert minimumFee(metaswapRoute(burn=True, residuals=0)) == minimumFee(
+        metaswapRoute(burn=True)
+    )
+    assert (
+        minimumFee(addLiquiditySingleRoute(zap=True, residuals=0))
+        == minimumFee(addLiquiditySingleRoute(zap=True)) - 2000
+    )
+
+
+def test_count_inner_txns():
+    txinfo = {"inner-txns": [{"inner-txns": [{}, {}]}, {}]}
+    assert countInnerTxns(txinfo) == 4
+
+
+def test_observed_inner_txns():
+    algofi = pytest.importorskip("algofi_amm.contract_strings")
+    swap = algofi.algofi_pool_strings.swap_exact_for.encode()
+    nanopoolCall = {
+        "txn": {"txn": {"type": "appl", "apid": 8, "apaa": [b64encode(swap).decode()]}},
+        "inner-txns": [{}, {}, {}],
+    }
+    innerTxns = dict(NANOPOOL_INNER_TXNS)
+    observeNanopoolInnerTxns({"inner-txns": [nanopoolCall]}, 8, innerTxns)
+    assert innerTxns["swap"] == 3 and NANOPOOL_INNER_TXNS["swap"] == 1
+    # Two more default fee transactions to cover
+    route = metaswapRoute(burn=False)
+    credit = minimumFeeCredit(route, innerTxns=innerTxns)
+    assert credit == minimumFeeCredit(route) + 2000
+    assert pays_defaults(route, credit, innerTxns=innerTxns)
+    assert not pays_defaults(route, credit - 1, innerTxns=innerTxns)
@@ -0,0 +1,102 @@
+from metapool.feeSweep import (
+    DEPOSIT,
+    Flow,
+    SWAP_META_IN,
+    frontier,
+    sweep,
+    sweepLanes,
+    syntheticFlow,
+)
+from metapool.metapoolMath import (
+    assessFee,
+    computeOtherTokenOutputPerGivenTokenInput,
+    tryTakeAdjustedAmounts,
+)
+import numpy as np
+
+
+def replay(flow, feeBps, minIncrement, meta, lp):
+    """Scalar replay with the exact contract math"""
+    metaFees = lpFees = volume = 0
+    for kind, amount, amountLp, maxCostBps in zip(*flow):
+        amount, amountLp = int(amount), int(amountLp)
+        if kind == DEPOSIT:
+            if min(amount, amountLp) < minIncrement:
+                continue
+            taken = tryTakeAdjustedAmounts(amount, meta, amountLp, lp, 1)
+            if taken is not None:
+                meta, lp = meta + amount, lp + amountLp - taken[1]
+            else:
+                taken = tryTakeAdjustedAmounts(amountLp, lp, amount, meta, 1)
+                if taken is not None:
+                    meta, lp = meta + amount - taken[1], lp + amountLp
+            continue
+        metaIn = kind == SWAP_META_IN
+        given, other = (meta, lp) if metaIn else (lp, meta)
+        out = computeOtherTokenOutputPerGivenTokenInput(amount, given, other, feeBps)
+        cost = 1 - out * given / (amount * other)
+        if cost > maxCostBps / 10_000 or out < 1:
+            continue
+        fee = amount - assessFee(amount, feeBps)
+        if metaIn:
+            meta, lp, metaFees, volume = (
+                meta + amount,
+                lp - out,
+                metaFees + fee,
+                volume + amount,
+            )
+        else:
+            volume += amount * meta / lp
+            lp, meta, lpFees = lp + amount, meta - out, lpFees + fee
+    return metaFees + lpFees * meta / lp, volume
+
+
+def test_sweep_matches_contract_math():
+    flow = syntheticFlow(1500, 10**8, sigma=2, depositShare=0.1, seed=5)
+    feeBps = np.array([0, 10, 30, 100, 30])
+    minIncrement = np.array([0, 1000, 10**7, 1000, 10**9])
+    revenue, volume, lostToPricing, lostToMinIncrement = sweepLanes(
+        flow, feeBps, minIncrement, 10**11, 10**11
+    )
+    for i in range(len(feeBps)):
+        expectedRevenue, expectedVolume = replay(
+            flow, int(feeBps[i]), int(minIncrement[i]), 10**11, 10**11
+        )
+        assert abs(revenue[i] - expectedRevenue) <= 1e-6 * expectedRevenue + 1
+        assert abs(volume[i] - expectedVolume) <= 1e-6 * expectedVolume
+    # Higher fees price out more traders, higher increments refuse more deposits
+    assert lostToPricing[3] > lostToPricing[2] > lostToPricing[0]
+    assert lostToMinIncrement[4] > lostToMinIncrement[2] > lostToMinIncrement[1] == 0
+
+
+def test_swap_below_min_increment_executes():
+    # A swap and a deposit, both below the min increment of the second lane
+    flow = Flow(
+        kind=np.array([SWAP_META_IN, DEPOSIT]),
+        amount=np.array([10.0**6, 10.0**6]),
+        amountLp=np.array([0.0, 10.0**6]),
+        maxCostBps=np.array([10_000.0, 0.0]),
+    )
+    revenue, volume, lostToPricing, lostToMinIncrement = sweepLanes(
+        flow, np.array([30, 30]), np.array([1000, 10**7]), 10**11, 10**11
+    )
+    assert volume[0] == volume[1] == 10**6 and revenue[1] == revenue[0] > 0
+    assert lostToMinIncrement[0] == 0 and lostToMinIncrement[1] > 10**6
+    assert (lostToPricing == 0).all()
+
+
+def test_frontier():
+    revenue = np.array([1.0, 3.0, 2.0, 3.0, 0.5])
+    volume = np.array([10.0, 5.0, 8.0, 4.0, 12.0])
+    assert list(frontier(revenue, volume)) == [4, 0, 2, 1]
+
+
+def test_sweep_grid():
+    flow = syntheticFlow(500, 10**8, seed=1)
+    inProcess = sweep(flow, [5, 30, 100], [1000, 10**8], 10**11, 10**11, 4, 0)
+    pooled = sweep(flow, [5, 30, 100], [1000, 10**8], 10**11, 10**11, 4, 2)
+    assert list(inProcess.feeBps) == [5, 5, 30, 30, 100, 100]
+    assert list(inProcess.minIncrement) == [1000, 10**8] * 3
+    assert (inProcess.revenue == pooled.revenue).all()
+    assert (inProcess.frontier == pooled.frontier).all()
+    assert len(inProcess.frontier) > 0
@@ -0,0 +1,74 @@
+from metapool.metapoolFactory import (
+    MetapoolFactory,
+    MetapoolSpec,
+    PartialDeploymentError,
+)
+import pytest
+from metapool.contracts.poolStrings import metapool_strings
+from algofi_amm.utils import get_application_global_state, get_account_balances
+from metapool.testing.resources import startup, newTestToken
+from metapool.testing.configTestnet import (
+    ASSET1_ID,
+    ASSET2_ID,
+    USTEST_ID,
+    MIN_INCREMENT,
+    FEE_BPS,
+)
+
+
+def test_factory_deploy():
+    amm_client, creator_account = startup()
+    other_meta = newTestToken(amm_client, creator_account)
+    specs = [
+        MetapoolSpec(ASSET1_ID, ASSET2_ID, USTEST_ID, FEE_BPS, MIN_INCREMENT),
+        MetapoolSpec(ASSET1_ID, ASSET2_ID, other_meta, FEE_BPS * 2, MIN_INCREMENT),
+    ]
+
+    factory = MetapoolFactory(amm_client, creator_account)
+    metapools = factory.deploy(specs)
+
+    balances = get_account_balances(amm_client.indexer, creator_account.getAddress())
+    for spec, metapool in zip(specs, metapools):
+        app_id, lp_id = factory.registry[
+            (spec.metaAssetId, spec.asset1Id, spec.asset2Id)
+        ]
+        assert app_id == metapool.metapool_application_id
+        state = get_application_global_state(amm_client.indexer, app_id)
+        assert state[metapool_strings.meta_asset_id] == spec.metaAssetId
+        assert state[metapool_strings.fee_bps] == spec.feeBps
+        assert state[metapool_strings.meta_lp_id] == lp_id
+        # Creator is opted in to the pool token
+        assert balances[lp_id] == 0
+
+    for metapool in metapools:
+        metapool.closeMetapool(creator_account)
+
+
+def test_factory_partial_deploy():
+    amm_client, creator_account = startup()
+    good = MetapoolSpec(ASSET1_ID, ASSET2_ID, USTEST_ID, FEE_BPS, MIN_INCREMENT)
+    # The contract cannot opt in to a meta asset that does not exist, the setup fails
+    bad = MetapoolSpec(ASSET1_ID, ASSET2_ID, 1, FEE_BPS, MIN_INCREMENT)
+
+    factory = MetapoolFactory(amm_client, creator_account)
+    with pytest.raises(PartialDeploymentError) as error:
+        factory.deploy([good, bad, bad])
+    # Both copies of the bad spec are reported
+    assert sorted(error.value.failed) == [1, 2]
+    metapool, _, partial = error.value.metapools
+    # The app of the failed spec was created, it is recorded without a pool token
+    assert factory.registry[(1, ASSET1_ID, ASSET2_ID)] == (
+        partial.metapool_application_id,
+        None,
+    )
+    assert factory.registry[(USTEST_ID, ASSET1_ID, ASSET2_ID)] == (
+        metapool.metapool_application_id,
+        metapool.metapool_lp_asset_id,
+    )
+
+    # Re-running the same specs creates new apps
+    metapools = factory.deploy([good])
+    assert metapools[0].metapool_application_id != metapool.metapool_application_id
+
+    for deployed in [metapool, partial, metapools[0]]:
+        deployed.closeMetapool(creator_account)
@@ -0,0 +1,115 @@
+from metapool.metapoolMath import (
+    computeBurnInputPerOutput,
+    computeGivenTokenInputPerOtherTokenOutput,
+    computeOtherTokenOutputPerGivenTokenInput,
+    planAddLiquidity,
+    tryTakeAdjustedAmounts,
+    xMulYDivZ,
+    computeZapInputPerLpOutput,
+)
+from metapool.metapoolSimulator import ConstantProductNanopool
+from random import Random
+import pytest
+
+
+def test_exact_output_input():
+    rng = Random(0)
+    for _ in range(2000):
+        given = rng.randint(1, 10**9)
+        other = rng.randint(2, 10**9)
+        fee_bps = rng.choice([0, 1, 30, 100, 9999])
+        out = rng.randint(1, other - 1)
+        amount = computeGivenTokenInputPerOtherTokenOutput(out, given, other, fee_bps)
+
+        # Enough to get the requested output...
+        assert (
+            computeOtherTokenOutputPerGivenTokenInput(amount, given, other, fee_bps)
+            >= out
+        )
+        # ...and not a single unit more than needed
+        assert (
+            computeOtherTokenOutputPerGivenTokenInput(amount - 1, given, other, fee_bps)
+            < out
+        )
+
+
+def test_exact_output_bounds():
+    with pytest.raises(ValueError):
+        computeGivenTokenInputPerOtherTokenOutput(0, 1000, 1000, 30)
+    with pytest.raises(ValueError):
+        computeGivenTokenInputPerOtherTokenOutput(1000, 1000, 1000, 30)
+
+
+def test_nanopool_closed_form_inverses():
+    rng = Random(2)
+    for _ in range(2000):
+        reserve1 = rng.randint(10**4, 10**14)
+        reserve2 = int(reserve1 * rng.uniform(0.2, 5))
+        circulation = int((reserve1 * reserve2) ** 0.5 * rng.uniform(0.5, 2))
+        fee_bps = rng.choice([0, 1, 25, 100])
+
+        # Burn then swap the asset 2 for asset 1
+        out = rng.randint(1, reserve1 // 3)
+        lp = computeBurnInputPerOutput(out, reserve1, reserve2, circulation, fee_bps)
+        nanopool = ConstantProductNanopool(
+            1, 2, 3, reserve1, reserve2, circulation, fee_bps
+        )
+        amount1, amount2 = nanopool.burn(lp)
+        received = amount1 + nanopool.swap(2, amount2)
+        assert out <= received <= out + 20
+
+        # Zap asset 1 into the LP
+        lp = rng.randint(1, circulation // 3)
+        amount, zap = computeZapInputPerLpOutput(
+            lp, reserve1, reserve2, circulation, fee_bps
+        )
+        nanopool = ConstantProductNanopool(
+            1, 2, 3, reserve1, reserve2, circulation, fee_bps
+        )
+        minted, residual1, _ = nanopool.pool(amount - zap, nanopool.swap(1, zap))
+        assert lp <= minted <= lp + 5 and residual1 == 0
+
+    with pytest.raises(ValueError):
+        computeBurnInputPerOutput(1000, 1000, 1000, 1000, 30)
+
+
+def test_plan_add_liquidity():
+    rng = Random(1)
+    for _ in range(2000):
+        reserve_a = rng.randint(1, 10**12)
+        reserve_b = rng.randint(1, 10**12)
+        outstanding = rng.randint(1, 10**12)
+        max_a = rng.randint(1, 10**9)
+        max_b = rng.randint(1, 10**9)
+        min_increment = rng.choice([0, 1000])
+        try:
+            qa, qb, minted = planAddLiquidity(
+                max_a, max_b, reserve_a, reserve_b, outstanding, min_increment
+            )
+        except ValueError:
+            # Only when the largest fitting deposit is too small for the contract
+            qa = min(max_a, ((max_b + 1) * reserve_a - 1) // reserve_b)
+            assert min(qa, xMulYDivZ(qa, reserve_b, reserve_a)) < max(min_increment, 1)
+            continue
+        assert qa <= max_a and qb <= max_b
+        assert min(qa, qb) >= max(min_increment, 1)
+        # The contract keeps both amounts in full...
+        assert tryTakeAdjustedAmounts(qa, reserve_a, qb, reserve_b, outstanding) == (
+            minted,
+            0,
+        )
+        # ...and one more unit of token A would not fit
+        if qa < max_a:
+            assert xMulYDivZ(qa + 1, reserve_b, reserve_a) > max_b
+
+
+def test_plan_add_liquidity_too_small():
+    # The token B corresponding to the largest token A rounds down to 0
+    with pytest.raises(ValueError, match="too small"):
+        planAddLiquidity(10, 10, 10**9, 10, 10**6)
+    # Both amounts are positive, token B is below the min increment
+    assert planAddLiquidity(10**6, 500, 10**9, 10**6, 10**6)[1] == 500
+    with pytest.raises(ValueError, match="too small"):
+        planAddLiquidity(10**6, 500, 10**9, 10**6, 10**6, minIncrement=1000)
+    with pytest.raises(ValueError, match="too small"):
+        planAddLiquidity(0, 10**6, 0, 0, 0)
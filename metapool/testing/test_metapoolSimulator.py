@@ -0,0 +1,218 @@
+from base64 import b64encode
+from types import SimpleNamespace
+import random
+from algosdk import account
+from algosdk.atomic_transaction_composer import ABI_RETURN_HASH
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+import pytest
+from metapool.contracts.poolStrings import metapool_strings
+from metapool.metapoolMath import (
+    computeOtherTokenOutputPerGivenTokenInput,
+    sqrt,
+    tryTakeAdjustedAmounts,
+)
+from metapool.metapoolSimulator import (
+    POOL_TOKEN_TOTAL,
+    ConstantProductNanopool,
+    MetapoolReject,
+    MetapoolSimulator,
+    replayDryrun,
+)
+from metapool.utils import encodeMethodCall
+
+ASSET1, ASSET2, NANO_LP, META, POOL_TOKEN = 1, 2, 3, 4, 5
+APP_ID = 77
+
+
+def newNanopool():
+    return ConstantProductNanopool(
+        ASSET1, ASSET2, NANO_LP, 10**9, 2 * 10**9, 10**9, feeBps=25
+    )
+
+
+def newSimulator(meta=10**8, lp=2 * 10**8, feeBps=30):
+    simulator = MetapoolSimulator(newNanopool(), META)
+    simulator.setup(feeBps, 1000, POOL_TOKEN)
+    simulator.add_liquidity(meta, lp)
+    return simulator
+
+
+def test_matches_contract_math():
+    simulator = MetapoolSimulator(newNanopool(), META)
+    assert simulator.setup(30, 1000, POOL_TOKEN) == POOL_TOKEN
+    with pytest.raises(MetapoolReject):
+        simulator.setup(30, 1000, POOL_TOKEN)
+    # First deposit takes everything
+    assert simulator.add_liquidity(10**8, 2 * 10**8) == sqrt(2 * 10**16)
+    outstanding = simulator.pool_tokens_outstanding
+    assert simulator.pool_token_balance == POOL_TOKEN_TOTAL - outstanding
+
+    # Excess LP is refunded by the first branch
+    minted, refund = tryTakeAdjustedAmounts(
+        10**6, 10**8, 3 * 10**6, 2 * 10**8, outstanding
+    )
+    assert simulator.add_liquidity(10**6, 3 * 10**6) == minted
+    assert simulator.sent == [(NANO_LP, refund), (POOL_TOKEN, minted)]
+    # Excess meta asset is refunded by the second branch
+    meta, lp = simulator.meta_asset_balance, simulator.lp_asset_balance
+    outstanding = simulator.pool_tokens_outstanding
+    minted, refund = tryTakeAdjustedAmounts(10**6, lp, 10**6, meta, outstanding)
+    assert simulator.add_liquidity(10**6, 10**6) == minted
+    assert simulator.sent[0] == (META, refund)
+
+    meta, lp = simulator.meta_asset_balance, simulator.lp_asset_balance
+    expected = computeOtherTokenOutputPerGivenTokenInput(10**6, lp, meta, 30)
+    assert simulator.metaswap_from_lp(10**6) == expected
+    assert simulator.meta_asset_balance == meta - expected
+
+    metaOut, lpOut = simulator.withdraw(simulator.pool_tokens_outstanding)
+    assert simulator.meta_asset_balance == simulator.lp_asset_balance == 0
+    assert (metaOut, lpOut) == (meta - expected, lp + 10**6)
+
+
+def test_rejects():
+    simulator = newSimulator()
+    with pytest.raises(MetapoolReject, match="min increment"):
+        simulator.add_liquidity(999, 10**6)
+    with pytest.raises(MetapoolReject, match="min amount out"):
+        simulator.metaswap_from_lp(10**6, minAmountOut=10**7)
+    with pytest.raises(MetapoolReject, match="fee payment"):
+        simulator.metaswap(META, 10**6, ASSET1, feePayment=3999)
+    # k = meta * lp overflows 64 bits, where the unchecked math still has an answer
+    large = newSimulator(10**9, 10**9)
+    large.add_liquidity(9 * 10**9, 9 * 10**9)
+    assert computeOtherTokenOutputPerGivenTokenInput(10**6, 10**10, 10**10, 30) > 0
+    with pytest.raises(MetapoolReject, match=r"\* overflow"):
+        large.metaswap_from_lp(10**6)
+    # The first deposit multiplies the amounts on 64 bits
+    empty = MetapoolSimulator(newNanopool(), META)
+    empty.setup(30, 1, POOL_TOKEN)
+    with pytest.raises(MetapoolReject, match=r"\* overflow"):
+        empty.add_liquidity(10**10, 10**10)
+
+
+def test_rejected_call_is_undone():
+    simulator = newSimulator()
+    before = simulator.state()
+    # The LP is burnt and swapped on the nanopool before the output check fails
+    with pytest.raises(MetapoolReject, match="below amount out"):
+        simulator.metaswap_exact_out(META, 10**6, ASSET1, 10**9, 10**5)
+    assert simulator.state() == before
+
+    out = simulator.metaswap(META, 10**6, ASSET1)
+    assert simulator.sent == [(ASSET1, out)]
+    assert simulator.state() != before
+    assert simulator.algo_balance == before[6]
+
+
+def test_random_sequences_keep_invariants():
+    rng = random.Random(4)
+    simulator = newSimulator()
+    rejects = 0
+    for _ in range(3000):
+        amount = int(10 ** rng.uniform(2, 8))
+        asset = rng.choice([ASSET1, ASSET2])
+        operation = rng.choice(
+            [
+                lambda: simulator.metaswap(META, amount, asset),
+                lambda: simulator.metaswap(asset, amount, META, amount // 2),
+                lambda: simulator.metaswap_from_lp(amount),
+                lambda: simulator.add_liquidity(amount, 2 * amount),
+                lambda: simulator.add_liquidity_single(META, amount, 0, amount // 2),
+                lambda: simulator.withdraw(amount),
+                lambda: simulator.withdraw_single(amount, asset, swapMeta=True),
+            ]
+        )
+        before = simulator.state()
+        try:
+            operation()
+        except MetapoolReject:
+            rejects += 1
+            assert simulator.state() == before
+        assert (
+            simulator.pool_token_balance + simulator.pool_tokens_outstanding
+            == POOL_TOKEN_TOTAL
+        )
+        assert simulator.meta_asset_balance >= 0 and simulator.lp_asset_balance >= 0
+    assert 0 < rejects < 3000
+
+
+def dryrunRequest(simulator, amount, minOut):
+    """Dry-run request of a metaswap_from_lp group against a metapool in the simulator state"""
+    sk, sender = account.generate_account()
+    address = get_application_address(APP_ID)
+    params = transaction.SuggestedParams(1000, 1, 1000, "", flat_fee=True)
+    txns = [
+        transaction.AssetTransferTxn(sender, params, address, amount, NANO_LP),
+        transaction.ApplicationNoOpTxn(
+            sender,
+            params,
+            APP_ID,
+            encodeMethodCall(metapool_strings.op_metaswap_from_lp, [minOut]),
+            accounts=[sender],
+            foreign_assets=[META, NANO_LP],
+        ),
+    ]
+    transaction.assign_group_id(txns)
+    state = {
+        metapool_strings.meta_asset_id: META,
+        metapool_strings.nanopool_app_id: 1,
+        metapool_strings.meta_lp_id: POOL_TOKEN,
+        metapool_strings.fee_bps: simulator.fee_bps,
+        metapool_strings.min_increment: simulator.min_increment,
+        metapool_strings.pool_token_outstanding: simulator.pool_tokens_outstanding,
+    }
+    return SimpleNamespace(
+        txns=[txn.sign(sk) for txn in txns],
+        apps=[
+            {
+                "id": APP_ID,
+                "params": {
+                    "global-state": [
+                        {
+                            "key": b64encode(key.encode()).decode(),
+                            "value": {"type": 2, "uint": value},
+                        }
+                        for key, value in state.items()
+                    ]
+                },
+            }
+        ],
+        accounts=[
+            {
+                "address": address,
+                "amount": 10**6,
+                "assets": [
+                    # Holdings before the group, the dry-run executes the transfer
+                    {"asset-id": META, "amount": simulator.meta_asset_balance},
+                    {"asset-id": NANO_LP, "amount": simulator.lp_asset_balance},
+                    {"asset-id": POOL_TOKEN, "amount": simulator.pool_token_balance},
+                ],
+            }
+        ],
+    )
+
+
+def dryrunResponse(value=None):
+    if value is None:
+        return {"txns": [{}, {"app-call-messages": ["ApprovalProgram", "REJECT"]}]}
+    log = b64encode(ABI_RETURN_HASH + value.to_bytes(8, "big")).decode()
+    return {"txns": [{}, {"app-call-messages": ["PASS"], "logs": [log]}]}
+
+
+def test_replay_dryrun():
+    simulator = newSimulator()
+    request = dryrunRequest(simulator, 10**6, 0)
+    expected = simulator.metaswap_from_lp(10**6)
+    comparison = replayDryrun(request, dryrunResponse(expected), newNanopool())
+    assert comparison.operation == metapool_strings.op_metaswap_from_lp
+    assert comparison.match and comparison.simulated == expected
+
+    assert not replayDryrun(request, dryrunResponse(expected + 1), newNanopool()).match
+    assert not replayDryrun(request, dryrunResponse(), newNanopool()).match
+    # Both reject when the minimum output is not met
+    request = dryrunRequest(simulator, 10**6, 10**9)
+    comparison = replayDryrun(request, dryrunResponse(), newNanopool())
+    assert comparison.match and comparison.simulated is None
+    assert "min amount out" in comparison.reason
@@ -0,0 +1,54 @@
+from metapool.monteCarlo import MonteCarloConfig, StreamingHistogram, simulate
+import numpy as np
+
+CONFIG = MonteCarloConfig(
+    feeBps=30, metaReserve=5 * 10**8, lpReserve=5 * 10**8, steps=200, tradeSize=10**7
+)
+
+
+def test_streaming_histogram():
+    values = np.random.default_rng(0).normal(0, 0.1, 100_000)
+    histogram, part = StreamingHistogram(-1, 1), StreamingHistogram(-1, 1)
+    histogram.add(values[:60_000])
+    part.add(values[60_000:])
+    histogram.merge(part)
+    assert histogram.count == 100_000
+    for q in [1, 5, 50, 95, 99]:
+        assert abs(histogram.percentile(q) - np.percentile(values, q)) < 2 / 16384
+    assert histogram.percentile(0) == values.min()
+    assert histogram.percentile(100) == values.max()
+
+
+def test_simulation_is_reproducible():
+    inProcess = simulate(CONFIG, 250, seed=3, shardSize=100, maxWorkers=0)
+    pooled = simulate(CONFIG, 250, seed=3, shardSize=100, maxWorkers=2)
+    other = simulate(CONFIG, 250, seed=4, shardSize=100, maxWorkers=0)
+    assert inProcess.paths == pooled.paths == 250
+    assert (inProcess.netReturn.counts == pooled.netReturn.counts).all()
+    assert inProcess.summary() == pooled.summary()
+    assert (inProcess.netReturn.counts != other.netReturn.counts).any()
+
+    summary = inProcess.summary()
+    assert summary["impermanentLoss"][99] <= 0
+    assert summary["feeReturn"][1] > 0
+    # The arbitrage keeps the pool close to the LP price, fees make up for the loss
+    assert summary["netReturn"][50] > summary["impermanentLoss"][50]
+    assert summary["nearLimitShare"] == 0 and summary["drainedShare"] == 0
+    # 4000 or 8000 µAlgo per user swap
+    assert 4000 * 200 <= summary["innerFees"][50] <= 8000 * 200
+
+
+def test_drain_and_uint64_limit():
+    # k = 2^62, 2 bits from the limit
+    config = CONFIG._replace(
+        metaReserve=2**31, lpReserve=2**31, tradeSize=2**27, reimbursedShare=0
+    )
+    result = simulate(config, 20, seed=0, shardSize=10, maxWorkers=0)
+    summary = result.summary()
+    assert summary["nearLimitShare"] == 1
+    assert summary["drainedShare"] == 1
+    assert result.headroomBits.percentile(0) <= 3
+    # k just below 2^64, the first fees push it over and the swaps fail
+    config = CONFIG._replace(metaReserve=2**32, lpReserve=2**32 - 1)
+    result = simulate(config, 20, seed=0, shardSize=10, maxWorkers=0)
+    assert result.failed > 0.9 * result.trades
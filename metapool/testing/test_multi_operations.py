@@ -0,0 +1,78 @@
+from metapool.multiMetapoolAMMClient import MultiMetapoolAMMClient
+from algofi_amm.v0.config import PoolType
+from algofi_amm.utils import get_account_balances
+from metapool.testing.resources import startup, newTestToken
+from metapool.testing.configTestnet import (
+    ASSET1_ID,
+    ASSET2_ID,
+    MIN_INCREMENT,
+    FEE_BPS,
+)
+import pytest
+
+
+def test_multi_metapool():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+    meta_a = newTestToken(amm_client, creator_account)
+    meta_b = newTestToken(amm_client, creator_account)
+
+    Metapool = MultiMetapoolAMMClient(client=amm_client, nanopool=nanopool)
+    Metapool.createMetapool(creator_account)
+    Metapool.setupMetapool(creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT)
+
+    # One slot per meta asset, each with its own pool token
+    lp_a = Metapool.registerMetaAsset(creator_account, meta_a)
+    lp_b = Metapool.registerMetaAsset(creator_account, meta_b)
+    assert lp_a != lp_b
+    assert Metapool.get_slot(meta_a).slot == 0
+    assert Metapool.get_slot(meta_b).slot == 1
+    # A meta asset can only be registered once
+    with pytest.raises(Exception):
+        Metapool.registerMetaAsset(creator_account, meta_a)
+
+    for meta in [meta_a, meta_b]:
+        Metapool.optInToPoolToken(creator_account, meta)
+    minted_a = Metapool.add_liquidity(creator_account, meta_a, 2_000_000, 1_000_000)
+    minted_b = Metapool.add_liquidity(creator_account, meta_b, 1_000_000, 1_000_000)
+    Metapool.fundMetapool(creator_account, 100_000)
+
+    # The nanopool LP of the app is split between the slots
+    Metapool.refresh_state()
+    assert Metapool.get_slot(meta_a).lp_asset_balance == 1_000_000
+    assert Metapool.get_slot(meta_b).lp_asset_balance == 1_000_000
+
+    expected = Metapool.get_metaswap_quote(meta_a, meta_a, 5000, ASSET1_ID)
+    assert Metapool.metaswap(creator_account, meta_a, meta_a, 5000, ASSET1_ID) == (
+        expected
+    )
+    # Only the slot of the swapped meta asset moved
+    Metapool.refresh_state()
+    assert Metapool.get_slot(meta_b).lp_asset_balance == 1_000_000
+
+    expected = Metapool.get_metaswap_quote(meta_b, ASSET2_ID, 5000, meta_b)
+    assert Metapool.metaswap(creator_account, meta_b, ASSET2_ID, 5000, meta_b) == (
+        expected
+    )
+
+    # Meta to meta, without leaving the app
+    expected = Metapool.get_metaswap_to_meta_quote(meta_a, meta_b, 5000)
+    with pytest.raises(Exception):
+        Metapool.metaswap_to_meta(
+            creator_account, meta_a, meta_b, 5000, minAmountOut=expected + 1
+        )
+    pool_balances = get_account_balances(amm_client.indexer, Metapool.metapool_address)
+    assert Metapool.metaswap_to_meta(creator_account, meta_a, meta_b, 5000) == expected
+    assert (
+        get_account_balances(amm_client.indexer, Metapool.metapool_address)[
+            nanopool.lp_asset_id
+        ]
+        == pool_balances[nanopool.lp_asset_id]
+    )
+
+    # Can't delete while a slot has liquidity
+    Metapool.withdraw(creator_account, meta_a, minted_a)
+    with pytest.raises(Exception):
+        Metapool.closeMetapool(creator_account)
+    Metapool.withdraw(creator_account, meta_b, minted_b)
+    Metapool.closeMetapool(creator_account)
@@ -1,8 +1,8 @@
 from metapool.metapoolAMMClient import MetapoolAMMClient
-from metapool.contracts.poolKeys import metapool_strings
+from metapool.contracts.poolStrings import metapool_strings
 from algofi_amm.v0.config import PoolType
 from algofi_amm.utils import get_application_global_state, get_account_balances
-from metapool.testing.resources import startup, is_close
+from metapool.testing.resources import startup, is_close, newTestToken
 from metapool.testing.configTestnet import (
     ASSET1_ID,
     ASSET2_ID,
@@ -12,8 +12,10 @@ from metapool.testing.configTestnet import (
 )
 from metapool.utils import MIN_BALANCE_REQUIREMENT
 from algosdk.encoding import decode_address
+from algosdk.error import ABIEncodingError
 import pytest
 import base64
+import json
 from math import sqrt
 
 
@@ -60,7 +62,7 @@ def test_setup():
     Metapool.createMetapool(creator_account)
 
     # Try to set up with negative fees
-    with pytest.raises(OverflowError):
+    with pytest.raises(ABIEncodingError):
         Metapool.setupMetapool(
             creator_account, feeBps=-FEE_BPS, minIncrement=MIN_INCREMENT
         )
@@ -131,6 +133,70 @@ def test_not_setup():
     Metapool.closeMetapool(creator_account)
 
 
+def test_deploy_metapool():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Create a new metapool client
+    Metapool = MetapoolAMMClient(
+        client=amm_client, nanopool=nanopool, metaAssetID=USTEST_ID
+    )
+
+    metapool_app_id, metapool_lp_id = Metapool.deploy_metapool(
+        creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
+    )
+    actual_state = get_application_global_state(amm_client.indexer, metapool_app_id)
+    assert actual_state[metapool_strings.meta_asset_id] == USTEST_ID
+    assert actual_state[metapool_strings.fee_bps] == FEE_BPS
+    assert actual_state[metapool_strings.meta_lp_id] == metapool_lp_id
+    # Creator is opted in to the pool token
+    assert (
+        get_account_balances(amm_client.indexer, creator_account.getAddress()).get(
+            metapool_lp_id
+        )
+        == 0
+    )
+
+    Metapool.closeMetapool(creator_account)
+
+
+def test_snapshot():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Create a new metapool client
+    Metapool = MetapoolAMMClient(
+        client=amm_client, nanopool=nanopool, metaAssetID=USTEST_ID
+    )
+    Metapool.deploy_metapool(
+        creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
+    )
+    Metapool.add_liquidity(creator_account, 2_000_000, 1_000_000)
+
+    expected = Metapool.get_metaswap_quote(USTEST_ID, 5000, ASSET1_ID)
+    snapshot = json.loads(json.dumps(Metapool.to_snapshot()))
+    Restored = MetapoolAMMClient.from_snapshot(amm_client, snapshot)
+    assert Restored.to_snapshot() == Metapool.to_snapshot()
+    # The nanopool quotes run on the restored fields, only the metapool state is loaded
+    Restored.refresh_state()
+    assert (
+        Restored.get_metaswap_quote(USTEST_ID, 5000, ASSET1_ID, refresh=False)
+        == expected
+    )
+    assert Restored.get_metaswap_quote(
+        ASSET1_ID, 5000, USTEST_ID, refresh=False
+    ) == Metapool.get_metaswap_quote(ASSET1_ID, 5000, USTEST_ID, refresh=False)
+    assert Restored.get_metaswap_quote(USTEST_ID, 5000, ASSET1_ID) == expected
+
+    Metapool.withdraw(
+        creator_account,
+        get_account_balances(amm_client.indexer, creator_account.getAddress())[
+            Metapool.metapool_lp_asset_id
+        ],
+    )
+    Metapool.closeMetapool(creator_account)
+
+
 def test_add_liquidity():
     amm_client, creator_account = startup()
     nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
@@ -369,8 +435,8 @@ def test_metaswap():
     assert actual_burned_token_b == expected_burned_token_b
     assert actual_received_token_a == x
     assert (
-        pool_balances[1] == initial_contract_algo - 4000
-    )  # only paid 4000 (forced) for inner swap transaction
+        pool_balances[1] == initial_contract_algo
+    )  # the forced inner swap fee is reimbursed by the user group
 
     expected_new_product = initial_product - expected_burned_token_b * (m + x) + (x * n)
     actual_new_product = (
@@ -414,8 +480,8 @@ def test_metaswap():
     )
     actual_received_token_a = mm - new_pool_balances[Metapool.meta_asset_id]
     assert (
-        new_pool_balances[1] == pool_balances[1] - 8000
-    )  # check force inner transaction fee is only spending
+        new_pool_balances[1] == pool_balances[1]
+    )  # check the forced inner transaction fees are reimbursed
     assert expected_received_token_a == actual_received_token_a
 
     expected_new_product = (
@@ -470,3 +536,286 @@ def test_metaswap():
         ],
     )
     Metapool.closeMetapool(creator_account)
+
+
+def test_metaswap_to_meta():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Two metapools of the same nanopool, with distinct meta assets
+    other_meta = newTestToken(amm_client, creator_account)
+    Metapools = []
+    for meta, m, n in [
+        (USTEST_ID, 2_000_000, 1_000_000),
+        (other_meta, 1_000_000, 1_000_000),
+    ]:
+        Metapool = MetapoolAMMClient(
+            client=amm_client, nanopool=nanopool, metaAssetID=meta
+        )
+        Metapool.createMetapool(creator_account)
+        Metapool.setupMetapool(
+            creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
+        )
+        Metapool.optInToPoolToken(creator_account)
+        Metapool.add_liquidity(creator_account, m, n)
+        Metapools.append(Metapool)
+    MetapoolA, MetapoolB = Metapools
+
+    x = 5000
+    expected_lp = 1_000_000 - 2_000_000 * 1_000_000 // (
+        2_000_000 + (100_00 - FEE_BPS) * x // 100_00
+    )
+    expected_out = 1_000_000 - 1_000_000 * 1_000_000 // (
+        1_000_000 + (100_00 - FEE_BPS) * expected_lp // 100_00
+    )
+
+    # Slippage protection is enforced by the receiving metapool
+    with pytest.raises(Exception):
+        MetapoolA.metaswap_to_meta(
+            creator_account, MetapoolB, x, minAmountOut=expected_out + 1
+        )
+
+    initial_balances = get_account_balances(
+        amm_client.indexer, creator_account.getAddress()
+    )
+    actual_out = MetapoolA.metaswap_to_meta(creator_account, MetapoolB, x)
+    assert actual_out == expected_out
+
+    balances = get_account_balances(amm_client.indexer, creator_account.getAddress())
+    # Meta asset A was sent, meta asset B received
+    assert balances[USTEST_ID] == initial_balances[USTEST_ID] - x
+    assert balances[other_meta] == initial_balances[other_meta] + expected_out
+
+    pool_a_balances = get_account_balances(
+        amm_client.indexer, MetapoolA.metapool_address
+    )
+    pool_b_balances = get_account_balances(
+        amm_client.indexer, MetapoolB.metapool_address
+    )
+    # The LP went straight from one metapool to the other
+    assert pool_a_balances[nanopool.lp_asset_id] == 1_000_000 - expected_lp
+    assert pool_b_balances[nanopool.lp_asset_id] == 1_000_000 + expected_lp
+    # Each metapool only moved its own meta asset
+    assert pool_a_balances[USTEST_ID] == 2_000_000 + x
+    assert pool_b_balances[other_meta] == 1_000_000 - expected_out
+    assert pool_a_balances.get(other_meta, 0) == 0
+    assert pool_b_balances.get(USTEST_ID, 0) == 0
+
+    for Metapool in Metapools:
+        Metapool.withdraw(
+            creator_account,
+            get_account_balances(amm_client.indexer, creator_account.getAddress())[
+                Metapool.metapool_lp_asset_id
+            ],
+        )
+        Metapool.closeMetapool(creator_account)
+
+
+def test_metaswap_exact_out():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Create a new metapool client
+    Metapool = MetapoolAMMClient(
+        client=amm_client, nanopool=nanopool, metaAssetID=USTEST_ID
+    )
+
+    Metapool.createMetapool(creator_account)
+    Metapool.setupMetapool(creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT)
+    Metapool.optInToPoolToken(creator_account)
+
+    m, n = 2_000_000, 1_000_000
+    Metapool.add_liquidity(creator_account, m, n)
+    Metapool.fundMetapool(creator_account, 100_000)
+
+    # Exact amount of nanopool asset 1 out, with a generous maximum input
+    y = 3000
+    amount_in, lp_amount = Metapool.get_metaswap_exact_out_quote(
+        Metapool.meta_asset_id, y, Metapool.nanopool.asset1.asset_id
+    )
+    received = Metapool.metaswap_exact_out(
+        creator_account,
+        Metapool.meta_asset_id,
+        y,
+        Metapool.nanopool.asset1.asset_id,
+        maxAmountIn=amount_in + 1000,
+    )
+    assert received >= y
+    pool_balances = get_account_balances(amm_client.indexer, Metapool.metapool_address)
+    # The unused meta asset has been refunded
+    assert pool_balances[Metapool.meta_asset_id] == m + amount_in
+    assert pool_balances[Metapool.nanopool.lp_asset_id] == n - lp_amount
+
+    # Exact amount of meta asset out
+    z = 2000
+    with pytest.raises(ValueError):
+        Metapool.metaswap_exact_out(
+            creator_account,
+            Metapool.nanopool.asset1.asset_id,
+            z,
+            Metapool.meta_asset_id,
+            maxAmountIn=1,
+        )
+    received = Metapool.metaswap_exact_out(
+        creator_account,
+        Metapool.nanopool.asset1.asset_id,
+        z,
+        Metapool.meta_asset_id,
+    )
+    assert received == z
+    new_pool_balances = get_account_balances(
+        amm_client.indexer, Metapool.metapool_address
+    )
+    assert (
+        new_pool_balances[Metapool.meta_asset_id]
+        == pool_balances[Metapool.meta_asset_id] - z
+    )
+
+    Metapool.withdraw(
+        creator_account,
+        get_account_balances(amm_client.indexer, creator_account.getAddress())[
+            Metapool.metapool_lp_asset_id
+        ],
+    )
+    Metapool.closeMetapool(creator_account)
+
+
+def test_add_liquidity_exact():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Create a new metapool client
+    Metapool = MetapoolAMMClient(
+        client=amm_client, nanopool=nanopool, metaAssetID=USTEST_ID
+    )
+
+    Metapool.createMetapool(creator_account)
+    metapool_lp_id = Metapool.setupMetapool(
+        creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
+    )
+    Metapool.optInToPoolToken(creator_account)
+    Metapool.add_liquidity(creator_account, 3_000_001, 1_000_000)
+
+    qA, qB, expected_minted = Metapool.plan_add_liquidity(100_000, 100_000)
+    assert qA <= 100_000 and qB <= 100_000
+
+    balances_before = get_account_balances(
+        amm_client.indexer, creator_account.getAddress()
+    )
+    minted = Metapool.add_liquidity(creator_account, 100_000, 100_000, exact=True)
+    balances_after = get_account_balances(
+        amm_client.indexer, creator_account.getAddress()
+    )
+
+    # Nothing refunded
+    assert minted == expected_minted
+    assert balances_before[USTEST_ID] - balances_after[USTEST_ID] == qA
+    assert (
+        balances_before[nanopool.lp_asset_id] - balances_after[nanopool.lp_asset_id]
+        == qB
+    )
+    assert balances_after[metapool_lp_id] - balances_before[metapool_lp_id] == minted
+
+    Metapool.withdraw(creator_account, balances_after[metapool_lp_id])
+    Metapool.closeMetapool(creator_account)
+
+
+def test_add_liquidity_single():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Create a new metapool client
+    Metapool = MetapoolAMMClient(
+        client=amm_client, nanopool=nanopool, metaAssetID=USTEST_ID
+    )
+
+    metapool_app_id = Metapool.createMetapool(creator_account)
+    metapool_lp_id = Metapool.setupMetapool(
+        creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
+    )
+    Metapool.optInToPoolToken(creator_account)
+
+    m, n = 2_000_000, 1_000_000
+    Metapool.add_liquidity(creator_account, m, n)
+    Metapool.fundMetapool(creator_account, 100_000)
+
+    # Meta asset only
+    _, _, expected_minted = Metapool.get_add_liquidity_single_quote(
+        Metapool.meta_asset_id, 50_000
+    )
+    minted = Metapool.add_liquidity_single(
+        creator_account, Metapool.meta_asset_id, 50_000
+    )
+    assert minted == expected_minted
+    actual_tokens_outstanding = get_application_global_state(
+        amm_client.indexer, metapool_app_id
+    )[metapool_strings.pool_token_outstanding]
+    assert actual_tokens_outstanding == int(sqrt(m * n)) + minted
+
+    # One nanopool asset, zapped by the contract
+    initial_balances = get_account_balances(
+        amm_client.indexer, creator_account.getAddress()
+    )
+    minted = Metapool.add_liquidity_single(
+        creator_account, Metapool.nanopool.asset1.asset_id, 50_000
+    )
+    assert minted > 0
+    balances = get_account_balances(amm_client.indexer, creator_account.getAddress())
+    assert balances[metapool_lp_id] == initial_balances[metapool_lp_id] + minted
+
+    Metapool.withdraw(creator_account, balances[metapool_lp_id])
+    Metapool.closeMetapool(creator_account)
+
+
+def test_withdraw_single():
+    amm_client, creator_account = startup()
+    nanopool = amm_client.get_pool(PoolType.NANOSWAP, ASSET1_ID, ASSET2_ID)
+
+    # Create a new metapool client
+    Metapool = MetapoolAMMClient(
+        client=amm_client, nanopool=nanopool, metaAssetID=USTEST_ID
+    )
+
+    metapool_app_id = Metapool.createMetapool(creator_account)
+    metapool_lp_id = Metapool.setupMetapool(
+        creator_account, feeBps=FEE_BPS, minIncrement=MIN_INCREMENT
+    )
+    Metapool.optInToPoolToken(creator_account)
+    Metapool.fundMetapool(creator_account, 100_000)
+
+    m, n = 2_000_000, 1_000_000
+    minted = Metapool.add_liquidity(creator_account, m, n)
+    out_asset = Metapool.nanopool.asset1.asset_id
+
+    # Meta asset share paid out, nanopool LP share burned to asset1
+    expected = Metapool.get_withdraw_single_quote(minted // 4, out_asset)
+    withdrawn = Metapool.withdraw_single(creator_account, minted // 4, out_asset)
+    assert withdrawn == list(expected)
+
+    # Everything converted to asset1
+    initial_balances = get_account_balances(
+        amm_client.indexer, creator_account.getAddress()
+    )
+    expected = Metapool.get_withdraw_single_quote(minted // 4, out_asset, True)
+    assert expected[0] == 0
+    withdrawn = Metapool.withdraw_single(
+        creator_account, minted // 4, out_asset, swapMeta=True
+    )
+    assert withdrawn == list(expected)
+    balances = get_account_balances(amm_client.indexer, creator_account.getAddress())
+    assert balances[USTEST_ID] == initial_balances[USTEST_ID]
+    assert balances[out_asset] == initial_balances[out_asset] + withdrawn[1]
+
+    # The slippage limit is enforced by the contract
+    with pytest.raises(Exception):
+        Metapool.withdraw_single(
+            creator_account, minted // 4, out_asset, minAmountOut=2**63
+        )
+
+    actual_tokens_outstanding = get_application_global_state(
+        amm_client.indexer, metapool_app_id
+    )[metapool_strings.pool_token_outstanding]
+    assert actual_tokens_outstanding == minted - 2 * (minted // 4)
+
+    Metapool.withdraw(creator_account, balances[metapool_lp_id])
+    Metapool.closeMetapool(creator_account)
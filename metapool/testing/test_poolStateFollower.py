@@ -0,0 +1,165 @@
+import asyncio
+from base64 import b64encode
+import msgpack
+from algosdk.encoding import decode_address
+from algosdk.error import AlgodHTTPError
+from algosdk.logic import get_application_address
+from metapool.poolStateFollower import PoolStateFollower
+
+APP_ID = 7
+ADDRESS = get_application_address(APP_ID)
+USER = decode_address(get_application_address(99))
+
+
+class FakeAlgod:
+    """Serves the blocks given for each round, the state is only counted as read"""
+
+    def __init__(self):
+        self.last_round = 10
+        self.blocks = {}
+        self.global_state = {"fee bps": 25}
+        self.assets = {1: 1000, 2: 500}
+        self.reads = 0
+
+    def status(self):
+        return {"last-round": self.last_round}
+
+    def status_after_block(self, round_num):
+        return {"last-round": self.last_round}
+
+    def application_info(self, app_id):
+        self.reads += 1
+        return {
+            "params": {
+                "global-state": [
+                    {
+                        "key": b64encode(key.encode()).decode(),
+                        "value": {"type": 2, "uint": value},
+                    }
+                    for key, value in self.global_state.items()
+                ]
+            }
+        }
+
+    def account_info(self, address):
+        return {
+            "round": self.last_round,
+            "assets": [
+                {"asset-id": asset, "amount": amount}
+                for asset, amount in self.assets.items()
+            ],
+        }
+
+    def block_info(self, round_num, response_format):
+        if round_num not in self.blocks:
+            raise AlgodHTTPError("block not available", 404)
+        return msgpack.packb(
+            {"block": {"rnd": round_num, "txns": self.blocks[round_num]}},
+            use_bin_type=True,
+        )
+
+
+def transfer(asset, amount, sender, receiver):
+    return {
+        "txn": {
+            "type": "axfer",
+            "xaid": asset,
+            "aamt": amount,
+            "snd": sender,
+            "arcv": receiver,
+        }
+    }
+
+
+def test_follow_blocks():
+    algod = FakeAlgod()
+    follower = PoolStateFollower(algod, [APP_ID])
+    updates = []
+    follower.subscribe(lambda rnd, changed: updates.append((rnd, changed)))
+    follower.step()
+    assert follower.apps[APP_ID].balances == {1: 1000, 2: 500}
+    assert algod.reads == 1
+
+    app = decode_address(ADDRESS)
+    # A swap: asset 1 in, asset 2 out with an inner transfer, reserves updated
+    algod.blocks[11] = [transfer(1, 3, USER, USER)]
+    algod.blocks[12] = [
+        transfer(1, 100, USER, app),
+        {
+            "txn": {"type": "appl", "apid": APP_ID, "snd": USER},
+            "dt": {
+                "gd": {"fee bps": {"at": 2, "ui": 30}, "old": {"at": 3}},
+                "itx": [transfer(2, 40, app, USER)],
+            },
+        },
+    ]
+    algod.last_round = 12
+    assert follower.step() == (12, {APP_ID})
+    state = follower.apps[APP_ID]
+    assert state.balances == {1: 1100, 2: 460}
+    assert state.globalState == {"fee bps": 30}
+    assert state.round == 12
+    assert updates[-1] == (12, {APP_ID})
+    # No state read
+    assert algod.reads == 1
+
+    # Nothing touching the app
+    algod.blocks[13] = [transfer(1, 5, USER, USER)]
+    algod.last_round = 13
+    assert follower.step() == (13, set())
+
+    # A missing block is a gap, the state is read again
+    algod.last_round = 15
+    algod.blocks[14] = []
+    follower.step()
+    assert algod.reads == 2
+    assert follower.apps[APP_ID].balances == {1: 1000, 2: 500}
+    assert follower.round == 15
+
+
+def test_async_updates():
+    algod = FakeAlgod()
+    follower = PoolStateFollower(algod, [APP_ID])
+
+    async def first_update():
+        async for update in follower.updates():
+            return update
+
+    assert asyncio.run(first_update()) == (10, {APP_ID})
+
+
+class FakeNanopool:
+    application_id = 8
+
+    def __init__(self):
+        self.refreshed = 0
+
+    def refresh_state(self):
+        self.refreshed += 1
+
+
+class FakeMetapool:
+    def __init__(self, appId):
+        self.metapool_application_id = appId
+        self.nanopool = FakeNanopool()
+        self.loaded = 0
+
+    def load_state(self, appGlobalState, balances):
+        self.loaded += 1
+
+
+def test_nanopool_refresh_is_opt_in():
+    algod = FakeAlgod()
+    follower = PoolStateFollower(algod)
+    quiet, refreshed = FakeMetapool(APP_ID), FakeMetapool(9)
+    follower.follow(quiet)
+    follower.follow(refreshed, refreshNanopool=True)
+    follower.step()
+    assert (quiet.loaded, refreshed.loaded) == (1, 1)
+    assert (quiet.nanopool.refreshed, refreshed.nanopool.refreshed) == (0, 1)
+
+    nanopool = decode_address(get_application_address(8))
+    algod.blocks[11] = [transfer(1, 100, USER, nanopool)]
+    algod.last_round = 11
+    assert follower.step() == (11, {8})
+    assert (quiet.nanopool.refreshed, refreshed.nanopool.refreshed) == (0, 2)
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+from metapool.quoteServer import QuoteServer
+from metapool.testing.test_poolStateFollower import FakeAlgod, APP_ID
+
+
+class FakeNanopool:
+    application_id = 8
+
+    def refresh_state(self):
+        pass
+
+
+class FakeMetapool:
+    """Quotes the fee bps times the amount, blocking until released"""
+
+    metapool_application_id = APP_ID
+
+    def __init__(self):
+        self.nanopool = FakeNanopool()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def load_state(self, appGlobalState, balances):
+        self.fee_bps = appGlobalState["fee bps"]
+
+    def get_metaswap_quote(self, inTokenId, amount, outTokenId, refresh=True):
+        self.release.wait(5)
+        self.calls += 1
+        if inTokenId == outTokenId:
+            raise ValueError("Invalid Output token")
+        return amount * self.fee_bps
+
+
+def test_quote_coalescing_and_cache():
+    metapool = FakeMetapool()
+    algod = FakeAlgod()
+    server = QuoteServer([metapool], algod)
+
+    async def scenario():
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, server.advance, server.follower.wait())
+        path = "/quote?in=1&out=2&amount=10"
+        pending = [asyncio.ensure_future(server.handle(path)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        metapool.release.set()
+        results = await asyncio.gather(*pending)
+        assert results == [(200, {"amount_out": 250, "round": 10})] * 5
+        assert metapool.calls == 1
+        assert server.metrics["coalesced"] == 4
+
+        assert (await server.handle(path))[0] == 200
+        assert metapool.calls == 1
+        assert server.metrics["cache_hits"] == 1
+
+        status, body = await server.handle("/quote?in=1&out=1&amount=10")
+        assert status == 400
+        assert (await server.handle("/unknown"))[0] == 404
+
+        metrics = (await server.handle("/metrics"))[1]
+        assert metrics["requests"]["quote"] == 7
+        assert metrics["cache_hit_rate"] == 1 / 7
+        assert metrics["round"] == 10
+
+    asyncio.run(scenario())
+
+
+def test_http():
+    metapool = FakeMetapool()
+    metapool.release.set()
+    server = QuoteServer([metapool], FakeAlgod())
+
+    async def scenario():
+        server.advance(server.follower.wait())
+        http = await asyncio.start_server(server.on_connection, "127.0.0.1", 0)
+        port = http.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /quote?in=1&out=2&amount=4 HTTP/1.1\r\nHost: x\r\n\r\n")
+        response = await reader.read()
+        http.close()
+        return response
+
+    response = asyncio.run(scenario())
+    head, body = response.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200")
+    assert json.loads(body) == {"amount_out": 100, "round": 10}
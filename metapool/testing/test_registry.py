@@ -0,0 +1,114 @@
+from base64 import b64encode
+from metapool.registry import MetapoolRegistry, programHash
+from metapool.contracts.poolStrings import metapool_strings, multi_metapool_strings
+
+CREATOR = "CREATOR"
+
+
+def uint(key, value):
+    return {
+        "key": b64encode(key.encode()).decode(),
+        "value": {"type": 2, "uint": value},
+    }
+
+
+def app(appId, state, program=b"metapool", deleted=False):
+    return {
+        "id": appId,
+        "deleted": deleted,
+        "params": {
+            "creator": CREATOR,
+            "approval-program": b64encode(program).decode(),
+            "global-state": [uint(key, value) for key, value in state.items()],
+        },
+    }
+
+
+def metapool_state(meta, asset1=1, asset2=2, outstanding=0):
+    return {
+        metapool_strings.nanopool_app_id: 10,
+        metapool_strings.nanopool_asset_1_id: asset1,
+        metapool_strings.nanopool_asset_2_id: asset2,
+        metapool_strings.nanopool_lp_id: 3,
+        metapool_strings.meta_asset_id: meta,
+        metapool_strings.meta_lp_id: meta + 1000,
+        metapool_strings.fee_bps: 25,
+        metapool_strings.min_increment: 1000,
+        metapool_strings.pool_token_outstanding: outstanding,
+    }
+
+
+class FakeIndexer:
+    """Applications in ascending ID order, the next token is the last ID of the page"""
+
+    def __init__(self, apps):
+        self.apps = apps
+        self.queries = 0
+
+    def search_applications(
+        self, creator=None, limit=None, next_page=None, include_all=False
+    ):
+        self.queries += 1
+        after = int(next_page or 0)
+        page = [
+            a
+            for a in self.apps
+            if a["id"] > after
+            and (creator is None or a["params"]["creator"] == creator)
+        ][:limit]
+        response = {"current-round": 100, "applications": page}
+        if page:
+            response["next-token"] = str(page[-1]["id"])
+        return response
+
+
+def test_registry_refresh():
+    multi_state = {
+        metapool_strings.nanopool_app_id: 10,
+        metapool_strings.nanopool_asset_1_id: 2,
+        metapool_strings.nanopool_asset_2_id: 1,
+        multi_metapool_strings.meta_count: 2,
+    }
+    for slot, meta in enumerate([50, 60]):
+        suffix = slot.to_bytes(8, "big").decode()
+        multi_state[metapool_strings.meta_asset_id + suffix] = meta
+        multi_state[metapool_strings.meta_lp_id + suffix] = meta + 1000
+    indexer = FakeIndexer(
+        [
+            app(1, metapool_state(50)),
+            app(2, {"other": 1}),
+            app(3, metapool_state(70, asset1=4, asset2=5)),
+            app(4, multi_state, program=b"multi"),
+        ]
+    )
+    registry = MetapoolRegistry(indexer, pageSize=2)
+    assert registry.refresh_by_creator(CREATOR) == 4
+
+    assert [r.appId for r in registry.lookup(50)] == [1, 4]
+    # The pair can be given in any order
+    assert [(r.appId, r.slot) for r in registry.lookup(60, 2, 1)] == [(4, 1)]
+    assert [r.appId for r in registry.pools_for_pair(5, 4)] == [3]
+
+    # Only the new apps are fetched
+    indexer.apps.append(app(5, metapool_state(80, outstanding=5)))
+    indexer.queries = 0
+    assert registry.refresh_by_creator(CREATOR) == 1
+    assert indexer.queries == 2
+    assert registry.lookup(80)[0].poolTokensOutstanding == 5
+
+    # A full refresh updates the known pools and drops the deleted ones
+    indexer.apps[0] = app(1, metapool_state(50, outstanding=7))
+    indexer.apps[2] = app(3, {}, deleted=True)
+    registry.refresh_by_creator(CREATOR, full=True)
+    assert registry.lookup(50, 1, 2)[0].poolTokensOutstanding == 7
+    assert registry.pools_for_pair(4, 5) == []
+
+
+def test_registry_by_program():
+    indexer = FakeIndexer(
+        [app(1, metapool_state(50)), app(2, metapool_state(60), program=b"other")]
+    )
+    registry = MetapoolRegistry(indexer)
+    assert programHash(b"metapool") != programHash(b"other")
+    registry.refresh_by_program(b"metapool")
+    assert [r.metaAssetId for r in registry.all()] == [50]
@@ -0,0 +1,161 @@
+from concurrent.futures import ProcessPoolExecutor
+import time
+from types import SimpleNamespace
+import pytest
+from metapool.contracts.poolStrings import metapool_strings
+from metapool.sharedState import (
+    HEADER_SIZE,
+    METAPOOL,
+    NANOPOOL,
+    SEQUENCE,
+    SharedStateReader,
+    SharedStateWriter,
+    nanopoolRecord,
+)
+
+META, NANO_LP = 1, 4
+TOTAL = 10**12
+
+
+class FakeMetapool:
+    meta_asset_id = META
+    metapool_application_id = 10
+
+    def __init__(self, meta=10**8, lp=2 * 10**8):
+        self.nanopool = SimpleNamespace(
+            application_id=11,
+            lp_asset_id=NANO_LP,
+            asset1_balance=10**10,
+            asset2_balance=3 * 10**10,
+            lp_circulation=10**9,
+            swap_fee=0.0025,
+            initial_amplification_factor=200,
+            future_amplification_factor=400,
+            initial_amplification_factor_time=1000,
+            future_amplification_factor_time=2000,
+        )
+        self.load_state(
+            {
+                metapool_strings.fee_bps: 30,
+                metapool_strings.min_increment: 1000,
+                metapool_strings.pool_token_outstanding: 10**8,
+            },
+            {META: meta, NANO_LP: lp},
+        )
+
+    def load_state(self, appGlobalState, balances):
+        self.fee_bps = appGlobalState[metapool_strings.fee_bps]
+        self.min_increment = appGlobalState[metapool_strings.min_increment]
+        self.pool_tokens_outstanding = appGlobalState[
+            metapool_strings.pool_token_outstanding
+        ]
+        self.meta_asset_balance = balances.get(META, 0)
+        self.lp_asset_balance = balances.get(NANO_LP, 0)
+
+
+class FakeFollower:
+    def __init__(self, metapool):
+        self.metapools, self.callbacks, self.round = [metapool], [], 5
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+
+def state(metapool):
+    return {
+        key: value for key, value in vars(metapool).items() if key != "nanopool"
+    }, vars(metapool.nanopool)
+
+
+def test_write_and_load():
+    metapool = FakeMetapool()
+    follower = FakeFollower(metapool)
+    writer = SharedStateWriter(capacity=2)
+    try:
+        writer.attach(follower)
+        reader = SharedStateReader(writer.name)
+        assert reader.round == 5 and sorted(reader.app_ids()) == [10, 11]
+        record = reader.read(10)
+        assert record.kind == METAPOOL and record.round == 5
+        assert (record.reserve1, record.reserve2, record.feeBps) == (
+            10**8,
+            2 * 10**8,
+            30,
+        )
+        nanoRecord = reader.read(11)
+        assert nanoRecord == nanopoolRecord(metapool.nanopool, 5)
+        assert nanoRecord.kind == NANOPOOL and nanoRecord.feeBps == 25
+        assert (
+            nanoRecord.amplification == 200
+            and nanoRecord.futureAmplificationTime == 2000
+        )
+        with pytest.raises(KeyError):
+            reader.read(12)
+
+        # Only the changed apps are written again
+        metapool.meta_asset_balance += 7
+        metapool.nanopool.asset1_balance += 9
+        for callback in follower.callbacks:
+            callback(6, {10})
+        assert reader.round == 6
+        assert reader.read(10).reserve1 == 10**8 + 7 and reader.read(11).round == 5
+        worker = FakeMetapool(meta=0, lp=0)
+        worker.nanopool.asset1_balance = 0
+        worker.nanopool.swap_fee = 0.003
+        assert reader.load(worker) == 5
+        assert worker.meta_asset_balance == 10**8 + 7
+        assert worker.nanopool.asset1_balance == 10**10
+        for callback in follower.callbacks:
+            callback(7, {11})
+        reader.load(worker)
+        assert state(worker) == state(metapool)
+
+        with pytest.raises(RuntimeError, match="full"):
+            writer.write(reader.read(10)._replace(appId=12))
+        # A record left odd by a writer stopped in the middle is never returned
+        SEQUENCE.pack_into(writer.memory.buf, HEADER_SIZE, 41)
+        reader.retries = 3
+        with pytest.raises(RuntimeError, match="busy"):
+            reader.read(10)
+        reader.close()
+    finally:
+        writer.close()
+
+
+def readConsistently(name, reads):
+    """Read the records while another process writes them, count the torn states"""
+    reader = SharedStateReader(name)
+    torn = 0
+    for _ in range(reads):
+        record = reader.read(10)
+        torn += (
+            record.reserve1 + record.reserve2 != TOTAL or record.supply != record.round
+        )
+    reader.close()
+    return torn
+
+
+def test_concurrent_readers():
+    metapool = FakeMetapool(meta=TOTAL // 2, lp=TOTAL // 2)
+    # The first record is consistent too, the readers may start before the next write
+    metapool.pool_tokens_outstanding = 0
+    writer = SharedStateWriter(capacity=2)
+    try:
+        writer.write_metapool(metapool, 0)
+        with ProcessPoolExecutor(2) as executor:
+            futures = [
+                executor.submit(readConsistently, writer.name, 20_000) for _ in range(2)
+            ]
+            round = 0
+            while not all(future.done() for future in futures):
+                round += 1
+                metapool.meta_asset_balance = round % 1000
+                metapool.lp_asset_balance = TOTAL - round % 1000
+                metapool.pool_tokens_outstanding = round
+                writer.write_metapool(metapool, round)
+                # Far more often than once per round, yet leaving the readers a chance
+                time.sleep(0.0001)
+            assert [future.result() for future in futures] == [0, 0]
+        assert round > 0
+    finally:
+        writer.close()
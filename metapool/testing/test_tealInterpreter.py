@@ -0,0 +1,227 @@
+import copy
+from algosdk import account
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+import pytest
+from metapool.contracts.poolStrings import metapool_strings
+from metapool.feeBudget import metaswapRoute, minimumFee, nanopoolFeePayment
+from metapool.metapoolSimulator import MetapoolSimulator
+from metapool.tealInterpreter import (
+    APP_CALL_BUDGET,
+    LocalLedger,
+    StubNanopool,
+    assemble,
+)
+from metapool.utils import MIN_BALANCE_REQUIREMENT, decodeMethodReturn, encodeMethodCall
+
+PARAMS = transaction.SuggestedParams(1000, 1, 1000, "", flat_fee=True)
+
+# Adds the two uint64 arguments, logs the sum as an ARC-4 return and counts the calls
+ADDER = """#pragma version 6
+txn ApplicationID
+bz main_l3
+txna ApplicationArgs 0
+btoi
+txna ApplicationArgs 1
+btoi
+callsub add_0
+store 0
+byte "calls"
+byte "calls"
+app_global_get
+int 1
++
+app_global_put
+byte 0x151f7c75
+load 0
+itob
+concat
+log
+int 1
+return
+main_l3:
+int 1
+return
+add_0:
++
+retsub
+"""
+
+# Pays its first argument to the sender with an inner payment at the default fee
+PAYER = """#pragma version 6
+txn ApplicationID
+bz main_l2
+itxn_begin
+int pay
+itxn_field TypeEnum
+txn Sender
+itxn_field Receiver
+txna ApplicationArgs 0
+btoi
+itxn_field Amount
+itxn_submit
+main_l2:
+int 1
+return
+"""
+
+
+def newLedger():
+    ledger = LocalLedger()
+    sk, user = account.generate_account()
+    ledger.fund(user, 10**9)
+    return ledger, user
+
+
+def appCall(user, appId, args, fee=1000, **kwargs):
+    params = transaction.SuggestedParams(fee, 1, 1000, "", flat_fee=True)
+    return transaction.ApplicationNoOpTxn(user, params, appId, args, **kwargs)
+
+
+def test_assemble_and_run():
+    program = assemble(ADDER)
+    assert program.version == 6
+    assert program.instructions[2].args == ("ApplicationArgs", 0)
+    assert program.instructions[-1].op == "retsub"
+    with pytest.raises(ValueError, match="not supported"):
+        assemble("#pragma version 6\nbox_get\n")
+
+    ledger, user = newLedger()
+    appId = ledger.create_app(user, ADDER)
+    args = [(2).to_bytes(8, "big"), (40).to_bytes(8, "big")]
+    result = ledger.send([appCall(user, appId, args)])
+    assert result.passed and result.budget == APP_CALL_BUDGET
+    assert result.cost == result.reports[0].cost == 23
+    assert decodeMethodReturn("add(uint64,uint64)uint64", result.txinfo()) == 42
+    assert ledger.global_state(appId) == {"calls": 1}
+
+    # The sum overflows 64 bits, the call and its state changes are dropped
+    args = [(2**63).to_bytes(8, "big")] * 2
+    result = ledger.send([appCall(user, appId, args)])
+    assert not result.passed and "line 27 +: uint64 overflow" in result.reason
+    assert ledger.global_state(appId) == {"calls": 1}
+    balance = ledger.balance(user)
+    result = ledger.send([appCall(user, appId, [b"", b""], fee=999)])
+    assert not result.passed and result.reason == "fee too small"
+    assert ledger.balance(user) == balance
+
+
+def test_inner_fee_credit_and_budget():
+    ledger, user = newLedger()
+    appId = ledger.create_app(user, PAYER)
+    address = get_application_address(appId)
+    ledger.fund(address, 10**6)
+    amount = (5000).to_bytes(8, "big")
+    # Without credit the app account pays the inner fee, the outer fee surplus covers it
+    assert ledger.send([appCall(user, appId, [amount])]).passed
+    assert ledger.balance(address) == 10**6 - 5000 - 1000
+    result = ledger.send([appCall(user, appId, [amount], fee=2000)])
+    assert result.passed and result.innerTxns == 1
+    assert ledger.balance(address) == 10**6 - 2 * 5000 - 1000
+    # The app account cannot go below its minimum balance
+    amount = (ledger.balance(address) - 99_999).to_bytes(8, "big")
+    result = ledger.send([appCall(user, appId, [amount], fee=2000)])
+    assert not result.passed and "minimum balance" in result.reason
+
+    loop = "#pragma version 6\nmain_l1:\nb main_l1\n"
+    loopId = ledger.create_app(user, "#pragma version 6\nint 1\nreturn\n")
+    ledger.apps[loopId].program = assemble(loop)
+    result = ledger.send([appCall(user, loopId, []), appCall(user, loopId, [])])
+    assert not result.passed and "budget exceeded" in result.reason
+    assert result.cost == result.budget + 1 == 2 * APP_CALL_BUDGET + 1
+
+
+def test_metapool_matches_simulator():
+    pytest.importorskip("algofi_amm")
+    from metapool.contracts.artifacts import loadTeal
+
+    ledger, user = newLedger()
+    ledger.profile = True
+    asset1, asset2, meta = (ledger.create_asset(user, 10**15) for _ in range(3))
+    nanopool = StubNanopool.deploy(
+        ledger, asset1, asset2, 10**10, 2 * 10**10, lpHolder=user
+    )
+    lpId = nanopool.lp_asset_id
+    simulator = MetapoolSimulator(copy.deepcopy(nanopool.model), meta)
+    appId = ledger.create_app(user, loadTeal("metapool_approval.teal"))
+    address = get_application_address(appId)
+    apps = [nanopool.application_id, nanopool.manager_application_id]
+
+    setup = appCall(
+        user,
+        appId,
+        encodeMethodCall(metapool_strings.op_set_metapool, [30, 1000]),
+        fee=6000,
+        foreign_apps=apps,
+        foreign_assets=[asset1, asset2, lpId, meta],
+    )
+    funding = transaction.PaymentTxn(
+        user, PARAMS, address, MIN_BALANCE_REQUIREMENT + 5000
+    )
+    result = ledger.send([funding, setup])
+    assert result.passed, result.reason
+    poolToken = decodeMethodReturn(metapool_strings.op_set_metapool, result.txinfo())
+    simulator.setup(30, 1000, poolToken)
+    ledger.send([transaction.AssetOptInTxn(user, PARAMS, poolToken)])
+
+    def transfer(assetId, amount):
+        return transaction.AssetTransferTxn(user, PARAMS, address, amount, assetId)
+
+    result = ledger.send(
+        [
+            transfer(meta, 10**8),
+            transfer(lpId, 2 * 10**8),
+            appCall(
+                user,
+                appId,
+                encodeMethodCall(metapool_strings.op_add_liquidity),
+                fee=2000,
+                foreign_assets=[meta, lpId, poolToken],
+            ),
+        ]
+    )
+    minted = decodeMethodReturn(metapool_strings.op_add_liquidity, result.txinfo())
+    assert minted == simulator.add_liquidity(10**8, 2 * 10**8)
+
+    def metaswap(inTokenId, amount, outTokenId, zapAmount=0):
+        route = metaswapRoute(burn=inTokenId == meta)
+        other = asset2 if asset1 in (inTokenId, outTokenId) else asset1
+        return ledger.send(
+            [
+                transfer(inTokenId, amount),
+                transaction.PaymentTxn(
+                    user, PARAMS, address, nanopoolFeePayment(route)
+                ),
+                appCall(
+                    user,
+                    appId,
+                    encodeMethodCall(metapool_strings.op_metaswap, [zapAmount]),
+                    fee=minimumFee(route),
+                    foreign_apps=apps,
+                    foreign_assets=[inTokenId, outTokenId, other, lpId],
+                    accounts=[nanopool.address],
+                ),
+            ]
+        )
+
+    for args in [(meta, 10**6, asset1), (asset2, 10**6, meta, 5 * 10**5)]:
+        result = metaswap(*args)
+        assert result.passed, result.reason
+        out = decodeMethodReturn(metapool_strings.op_metaswap, result.txinfo())
+        assert out == simulator.metaswap(*args)
+        assert result.cost <= result.budget
+        assert [report.depth for report in result.reports][:2] == [0, 1]
+    assert nanopool.model.snapshot() == simulator.nanopool.snapshot()
+    assert ledger.balance(address, meta) == simulator.meta_asset_balance
+    assert ledger.balance(address, lpId) == simulator.lp_asset_balance
+    state = ledger.global_state(appId)
+    outstanding = state[metapool_strings.pool_token_outstanding]
+    assert outstanding == simulator.pool_tokens_outstanding
+    assert sum(result.profile.values()) == result.cost
+
+    # A zap of the whole input leaves nothing to pool, the group is dropped
+    balance = ledger.balance(user, asset1)
+    result = metaswap(asset1, 10**6, meta, 10**6)
+    assert not result.passed and not result.reports[0].passed
+    assert nanopool.model.snapshot() == simulator.nanopool.snapshot()
+    assert ledger.balance(user, asset1) == balance
@@ -1,9 +1,9 @@
 from base64 import b64decode
-from pyteal import compileTeal, MAX_TEAL_VERSION, Mode
-from metapool.contracts.metapoolContract import approval, clear
-from typing import Tuple
+from metapool.contracts.artifacts import loadTeal
+from typing import List, Tuple
 from algosdk.v2client.algod import AlgodClient
-from algosdk import account, mnemonic
+from algosdk.atomic_transaction_composer import ABI_RETURN_HASH
+from algosdk import abi, account, mnemonic
 
 MIN_BALANCE_REQUIREMENT = (
     # min account balance
@@ -12,6 +12,15 @@ MIN_BALANCE_REQUIREMENT = (
     + 100_000 * 5
 )
 
+MULTI_MIN_BALANCE_REQUIREMENT = (
+    # min account balance
+    100_000
+    # additional min balance for the 3 nanopool assets
+    + 100_000 * 3
+)
+# additional min balance for a meta asset slot, the meta asset and its pool token
+SLOT_MIN_BALANCE_REQUIREMENT = 100_000 * 2
+
 
 class Account:
     """Represents a private key and address for an Algorand account"""
@@ -43,11 +52,66 @@ def getPoolTokenId(appGlobalState):
         )
 
 
+def encodeMethodCall(signature: str, *args) -> List[bytes]:
+    """Build the application arguments of an ARC-4 method call.
+
+    Args:
+        signature: method signature, as found in metapool_strings.
+        args: values of the non-transaction arguments, a list for a tuple argument.
+    Returns:
+        The method selector followed by the encoded arguments.
+    """
+    method = abi.Method.from_signature(signature)
+    app_args = [method.get_selector()]
+    method_args = [
+        arg for arg in method.args if not abi.is_abi_transaction_type(arg.type)
+    ]
+    if len(method_args) != len(args):
+        raise ValueError(
+            "%s expects %i arguments, got %i" % (signature, len(method_args), len(args))
+        )
+    for arg, value in zip(method_args, args):
+        app_args.append(arg.type.encode(value))
+    return app_args
+
+
+def decodeMethodReturn(signature: str, txinfo: dict):
+    """Decode the ARC-4 return value logged by a confirmed method call.
+
+    Args:
+        signature: method signature, as found in metapool_strings.
+        txinfo: the confirmed transaction information of the app call.
+    Returns:
+        The decoded value, None for a void method.
+    """
+    method = abi.Method.from_signature(signature)
+    if method.returns.type == abi.Returns.VOID:
+        return None
+    logs = txinfo.get("logs", [])
+    if not logs:
+        raise RuntimeError("No return value logged by %s" % signature)
+    last_log = b64decode(logs[-1])
+    if last_log[:4] != ABI_RETURN_HASH:
+        raise RuntimeError("Invalid return value logged by %s" % signature)
+    return method.returns.type.decode(last_log[4:])
+
+
 def compiledContract(algod_client: AlgodClient) -> Tuple[bytes, bytes]:
-    approval_program = algod_client.compile(
-        compileTeal(approval(), mode=Mode.Application, version=MAX_TEAL_VERSION)
+    return compiledPrograms(
+        algod_client, "metapool_approval.teal", "metapool_clear.teal"
     )
-    clear_program = algod_client.compile(
-        compileTeal(clear(), mode=Mode.Application, version=MAX_TEAL_VERSION)
+
+
+def compiledMultiContract(algod_client: AlgodClient) -> Tuple[bytes, bytes]:
+    return compiledPrograms(
+        algod_client, "multi_metapool_approval.teal", "multi_metapool_clear.teal"
     )
+
+
+def compiledPrograms(
+    algod_client: AlgodClient, approvalName: str, clearName: str
+) -> Tuple[bytes, bytes]:
+    """Assemble the prebuilt TEAL artifacts of a contract, see contracts/artifacts.py"""
+    approval_program = algod_client.compile(loadTeal(approvalName))
+    clear_program = algod_client.compile(loadTeal(clearName))
     return (b64decode(approval_program["result"]), b64decode(clear_program["result"]))
@@ -16,6 +16,7 @@ setup(
     },
     # install_requires=["algofi-amm-py-sdk==1.0.5"],
     packages=find_packages(),
-    python_requires=">=3.7",
+    package_data={"metapool.contracts": ["teal/*.teal"]},
+    python_requires=">=3.8",
     include_package_data=True,
 )